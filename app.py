@@ -1,5 +1,252 @@
+import importlib
+import sys
+import time
+
+START_TIME = time.perf_counter()
+
+# модули пути компиляции в порядке зависимостей: время импорта каждого - без уже загруженных зависимостей
+# (бэкенды sal_vm, sal_py, sal_c, sal_pe и IR импортируются только своими режимами)
+STARTUP_MODULES = ('lark', 'sal_semantic_base', 'visitor', 'sal_ast', 'sal_cache', 'sal_parser',
+                   'sal_semantic_checker', 'sal_peephole', 'sal_msil', 'sal_inline', 'sal_regalloc', 'sal_optimizer',
+                   'sal_incremental', 'sal_context', 'program')
+startup_times = []
+
 import argparse
-import program
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import sal_server
+
+
+def import_compiler() -> None:
+    """Импорт модулей компилятора (клиенту компиляционного сервера они не нужны)
+    """
+
+    for module_name in STARTUP_MODULES:
+        if module_name in sys.modules:
+            continue
+        start = time.perf_counter()
+        importlib.import_module(module_name)
+        startup_times.append(('import ' + module_name, time.perf_counter() - start))
+
+
+def print_startup_profile(parser_engine: str) -> None:
+    import sal_parser
+    import sal_semantic_checker
+
+    start = time.perf_counter()
+    sal_parser.get_parser(parser_engine)
+    startup_times.append(('parser {} ({})'.format(parser_engine, sal_parser.parsers_origin[parser_engine]),
+                          time.perf_counter() - start))
+    start = time.perf_counter()
+    sal_semantic_checker.prepare_global_scope()
+    startup_times.append(('prepare_global_scope', time.perf_counter() - start))
+
+    for name, elapsed in startup_times:
+        print('{:>40}: {:8.2f} ms'.format(name, elapsed * 1000), file=sys.stderr)
+    print('{:>40}: {:8.2f} ms'.format('total (since app start)', (time.perf_counter() - START_TIME) * 1000),
+          file=sys.stderr)
+
+
+def expand_sources(patterns: List[str]) -> List[str]:
+    """Список исходных файлов: шаблоны (glob) раскрываются, для каталогов берутся все файлы в них
+    """
+
+    sources = []
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            if os.path.isdir(path):
+                sources.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                      if os.path.isfile(os.path.join(path, name))))
+            else:
+                sources.append(path)
+    return sources
+
+
+def compile_batch(sources: List[str], out_dir: str, jobs: int, parser_engine: str, encoding: str,
+                  incremental: bool = False, use_cache: bool = True, cache_stats: bool = False,
+                  opt_level: int = 0, inline_budget: Optional[int] = None, drop_unused: bool = False,
+                  ir: bool = False, exe: bool = False) -> int:
+    """Пакетная компиляция: по одному .msil (с exe - .exe) на исходник в out_dir, файлы распределяются по процессам
+    :return: кол-во файлов с ошибками
+    """
+
+    out_paths = {}
+    for src_path in sources:
+        out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(src_path))[0] + ('.exe' if exe else '.msil'))
+        if out_path in out_paths.values():
+            raise SystemExit('Ошибка: несколько исходников компилируются в {}'.format(out_path))
+        out_paths[src_path] = out_path
+    os.makedirs(out_dir, exist_ok=True)
+
+    import program
+
+    inline = program.inline_options(inline_budget, drop_unused)
+    start = time.perf_counter()
+    failed = 0
+    cached_count = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=program.init_worker, initargs=(parser_engine,)) as executor:
+        chunksize = max(1, len(sources) // (jobs * 8))
+        results = executor.map(program.compile_file, sources, [out_paths[s] for s in sources],
+                               [parser_engine] * len(sources), [encoding] * len(sources),
+                               [incremental] * len(sources), [use_cache] * len(sources),
+                               [opt_level] * len(sources), [inline] * len(sources), [ir] * len(sources),
+                               [exe] * len(sources), chunksize=chunksize)
+        for src_path, error, elapsed, cached in results:
+            if error is None:
+                cached_count += cached
+                print('{:7}{:8.2f} ms  {} -> {}'.format('cached' if cached else 'ok', elapsed * 1000, src_path,
+                                                        out_paths[src_path]))
+            else:
+                failed += 1
+                print('error  {:8.2f} ms  {}: {}'.format(elapsed * 1000, src_path, error))
+    elapsed = time.perf_counter() - start
+    print('files: {}, ok: {}, errors: {}, jobs: {}, time: {:.2f} s ({:.1f} files/s)'.format(
+        len(sources), len(sources) - failed, failed, jobs, elapsed, len(sources) / elapsed))
+    if cache_stats:
+        size, count = program.get_unit_cache().usage()
+        print('cache: hits: {}, misses: {}, {} entries, {} bytes'.format(
+            cached_count, len(sources) - failed - cached_count if use_cache else 0, count, size), file=sys.stderr)
+    return failed
+
+
+def compile_remote(path: str, src: str, parser_engine: str, incremental: bool = False, use_cache: bool = True,
+                   opt_level: int = 0, inline_budget: Optional[int] = None, drop_unused: bool = False,
+                   ir: bool = False) -> bool:
+    """Компиляция через сервер (app.py --serve)
+    :return: False, если сервер недоступен
+    """
+
+    try:
+        response = sal_server.request(path, {'src': src, 'parser': parser_engine, 'incremental': incremental,
+                                             'cache': use_cache, 'opt': opt_level, 'inline_budget': inline_budget,
+                                             'drop_unused': drop_unused, 'ir': ir})
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+    except OSError as e:
+        # сервер запущен, но не ответил за sal_server.CLIENT_TIMEOUT: программа компилируется локально
+        print('сервер {} не отвечает ({}), локальная компиляция'.format(path, e), file=sys.stderr)
+        return False
+    if response['ok']:
+        print(response['msil'])
+    else:
+        print('Ошибка: {}'.format(response['error']))
+    return True
+
+
+def run_vm(path: str, encoding: Optional[str], parser_engine: str, opt_level: int, inline,
+           stats: bool = False, dump: bool = False) -> None:
+    """Выполнение программы встроенной виртуальной машиной (sal_vm)
+    """
+
+    import program
+    import sal_parser
+    import sal_semantic_base
+    import sal_vm
+
+    with open(path, mode='r', encoding=encoding) as f:
+        src = f.read()
+    try:
+        vm_program = program.compile_vm(src, parser_engine, opt_level, inline)
+        if dump:
+            print(*vm_program.dump(), sep=os.linesep, file=sys.stderr)
+        machine = sal_vm.Machine(vm_program)
+        try:
+            machine.run()
+        finally:
+            sys.stdout.flush()
+            if stats:
+                print('vm: {} instructions, {} calls, {:.2f} ms ({:.0f} instructions/s)'.format(
+                    machine.executed, machine.calls, machine.seconds * 1000,
+                    machine.executed / machine.seconds if machine.seconds else 0), file=sys.stderr)
+    except sal_parser.syntax_errors() as e:
+        print('Ошибка: {}'.format(sal_parser.syntax_error(e)[0]))
+        exit(1)
+    except (sal_semantic_base.SemanticException, sal_vm.VmException) as e:
+        print('Ошибка: {}'.format(e.message))
+        exit(1)
+
+
+def run_py(path: str, encoding: Optional[str], parser_engine: str, opt_level: int, inline,
+           use_cache: bool = True, stats: bool = False, dump: bool = False) -> None:
+    """Выполнение программы, скомпилированной в объект кода Python (sal_py)
+    """
+
+    import program
+    import sal_parser
+    import sal_py
+    import sal_semantic_base
+    import sal_vm
+
+    with open(path, mode='r', encoding=encoding) as f:
+        src = f.read()
+    try:
+        if dump:
+            print(program.python_source(src, parser_engine, opt_level, inline), file=sys.stderr)
+        start = time.perf_counter()
+        code, cached = program.compile_python(src, parser_engine, opt_level, inline, use_cache)
+        compile_time = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            sal_py.run(code)
+        finally:
+            sys.stdout.flush()
+            if stats:
+                print('py: compile {:.2f} ms ({}), run {:.2f} ms'.format(
+                    compile_time * 1000, 'cached' if cached else 'compiled', (time.perf_counter() - start) * 1000),
+                    file=sys.stderr)
+    except sal_parser.syntax_errors() as e:
+        print('Ошибка: {}'.format(sal_parser.syntax_error(e)[0]))
+        exit(1)
+    except (sal_semantic_base.SemanticException, sal_vm.VmException) as e:
+        print('Ошибка: {}'.format(e.message))
+        exit(1)
+
+
+def run_c(path: str, encoding: Optional[str], parser_engine: str, opt_level: int, inline,
+          cc: str, emit: bool = False, output: Optional[str] = None, stats: bool = False) -> None:
+    """Компиляция программы в C99 (sal_c): запись исходника (emit) или сборка компилятором C и запуск
+    """
+
+    import subprocess
+    import tempfile
+
+    import program
+    import sal_c
+    import sal_parser
+    import sal_semantic_base
+
+    with open(path, mode='r', encoding=encoding) as f:
+        src = f.read()
+    try:
+        source = program.c_source(src, parser_engine, opt_level, inline)
+        if emit:
+            if output is None:
+                sys.stdout.write(source)
+            else:
+                with open(output, mode='w', encoding='utf-8', newline='\n') as f:
+                    f.write(source)
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            exe_path = os.path.join(tmp_dir, 'program')
+            build_time = sal_c.build(source, exe_path, cc)
+            start = time.perf_counter()
+            returncode = subprocess.run([exe_path]).returncode
+            if stats:
+                print('c: {} build {:.2f} ms, run {:.2f} ms'.format(
+                    cc, build_time * 1000, (time.perf_counter() - start) * 1000), file=sys.stderr)
+    except sal_parser.syntax_errors() as e:
+        print('Ошибка: {}'.format(sal_parser.syntax_error(e)[0]))
+        exit(1)
+    except (sal_semantic_base.SemanticException, sal_c.CBuildException) as e:
+        print('Ошибка: {}'.format(e.message))
+        exit(1)
+    if returncode != 0:
+        exit(returncode)
 
 
 def main():
@@ -82,17 +329,173 @@ def main():
     #print(*prog.tree, sep=os.linesep)
 
     parser = argparse.ArgumentParser(description='Compiler demo program (msil)')
-    parser.add_argument('src', type=str, help='source code file')
+    parser.add_argument('src', type=str, nargs='*', help='source code file (several files, dirs or globs with --out-dir)')
     parser.add_argument('--msil-only', default=False, action='store_true', help='pring only msil code (no ast)')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='write msil to this file (streamed while generating, single source only)')
+    parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2), default=0,
+                        help='optimization level: -O1 - constant folding/propagation, dead code elimination, '
+                             '-O2 - also function inlining and msil peephole optimization (default -O0)')
+    parser.add_argument('--inline-budget', type=int, default=None,
+                        help='max inlined function body size in AST nodes, 0 - no inlining (-O2, default 40)')
+    parser.add_argument('--drop-unused-funcs', default=False, action='store_true',
+                        help='remove functions with no calls left after inlining (-O2)')
+    parser.add_argument('--inline-report', default=False, action='store_true',
+                        help='print inlined functions and calls count change to stderr (-O2)')
+    parser.add_argument('--exe', default=False, action='store_true',
+                        help='write CLI assembly (PE .exe) instead of msil, no ilasm needed '
+                             '(to -o file or <source>.exe, .exe per source with --out-dir)')
+    parser.add_argument('--run', default=False, action='store_true',
+                        help='run the program in the built-in bytecode VM (no msil, no Mono); '
+                             'вывод goes to stdout, ввод reads stdin')
+    parser.add_argument('--run-py', default=False, action='store_true',
+                        help='compile the program to a Python code object (cached by source hash) and run it '
+                             'in-process; вывод goes to stdout, ввод reads stdin')
+    parser.add_argument('--emit-c', default=False, action='store_true',
+                        help='write portable C99 source instead of msil (to -o file or stdout)')
+    parser.add_argument('--run-c', default=False, action='store_true',
+                        help='build the program from C99 source with a C compiler and run the native binary')
+    parser.add_argument('--cc', default='gcc', help='C compiler for --run-c (default gcc)')
+    parser.add_argument('--vm-stats', default=False, action='store_true',
+                        help='print executed VM instructions, calls and time to stderr (--run), '
+                             'compile/run time and cache status (--run-py), build/run time (--run-c)')
+    parser.add_argument('--dump-bytecode', default=False, action='store_true',
+                        help='print VM bytecode to stderr (--run)')
+    parser.add_argument('--dump-py', default=False, action='store_true',
+                        help='print generated Python source to stderr (--run-py)')
+    parser.add_argument('--ir', default=False, action='store_true',
+                        help='generate msil via typed three-address IR (basic blocks, IR passes)')
+    parser.add_argument('--dump-ir', default=False, action='store_true',
+                        help='print IR and IR pass timings to stderr (implies --ir)')
+    parser.add_argument('--peephole-stats', default=False, action='store_true',
+                        help='print peephole rules hit counters to stderr (-O2)')
+    parser.add_argument('--parser', default=None,
+                        help='parser engine: lalr (default), standalone or earley (original grammar, slow)')
+    parser.add_argument('--startup-profile', default=False, action='store_true',
+                        help='print import/initialization time breakdown to stderr')
+    parser.add_argument('--out-dir', type=str, default=None, help='batch mode: write one .msil per source to this dir')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='batch mode: worker processes')
+    parser.add_argument('--encoding', type=str, default=None, help='source files encoding (default: locale)')
+    parser.add_argument('--incremental', default=False, action='store_true',
+                        help='reuse checked/generated functions (алг) from cache, print cache hit/miss report')
+    parser.add_argument('--no-cache', default=False, action='store_true',
+                        help='do not use compiled units cache (msil only and batch modes)')
+    parser.add_argument('--cache-stats', default=False, action='store_true',
+                        help='print compiled units cache hit/miss report to stderr')
+    parser.add_argument('--serve', metavar='SOCKET', default=None, help='run warm compile server on unix socket')
+    parser.add_argument('--workers', type=int, default=1, help='compile server: worker threads')
+    parser.add_argument('--queue-size', type=int, default=sal_server.DEFAULT_QUEUE_SIZE,
+                        help='compile server: max queued requests (others get "busy")')
+    parser.add_argument('--server', metavar='SOCKET', default=None,
+                        help='compile via server started with --serve (msil only, local compile if not running)')
+    parser.add_argument('--server-stats', default=False, action='store_true', help='print compile server stats')
     args = parser.parse_args()
+    if args.dump_ir:
+        args.ir = True
 
-    with open(args.src, mode='r') as f:
-        src = f.read()
+    if args.server and args.server_stats:
+        try:
+            print(json.dumps(sal_server.request(args.server, {'cmd': 'stats'}), indent=2))
+        except (FileNotFoundError, ConnectionRefusedError):
+            print('Ошибка: сервер {} не запущен'.format(args.server))
+            exit(1)
+        except OSError as e:
+            print('Ошибка: сервер {} не отвечает ({})'.format(args.server, e))
+            exit(1)
+        return
+    if not args.src and args.serve is None:
+        parser.error('the following arguments are required: src')
+    if args.output is not None and (args.out_dir is not None or args.server):
+        parser.error('-o/--output cannot be used with --out-dir or --server')
+    if args.exe and args.server:
+        parser.error('--exe cannot be used with --server')
+    modes = [flag for flag, enabled in (('--run', args.run), ('--run-py', args.run_py), ('--emit-c', args.emit_c),
+                                        ('--run-c', args.run_c)) if enabled]
+    if len(modes) > 1:
+        parser.error('{} cannot be used with {}'.format(modes[0], modes[1]))
+    for flag in modes:
+        if args.exe or args.server or args.out_dir is not None or (args.output is not None and flag != '--emit-c'):
+            parser.error('{} cannot be used with --exe, --server, --out-dir or -o/--output'.format(flag))
+    if args.server and args.out_dir is None:
+        if len(args.src) > 1:
+            parser.error('several sources require --out-dir')
+        with open(args.src[0], mode='r', encoding=args.encoding) as f:
+            src = f.read()
+        if compile_remote(args.server, src, args.parser, args.incremental, not args.no_cache, args.opt_level,
+                          args.inline_budget, args.drop_unused_funcs, args.ir):
+            return
+        print('Сервер {} недоступен, локальная компиляция'.format(args.server), file=sys.stderr)
+        args.msil_only = True
+
+    import_compiler()
+    import program
+    import sal_parser
+
+    if args.parser is None:
+        args.parser = sal_parser.DEFAULT_ENGINE
+    elif args.parser not in sal_parser.ENGINES:
+        parser.error('unknown parser engine {} (choose from {})'.format(args.parser, ', '.join(sal_parser.ENGINES)))
+
+    if args.serve is not None:
+        sal_server.CompileServer(args.serve, args.workers, args.queue_size).serve_forever(args.parser)
+        return
+    if args.out_dir is not None:
+        sources = expand_sources(args.src)
+        if not sources:
+            parser.error('no source files found')
+        failed = compile_batch(sources, args.out_dir, args.jobs, args.parser, args.encoding, args.incremental,
+                               not args.no_cache, args.cache_stats, args.opt_level, args.inline_budget,
+                               args.drop_unused_funcs, args.ir, args.exe)
+        exit(1 if failed else 0)
+    if len(args.src) > 1:
+        parser.error('several sources require --out-dir')
+
+    if args.startup_profile:
+        print_startup_profile(args.parser)
+
+    if args.run:
+        run_vm(args.src[0], args.encoding, args.parser, args.opt_level,
+               program.inline_options(args.inline_budget, args.drop_unused_funcs), args.vm_stats, args.dump_bytecode)
+    elif args.run_py:
+        run_py(args.src[0], args.encoding, args.parser, args.opt_level,
+               program.inline_options(args.inline_budget, args.drop_unused_funcs), not args.no_cache, args.vm_stats,
+               args.dump_py)
+    elif args.emit_c or args.run_c:
+        run_c(args.src[0], args.encoding, args.parser, args.opt_level,
+              program.inline_options(args.inline_budget, args.drop_unused_funcs), args.cc, args.emit_c, args.output,
+              args.vm_stats)
+    elif args.exe:
+        out_path = args.output or os.path.splitext(args.src[0])[0] + '.exe'
+        _, error, elapsed, _ = program.compile_file(args.src[0], out_path, args.parser, args.encoding,
+                                                    args.incremental, not args.no_cache, args.opt_level,
+                                                    program.inline_options(args.inline_budget, args.drop_unused_funcs),
+                                                    args.ir, exe=True)
+        if error is not None:
+            print('Ошибка: {}'.format(error))
+            exit(1)
+        print('{} -> {} ({:.2f} ms)'.format(args.src[0], out_path, elapsed * 1000))
+    else:
+        with open(args.src[0], mode='r', encoding=args.encoding) as f:
+            src = f.read()
 
-    
+        # program.execute(prog)
+        if not program.execute(src, args.msil_only, args.parser, args.incremental, not args.no_cache, args.output,
+                               args.opt_level, program.inline_options(args.inline_budget, args.drop_unused_funcs),
+                               args.ir, args.dump_ir):
+            exit(1)
+    if args.incremental:
+        print('incremental: ' + program.get_func_cache().report(), file=sys.stderr)
+    if args.cache_stats:
+        print('cache: ' + program.get_unit_cache().report(), file=sys.stderr)
+    if args.peephole_stats:
+        print('peephole: ' + program.get_peephole().report(), file=sys.stderr)
+    if args.inline_report:
+        print('inline: {}'.format(program.get_inline_report()), file=sys.stderr)
+    if args.dump_ir:
+        print('ir passes: ' + program.get_ir_passes().report(), file=sys.stderr)
 
-    # program.execute(prog)
-    program.execute(src, args.msil_only)
+    if args.startup_profile:
+        print('{:>40}: {:8.2f} ms'.format('total', (time.perf_counter() - START_TIME) * 1000), file=sys.stderr)
 
 
 if __name__ == "__main__":
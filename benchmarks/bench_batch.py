@@ -0,0 +1,51 @@
+"""Масштабирование пакетной компиляции (app.py --out-dir) по числу процессов
+
+samples/ размножаются до --files файлов во временном каталоге.
+
+    python benchmarks/bench_batch.py [--files 2000] [--jobs 1,2,4]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from sal_corpus import ROOT_DIR, read_samples
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='batch compilation scaling benchmark')
+    arg_parser.add_argument('--files', type=int, default=2000, help='source files count')
+    arg_parser.add_argument('--jobs', default=None, help='comma separated worker counts (default: 1..cpu_count)')
+    args = arg_parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    if args.jobs:
+        jobs_list = [int(j) for j in args.jobs.split(',')]
+    else:
+        jobs_list = sorted({1, cpus} | {j for j in (2, 4, 8, 16) if j < cpus})
+    samples = read_samples()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src_dir = os.path.join(tmp_dir, 'src')
+        os.makedirs(src_dir)
+        for i in range(args.files):
+            with open(os.path.join(src_dir, '{}.txt'.format(i)), mode='w', encoding='utf-8') as f:
+                f.write(samples[i % len(samples)])
+
+        base = None
+        for jobs in jobs_list:
+            out_dir = os.path.join(tmp_dir, 'out{}'.format(jobs))
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'app.py'), '--out-dir', out_dir, '--jobs', str(jobs),
+                            '--encoding', 'utf-8', src_dir], check=True, stdout=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            print('jobs {:3}: {:8.2f} с, {:8.1f} файлов/с, ускорение x{:.2f} (cpu: {})'.format(
+                jobs, elapsed, args.files / elapsed, base / elapsed, cpus))
+
+
+if __name__ == "__main__":
+    main()
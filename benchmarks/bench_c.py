@@ -0,0 +1,88 @@
+"""Бэкенд C99 (sal_c): сборка gcc и время выполнения native-программ в сравнении с другими способами выполнения
+
+Программы samples/ с длинными циклами (bench_py) и программы bench_loops и bench_inline компилируются в C на
+-O0, -O1 и -O2, собираются компилятором C и выполняются; для сравнения те же программы выполняются объектом кода
+Python (sal_py), встроенной виртуальной машиной (sal_vm) и, если в PATH есть ilasm и mono, через MSIL и Mono.
+Вывод native-программы и значения глобальных переменных (печатаются в stderr) должны совпадать с vm.
+
+    python benchmarks/bench_c.py [--n 100000] [-O 0 1 2] [--cc gcc] [--cflags -std=c99 -O2]
+"""
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import bench_inline
+import bench_loops
+import bench_py
+import program
+import sal_c
+import sal_py
+from sal_vm import Machine, format_value
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='C backend (native binaries) runtime comparison')
+    arg_parser.add_argument('--n', type=int, default=100000, help='loop iterations')
+    arg_parser.add_argument('-O', dest='levels', type=int, nargs='+', choices=(0, 1, 2), default=[0, 1, 2],
+                            help='optimization levels')
+    arg_parser.add_argument('--cc', default=sal_c.CC, help='C compiler')
+    arg_parser.add_argument('--cflags', nargs='+', default=list(sal_c.CFLAGS), help='C compiler flags')
+    args = arg_parser.parse_args()
+    if sal_c.find_compiler(args.cc) is None:
+        arg_parser.error('C compiler {} not found'.format(args.cc))
+
+    programs = {}
+    for name, driver in bench_py.DRIVERS.items():
+        with open(os.path.join(bench_py.SAMPLES_DIR, name), mode='r', encoding='cp1251') as f:
+            programs[name] = f.read() + driver.format(n=args.n)
+    for name, template in dict(bench_loops.PROGRAMS, **bench_inline.PROGRAMS).items():
+        programs[name] = template.format(n=args.n)
+
+    ilasm, mono = shutil.which('ilasm'), shutil.which('mono')
+    print('{:<24}{:>4}{:>12}{:>10}{:>10}{:>10}{:>10}{:>10}'.format('программа', '-O', 'сборка, мс', 'c, мс',
+                                                                   'py, мс', 'vm, мс', 'mono, мс', 'c/vm'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        exe_path = os.path.join(tmp_dir, 'program')
+        for name, src in programs.items():
+            for level in args.levels:
+                stdout = io.StringIO()
+                machine = Machine(program.compile_vm(src, opt_level=level), stdout=stdout)
+                machine.run()
+
+                code, _ = program.compile_python(src, opt_level=level, use_cache=False)
+                start = time.perf_counter()
+                sal_py.run(code, stdout=io.StringIO())
+                py_time = time.perf_counter() - start
+
+                build_time = sal_c.build(program.c_source(src, opt_level=level, dump_globals=True), exe_path,
+                                         args.cc, args.cflags)
+                start = time.perf_counter()
+                res = subprocess.run([exe_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+                c_time = time.perf_counter() - start
+                expected = ''.join('g{}={}\n'.format(i, format_value(value)) for i, value in enumerate(machine.globals))
+                if res.stdout.decode() != stdout.getvalue() or res.stderr.decode() != expected:
+                    raise AssertionError('{}: результаты c и vm различаются на -O{}:\n{}\n{}'.format(
+                        name, level, res.stderr.decode(), expected))
+
+                mono_time = '-'
+                if ilasm is not None and mono is not None:
+                    mono_time = '{:.1f}'.format(bench_py.run_mono(program.compile_msil(src, opt_level=level), tmp_dir,
+                                                                  ilasm, mono)[1] * 1000)
+                print('{:<24}{:>4}{:>12.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10}{:>10.3f}'.format(
+                    name, level, build_time * 1000, c_time * 1000, py_time * 1000, machine.seconds * 1000, mono_time,
+                    c_time / machine.seconds))
+    if ilasm is None or mono is None:
+        print('ilasm или mono не найдены: путь MSIL + Mono не измерялся')
+    print('c - запуск собранной программы (вместе со стартом процесса); {} {}; вывод и глобальные переменные '
+          'проверены по vm'.format(args.cc, ' '.join(args.cflags)))
+
+
+if __name__ == "__main__":
+    main()
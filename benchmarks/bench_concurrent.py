@@ -0,0 +1,106 @@
+"""Одновременные компиляции в одном процессе (program.compile_in_context): пул потоков и asyncio
+
+Программы samples/, сгенерированные программы и программы с семантической и синтаксической ошибками
+компилируются с разными параметрами (-O0, -O1 инкрементально, -O2, -O2 через IR) сотнями одновременных компиляций:
+сначала из пула потоков (парсер и встроенные идентификаторы при этом создаются впервые), затем через
+run_in_executor в asyncio. Для каждой
+компиляции MSIL, диагностики и счетчики peephole-оптимизатора ее контекста должны совпасть с результатом
+последовательной компиляции той же программы.
+
+    python benchmarks/bench_concurrent.py [--compiles 400] [--threads 16] [--programs 20] [--lines 200]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from sal_corpus import generate_program, read_samples
+
+import program
+import sal_inline
+from sal_context import CompileContext, CompileOptions
+
+# семантическая ошибка в середине программы: диагностика с позицией
+ERROR_PROGRAM = '''цел i := 2
+лит s := "abc"
+i := s
+'''
+
+# синтаксическая ошибка (разбор не завершается): диагностика с позицией лексемы
+SYNTAX_ERROR_PROGRAM = '''цел i := 2
+если i > 1 то
+    i := (i + 1
+все
+'''
+
+OPTIONS = (
+    CompileOptions(opt_level=0),
+    CompileOptions(opt_level=1, incremental=True),
+    CompileOptions(opt_level=2, inline=sal_inline.InlineOptions()),
+    CompileOptions(opt_level=2, ir=True),
+)
+
+
+def compile_one(task: Tuple[str, CompileOptions]) -> Tuple:
+    src, options = task
+    ctx = CompileContext(options)
+    code = program.compile_in_context(src, ctx)
+    hits = tuple(sorted(ctx.peephole.hits.items())) if ctx.peephole is not None else ()
+    return tuple(code) if code is not None else None, tuple(ctx.diagnostics), hits
+
+
+async def compile_async(tasks: List[Tuple[str, CompileOptions]], executor: ThreadPoolExecutor) -> List[Tuple]:
+    loop = asyncio.get_running_loop()
+    return list(await asyncio.gather(*(loop.run_in_executor(executor, compile_one, task) for task in tasks)))
+
+
+def check(name: str, tasks: List[Tuple[str, CompileOptions]], results: List[Tuple], expected: dict) -> None:
+    for task, res in zip(tasks, results):
+        if res != expected[task]:
+            raise AssertionError('{}: результат компиляции отличается от последовательного ({})'.format(name, task[1]))
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='concurrent in-process compiles stress check')
+    arg_parser.add_argument('--compiles', type=int, default=400, help='concurrent compiles per run')
+    arg_parser.add_argument('--threads', type=int, default=16, help='thread pool size')
+    arg_parser.add_argument('--programs', type=int, default=20, help='generated programs count')
+    arg_parser.add_argument('--lines', type=int, default=200, help='generated program size')
+    args = arg_parser.parse_args()
+
+    sources = read_samples() + [generate_program(args.lines, seed=i) for i in range(args.programs)] + \
+        [ERROR_PROGRAM, SYNTAX_ERROR_PROGRAM]
+    unique = [(src, options) for src in sources for options in OPTIONS]
+    rnd = random.Random(0)
+    tasks = [rnd.choice(unique) for _ in range(args.compiles)]
+
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        start = time.perf_counter()
+        thread_results = list(executor.map(compile_one, tasks))
+        thread_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = {task: compile_one(task) for task in unique}
+        sequential_time = time.perf_counter() - start
+        check('пул потоков', tasks, thread_results, expected)
+
+        start = time.perf_counter()
+        async_results = asyncio.run(compile_async(tasks, executor))
+        async_time = time.perf_counter() - start
+        check('asyncio', tasks, async_results, expected)
+
+    errors = sum(1 for task in tasks if expected[task][1])
+    print('программ: {}, вариантов: {}, компиляций: {} (с ошибками: {}), потоков: {}'.format(
+        len(sources), len(unique), len(tasks), errors, args.threads))
+    print('последовательно: {:.1f} мс на {} вариантов ({:.2f} мс на компиляцию)'.format(
+        sequential_time * 1000, len(unique), sequential_time * 1000 / len(unique)))
+    for name, seconds in (('пул потоков', thread_time), ('asyncio', async_time)):
+        print('{}: {:.1f} мс ({:.2f} мс на компиляцию)'.format(name, seconds * 1000, seconds * 1000 / len(tasks)))
+    print('MSIL, диагностики и счетчики peephole всех компиляций совпадают с последовательными')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Стресс-тест глубоких AST: длинные левые цепочки выражений и глубокая вложенность операторов
+
+Разбор, семантический анализ, генерация MSIL и вывод дерева (AstNode.tree) не должны упираться
+в предел рекурсии Python (sys.getrecursionlimit()). Для длинного выражения дерево не выводится:
+отступы строк растут с глубиной, и размер вывода квадратичен по числу слагаемых.
+
+    python benchmarks/bench_deep.py [--terms 100000] [--depth 1000]
+"""
+
+import argparse
+import sys
+import time
+from typing import Callable, List
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import sal_parser
+import sal_semantic_checker
+import sal_msil
+
+
+def long_expr_program(terms: int) -> str:
+    expr = ' + '.join('x * {}'.format(i % 7 + 1) if i % 3 == 0 else str(i % 100) for i in range(terms))
+    return 'цел x := 1\nцел y := {}\n'.format(expr)
+
+
+def nested_program(depth: int) -> str:
+    # снаружи если, внутри нц пока: генератор MSIL проходит и вложенные ветви, и вложенные тела циклов
+    lines: List[str] = ['цел x := 1']
+    for i in range(depth):
+        indent = ' ' * (i % 40)
+        if i < depth // 2:
+            lines.append(indent + 'если x > {}'.format(i))
+            lines.append(indent + 'то')
+        else:
+            lines.append(indent + 'нц пока x > {}'.format(i))
+    lines.append('x := x + 1')
+    for i in reversed(range(depth)):
+        lines.append(' ' * (i % 40) + ('все' if i < depth // 2 else 'кц'))
+    return '\n'.join(lines) + '\n'
+
+
+def timed(name: str, func: Callable):
+    start = time.perf_counter()
+    res = func()
+    print('  {:>12}: {:8.3f} с'.format(name, time.perf_counter() - start))
+    return res
+
+
+def compile_stress(name: str, src: str, with_tree: bool = True) -> None:
+    print('{} ({} строк, {} символов):'.format(name, src.count('\n'), len(src)))
+    prog = timed('разбор', lambda: sal_parser.parse(src, 'lalr'))
+    checker = sal_semantic_checker.SemanticChecker()
+    scope = sal_semantic_checker.prepare_global_scope()
+    timed('семантика', lambda: checker.semantic_check(prog, scope))
+    gen = sal_msil.CodeGenerator()
+    timed('MSIL', lambda: gen.msil_gen_program(prog))
+    code = timed('метки', lambda: gen.code)
+    tree = timed('tree', lambda: prog.tree) if with_tree else ()
+    print('  {:>12}: {} строк MSIL, {} строк дерева'.format('итого', len(code), len(tree)))
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='deep AST stress benchmark')
+    arg_parser.add_argument('--terms', type=int, default=100000, help='terms in one expression')
+    arg_parser.add_argument('--depth', type=int, default=1000, help='nesting depth of если/нц пока')
+    args = arg_parser.parse_args()
+
+    print('предел рекурсии: {}'.format(sys.getrecursionlimit()))
+    sal_parser.get_parser('lalr')
+    compile_stress('выражение из {} слагаемых'.format(args.terms), long_expr_program(args.terms), False)
+    compile_stress('вложенность {}'.format(args.depth), nested_program(args.depth))
+
+
+if __name__ == "__main__":
+    main()
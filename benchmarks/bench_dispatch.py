@@ -0,0 +1,119 @@
+"""Скорость диспетчеризации visitor.on/when (вызовов в секунду)
+
+Сравнивается прежний Dispatcher (поиск по точному классу, при промахе - перебор всех целей через issubclass)
+и текущий (выбор по MRO с кэшем по конкретному классу) на узлах AST сгенерированной программы.
+
+    python benchmarks/bench_dispatch.py [--lines 2000] [--repeat 20]
+"""
+
+import argparse
+import time
+from typing import List
+
+from sal_corpus import generate_program
+
+import sal_parser
+import visitor
+from sal_ast import AstNode, ExprNode, StmtNode, IdentNode, NumNode, BinOpNode
+
+
+class LegacyDispatcher:
+    # так visitor.Dispatcher.__call__ работал до кэширования выбора по MRO
+    def __init__(self, param_index: int) -> None:
+        self.param_index = param_index
+        self.targets = {}
+
+    def __call__(self, *args, **kw):
+        typ = args[self.param_index].__class__
+        d = self.targets.get(typ)
+        if d is not None:
+            return d(*args, **kw)
+        else:
+            issub = issubclass
+            t = self.targets
+            ks = iter(t)
+            return [t[k](*args, **kw) for k in ks if issub(typ, k)]
+
+
+class Counter:
+    @visitor.on('node')
+    def visit(self, node):
+        pass
+
+    @visitor.when(IdentNode)
+    def visit(self, node):
+        return 1
+
+    @visitor.when(NumNode)
+    def visit(self, node):
+        return 2
+
+    @visitor.when(BinOpNode)
+    def visit(self, node):
+        return 3
+
+    @visitor.when(ExprNode)
+    def visit(self, node):
+        return 4
+
+    @visitor.when(StmtNode)
+    def visit(self, node):
+        return 5
+
+    @visitor.when(AstNode)
+    def visit(self, node):
+        return 6
+
+
+class LegacyCounter:
+    visit = LegacyDispatcher(1)
+
+
+def legacy_wrapper(dispatcher):
+    # прежний @when оборачивал диспетчер в функцию
+    def ff(*args, **kw):
+        return dispatcher(*args, **kw)
+
+    return ff
+
+
+def all_nodes(prog: AstNode) -> List[AstNode]:
+    res = []
+    stack = [prog]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, AstNode):
+            res.append(node)
+            stack.extend(node.children)
+    return res
+
+
+def measure(obj, nodes: List[AstNode], repeat: int) -> float:
+    visit = obj.visit
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for node in nodes:
+            visit(node)
+    return len(nodes) * repeat / (time.perf_counter() - start)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='visitor dispatch micro-benchmark')
+    arg_parser.add_argument('--lines', type=int, default=2000, help='generated program lines')
+    arg_parser.add_argument('--repeat', type=int, default=20, help='passes over AST nodes')
+    args = arg_parser.parse_args()
+
+    nodes = all_nodes(sal_parser.parse(generate_program(args.lines), 'lalr'))
+    print('узлов AST: {}, классов: {}'.format(len(nodes), len({type(n) for n in nodes})))
+
+    legacy = LegacyDispatcher(1)
+    for typ, target in Counter.visit.dispatcher.targets.items():
+        legacy.targets[typ] = target
+    LegacyCounter.visit = legacy_wrapper(legacy)
+
+    for name, obj in (('прежний', LegacyCounter()), ('текущий', Counter())):
+        print('{:>8}: {:12,.0f} вызовов/с'.format(name, measure(obj, nodes, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
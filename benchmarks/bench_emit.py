@@ -0,0 +1,66 @@
+"""Скорость вывода MSIL (МБ/с сгенерированного кода) и пиковая память генератора
+
+Сравнивается генерация в список строк с последующей записью файла и потоковая запись
+в файл (CodeGenerator(out)) на сгенерированной программе.
+
+    python benchmarks/bench_emit.py [--lines 50000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from sal_corpus import generate_program
+
+import sal_parser
+import sal_semantic_checker
+import sal_msil
+from sal_ast import StmtListNode
+
+
+def in_memory(prog: StmtListNode, path: str) -> None:
+    gen = sal_msil.CodeGenerator()
+    gen.msil_gen_program(prog)
+    with open(path, mode='w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(gen.code) + '\n')
+
+
+def streamed(prog: StmtListNode, path: str) -> None:
+    with open(path, mode='w', encoding='utf-8', newline='\n') as f:
+        sal_msil.CodeGenerator(f).msil_gen_program(prog)
+
+
+def measure(name: str, func: Callable[[StmtListNode, str], None], prog: StmtListNode, path: str) -> None:
+    start = time.perf_counter()
+    func(prog, path)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(path)
+    tracemalloc.start()
+    func(prog, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{:>10}: {:8.3f} с, {:6.2f} МБ/с, пиковая память {:8.2f} МБ'.format(
+        name, elapsed, size / 1024 / 1024 / elapsed, peak / 1024 / 1024))
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='MSIL emission throughput benchmark')
+    arg_parser.add_argument('--lines', type=int, default=50000, help='generated program lines')
+    args = arg_parser.parse_args()
+
+    prog = sal_parser.parse(generate_program(args.lines), 'lalr')
+    sal_semantic_checker.SemanticChecker().semantic_check(prog, sal_semantic_checker.prepare_global_scope())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'out.msil')
+        in_memory(prog, path)
+        print('MSIL: {:.2f} МБ'.format(os.path.getsize(path) / 1024 / 1024))
+        measure('в память', in_memory, prog, path)
+        measure('поток', streamed, prog, path)
+
+
+if __name__ == "__main__":
+    main()
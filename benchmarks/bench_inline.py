@@ -0,0 +1,114 @@
+"""Встраивание функций: что встроено и сколько вызовов остается на -O1 (без встраивания) и -O2
+
+Для каждой программы печатаются вызовы пользовательских функций в тексте программы (статически, по отчету
+sal_inline), выполненные вызовы и выполненные инструкции MSIL (встроенный интерпретатор из bench_loops, без Mono).
+Результаты (глобальные переменные) на обоих уровнях должны совпадать.
+
+    python benchmarks/bench_inline.py [--n 1000] [--budget 40] [--drop-unused]
+"""
+
+import argparse
+from typing import Dict, Tuple
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import program
+from bench_loops import Interpreter, load_methods
+from sal_inline import InlineOptions, InlineReport
+
+PROGRAMS = {
+    'счетчик в цикле': '''
+        цел total := 0
+        алг Add(арг цел x)
+        нач
+            total := total + x
+        кон
+        цел i
+        нц для i от 1 до {n}
+            Add(i)
+        кц
+    ''',
+    'цепочка вызовов': '''
+        цел acc := 0
+        алг Step(арг цел x, цел k)
+        нач
+            acc := acc + x * k
+        кон
+        алг Twice(арг цел x)
+        нач
+            Step(x, 1)
+            Step(x, 2)
+        кон
+        алг Run(арг цел n)
+        нач
+            цел i
+            нц для i от 1 до n
+                Twice(i)
+            кц
+        кон
+        Run({n})
+    ''',
+    'локальные в цикле': '''
+        вещ sum := 0.0
+        алг Mix(арг цел i)
+        нач
+            вещ t
+            если i > 3 то
+                t := t + 0.5
+            все
+            sum := sum + t
+        кон
+        цел i
+        нц для i от 1 до {n}
+            Mix(i)
+        кц
+    ''',
+    'рез не встраивается': '''
+        цел r := 0
+        алг Sq(арг цел x, рез цел y)
+        нач
+            y := x * x
+        кон
+        алг Acc(арг цел x)
+        нач
+            r := r + Sq(x)
+        кон
+        цел i
+        нц для i от 1 до {n}
+            Acc(i)
+        кц
+    ''',
+}
+
+
+def execute(src: str, level: int, options: InlineOptions) -> Tuple[int, int, Dict[str, object]]:
+    interpreter = Interpreter(load_methods(program.compile_msil(src, opt_level=level, inline=options)))
+    interpreter.run()
+    return interpreter.calls, interpreter.executed, interpreter.statics
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='function inlining benchmark')
+    arg_parser.add_argument('--n', type=int, default=1000, help='loop iterations')
+    arg_parser.add_argument('--budget', type=int, default=InlineOptions().budget, help='inline budget (AST nodes)')
+    arg_parser.add_argument('--drop-unused', default=False, action='store_true', help='drop unreferenced functions')
+    args = arg_parser.parse_args()
+
+    options = InlineOptions(args.budget, args.drop_unused)
+    print('{:<22}{:>14}{:>18}{:>22}'.format('программа', 'вызовы (текст)', 'вызовы (-O1/-O2)', 'инструкции (-O1/-O2)'))
+    for name, template in PROGRAMS.items():
+        src = template.format(n=args.n)
+        report = InlineReport()
+        program.inline_report = report
+        calls1, executed1, results1 = execute(src, 1, options)
+        calls2, executed2, results2 = execute(src, 2, options)
+        if results1 != results2:
+            raise AssertionError('{}: результаты -O1 и -O2 различаются: {} {}'.format(name, results1, results2))
+        print('{:<22}{:>14}{:>18}{:>22}'.format(
+            name, '{} -> {}'.format(report.calls_before, report.calls_after), '{} / {}'.format(calls1, calls2),
+            '{} / {}'.format(executed1, executed2)))
+        print('    ' + str(report))
+
+
+if __name__ == "__main__":
+    main()
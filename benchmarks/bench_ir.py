@@ -0,0 +1,53 @@
+"""Генерация MSIL через IR (sal_ir) и напрямую из AST (CodeGenerator): размер кода и выполняемые инструкции
+
+Программы из bench_loops и bench_inline компилируются обоими путями на -O0, -O1 и -O2 и выполняются
+встроенным интерпретатором MSIL (без Mono). Результаты (глобальные переменные) обоих путей должны совпадать.
+После таблицы печатается время построения IR и каждого прохода.
+
+    python benchmarks/bench_ir.py [--n 1000]
+"""
+
+import argparse
+from typing import Dict, Tuple
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import bench_inline
+import bench_loops
+import program
+from bench_loops import Interpreter, load_methods
+
+
+def execute(src: str, level: int, ir: bool) -> Tuple[int, int, Dict[str, object]]:
+    code = program.compile_msil(src, opt_level=level, ir=ir)
+    interpreter = Interpreter(load_methods(code))
+    interpreter.run()
+    size = sum(1 for line in code if line.strip() and not line.strip().startswith(('.', '{', '}')))
+    return size, interpreter.executed, interpreter.statics
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='MSIL via IR vs AST benchmark')
+    arg_parser.add_argument('--n', type=int, default=1000, help='loop iterations')
+    args = arg_parser.parse_args()
+
+    levels = (0, 1, 2)
+    programs = dict(bench_loops.PROGRAMS, **bench_inline.PROGRAMS)
+    print('{:<24}'.format('программа') + ''.join('{:>22}'.format('-O{} ast/ir'.format(level)) for level in levels))
+    for name, template in programs.items():
+        src = template.format(n=args.n)
+        cells = []
+        for level in levels:
+            size1, executed1, results1 = execute(src, level, False)
+            size2, executed2, results2 = execute(src, level, True)
+            if results1 != results2:
+                raise AssertionError('{}: результаты AST и IR различаются на -O{}: {} {}'.format(
+                    name, level, results1, results2))
+            cells.append('{}/{} {}/{}'.format(size1, size2, executed1, executed2))
+        print('{:<24}'.format(name) + ''.join('{:>22}'.format(cell) for cell in cells))
+    print('инструкций в коде / выполнено')
+    print('ir passes: ' + program.get_ir_passes().report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Инструкции MSIL, выполняемые за итерацию цикла (нц для / нц пока / нц ... кц_при), на -O0, -O1 и -O2
+
+Программы компилируются в MSIL и выполняются встроенным интерпретатором подмножества MSIL, которое выдает
+CodeGenerator (без Mono). Каждая программа запускается с n и 2 * n итерациями, инструкций за итерацию -
+разность количеств выполненных инструкций, деленная на n. Результаты (глобальные переменные)
+на всех уровнях оптимизации должны совпадать.
+
+    python benchmarks/bench_loops.py [--n 1000]
+"""
+
+import argparse
+import re
+import time
+from typing import Dict, List, Tuple
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import program
+from sal_optimizer import int32, int_div
+from sal_peephole import BRANCHES, Line, parse_lines
+
+PROGRAMS = {
+    'для: сумма': '''
+        алг Sum(арг цел n, рез цел s)
+        нач
+            цел i
+            s := 0
+            нц для i от 1 до n
+                s := s + i
+            кц
+        кон
+        цел r := Sum({n})
+    ''',
+    'для: вложенные': '''
+        алг Grid(арг цел n, рез цел s)
+        нач
+            цел i
+            цел j
+            нц для i от 1 до n
+                нц для j от 1 до 4
+                    s := s + i * j
+                кц
+            кц
+        кон
+        цел r := Grid({n})
+    ''',
+    'пока: счетчик': '''
+        алг Count(арг цел n, рез цел s)
+        нач
+            цел i := 0
+            нц пока i < n
+                i := i + 1
+                s := s + i * 2
+            кц
+        кон
+        цел r := Count({n})
+    ''',
+    'кц_при: обратный счет': '''
+        алг Down(арг цел n, рез цел s)
+        нач
+            цел j := n
+            нц
+                s := s + j
+                j := j - 1
+            кц_при j > 0
+        кон
+        цел r := Down({n})
+    ''',
+    'для: вещ, если': '''
+        алг Mix(арг цел n, рез вещ x)
+        нач
+            цел i
+            нц для i от 1 до n
+                если i > n / 2 то
+                    x := x + 0.5
+                иначе
+                    x := x - 0.25
+                все
+            кц
+        кон
+        вещ r := Mix({n})
+    ''',
+    'глобальный цикл': '''
+        цел i
+        цел s := 0
+        нц для i от 1 до {n}
+            s := s + i
+        кц
+    ''',
+}
+
+METHOD_RE = re.compile(r'\.method public static \S+ (\w+)\(')
+
+
+class Method:
+    def __init__(self, code: List[Line]) -> None:
+        self.code = [line for line in code if line.op is not None or line.label is not None]
+        self.labels = {line.label: i for i, line in enumerate(self.code) if line.label is not None}
+
+
+def load_methods(lines: List[str]) -> Dict[str, Method]:
+    methods: Dict[str, Method] = {}
+    name, body = None, []
+    for line in lines:
+        m = METHOD_RE.search(line)
+        if m:
+            name, body = m.group(1), []
+        elif name is not None and line == '  }':
+            methods[name] = Method(parse_lines(body))
+            name = None
+        elif name is not None:
+            body.append(line)
+    return methods
+
+
+def short_arg(line: Line) -> int:
+    """Индекс/значение инструкции (ldloc 4, ldloc.s 4, ldloc.0, ldc.i4.m1)
+    """
+
+    if line.arg is not None:
+        return int(line.arg)
+    suffix = line.op.rsplit('.', 1)[1]
+    return -1 if suffix == 'm1' else int(suffix)
+
+
+class Interpreter:
+    """Интерпретатор подмножества MSIL, которое выдает CodeGenerator; считает выполненные инструкции
+    """
+
+    def __init__(self, methods: Dict[str, Method]) -> None:
+        self.methods = methods
+        self.statics: Dict[str, object] = {}
+        self.executed = 0
+        # выполненные вызовы методов Program (без библиотеки времени выполнения)
+        self.calls = 0
+
+    def run(self) -> None:
+        self.call('Main', [])
+
+    def call(self, name: str, args: list):
+        method = self.methods[name]
+        code, labels = method.code, method.labels
+        locals_ = [0] * 256
+        stack: list = []
+        pc = 0
+        while pc < len(code):
+            line = code[pc]
+            pc += 1
+            op = line.op
+            if op is None:
+                continue
+            self.executed += 1
+            base = op[:-2] if op.endswith('.s') else op
+            if base in BRANCHES:
+                if base == 'br':
+                    taken = True
+                elif base in ('brtrue', 'brfalse'):
+                    taken = bool(stack.pop()) == (base == 'brtrue')
+                else:
+                    b, a = stack.pop(), stack.pop()
+                    # .un для вещественных: переход и при неупорядоченных операндах (NaN)
+                    taken = {'beq': a == b, 'bne.un': a != b, 'bgt': a > b, 'blt': a < b,
+                             'bge': a >= b, 'ble': a <= b, 'bgt.un': not a <= b, 'blt.un': not a >= b,
+                             'bge.un': not a < b, 'ble.un': not a > b}[base]
+                if taken:
+                    pc = labels[line.arg]
+            elif op.startswith('ldc.i4'):
+                stack.append(short_arg(line))
+            elif op == 'ldc.r8':
+                stack.append(float(line.arg))
+            elif op == 'ldstr':
+                stack.append(line.arg[1:-1])
+            elif op.startswith('ldloc'):
+                stack.append(locals_[short_arg(line)])
+            elif op.startswith('stloc'):
+                locals_[short_arg(line)] = stack.pop()
+            elif op.startswith('ldarg'):
+                stack.append(args[short_arg(line)])
+            elif op.startswith('starg'):
+                args[short_arg(line)] = stack.pop()
+            elif op == 'ldsfld':
+                stack.append(self.statics.get(line.arg.split('::')[1], 0))
+            elif op == 'stsfld':
+                self.statics[line.arg.split('::')[1]] = stack.pop()
+            elif op == 'dup':
+                stack.append(stack[-1])
+            elif op == 'pop':
+                stack.pop()
+            elif op == 'ret':
+                return stack.pop() if stack else None
+            elif op == 'call':
+                callee = line.arg.split('::')[1]
+                callee_name, params = callee[:-1].split('(')
+                count = len(params.split(',')) if params else 0
+                call_args = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                if 'CompilerDemo.Runtime' in line.arg:
+                    result = float(call_args[0]) if line.arg.split()[0] == 'float64' else int(call_args[0])
+                else:
+                    self.calls += 1
+                    result = self.call(callee_name, call_args)
+                if not line.arg.startswith('void'):
+                    stack.append(result)
+            else:
+                b, a = stack.pop(), stack.pop()
+                if op == 'add':
+                    res = a + b
+                elif op == 'sub':
+                    res = a - b
+                elif op == 'mul':
+                    res = a * b
+                elif op == 'div':
+                    res = int_div(a, b) if isinstance(a, int) else a / b
+                elif op in ('and', 'or'):
+                    res = a & b if op == 'and' else a | b
+                elif op in ('cgt', 'clt', 'ceq'):
+                    res = int(a > b if op == 'cgt' else a < b if op == 'clt' else a == b)
+                else:
+                    raise ValueError('Инструкция не поддерживается: ' + op)
+                stack.append(int32(res) if isinstance(res, int) else res)
+        return None
+
+
+def execute(src: str, level: int) -> Tuple[int, Dict[str, object]]:
+    interpreter = Interpreter(load_methods(program.compile_msil(src, opt_level=level)))
+    interpreter.run()
+    return interpreter.executed, interpreter.statics
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='MSIL instructions per loop iteration benchmark')
+    arg_parser.add_argument('--n', type=int, default=1000, help='loop iterations')
+    args = arg_parser.parse_args()
+
+    levels = (0, 1, 2)
+    print('{:<24}'.format('программа') + ''.join('{:>10}'.format('-O{}'.format(level)) for level in levels))
+    start = time.perf_counter()
+    for name, template in PROGRAMS.items():
+        per_iteration = []
+        results = []
+        for level in levels:
+            executed1, statics = execute(template.format(n=args.n), level)
+            executed2, _ = execute(template.format(n=2 * args.n), level)
+            per_iteration.append((executed2 - executed1) / args.n)
+            results.append(statics)
+        if any(res != results[0] for res in results):
+            raise AssertionError('{}: результаты на разных уровнях оптимизации различаются: {}'.format(name, results))
+        print('{:<24}'.format(name) + ''.join('{:>10.2f}'.format(count) for count in per_iteration))
+    print('инструкций за итерацию (интерпретатор MSIL: {:.2f} с)'.format(time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Память, занимаемая AST-деревом большой программы (по умолчанию ~1M узлов)
+
+Узлы AST используют __slots__. Для сравнения строится копия дерева из объектов прежнего вида
+(атрибуты узла в __dict__ экземпляра, как было до перехода на __slots__) с теми же значениями атрибутов.
+
+    python benchmarks/bench_memory.py [--nodes 1000000]
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Type
+
+from sal_corpus import generate_program
+
+import sal_parser
+from sal_ast import AstNode
+
+
+def all_nodes(prog: AstNode) -> List[AstNode]:
+    res = []
+    stack = [prog]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, AstNode):
+            continue
+        res.append(node)
+        stack.extend(node.children)
+    return res
+
+
+def slot_names(cls: type) -> List[str]:
+    names = []
+    for c in reversed(cls.__mro__):
+        names.extend(c.__dict__.get('__slots__', ()))
+    return names
+
+
+def legacy_copy(nodes: List[AstNode]) -> list:
+    """Копии узлов с атрибутами в __dict__ (значения атрибутов общие с исходными узлами)
+    """
+
+    classes: Dict[type, Type] = {}
+    res = []
+    for node in nodes:
+        cls = type(node)
+        if cls not in classes:
+            classes[cls] = (type('Legacy' + cls.__name__, (), {}), slot_names(cls))
+        legacy_cls, names = classes[cls]
+        obj = legacy_cls()
+        for name in names:
+            setattr(obj, name, getattr(node, name, None))
+        res.append(obj)
+    return res
+
+
+def node_bytes(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='AST memory benchmark')
+    arg_parser.add_argument('--nodes', type=int, default=1000000, help='approximate AST nodes count')
+    args = arg_parser.parse_args()
+
+    sample = generate_program(1000)
+    sample_nodes = len(all_nodes(sal_parser.parse(sample, 'lalr')))
+    src = generate_program(max(1, int(args.nodes / sample_nodes * 1000)))
+    print('исходник: {:.1f} МБ, {} строк'.format(len(src.encode('utf-8')) / 1024 / 1024, src.count('\n')))
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    prog = sal_parser.parse(src, 'lalr')
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    ast_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = all_nodes(prog)
+    print('узлов AST: {}, разбор: {:.2f} с'.format(len(nodes), elapsed))
+    print('AST целиком (узлы, кортежи детей, строки): {:8.1f} МБ, {:6.1f} байт на узел'.format(
+        ast_size / 1024 / 1024, ast_size / len(nodes)))
+
+    slots_size = sum(node_bytes(node) for node in nodes)
+    print('__slots__: {:8.1f} МБ, {:6.1f} байт на узел'.format(slots_size / 1024 / 1024, slots_size / len(nodes)))
+
+    gc.collect()
+    tracemalloc.start()
+    legacy = legacy_copy(nodes)
+    legacy_traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    legacy_size = sum(node_bytes(obj) for obj in legacy)
+    print('__dict__:  {:8.1f} МБ, {:6.1f} байт на узел (tracemalloc: {:.1f} байт на узел)'.format(
+        legacy_size / 1024 / 1024, legacy_size / len(nodes), legacy_traced / len(nodes)))
+    print('экономия: {:.1f} МБ ({:.0f}%)'.format(
+        (legacy_size - slots_size) / 1024 / 1024, (1 - slots_size / legacy_size) * 100))
+
+
+if __name__ == "__main__":
+    main()
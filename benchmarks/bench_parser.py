@@ -0,0 +1,50 @@
+"""Сравнение движков sal_parser: одинаковость AST и скорость разбора (строк/с)
+
+    python benchmarks/bench_parser.py [--lines 1000] [--files 3] [--engines lalr,standalone]
+"""
+
+import argparse
+import time
+from typing import List, Tuple
+
+from sal_corpus import generate_program, read_samples
+
+import sal_parser
+from sal_ast import AstNode
+
+
+def ast_dump(node: AstNode) -> Tuple:
+    if not isinstance(node, AstNode):
+        return repr(node),
+    return (type(node).__name__, node.to_str_full()) + tuple(ast_dump(child) for child in node.children)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='sal_parser engines benchmark')
+    arg_parser.add_argument('--lines', type=int, default=1000, help='lines in each generated program')
+    arg_parser.add_argument('--files', type=int, default=3, help='generated programs count')
+    arg_parser.add_argument('--engines', default=','.join(sal_parser.ENGINES), help='engines to compare')
+    args = arg_parser.parse_args()
+
+    engines: List[str] = args.engines.split(',')
+    corpus = read_samples() + [generate_program(args.lines, seed) for seed in range(args.files)]
+
+    for i, src in enumerate(corpus):
+        dumps = {engine: ast_dump(sal_parser.parse(src, engine)) for engine in engines}
+        for engine in engines[1:]:
+            if dumps[engine] != dumps[engines[0]]:
+                raise SystemExit('AST {} != {} (программа #{})'.format(engine, engines[0], i))
+    print('AST совпадают: {} программ, движки: {}'.format(len(corpus), ', '.join(engines)))
+
+    total_lines = sum(src.count('\n') + 1 for src in corpus)
+    for engine in engines:
+        sal_parser.get_parser(engine)
+        start = time.perf_counter()
+        for src in corpus:
+            sal_parser.parse(src, engine)
+        elapsed = time.perf_counter() - start
+        print('{:>10}: {:8.3f} с, {:10.0f} строк/с'.format(engine, elapsed, total_lines / elapsed))
+
+
+if __name__ == "__main__":
+    main()
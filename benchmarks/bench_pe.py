@@ -0,0 +1,72 @@
+"""Сборка .exe напрямую (sal_pe) и через текст MSIL + ilasm: время от исходника до сборки
+
+Для сгенерированных программ разного размера измеряется: компиляция в MSIL и запись .msil, запуск ilasm
+(если он есть в PATH), компиляция и запись .exe через sal_pe. Каждая записанная сборка проверяется
+структурным читателем (pe_reader) и сравнивается по инструкциям с MSIL.
+
+    python benchmarks/bench_pe.py [--lines 1000 5000 20000] [-O 2]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from sal_corpus import generate_program
+
+import program
+import sal_pe
+from pe_reader import PeImage, compare
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='direct PE emission vs msil + ilasm benchmark')
+    arg_parser.add_argument('--lines', type=int, nargs='+', default=[1000, 5000, 20000], help='program sizes')
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2), default=2, help='optimization level')
+    args = arg_parser.parse_args()
+
+    ilasm = shutil.which('ilasm')
+    print('{:>8}{:>12}{:>12}{:>12}{:>12}{:>12}'.format('строк', 'msil, мс', 'ilasm, мс', 'exe, мс', 'pe, мс',
+                                                     'exe, КБ'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        msil_path = os.path.join(tmp_dir, 'program.msil')
+        exe_path = os.path.join(tmp_dir, 'program.exe')
+        for lines in args.lines:
+            src = generate_program(lines)
+
+            start = time.perf_counter()
+            code = program.compile_msil(src, opt_level=args.opt_level)
+            with open(msil_path, mode='w', encoding='utf-8', newline='\n') as f:
+                f.write('\n'.join(code) + '\n')
+            msil_time = time.perf_counter() - start
+            ilasm_time = None
+            if ilasm is not None:
+                start = time.perf_counter()
+                subprocess.run([ilasm, '/quiet', '/output:' + os.path.join(tmp_dir, 'ilasm.exe'), msil_path],
+                               check=True, stdout=subprocess.DEVNULL)
+                ilasm_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            code = program.compile_msil(src, opt_level=args.opt_level)
+            pe_start = time.perf_counter()
+            image = sal_pe.assemble(code)
+            with open(exe_path, mode='wb') as f:
+                f.write(image)
+            exe_time = time.perf_counter() - start
+            pe_time = time.perf_counter() - pe_start
+
+            reader = PeImage(image)
+            reader.verify()
+            compare(reader, code)
+            print('{:>8}{:>12.1f}{:>12}{:>12.1f}{:>12.1f}{:>12.1f}'.format(
+                lines, msil_time * 1000, '-' if ilasm_time is None else '{:.1f}'.format(ilasm_time * 1000),
+                exe_time * 1000, pe_time * 1000, len(image) / 1024))
+    if ilasm is None:
+        print('ilasm не найден: время сборки через текст - только компиляция и запись .msil')
+    print('msil + ilasm = .msil, затем ilasm; exe = компиляция + sal_pe (pe) + запись; сборки проверены pe_reader')
+
+
+if __name__ == "__main__":
+    main()
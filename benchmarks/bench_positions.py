@@ -0,0 +1,86 @@
+"""Память и время вычисления позиций узлов AST на большом исходнике
+
+Сравнивается прежняя посимвольная таблица позиций (список (row, col) на каждый символ исходника)
+и разбор, в котором позиции узлов берутся из токенов lark.
+
+    python benchmarks/bench_positions.py [--size-mb 10]
+"""
+
+import argparse
+import resource
+import time
+import tracemalloc
+from typing import List, Tuple
+
+from sal_corpus import generate_program
+
+import sal_parser
+from sal_ast import AstNode
+
+
+def legacy_locs(prog: str) -> List[Tuple[int, int]]:
+    # так позиции вычислялись в sal_parser.parse до перехода на позиции токенов
+    locs = []
+    row, col = 0, 0
+    for c in prog:
+        if c == '\n':
+            row += 1
+            col = 0
+        elif c == '\r':
+            pass
+        else:
+            col += 1
+        locs.append((row, col))
+    return locs
+
+
+def count_positioned(node: AstNode) -> Tuple[int, int]:
+    total, positioned = 0, 0
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if not isinstance(n, AstNode):
+            continue
+        total += 1
+        positioned += n.row is not None
+        stack.extend(n.children)
+    return total, positioned
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='AST positions memory/latency benchmark')
+    arg_parser.add_argument('--size-mb', type=float, default=10, help='source size in MB')
+    args = arg_parser.parse_args()
+
+    sample = generate_program(1000)
+    lines = int(args.size_mb * 1024 * 1024 / len(sample.encode('utf-8')) * sample.count('\n'))
+    src = generate_program(lines)
+    size = len(src.encode('utf-8'))
+    print('исходник: {:.1f} МБ, {} строк, {} символов'.format(size / 1024 / 1024, src.count('\n'), len(src)))
+
+    sal_parser.get_parser('lalr')
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    prog = sal_parser.parse(src, 'lalr')
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    total, positioned = count_positioned(prog)
+    print('разбор (позиции токенов): {:8.3f} с, {:.0f} строк/с, прирост max RSS {:.1f} МБ'.format(
+        elapsed, src.count('\n') / elapsed, (rss_after - rss_before) / 1024))
+    print('узлов AST: {}, с позицией: {}'.format(total, positioned))
+
+    del prog
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    locs = legacy_locs(src)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del locs
+    print('посимвольная таблица: {:8.3f} с, {:8.1f} МБ ({:.1f} байт на байт исходника)'.format(
+        elapsed, peak / 1024 / 1024, peak / size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Компиляция в объект кода Python (sal_py): время компиляции (без кэша и из кэша) и выполнения
+
+Программы samples/ дополняются длинным циклом, вызывающим их функции (или повторяющим их код), и выполняются
+объектом кода Python и встроенной виртуальной машиной (sal_vm); глобальные переменные после выполнения должны
+совпадать. Если в PATH есть ilasm и mono, та же программа собирается из MSIL и выполняется Mono.
+
+    python benchmarks/bench_py.py [--n 100000] [-O 0 1 2]
+"""
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import program
+import sal_py
+from sal_vm import Machine
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'samples')
+
+# цикл, дописываемый к программе из samples/
+DRIVERS = {
+    '1.txt': '''
+цел k
+нц для k от 1 до {n}
+    F()
+кц
+''',
+    '2.txt': '''
+цел s := 0
+цел k
+нц для k от 1 до {n}
+    s := s + i
+    i := i + k
+кц
+''',
+    '3.txt': '''
+цел s := 0
+цел k
+нц для k от 1 до {n}
+    s := s + Func(0)
+кц
+''',
+    '4.txt': '''
+цел s := 0
+цел k
+нц для k от 1 до {n}
+    s := s + Test(k)
+кц
+''',
+}
+
+
+def run_mono(code, tmp_dir: str, ilasm: str, mono: str):
+    """Сборка MSIL через ilasm и выполнение Mono: (время сборки, время выполнения)
+    """
+
+    msil_path = os.path.join(tmp_dir, 'program.msil')
+    exe_path = os.path.join(tmp_dir, 'program.exe')
+    with open(msil_path, mode='w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(code) + '\n')
+    start = time.perf_counter()
+    subprocess.run([ilasm, '/quiet', '/output:' + exe_path, msil_path], check=True, stdout=subprocess.DEVNULL)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    subprocess.run([mono, exe_path], check=True, stdout=subprocess.DEVNULL)
+    return build_time, time.perf_counter() - start
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='Python code object backend benchmark')
+    arg_parser.add_argument('--n', type=int, default=100000, help='loop iterations')
+    arg_parser.add_argument('-O', dest='levels', type=int, nargs='+', choices=(0, 1, 2), default=[0, 1, 2],
+                            help='optimization levels')
+    args = arg_parser.parse_args()
+
+    ilasm, mono = shutil.which('ilasm'), shutil.which('mono')
+    print('{:<8}{:>4}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}'.format(
+        'пример', '-O', 'py комп, мс', 'кэш, мс', 'py, мс', 'vm, мс', 'ilasm, мс', 'mono, мс'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = sal_py.CodeCache(os.path.join(tmp_dir, 'python'))
+        for name, driver in DRIVERS.items():
+            with open(os.path.join(SAMPLES_DIR, name), mode='r', encoding='cp1251') as f:
+                src = f.read() + driver.format(n=args.n)
+            for level in args.levels:
+                key = cache.key(src, str(level))
+                start = time.perf_counter()
+                cache.put(key, sal_py.compile_source(program.python_source(src, opt_level=level)))
+                compile_time = time.perf_counter() - start
+                cache.memory.clear()
+                start = time.perf_counter()
+                code = cache.get(key)
+                cached_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                namespace = sal_py.run(code, stdout=io.StringIO())
+                py_time = time.perf_counter() - start
+
+                machine = Machine(program.compile_vm(src, opt_level=level), stdout=io.StringIO())
+                machine.run()
+                expected = dict(enumerate(machine.globals))
+                if sal_py.program_globals(namespace) != expected:
+                    raise AssertionError('{}: результаты py и vm различаются на -O{}: {} {}'.format(
+                        name, level, sal_py.program_globals(namespace), expected))
+
+                mono_times = ('-', '-')
+                if ilasm is not None and mono is not None:
+                    mono_times = tuple('{:.1f}'.format(t * 1000) for t in run_mono(
+                        program.compile_msil(src, opt_level=level), tmp_dir, ilasm, mono))
+                print('{:<8}{:>4}{:>12.2f}{:>12.2f}{:>12.1f}{:>12.1f}{:>12}{:>12}'.format(
+                    name, level, compile_time * 1000, cached_time * 1000, py_time * 1000, machine.seconds * 1000,
+                    *mono_times))
+    if ilasm is None or mono is None:
+        print('ilasm или mono не найдены: путь MSIL + Mono не измерялся')
+    print('py комп - генерация и compile() без кэша, кэш - загрузка объекта кода с диска; '
+          'результаты py проверены по vm')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Поиск идентификаторов в областях видимости на глубокой вложенности
+
+Сравнивается прежний IdentScope (поиск по цепочке родительских областей, curr_func/curr_global -
+проход по цепочке) и текущий (общая таблица имя -> стек описаний). Сценарий: вложенные блоки
+глубины depth, в каждом объявляется переменная и ищутся имена из глобальной области,
+функции и соседних уровней. Дополнительно - семантический анализ программы с такой вложенностью.
+
+    python benchmarks/bench_scope.py [--depth 1000] [--lookups 20]
+"""
+
+import argparse
+import time
+from typing import Dict, Optional
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import sal_parser
+import sal_semantic_checker
+from sal_semantic_base import IdentDesc, IdentScope, ScopeType, SemanticException, TypeDesc
+
+
+class LegacyIdentScope:
+    # так IdentScope был устроен до перехода на общую таблицу идентификаторов
+    def __init__(self, parent: Optional['LegacyIdentScope'] = None) -> None:
+        self.idents: Dict[str, IdentDesc] = {}
+        self.func: Optional[IdentDesc] = None
+        self.parent = parent
+        self.var_index = 0
+        self.param_index = 0
+
+    @property
+    def curr_global(self) -> 'LegacyIdentScope':
+        curr = self
+        while curr.parent:
+            curr = curr.parent
+        return curr
+
+    @property
+    def curr_func(self) -> Optional['LegacyIdentScope']:
+        curr = self
+        while curr and not curr.func:
+            curr = curr.parent
+        return curr
+
+    def exit(self) -> None:
+        pass
+
+    def add_ident(self, ident: IdentDesc) -> IdentDesc:
+        func_scope = self.curr_func
+        global_scope = self.curr_global
+        if ident.scope != ScopeType.PARAM:
+            ident.scope = ScopeType.LOCAL if func_scope else \
+                ScopeType.GLOBAL if self == global_scope else ScopeType.GLOBAL_LOCAL
+        old_ident = self.get_ident(ident.name)
+        if old_ident and not (ident.scope == ScopeType.LOCAL and
+                              old_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL)):
+            raise SemanticException('Идентификатор {} уже объявлен'.format(ident.name))
+        ident_scope = func_scope if func_scope else global_scope
+        ident.index = ident_scope.var_index
+        ident_scope.var_index += 1
+        self.idents[ident.name] = ident
+        return ident
+
+    def get_ident(self, name: str) -> Optional[IdentDesc]:
+        scope = self
+        ident = None
+        while scope:
+            ident = scope.idents.get(name)
+            if ident:
+                break
+            scope = scope.parent
+        return ident
+
+
+def nested_scopes(scope_class, depth: int, lookups: int) -> int:
+    found = 0
+    glob = scope_class()
+    glob.add_ident(IdentDesc('g', TypeDesc.INT))
+    func = scope_class(glob)
+    func.func = IdentDesc('F', TypeDesc.VOID)
+    func.add_ident(IdentDesc('p', TypeDesc.INT, ScopeType.PARAM))
+    scopes = [func]
+    for i in range(depth):
+        scope = scope_class(scopes[-1])
+        scope.add_ident(IdentDesc('v{}'.format(i), TypeDesc.INT))
+        for j in range(lookups):
+            name = ('g', 'p', 'v{}'.format(i), 'v{}'.format(i // 2), 'v{}'.format(j))[j % 5]
+            found += scope.get_ident(name) is not None
+        scopes.append(scope)
+    for scope in reversed(scopes):
+        scope.exit()
+    return found
+
+
+def nested_program(depth: int) -> str:
+    lines = ['цел g := 1', 'алг F(арг цел p)', 'нач']
+    for i in range(depth):
+        lines.append('нц пока g > {}'.format(i))
+        lines.append('цел v{} := p + g'.format(i))
+        lines.append('v{0} := v{1} + g + p'.format(i, i // 2))
+    lines.extend(['кц'] * depth)
+    lines.extend(['кон', 'F(g)'])
+    return '\n'.join(lines) + '\n'
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='IdentScope lookup benchmark')
+    arg_parser.add_argument('--depth', type=int, default=1000, help='nesting depth')
+    arg_parser.add_argument('--lookups', type=int, default=20, help='lookups per block')
+    args = arg_parser.parse_args()
+
+    results = []
+    for name, scope_class in (('прежний', LegacyIdentScope), ('текущий', IdentScope)):
+        start = time.perf_counter()
+        found = nested_scopes(scope_class, args.depth, args.lookups)
+        elapsed = time.perf_counter() - start
+        results.append(found)
+        print('{:>8}: {:8.3f} с, {:12,.0f} поисков/с'.format(name, elapsed, args.depth * args.lookups / elapsed))
+    assert results[0] == results[1], results
+
+    prog = sal_parser.parse(nested_program(args.depth), 'lalr')
+    start = time.perf_counter()
+    sal_semantic_checker.SemanticChecker().semantic_check(prog, sal_semantic_checker.prepare_global_scope())
+    print('семантический анализ, вложенность {}: {:.3f} с'.format(args.depth, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
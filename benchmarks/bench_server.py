@@ -0,0 +1,63 @@
+"""Задержка компиляции через сервер (app.py --serve) в сравнении с запуском app.py на каждый файл
+
+    python benchmarks/bench_server.py [--requests 200] [--clients 8]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sal_corpus import ROOT_DIR, read_samples
+
+import sal_server
+
+APP = os.path.join(ROOT_DIR, 'app.py')
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='compile server latency benchmark')
+    arg_parser.add_argument('--requests', type=int, default=200, help='requests count')
+    arg_parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    args = arg_parser.parse_args()
+
+    samples = read_samples()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src_path = os.path.join(tmp_dir, 'src.txt')
+        with open(src_path, mode='w', encoding='utf-8') as f:
+            f.write(samples[2])
+        start = time.perf_counter()
+        subprocess.run([sys.executable, APP, '--msil-only', '--encoding', 'utf-8', src_path],
+                       check=True, stdout=subprocess.DEVNULL)
+        print('app.py (новый процесс):  {:8.2f} мс'.format((time.perf_counter() - start) * 1000))
+
+        sock_path = os.path.join(tmp_dir, 'sal.sock')
+        server = subprocess.Popen([sys.executable, APP, '--serve', sock_path])
+        try:
+            while not os.path.exists(sock_path):
+                time.sleep(0.01)
+
+            def compile_one(i: int) -> float:
+                start = time.perf_counter()
+                response = sal_server.request(sock_path, {'src': samples[i % len(samples)]})
+                assert response['ok'], response
+                return (time.perf_counter() - start) * 1000
+
+            times = [compile_one(i) for i in range(args.requests)]
+            print('сервер, 1 клиент:        {}'.format(sal_server.percentiles(times)))
+            with ThreadPoolExecutor(args.clients) as executor:
+                times = list(executor.map(compile_one, range(args.requests)))
+            print('сервер, {} клиентов:     {}'.format(args.clients, sal_server.percentiles(times)))
+            print('статистика сервера:      {}'.format(sal_server.request(sock_path, {'cmd': 'stats'})))
+            sal_server.request(sock_path, {'cmd': 'shutdown'})
+            server.wait(10)
+        finally:
+            if server.poll() is None:
+                server.kill()
+
+
+if __name__ == "__main__":
+    main()
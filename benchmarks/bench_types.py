@@ -0,0 +1,111 @@
+"""Сравнение типов и семантический анализ программ с большим количеством вызовов функций
+
+Сравнивается прежний TypeDesc (структурное сравнение функциональных типов по параметрам, новый объект
+на каждое объявление) и текущий (интернированные типы, сравнение ссылок).
+
+    python benchmarks/bench_types.py [--funcs 200] [--calls 50000]
+"""
+
+import argparse
+import random
+import time
+from typing import Optional, Tuple
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import sal_parser
+import sal_semantic_checker
+import sal_msil
+from sal_semantic_base import BaseType, TypeDesc
+
+
+class LegacyTypeDesc:
+    # так TypeDesc сравнивался до интернирования
+    def __init__(self, base_type_: Optional[BaseType] = None,
+                 return_type: Optional['LegacyTypeDesc'] = None, params: Optional[Tuple['LegacyTypeDesc']] = None) -> None:
+        self.base_type = base_type_
+        self.return_type = return_type
+        self.params = params
+
+    @property
+    def func(self) -> bool:
+        return self.return_type is not None
+
+    def __eq__(self, other: 'LegacyTypeDesc'):
+        if self.func != other.func:
+            return False
+        if not self.func:
+            return self.base_type == other.base_type
+        else:
+            if self.return_type != other.return_type:
+                return False
+            if len(self.params) != len(other.params):
+                return False
+            for i in range(len(self.params)):
+                if self.params[i] != other.params[i]:
+                    return False
+            return True
+
+
+TYPES = ('цел', 'вещ', 'лог')
+
+
+def call_heavy_program(funcs: int, calls: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    lines = []
+    signatures = []
+    for i in range(funcs):
+        params = [rnd.choice(TYPES) for _ in range(rnd.randint(2, 5))]
+        signatures.append(params)
+        lines.append('алг F{}(арг {}, рез цел r)'.format(i, ', '.join(
+            '{} p{}'.format(t, j) for j, t in enumerate(params))))
+        lines.append('нач')
+        lines.append('    r := {}'.format(i))
+        lines.append('кон')
+    lines.append('цел x := 0')
+    lines.append('вещ y := 1.5')
+    lines.append('лог z := да')
+    values = {'цел': 'x', 'вещ': 'y', 'лог': 'z'}
+    for _ in range(calls):
+        i = rnd.randrange(funcs)
+        lines.append('x := F{}({})'.format(i, ', '.join(values[t] for t in signatures[i])))
+    return '\n'.join(lines) + '\n'
+
+
+def compare_types(type_class, count: int) -> float:
+    base = [type_class(b) for b in (BaseType.INT, BaseType.FLOAT, BaseType.BOOL)]
+    rnd = random.Random(0)
+    sigs = [tuple(rnd.choice(base) for _ in range(4)) for _ in range(50)]
+    # типы функций создаются заново для каждого объявления/вызова, как при семантическом анализе
+    decl = [type_class(None, base[0], sig) for sig in sigs]
+    call = [type_class(None, base[0], sig) for sig in sigs]
+    start = time.perf_counter()
+    equal = 0
+    for k in range(count):
+        equal += decl[k % 50] == call[k % 50]
+    assert equal == count
+    return count / (time.perf_counter() - start)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='TypeDesc benchmark')
+    arg_parser.add_argument('--funcs', type=int, default=200, help='declared functions')
+    arg_parser.add_argument('--calls', type=int, default=50000, help='function calls')
+    args = arg_parser.parse_args()
+
+    for name, type_class in (('прежний', LegacyTypeDesc), ('текущий', TypeDesc)):
+        print('{:>8}: {:12,.0f} сравнений функциональных типов/с'.format(name, compare_types(type_class, 500000)))
+
+    prog = sal_parser.parse(call_heavy_program(args.funcs, args.calls), 'lalr')
+    start = time.perf_counter()
+    sal_semantic_checker.SemanticChecker().semantic_check(prog, sal_semantic_checker.prepare_global_scope())
+    checked = time.perf_counter()
+    gen = sal_msil.CodeGenerator()
+    gen.msil_gen_program(prog)
+    done = time.perf_counter()
+    print('{} вызовов: семантический анализ {:.3f} с ({:,.0f} вызовов/с), MSIL {:.3f} с'.format(
+        args.calls, checked - start, args.calls / (checked - start), done - checked))
+
+
+if __name__ == "__main__":
+    main()
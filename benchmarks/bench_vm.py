@@ -0,0 +1,58 @@
+"""Встроенная виртуальная машина (sal_vm): выполненные команды байт-кода и команд в секунду
+
+Программы из bench_loops и bench_inline компилируются в байт-код на -O0, -O1 и -O2 и выполняются sal_vm.Machine.
+Для сравнения те же программы выполняются интерпретатором MSIL из bench_loops (без Mono); глобальные переменные
+после выполнения должны совпадать с полями _gv интерпретатора.
+
+    python benchmarks/bench_vm.py [--n 100000] [-O 0 1 2]
+"""
+
+import argparse
+import time
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+import bench_inline
+import bench_loops
+import program
+from bench_loops import Interpreter, load_methods
+from sal_vm import Machine
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='bytecode VM instructions/sec benchmark')
+    arg_parser.add_argument('--n', type=int, default=100000, help='loop iterations')
+    arg_parser.add_argument('-O', dest='levels', type=int, nargs='+', choices=(0, 1, 2), default=[0, 1, 2],
+                            help='optimization levels')
+    args = arg_parser.parse_args()
+
+    programs = dict(bench_loops.PROGRAMS, **bench_inline.PROGRAMS)
+    print('{:<24}{:>4}{:>12}{:>10}{:>14}{:>12}{:>10}'.format('программа', '-O', 'команд', 'vm, мс', 'команд/с',
+                                                             'msil, мс', 'ускор.'))
+    total_executed = total_seconds = 0.0
+    for name, template in programs.items():
+        src = template.format(n=args.n)
+        for level in args.levels:
+            machine = Machine(program.compile_vm(src, opt_level=level))
+            machine.run()
+
+            interpreter = Interpreter(load_methods(program.compile_msil(src, opt_level=level)))
+            start = time.perf_counter()
+            interpreter.run()
+            msil_seconds = time.perf_counter() - start
+            expected = {'_gv{}'.format(i): value for i, value in enumerate(machine.globals)}
+            if any(expected[field] != value for field, value in interpreter.statics.items()):
+                raise AssertionError('{}: результаты vm и msil различаются на -O{}: {} {}'.format(
+                    name, level, expected, interpreter.statics))
+
+            total_executed += machine.executed
+            total_seconds += machine.seconds
+            print('{:<24}{:>4}{:>12}{:>10.1f}{:>14,.0f}{:>12.1f}{:>10.1f}'.format(
+                name, level, machine.executed, machine.seconds * 1000, machine.executed / machine.seconds,
+                msil_seconds * 1000, msil_seconds / machine.seconds))
+    print('всего: {:.0f} команд за {:.2f} с ({:,.0f} команд/с); ускор. - время интерпретатора MSIL / время vm'.format(
+        total_executed, total_seconds, total_executed / total_seconds))
+
+
+if __name__ == "__main__":
+    main()
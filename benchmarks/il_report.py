@@ -0,0 +1,69 @@
+"""Количество инструкций MSIL и слотов локальных переменных до и после оптимизаций (по умолчанию -O0, -O1 и -O2)
+на примерах из samples/ и на сгенерированной программе
+
+Инструкции - строки внутри методов без директив (.entrypoint, .locals, ...), скобок и меток без инструкции,
+слоты - сумма размеров .locals init всех методов.
+
+    python benchmarks/il_report.py [--levels 0 1 2] [--lines 2000]
+"""
+
+import argparse
+import os
+import re
+from typing import Iterable, List, Tuple
+
+from sal_corpus import SAMPLES_DIR, generate_program, read_samples
+
+import program
+
+LABEL_RE = re.compile(r'^\s*IL_\d+:\s*')
+
+
+def count_instructions(lines: Iterable[str]) -> int:
+    count = 0
+    for line in lines:
+        line = LABEL_RE.sub('', line).strip()
+        if not line or line[0] in '.{}':
+            continue
+        count += 1
+    return count
+
+
+def count_locals(lines: Iterable[str]) -> int:
+    return sum(line.count(' V_') for line in lines if line.lstrip().startswith('.locals'))
+
+
+def print_table(title: str, rows: List[Tuple[str, List[int]]], levels: List[int]) -> None:
+    print('{:<20}'.format(title) + ''.join('{:>10}'.format('-O{}'.format(level)) for level in levels) +
+          '{:>10}'.format('разница'))
+    totals = [sum(counts[i] for _, counts in rows) for i in range(len(levels))]
+    for name, counts in rows + [('всего', totals)]:
+        print('{:<20}'.format(name) + ''.join('{:>10}'.format(count) for count in counts) +
+              '{:>9.1f}%'.format((counts[-1] / counts[0] - 1) * 100 if counts[0] else 0))
+
+
+def report(sources: List[Tuple[str, str]], levels: List[int]) -> None:
+    instructions, slots = [], []
+    for name, src in sources:
+        codes = [program.compile_msil(src, opt_level=level) for level in levels]
+        instructions.append((name, [count_instructions(code) for code in codes]))
+        slots.append((name, [count_locals(code) for code in codes]))
+    print_table('инструкции', instructions, levels)
+    print()
+    print_table('слоты .locals', slots, levels)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='MSIL instructions count report')
+    arg_parser.add_argument('--levels', type=int, nargs='+', default=[0, 1, 2], help='optimization levels to compare')
+    arg_parser.add_argument('--lines', type=int, default=2000, help='generated program size (0 - samples only)')
+    args = arg_parser.parse_args()
+
+    sources = list(zip(sorted(os.listdir(SAMPLES_DIR)), read_samples()))
+    if args.lines:
+        sources.append(('generated ({})'.format(args.lines), generate_program(args.lines)))
+    report(sources, args.levels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Структурная проверка сборки (.exe), записанной sal_pe, без Mono
+
+Читает заголовки PE, таблицу импорта и поправки, заголовок CLI, потоки и таблицы метаданных, тела методов
+и декодирует инструкции. Проверяется: ссылки между таблицами и индексы куч в границах, точка входа - Main,
+переходник точки входа вызывает mscoree.dll!_CorExeMain через IAT и покрыт поправкой, переходы попадают
+на начала инструкций, токены инструкций существуют. С --msil инструкции каждого метода сравниваются
+со строками MSIL, из которых собрана сборка (операции, операнды, цели переходов, имена полей и методов).
+
+    python benchmarks/pe_reader.py program.exe [--msil program.msil] [--disasm]
+"""
+
+import argparse
+import struct
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import sal_corpus  # noqa: F401 (путь к модулям компилятора)
+
+from bench_loops import load_methods
+
+TABLE_NAMES = {0x00: 'Module', 0x01: 'TypeRef', 0x02: 'TypeDef', 0x04: 'Field', 0x06: 'MethodDef', 0x08: 'Param',
+               0x0a: 'MemberRef', 0x11: 'StandAloneSig', 0x20: 'Assembly', 0x23: 'AssemblyRef'}
+# коды индексов: таблицы в порядке тегов
+CODED = {
+    'TypeDefOrRef': (0x02, 0x01, 0x1b),
+    'ResolutionScope': (0x00, 0x1a, 0x23, 0x01),
+    'MemberRefParent': (0x02, 0x01, 0x1a, 0x06, 0x1b),
+}
+COLUMNS = {
+    0x00: ('u2', 'str', 'guid', 'guid', 'guid'),
+    0x01: ('ResolutionScope', 'str', 'str'),
+    0x02: ('u4', 'str', 'str', 'TypeDefOrRef', 0x04, 0x06),
+    0x04: ('u2', 'str', 'blob'),
+    0x06: ('u4', 'u2', 'u2', 'str', 'blob', 0x08),
+    0x08: ('u2', 'u2', 'str'),
+    0x0a: ('MemberRefParent', 'str', 'blob'),
+    0x11: ('blob',),
+    0x20: ('u4', 'u2', 'u2', 'u2', 'u2', 'u4', 'blob', 'str', 'str'),
+    0x23: ('u2', 'u2', 'u2', 'u2', 'u4', 'blob', 'str', 'str', 'blob'),
+}
+
+# декодирование инструкций: код -> (имя, вид операнда)
+OPS: Dict[int, Tuple[str, Optional[str]]] = {
+    0x00: ('nop', None), 0x0e: ('ldarg.s', 'u1'), 0x10: ('starg.s', 'u1'), 0x11: ('ldloc.s', 'u1'),
+    0x13: ('stloc.s', 'u1'), 0x14: ('ldnull', None), 0x15: ('ldc.i4.m1', None), 0x1f: ('ldc.i4.s', 'i1'),
+    0x20: ('ldc.i4', 'i4'), 0x23: ('ldc.r8', 'r8'), 0x25: ('dup', None), 0x26: ('pop', None),
+    0x28: ('call', 'token'), 0x2a: ('ret', None), 0x58: ('add', None), 0x59: ('sub', None), 0x5a: ('mul', None),
+    0x5b: ('div', None), 0x5d: ('rem', None), 0x5f: ('and', None), 0x60: ('or', None), 0x61: ('xor', None),
+    0x65: ('neg', None), 0x66: ('not', None), 0x72: ('ldstr', 'token'), 0x7e: ('ldsfld', 'token'),
+    0x80: ('stsfld', 'token'),
+    0xfe01: ('ceq', None), 0xfe02: ('cgt', None), 0xfe03: ('cgt.un', None), 0xfe04: ('clt', None),
+    0xfe05: ('clt.un', None), 0xfe09: ('ldarg', 'u2'), 0xfe0b: ('starg', 'u2'), 0xfe0c: ('ldloc', 'u2'),
+    0xfe0e: ('stloc', 'u2'),
+}
+for _i in range(4):
+    OPS[0x02 + _i] = ('ldarg.{}'.format(_i), None)
+    OPS[0x06 + _i] = ('ldloc.{}'.format(_i), None)
+    OPS[0x0a + _i] = ('stloc.{}'.format(_i), None)
+for _i in range(9):
+    OPS[0x16 + _i] = ('ldc.i4.{}'.format(_i), None)
+for _i, _name in enumerate(('br', 'brfalse', 'brtrue', 'beq', 'bge', 'bgt', 'ble', 'blt', 'bne.un', 'bge.un',
+                            'bgt.un', 'ble.un', 'blt.un')):
+    OPS[0x2b + _i] = (_name + '.s', 'br1')
+    OPS[0x38 + _i] = (_name, 'br4')
+OPERAND_FORMATS = {None: '', 'u1': '<B', 'i1': '<b', 'u2': '<H', 'i4': '<i', 'r8': '<d', 'token': '<I',
+                   'br1': '<b', 'br4': '<i'}
+
+
+class Instr(NamedTuple):
+    offset: int
+    op: str
+    # число, токен или смещение цели перехода
+    arg: object
+
+
+class MethodBody(NamedTuple):
+    name: str
+    max_stack: int
+    locals_token: int
+    instrs: List[Instr]
+
+
+class PeImage:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        check(data[:2] == b'MZ', 'нет сигнатуры MZ')
+        pe = struct.unpack_from('<I', data, 0x3c)[0]
+        check(data[pe:pe + 4] == b'PE\x00\x00', 'нет сигнатуры PE')
+        machine, sections, _, _, _, opt_size, characteristics = struct.unpack_from('<HHIIIHH', data, pe + 4)
+        check(machine == 0x14c and characteristics & 0x2, 'не образ i386 (.exe)')
+        opt = pe + 24
+        check(struct.unpack_from('<H', data, opt)[0] == 0x10b, 'необязательный заголовок не PE32')
+        self.entry_rva = struct.unpack_from('<I', data, opt + 16)[0]
+        self.image_base = struct.unpack_from('<I', data, opt + 28)[0]
+        count = struct.unpack_from('<I', data, opt + 92)[0]
+        self.directories = [struct.unpack_from('<II', data, opt + 96 + 8 * i) for i in range(count)]
+        self.sections = []
+        for i in range(sections):
+            name, vsize, rva, raw_size, raw_ptr = struct.unpack_from('<8sIIII', data, opt + opt_size + 40 * i)
+            check(raw_ptr + raw_size <= len(data), 'секция {} за концом файла'.format(name))
+            self.sections.append((name.rstrip(b'\x00').decode(), rva, vsize, raw_ptr))
+
+        cli_rva, cli_size = self.directories[14]
+        check(cli_size == 72, 'нет заголовка CLI')
+        cb, major, minor, md_rva, md_size, flags, self.entry_token = struct.unpack_from('<IHHIIII', data,
+                                                                                        self.offset(cli_rva))
+        check(cb == 72 and flags & 0x1, 'заголовок CLI: размер {}, флаги {:#x}'.format(cb, flags))
+        self.read_metadata(self.offset(md_rva), md_size)
+
+    def offset(self, rva: int) -> int:
+        for _, start, size, raw_ptr in self.sections:
+            if start <= rva < start + size:
+                return raw_ptr + rva - start
+        raise AssertionError('RVA {:#x} вне секций'.format(rva))
+
+    def read_metadata(self, start: int, size: int) -> None:
+        data = self.data
+        check(struct.unpack_from('<I', data, start)[0] == 0x424a5342, 'нет сигнатуры метаданных')
+        version_length = struct.unpack_from('<I', data, start + 12)[0]
+        pos = start + 16 + version_length + 2
+        streams_count = struct.unpack_from('<H', data, pos)[0]
+        pos += 2
+        self.streams: Dict[str, bytes] = {}
+        for _ in range(streams_count):
+            offset, length = struct.unpack_from('<II', data, pos)
+            end = data.index(b'\x00', pos + 8)
+            name = data[pos + 8:end].decode()
+            pos = pos + 8 + (end - pos - 8 + 4) // 4 * 4
+            check(offset + length <= size, 'поток {} за концом метаданных'.format(name))
+            self.streams[name] = data[start + offset:start + offset + length]
+        for name in ('#~', '#Strings', '#US', '#GUID', '#Blob'):
+            check(name in self.streams, 'нет потока ' + name)
+        self.read_tables(self.streams['#~'])
+
+    def read_tables(self, data: bytes) -> None:
+        heap_sizes = data[6]
+        valid = struct.unpack_from('<Q', data, 8)[0]
+        present = [t for t in range(64) if valid >> t & 1]
+        for table in present:
+            check(table in COLUMNS, 'неизвестная таблица {:#x}'.format(table))
+        self.counts = {t: struct.unpack_from('<I', data, 24 + 4 * i)[0] for i, t in enumerate(present)}
+        pos = 24 + 4 * len(present)
+        heap_limits = {'str': len(self.streams['#Strings']), 'guid': len(self.streams['#GUID']) // 16,
+                       'blob': len(self.streams['#Blob'])}
+        heap_formats = {'str': 'I' if heap_sizes & 1 else 'H', 'guid': 'I' if heap_sizes & 2 else 'H',
+                        'blob': 'I' if heap_sizes & 4 else 'H', 'u2': 'H', 'u4': 'I'}
+
+        def column_format(column) -> str:
+            if column in heap_formats:
+                return heap_formats[column]
+            if column in CODED:
+                tables = CODED[column]
+                bits = (len(tables) - 1).bit_length()
+                return 'I' if max(self.counts.get(t, 0) for t in tables) >= 1 << (16 - bits) else 'H'
+            return 'I' if self.counts.get(column, 0) > 0xffff else 'H'
+
+        self.tables: Dict[int, List[tuple]] = {}
+        for table in present:
+            columns = COLUMNS[table]
+            row_struct = struct.Struct('<' + ''.join(column_format(c) for c in columns))
+            rows = []
+            for _ in range(self.counts[table]):
+                row = list(row_struct.unpack_from(data, pos))
+                pos += row_struct.size
+                for i, column in enumerate(columns):
+                    if column in CODED:
+                        tables = CODED[column]
+                        bits = (len(tables) - 1).bit_length()
+                        tag, index = row[i] & ((1 << bits) - 1), row[i] >> bits
+                        check(tag < len(tables), '{}: неверный тег'.format(TABLE_NAMES[table]))
+                        check(index <= self.counts.get(tables[tag], 0),
+                              '{}: строка {} таблицы {:#x} не существует'.format(TABLE_NAMES[table], index, tables[tag]))
+                        row[i] = (tables[tag], index)
+                    elif column in heap_limits:
+                        check(row[i] <= heap_limits[column] and (column == 'guid' or row[i] < heap_limits[column]),
+                              '{}: индекс {} за концом кучи {}'.format(TABLE_NAMES[table], row[i], column))
+                    elif isinstance(column, int):
+                        # списки (FieldList, MethodList, ParamList) могут указывать на строку после последней
+                        check(row[i] <= self.counts.get(column, 0) + 1,
+                              '{}: строка {} таблицы {:#x} не существует'.format(TABLE_NAMES[table], row[i], column))
+                rows.append(tuple(row))
+            self.tables[table] = rows
+
+    def string(self, offset: int) -> str:
+        heap = self.streams['#Strings']
+        return heap[offset:heap.index(b'\x00', offset)].decode('utf-8')
+
+    def user_string(self, offset: int) -> str:
+        heap = self.streams['#US']
+        length, pos = blob_length(heap, offset)
+        check(length % 2 == 1, '#US: строка {} нечетной длины'.format(offset))
+        return heap[pos:pos + length - 1].decode('utf-16-le')
+
+    def member_name(self, token: int) -> str:
+        table, row = token >> 24, token & 0xffffff
+        check(table in (0x04, 0x06, 0x0a) and 1 <= row <= self.counts.get(table, 0),
+              'токен {:#010x} не существует'.format(token))
+        if table == 0x0a:
+            (parent_table, parent), name, _ = self.tables[0x0a][row - 1]
+            _, type_name, namespace = self.tables[parent_table][parent - 1]
+            return '{}::{}'.format('.'.join(filter(None, (self.string(namespace), self.string(type_name)))),
+                                   self.string(name))
+        name = self.tables[table][row - 1][3 if table == 0x06 else 1]
+        return 'Program::' + self.string(name)
+
+    def methods(self) -> List[MethodBody]:
+        return [self.method(i) for i in range(self.counts.get(0x06, 0))]
+
+    def method(self, index: int) -> MethodBody:
+        rva, _, _, name, _, _ = self.tables[0x06][index]
+        pos = self.offset(rva)
+        data = self.data
+        if data[pos] & 0x3 == 0x2:
+            max_stack, code_size, locals_token = 8, data[pos] >> 2, 0
+            pos += 1
+        else:
+            check(data[pos] & 0x3 == 0x3 and rva % 4 == 0, 'неверный заголовок тела метода')
+            flags, max_stack, code_size, locals_token = struct.unpack_from('<HHII', data, pos)
+            check(flags >> 12 == 3, 'размер fat-заголовка не 12 байт')
+            if locals_token:
+                check(locals_token >> 24 == 0x11 and (locals_token & 0xffffff) <= self.counts.get(0x11, 0),
+                      'неверный токен локальных переменных')
+            pos += 12
+        instrs = []
+        offset = 0
+        while offset < code_size:
+            code = data[pos + offset]
+            size = 1
+            if code == 0xfe:
+                code, size = 0xfe00 | data[pos + offset + 1], 2
+            check(code in OPS, 'неизвестная инструкция {:#x}'.format(code))
+            op, kind = OPS[code]
+            arg = None
+            if kind is not None:
+                fmt = OPERAND_FORMATS[kind]
+                arg = struct.unpack_from(fmt, data, pos + offset + size)[0]
+                size += struct.calcsize(fmt)
+                if kind in ('br1', 'br4'):
+                    arg += offset + size
+            instrs.append(Instr(offset, op, arg))
+            offset += size
+        check(offset == code_size, 'инструкция выходит за конец тела')
+        starts = {instr.offset for instr in instrs}
+        for instr in instrs:
+            if OPS_KINDS.get(instr.op) in ('br1', 'br4'):
+                check(instr.arg in starts, 'переход на {} - не начало инструкции'.format(instr.arg))
+            elif instr.op == 'ldstr':
+                check(instr.arg >> 24 == 0x70, 'неверный токен строки')
+                self.user_string(instr.arg & 0xffffff)
+            elif instr.op in ('call', 'ldsfld', 'stsfld'):
+                self.member_name(instr.arg)
+        return MethodBody(self.string(name), max_stack, locals_token, instrs)
+
+    def verify(self) -> None:
+        check(self.entry_token >> 24 == 0x06, 'точка входа - не метод')
+        check(self.method((self.entry_token & 0xffffff) - 1).name == 'Main', 'точка входа - не Main')
+        # переходник: jmp [IAT], IAT указывает на _CorExeMain из mscoree.dll
+        pos = self.offset(self.entry_rva)
+        check(self.data[pos:pos + 2] == b'\xff\x25', 'точка входа - не jmp [IAT]')
+        iat_rva, _ = self.directories[12]
+        check(struct.unpack_from('<I', self.data, pos + 2)[0] == self.image_base + iat_rva,
+              'переходник не ссылается на IAT')
+        import_rva, _ = self.directories[1]
+        lookup, _, _, name_rva, first_thunk = struct.unpack_from('<IIIII', self.data, self.offset(import_rva))
+        check(first_thunk == iat_rva, 'IAT не совпадает с таблицей импорта')
+        check(self.c_string(name_rva) == 'mscoree.dll', 'импорт не из mscoree.dll')
+        hint_name = struct.unpack_from('<I', self.data, self.offset(lookup))[0]
+        check(self.c_string(hint_name + 2) == '_CorExeMain', 'импорт не _CorExeMain')
+        reloc_rva, reloc_size = self.directories[5]
+        page, block_size, entry = struct.unpack_from('<IIH', self.data, self.offset(reloc_rva))
+        check(block_size <= reloc_size and entry >> 12 == 3 and page + (entry & 0xfff) == self.entry_rva + 2,
+              'адрес в переходнике не покрыт поправкой')
+
+    def c_string(self, rva: int) -> str:
+        pos = self.offset(rva)
+        return self.data[pos:self.data.index(b'\x00', pos)].decode()
+
+
+OPS_KINDS = {name: kind for name, kind in OPS.values()}
+
+
+def blob_length(heap: bytes, offset: int) -> Tuple[int, int]:
+    b = heap[offset]
+    if b & 0x80 == 0:
+        return b, offset + 1
+    if b & 0xc0 == 0x80:
+        return struct.unpack_from('>H', heap, offset)[0] & 0x3fff, offset + 2
+    return struct.unpack_from('>I', heap, offset)[0] & 0x1fffffff, offset + 4
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise AssertionError(message)
+
+
+def compare(image: PeImage, lines: List[str]) -> int:
+    """Сравнение инструкций методов сборки со строками MSIL; :return: количество сравненных инструкций
+    """
+
+    text_methods = load_methods(lines)
+    methods = {method.name: method for method in image.methods()}
+    check(set(methods) == set(text_methods), 'методы различаются: {} и {}'.format(sorted(methods), sorted(text_methods)))
+    res = 0
+    for name, text in text_methods.items():
+        instrs = methods[name].instrs
+        code = [line for line in text.code if line.op is not None]
+        check(len(code) == len(instrs), '{}: {} инструкций вместо {}'.format(name, len(instrs), len(code)))
+        # метка -> номер следующей за ней инструкции
+        targets, index = {}, 0
+        for line in text.code:
+            if line.label is not None:
+                targets[line.label] = index
+            else:
+                index += 1
+        indexes = {instr.offset: i for i, instr in enumerate(instrs)}
+        for i, (line, instr) in enumerate(zip(code, instrs)):
+            where = '{}, инструкция {} ({} {})'.format(name, i, line.op, line.arg or '')
+            check(line.op == instr.op, where + ': в сборке ' + instr.op)
+            kind = OPS_KINDS[instr.op]
+            if kind in ('br1', 'br4'):
+                check(targets[line.arg] == indexes[instr.arg], where + ': другая цель перехода')
+            elif instr.op == 'ldstr':
+                check(image.user_string(instr.arg & 0xffffff) == line.arg[1:-1], where + ': другая строка')
+            elif instr.op in ('call', 'ldsfld', 'stsfld'):
+                member = image.member_name(instr.arg)
+                arg = line.arg.replace('[mscorlib]', '').replace('class ', '')
+                check(' {}('.format(member) in arg if instr.op == 'call' else arg.endswith(' ' + member),
+                      where + ': в сборке ' + member)
+            elif kind == 'r8':
+                check(instr.arg == float(line.arg), where + ': другое значение')
+            elif kind is not None:
+                check(instr.arg == int(line.arg), where + ': другое значение')
+            res += 1
+    return res
+
+
+def operand_text(image: PeImage, instr: Instr) -> str:
+    kind = OPS_KINDS[instr.op]
+    if kind is None:
+        return ''
+    if kind in ('br1', 'br4'):
+        return ' IL_{:04x}'.format(instr.arg)
+    if instr.op == 'ldstr':
+        return ' "{}"'.format(image.user_string(instr.arg & 0xffffff))
+    if kind == 'token':
+        return ' ' + image.member_name(instr.arg)
+    return ' {}'.format(instr.arg)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='CLI assembly structural check')
+    arg_parser.add_argument('exe', help='assembly written by app.py --exe')
+    arg_parser.add_argument('--msil', default=None, help='msil the assembly was built from (compare instructions)')
+    arg_parser.add_argument('--disasm', default=False, action='store_true', help='print decoded instructions')
+    args = arg_parser.parse_args()
+
+    with open(args.exe, mode='rb') as f:
+        image = PeImage(f.read())
+    image.verify()
+    print('sections: ' + ', '.join('{} {:#x} ({} bytes)'.format(name, rva, size)
+                                   for name, rva, size, _ in image.sections))
+    print('tables: ' + ', '.join('{} {}'.format(TABLE_NAMES[t], count) for t, count in image.counts.items()))
+    for method in image.methods():
+        print('{}: {} instructions, maxstack {}{}'.format(method.name, len(method.instrs), method.max_stack,
+                                                         ', locals' if method.locals_token else ''))
+        if args.disasm:
+            for instr in method.instrs:
+                print('    IL_{:04x}: {}{}'.format(instr.offset, instr.op, operand_text(image, instr)))
+    if args.msil is not None:
+        with open(args.msil, mode='r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        print('msil: {} instructions match'.format(compare(image, lines)))
+
+
+if __name__ == "__main__":
+    main()
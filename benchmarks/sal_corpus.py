@@ -0,0 +1,131 @@
+"""Генератор синтетических программ на школьном алгоритмическом языке для бенчмарков
+"""
+
+import os
+import random
+import sys
+from typing import List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(ROOT_DIR, 'samples')
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def read_samples() -> List[str]:
+    """Исходники из samples/ (хранятся в cp1251)
+    """
+
+    res = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        with open(os.path.join(SAMPLES_DIR, name), mode='r', encoding='cp1251') as f:
+            res.append(f.read())
+    return res
+
+
+class ProgramGenerator:
+    def __init__(self, seed: int = 0) -> None:
+        self.rnd = random.Random(seed)
+        self.lines: List[str] = []
+        self.indent = 0
+
+    def line(self, text: str) -> None:
+        self.lines.append('    ' * self.indent + text)
+
+    def int_expr(self, names: List[str], depth: int = 0) -> str:
+        rnd = self.rnd
+        if depth > 2 or rnd.random() < 0.3:
+            return rnd.choice(names) if rnd.random() < 0.6 else str(rnd.randint(0, 100))
+        op = rnd.choice('+-*')
+        expr = '{} {} {}'.format(self.int_expr(names, depth + 1), op, self.int_expr(names, depth + 1))
+        return '(' + expr + ')' if rnd.random() < 0.3 else expr
+
+    def bool_expr(self, names: List[str]) -> str:
+        rnd = self.rnd
+        cmp = '{} {} {}'.format(self.int_expr(names, 2), rnd.choice(['<', '>', '<=', '>=', '=']), self.int_expr(names, 2))
+        if rnd.random() < 0.3:
+            cmp = '({}) {} {}'.format(cmp, rnd.choice(['и', 'или']), rnd.choice(['да', 'нет']))
+        return cmp
+
+    def block(self, names: List[str], funcs: List[str], size: int, depth: int) -> None:
+        rnd = self.rnd
+        for _ in range(size):
+            kind = rnd.random()
+            if depth < 3 and kind < 0.12:
+                self.line('если ' + self.bool_expr(names))
+                self.indent += 1
+                self.line('то')
+                self.indent += 1
+                self.block(names, funcs, 2, depth + 1)
+                self.indent -= 1
+                self.line('иначе')
+                self.indent += 1
+                self.block(names, funcs, 2, depth + 1)
+                self.indent -= 2
+                self.line('все')
+            elif depth < 3 and kind < 0.20:
+                self.line('нц пока ' + self.bool_expr(names))
+                self.indent += 1
+                self.block(names, funcs, 2, depth + 1)
+                self.indent -= 1
+                self.line('кц')
+            elif depth < 3 and kind < 0.26:
+                self.line('нц для {} от {} до {}'.format(names[0], rnd.randint(0, 5), self.int_expr(names, 2)))
+                self.indent += 1
+                self.block(names, funcs, 2, depth + 1)
+                self.indent -= 1
+                self.line('кц')
+            elif depth < 3 and kind < 0.30:
+                self.line('нц')
+                self.indent += 1
+                self.block(names, funcs, 2, depth + 1)
+                self.indent -= 1
+                self.line('кц_при ' + self.bool_expr(names))
+            elif kind < 0.40 and funcs:
+                self.line('{} := {}({}, {})'.format(rnd.choice(names), rnd.choice(funcs),
+                                                    self.int_expr(names, 2), self.int_expr(names, 2)))
+            elif kind < 0.50:
+                self.line('вывод ' + self.int_expr(names))
+            else:
+                self.line('{} := {}'.format(rnd.choice(names), self.int_expr(names)))
+
+    def function(self, name: str, funcs: List[str], size: int) -> None:
+        self.line('алг {}(арг цел a, цел b, рез цел r)'.format(name))
+        self.indent += 1
+        self.line('нач')
+        self.indent += 1
+        self.line('цел x := a + b')
+        self.line('цел y := 1')
+        self.block(['x', 'y', 'a', 'b'], funcs, size, 0)
+        self.line('r := x + y')
+        self.indent -= 1
+        self.line('кон')
+        self.indent -= 1
+        self.line('')
+
+    def program(self, funcs_count: int, func_size: int = 20) -> str:
+        funcs: List[str] = []
+        for i in range(funcs_count):
+            name = 'Func{}'.format(i)
+            self.function(name, funcs, func_size)
+            funcs.append(name)
+        self.line('цел g := 0')
+        for name in funcs[-10:]:
+            self.line('g := {}(g, 1)'.format(name))
+        self.line('вывод g')
+        return '\n'.join(self.lines) + '\n'
+
+
+def generate_program(lines: int, seed: int = 0, func_size: int = 20) -> str:
+    """Сгенерировать программу примерно из lines строк
+    """
+
+    funcs_count = 1
+    text = ''
+    while True:
+        text = ProgramGenerator(seed).program(funcs_count, func_size)
+        count = text.count('\n')
+        if count >= lines:
+            return text
+        funcs_count = max(funcs_count + 1, funcs_count * lines // max(count, 1))
@@ -1,40 +1,486 @@
+import contextlib
 import os
+import sys
+import threading
+import time
+import types
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
 import sal_parser
 # import sal_semantic
 import sal_semantic_base
 import sal_semantic_checker
 import sal_msil
+import sal_incremental
+import sal_cache
+import sal_optimizer
+import sal_peephole
+import sal_inline
+import sal_context
+from sal_ast import FuncDeclNode, StmtListNode
+
+# IR и бэкенды (sal_vm, sal_py, sal_c, sal_pe) импортируются при первом использовании: компиляции в MSIL
+# (в т.ч. --msil-only) они не нужны и не увеличивают время запуска
+if TYPE_CHECKING:
+    import sal_ir
+    import sal_ir_passes
+    import sal_py
+    import sal_vm
+
+# кэш функций процесса для инкрементальной компиляции (создается при первом использовании)
+func_cache: Optional[sal_incremental.FunctionCache] = None
+# кэш результатов компиляции целых файлов
+unit_cache: Optional[sal_cache.UnitCache] = None
+# peephole-оптимизатор (-O2), счетчики срабатываний правил накапливаются по всем компиляциям процесса
+peephole: Optional[sal_peephole.Peephole] = None
+# отчет о встроенных функциях (-O2), накапливается по всем компиляциям процесса
+inline_report: Optional[sal_inline.InlineReport] = None
+# объекты кода программ, скомпилированных в Python (sal_py)
+py_cache: Optional['sal_py.CodeCache'] = None
+# менеджер проходов IR (генерация MSIL через IR), время проходов накапливается по всем компиляциям процесса
+ir_passes: Optional['sal_ir_passes.PassManager'] = None
+# создание объектов процесса и добавление к ним счетчиков завершенных компиляций (компиляции идут в разных потоках)
+state_lock = threading.RLock()
+
+# обратный вызов после этапа компиляции: (имя этапа, дерево программы или программа IR)
+StageCallback = Callable[[str, Any], None]
+
+
+def get_func_cache() -> sal_incremental.FunctionCache:
+    global func_cache
+
+    with state_lock:
+        if func_cache is None:
+            func_cache = sal_incremental.FunctionCache()
+    return func_cache
+
+
+def get_unit_cache() -> sal_cache.UnitCache:
+    global unit_cache
+
+    with state_lock:
+        if unit_cache is None:
+            unit_cache = sal_cache.UnitCache()
+    return unit_cache
+
+
+def get_py_cache() -> 'sal_py.CodeCache':
+    import sal_py
+
+    global py_cache
+    with state_lock:
+        if py_cache is None:
+            py_cache = sal_py.CodeCache()
+    return py_cache
+
+
+def get_peephole() -> sal_peephole.Peephole:
+    global peephole
+
+    with state_lock:
+        if peephole is None:
+            peephole = sal_peephole.Peephole()
+    return peephole
+
+
+def get_inline_report() -> sal_inline.InlineReport:
+    global inline_report
+
+    with state_lock:
+        if inline_report is None:
+            inline_report = sal_inline.InlineReport()
+    return inline_report
+
+
+def get_ir_passes() -> 'sal_ir_passes.PassManager':
+    import sal_ir_passes
+
+    global ir_passes
+    with state_lock:
+        if ir_passes is None:
+            ir_passes = sal_ir_passes.PassManager()
+    return ir_passes
+
+
+def merge_stats(ctx: sal_context.CompileContext) -> None:
+    """Счетчики компиляции добавляются к счетчикам процесса (--peephole-stats, --inline-report, --dump-ir)
+    """
 
+    with state_lock:
+        if ctx.peephole is not None:
+            get_peephole().merge(ctx.peephole)
+        get_inline_report().merge(ctx.inline_report)
+        if ctx.ir_passes is not None:
+            get_ir_passes().merge(ctx.ir_passes)
 
-def execute(prog: str, msil_only: bool = False) -> None:
-    prog = sal_parser.parse(prog)
 
-    if not msil_only:
-        print('ast:')
-        print(*prog.tree, sep=os.linesep)
-        print()
+def inline_options(budget: Optional[int] = None, drop_unused: bool = False) -> sal_inline.InlineOptions:
+    """Параметры встраивания из параметров командной строки или запроса к серверу (None - бюджет по умолчанию)
+    """
 
-        print('semantic_check:')
+    return sal_inline.InlineOptions(sal_inline.DEFAULT_BUDGET if budget is None else budget, drop_unused)
+
+
+def use_incremental(incremental: bool, opt_level: int, inline: sal_inline.InlineOptions, ir: bool = False) -> bool:
+    """Инкрементальная компиляция несовместима со встраиванием функций (код функции зависит от тел вызываемых)
+       и с генерацией через IR (в кэше функций - код CodeGenerator), в этих случаях программа компилируется целиком
+    """
+
+    return incremental and not sal_optimizer.inline_enabled(opt_level, inline) and not ir
+
+
+def cache_flags(opt_level: int, inline: sal_inline.InlineOptions = sal_inline.InlineOptions(),
+                ir: bool = False) -> str:
+    """Флаги компиляции, влияющие на результат (часть ключа кэша единиц трансляции)
+    """
+
+    res = 'O{}'.format(opt_level)
+    if sal_optimizer.inline_enabled(opt_level, inline):
+        res += ' inline{}{}'.format(inline.budget, ' drop' if inline.drop_unused else '')
+    if ir:
+        res += ' ir'
+    return res
+
+
+def msil_gen_program(gen: sal_msil.CodeGenerator, prog, func_code=None,
+                     ir_prog: Optional['sal_ir.IrProgram'] = None) -> None:
+    """Генерация MSIL программы: из AST (CodeGenerator) или, если передан ir_prog, из IR
+    """
+
+    if ir_prog is not None:
+        import sal_ir_msil
+
+        sal_ir_msil.msil_gen_ir(gen, ir_prog)
+    else:
+        gen.msil_gen_program(prog, func_code)
+
+
+def execute(prog: str, msil_only: bool = False, parser_engine: str = sal_parser.DEFAULT_ENGINE,
+            incremental: bool = False, use_cache: bool = False, out_path: Optional[str] = None,
+            opt_level: int = 0, inline: sal_inline.InlineOptions = sal_inline.InlineOptions(), ir: bool = False,
+            dump_ir: bool = False) -> bool:
+    """
+    :param use_cache: (только для msil_only) брать MSIL из кэша единиц трансляции, если исходник уже компилировался
+    :param out_path: файл для MSIL (код пишется в файл по мере генерации, без накопления в памяти)
+    :param opt_level: уровень оптимизации (0 - без оптимизаций, 1 - sal_optimizer, 2 - и sal_inline, sal_peephole)
+    :param inline: параметры встраивания функций (-O2)
+    :param ir: генерировать MSIL через IR (sal_ir)
+    :param dump_ir: напечатать IR в stderr (вместе с ir)
+    :return: скомпилирована ли программа без ошибок (ошибки напечатаны)
+    """
+
+    ctx = sal_context.CompileContext(sal_context.CompileOptions(parser_engine, opt_level, inline, ir, incremental))
     try:
-        checker = sal_semantic_checker.SemanticChecker()
-        scope = sal_semantic_checker.prepare_global_scope()
-        checker.semantic_check(prog, scope)
+        return execute_in_context(prog, ctx, msil_only, use_cache, out_path, dump_ir)
+    finally:
+        merge_stats(ctx)
+
+
+def execute_in_context(prog: str, ctx: sal_context.CompileContext, msil_only: bool = False, use_cache: bool = False,
+                       out_path: Optional[str] = None, dump_ir: bool = False) -> bool:
+    """Компиляция из командной строки: front_end и msil_codegen, деревья этапов и IR печатаются по мере
+       выполнения (кроме msil_only), ошибки печатаются из ctx.diagnostics
+    :return: скомпилирована ли программа без ошибок
+    """
+
+    options = ctx.options
+    cache_key = None
+    if msil_only and use_cache and not dump_ir:
+        cache_key = sal_cache.UnitCache.key(prog, cache_flags(options.opt_level, options.inline, options.ir))
+        if out_path is not None:
+            if get_unit_cache().get_file(cache_key, out_path):
+                return True
+        else:
+            text = get_unit_cache().get(cache_key)
+            if text is not None:
+                print(text)
+                return True
+
+    def print_stage(stage: str, value) -> None:
+        if stage == 'ir' and dump_ir:
+            print(*value.dump(), sep=os.linesep, file=sys.stderr)
+        if msil_only:
+            return
+        if stage == 'ast':
+            print('ast:')
+            print(*value.tree, sep=os.linesep)
+            print()
+        elif stage == 'semantic_check':
+            print('semantic_check:')
+            print(*value.tree, sep=os.linesep)
+        elif stage == 'optimized' and options.opt_level > 0:
+            print()
+            print('optimized (-O{}):'.format(options.opt_level))
+            print(*value.tree, sep=os.linesep)
+            # при встраивании программа всегда компилируется целиком (use_incremental)
+            if sal_optimizer.inline_enabled(options.opt_level, options.inline):
+                print()
+                print('inline: {}'.format(ctx.inline_report))
+        elif stage == 'ir':
+            print()
+            print('ir:')
+            print(*value.dump(), sep=os.linesep)
+
+    with collect_errors(ctx):
+        tree, func_code = front_end(prog, ctx, print_stage)
+        if out_path is not None:
+            try:
+                with open(out_path, mode='w', encoding='utf-8', newline='\n') as f:
+                    msil_codegen(ctx, tree, func_code, f, print_stage)
+            except BaseException:
+                os.unlink(out_path)
+                raise
+            if cache_key is not None:
+                get_unit_cache().put_file(cache_key, out_path)
+            code = None
+        else:
+            code = msil_codegen(ctx, tree, func_code, on_stage=print_stage).code
+            if cache_key is not None:
+                get_unit_cache().put(cache_key, '\n'.join(code))
         if not msil_only:
-            print(*prog.tree, sep=os.linesep)
+            print()
+            print('msil:')
+        if code is not None:
+            print(*code, sep=os.linesep)
+        if not msil_only:
+            print()
+            if ctx.peephole is not None:
+                print('peephole: ' + ctx.peephole.report())
+                print()
+            if options.ir:
+                print('ir passes: ' + ctx.ir_passes.report())
+                print()
+    for diagnostic in ctx.diagnostics:
+        print('Ошибка: {}'.format(diagnostic.message))
+    return not ctx.failed
+
+
+def front_end(prog: str, ctx: sal_context.CompileContext, on_stage: Optional[StageCallback] = None) \
+        -> Tuple[StmtListNode, Optional[Dict[FuncDeclNode, List[str]]]]:
+    """Разбор, семантическая проверка и оптимизация (ошибки - исключения разбора lark, SemanticException)
+    :param on_stage: вызывается после каждого этапа с деревом программы ('ast', 'semantic_check', 'optimized')
+    :return: (дерево программы, код функций из кэша функций при инкрементальной компиляции или None)
+    """
+
+    options = ctx.options
+    start = time.perf_counter()
+    tree = sal_parser.parse(prog, options.parser_engine)
+    ctx.add_time('parse', time.perf_counter() - start)
+    if on_stage is not None:
+        on_stage('ast', tree)
+
+    start = time.perf_counter()
+    checker = sal_semantic_checker.SemanticChecker()
+    scope = sal_semantic_checker.prepare_global_scope()
+    func_code = None
+    if use_incremental(options.incremental, options.opt_level, options.inline, options.ir):
+        func_code = sal_incremental.check_program(checker, tree, scope, get_func_cache(), options.opt_level,
+                                                  ctx.peephole)
+    else:
+        checker.semantic_check(tree, scope)
+    ctx.add_time('check', time.perf_counter() - start)
+    if on_stage is not None:
+        on_stage('semantic_check', tree)
+
+    start = time.perf_counter()
+    sal_optimizer.optimize_program(tree, options.opt_level, func_code, options.inline, ctx.inline_report)
+    ctx.add_time('optimize', time.perf_counter() - start)
+    if on_stage is not None:
+        on_stage('optimized', tree)
+    return tree, func_code
+
+
+def msil_codegen(ctx: sal_context.CompileContext, tree: StmtListNode,
+                 func_code: Optional[Dict[FuncDeclNode, List[str]]] = None, out: Optional[TextIO] = None,
+                 on_stage: Optional[StageCallback] = None) -> sal_msil.CodeGenerator:
+    """Генерация MSIL проверенного дерева (через IR, если options.ir); ошибки - MsilException
+    :param out: файл, в который код пишется по мере генерации (иначе код накапливается в gen.code)
+    :param on_stage: вызывается с программой IR после ее построения и проходов ('ir')
+    """
+
+    start = time.perf_counter()
+    ir_prog = None
+    if ctx.options.ir:
+        ir_prog = ctx.ir_passes.build(tree)
+        if on_stage is not None:
+            on_stage('ir', ir_prog)
+    gen = sal_msil.CodeGenerator(out, peephole=ctx.peephole)
+    msil_gen_program(gen, tree, func_code, ir_prog)
+    ctx.add_time('codegen', time.perf_counter() - start)
+    return gen
+
+
+@contextlib.contextmanager
+def collect_errors(ctx: sal_context.CompileContext) -> Iterator[None]:
+    """Ошибки разбора, семантической проверки и генерации кода записываются в ctx.diagnostics
+    """
+
+    try:
+        yield
+    except sal_parser.syntax_errors() as e:
+        ctx.error(*sal_parser.syntax_error(e))
     except sal_semantic_base.SemanticException as e:
-        print('Ошибка: {}'.format(e.message))
-        return
-    if not msil_only:
-        print()
+        ctx.error(e.message, e.row, e.col)
+    except sal_msil.MsilException as e:
+        ctx.error(e.message)
+
+
+def msil_in_context(prog: str, ctx: sal_context.CompileContext) -> List[str]:
+    """Компиляция исходного текста в строки MSIL; все состояние компиляции - в ctx
+       (ошибки - SemanticException / MsilException)
+    """
+
+    tree, func_code = front_end(prog, ctx)
+    return msil_codegen(ctx, tree, func_code).code
+
 
-    # if not msil_only:
-        print('msil:')
+def compile_in_context(prog: str, ctx: sal_context.CompileContext) -> Optional[List[str]]:
+    """Реентерабельная компиляция в строки MSIL: модули, классы и объекты процесса не изменяются (счетчики
+       оптимизаторов остаются в ctx), поэтому компиляции с разными контекстами можно выполнять одновременно
+       в разных потоках; общие для процесса - только кэш функций (options.incremental) и парсеры
+    :return: строки MSIL или None, если есть ошибки (они записаны в ctx.diagnostics)
+    """
+
+    with collect_errors(ctx):
+        return msil_in_context(prog, ctx)
+    return None
+
+
+def compile_msil(prog: str, parser_engine: str = sal_parser.DEFAULT_ENGINE, incremental: bool = False,
+                 opt_level: int = 0, inline: sal_inline.InlineOptions = sal_inline.InlineOptions(),
+                 ir: bool = False) -> List[str]:
+    """Компиляция исходного текста в строки MSIL (ошибки - SemanticException / MsilException)
+    :param ir: генерировать MSIL через IR (sal_ir)
+    """
+
+    ctx = sal_context.CompileContext(sal_context.CompileOptions(parser_engine, opt_level, inline, ir, incremental))
+    try:
+        return msil_in_context(prog, ctx)
+    finally:
+        merge_stats(ctx)
+
+
+def checked_tree(prog: str, parser_engine: str, opt_level: int, inline: sal_inline.InlineOptions) -> StmtListNode:
+    """Проверенное и оптимизированное дерево программы для генераторов без кэша функций (sal_vm, sal_py, sal_c)
+    """
+
+    ctx = sal_context.CompileContext(sal_context.CompileOptions(parser_engine, opt_level, inline))
     try:
-        gen = sal_msil.CodeGenerator()
-        gen.msil_gen_program(prog)
-        print(*gen.code, sep=os.linesep)
-    except sal_msil.MsilException or Exception as e:
-        print(f'Ошибка {e.message}')
-        exit(3)
-    if not msil_only:
-        print()
+        return front_end(prog, ctx)[0]
+    finally:
+        merge_stats(ctx)
+
+
+def compile_vm(prog: str, parser_engine: str = sal_parser.DEFAULT_ENGINE, opt_level: int = 0,
+               inline: sal_inline.InlineOptions = sal_inline.InlineOptions()) -> 'sal_vm.VmProgram':
+    """Компиляция исходного текста в байт-код встроенной виртуальной машины (ошибки - SemanticException /
+       VmException); оптимизации - те же, что и перед генерацией MSIL
+    """
+
+    import sal_vm
+
+    return sal_vm.compile_program(checked_tree(prog, parser_engine, opt_level, inline))
+
+
+def python_source(prog: str, parser_engine: str = sal_parser.DEFAULT_ENGINE, opt_level: int = 0,
+                  inline: sal_inline.InlineOptions = sal_inline.InlineOptions()) -> str:
+    """Компиляция исходного текста в исходный текст Python (sal_py)
+    """
+
+    import sal_py
+
+    return sal_py.gen_program(checked_tree(prog, parser_engine, opt_level, inline))
+
+
+def c_source(prog: str, parser_engine: str = sal_parser.DEFAULT_ENGINE, opt_level: int = 0,
+             inline: sal_inline.InlineOptions = sal_inline.InlineOptions(), dump_globals: bool = False) -> str:
+    """Компиляция исходного текста в исходный текст C99 (sal_c)
+    :param dump_globals: в конце main выводить значения глобальных переменных в stderr
+    """
+
+    import sal_c
+
+    return sal_c.gen_program(checked_tree(prog, parser_engine, opt_level, inline), dump_globals)
+
+
+def compile_python(prog: str, parser_engine: str = sal_parser.DEFAULT_ENGINE, opt_level: int = 0,
+                   inline: sal_inline.InlineOptions = sal_inline.InlineOptions(),
+                   use_cache: bool = True) -> Tuple[types.CodeType, bool]:
+    """Компиляция исходного текста в объект кода Python (ошибки - SemanticException / VmException)
+    :param use_cache: брать объект кода из кэша (по хэшу исходника и флагов), если исходник уже компилировался
+    :return: (объект кода, взят ли он из кэша)
+    """
+
+    import sal_py
+
+    key = sal_py.CodeCache.key(prog, cache_flags(opt_level, inline)) if use_cache else None
+    if key is not None:
+        code = get_py_cache().get(key)
+        if code is not None:
+            return code, True
+    code = sal_py.compile_source(python_source(prog, parser_engine, opt_level, inline))
+    if key is not None:
+        get_py_cache().put(key, code)
+    return code, False
+
+
+def compile_text(prog: str, parser_engine: str = sal_parser.DEFAULT_ENGINE, incremental: bool = False,
+                 use_cache: bool = True, opt_level: int = 0,
+                 inline: sal_inline.InlineOptions = sal_inline.InlineOptions(), ir: bool = False) -> Tuple[str, bool]:
+    """Компиляция в текст MSIL с кэшем единиц трансляции
+    :return: (MSIL, взят ли результат из кэша)
+    """
+
+    if not use_cache:
+        return '\n'.join(compile_msil(prog, parser_engine, incremental, opt_level, inline, ir)), False
+    cache = get_unit_cache()
+    key = cache.key(prog, cache_flags(opt_level, inline, ir))
+    text = cache.get(key)
+    if text is not None:
+        return text, True
+    text = '\n'.join(compile_msil(prog, parser_engine, incremental, opt_level, inline, ir))
+    cache.put(key, text)
+    return text, False
+
+
+def init_worker(parser_engine: str) -> None:
+    """Инициализация процесса пакетной компиляции: парсер строится (или грузится из кэша) один раз на процесс
+    """
+
+    sal_parser.get_parser(parser_engine)
+
+
+def compile_file(src_path: str, out_path: str, parser_engine: str = sal_parser.DEFAULT_ENGINE,
+                 encoding: Optional[str] = None, incremental: bool = False,
+                 use_cache: bool = True, opt_level: int = 0,
+                 inline: sal_inline.InlineOptions = sal_inline.InlineOptions(),
+                 ir: bool = False, exe: bool = False) -> Tuple[str, Optional[str], float, bool]:
+    """Компиляция одного файла в out_path
+    :param exe: записать сборку CLI (sal_pe) вместо текста MSIL
+    :return: (src_path, текст ошибки или None, время компиляции в секундах, взят ли результат из кэша)
+    """
+
+    start = time.perf_counter()
+    error = None
+    cached = False
+    try:
+        with open(src_path, mode='r', encoding=encoding) as f:
+            src = f.read()
+        text, cached = compile_text(src, parser_engine, incremental, use_cache, opt_level, inline, ir)
+        if exe:
+            import sal_pe
+
+            image = sal_pe.assemble(text.split('\n'))
+            with open(out_path, mode='wb') as f:
+                f.write(image)
+        else:
+            with open(out_path, mode='w', encoding='utf-8') as f:
+                f.write(text + '\n')
+    except sal_parser.syntax_errors() as e:
+        error = sal_parser.syntax_error(e)[0]
+    except (sal_semantic_base.SemanticException, sal_msil.MsilException) as e:
+        error = e.message
+    except Exception as e:
+        # одна строка на файл в выводе пакетной компиляции
+        error = '{}: {}'.format(type(e).__name__, ' '.join(str(e).split()))
+    return src_path, error, time.perf_counter() - start, cached
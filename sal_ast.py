@@ -1,6 +1,5 @@
 from abc import ABC, abstractmethod
 from contextlib import suppress
-import imp
 from typing import Callable, Tuple, Union, Optional, List
 from enum import Enum
 from sal_semantic_base import VOID, BinOp
@@ -9,16 +8,16 @@ from sal_semantic_base import TypeDesc, IdentDesc, SemanticException, IdentScope
 
 
 class AstNode(ABC):
-    init_action: Callable[['AstNode'], None] = None
+    """Базовый класс узлов AST-дерева
+       (все узлы используют __slots__ - без __dict__ у каждого узла, поэтому атрибуты узла
+       должны быть перечислены в __slots__ его класса)
+    """
+
+    __slots__ = ('row', 'col', 'node_type', 'node_ident')
 
-    def __init__(self, row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__()
+    def __init__(self, row: Optional[int] = None, col: Optional[int] = None) -> None:
         self.row = row
         self.col = col
-        for k, v in props.items():
-            setattr(self, k, v)
-        if AstNode.init_action is not None:
-            AstNode.init_action(self)
         self.node_type: Optional[TypeDesc] = None
         self.node_ident: Optional[IdentDesc] = None
 
@@ -32,15 +31,22 @@ class AstNode(ABC):
 
     @property
     def tree(self) -> [str, ...]:
-        res = [self.to_str_full()]
-        childs = self.children
-        for i, child in enumerate(childs):
-            # if child.__str__() == '': continue
-            ch0, ch = '├', '│'
-            if i == len(childs) - 1:
-                ch0, ch = '└', ' '
-            if child is not None:
-                res.extend(((ch0 if j == 0 else ch) + ' ' + s for j, s in enumerate(child.tree)))
+        # обход с явным стеком (без рекурсии): для каждого узла хранится префикс
+        # его первой строки и префикс строк его поддерева
+        res = []
+        stack = [(self, '', '')]
+        while stack:
+            node, first, prefix = stack.pop()
+            res.append(first + node.to_str_full())
+            childs = node.children
+            for i in range(len(childs) - 1, -1, -1):
+                child = childs[i]
+                if child is None:
+                    continue
+                ch0, ch = '├', '│'
+                if i == len(childs) - 1:
+                    ch0, ch = '└', ' '
+                stack.append((child, prefix + ch0 + ' ', prefix + ch + ' '))
         return tuple(res)
 
     def visit(self, func: Callable[['AstNode'], None]) -> None:
@@ -73,17 +79,19 @@ class AstNode(ABC):
 
 
 class ExprNode(AstNode, ABC):
-    pass
+    __slots__ = ()
 
 
 class ValueNode(ExprNode, ABC):
-    pass
+    __slots__ = ()
 
 
 class NumNode(ValueNode):
+    __slots__ = ('value',)
+
     def __init__(self, num: str,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         if '.' in num:
             self.value = float(num)
         else:
@@ -94,9 +102,11 @@ class NumNode(ValueNode):
 
 
 class StringNode(ValueNode):
+    __slots__ = ('value',)
+
     def __init__(self, str_: str,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.value = str_
 
     def __str__(self):
@@ -104,9 +114,11 @@ class StringNode(ValueNode):
 
 
 class CharacterNode(ValueNode):
+    __slots__ = ('value',)
+
     def __init__(self, char: str,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row=row, col=col)
         self.value = char
 
     def __str__(self):
@@ -114,10 +126,11 @@ class CharacterNode(ValueNode):
 
 
 class IdentNode(ExprNode):
+    __slots__ = ('name',)
 
     def __init__(self, name: str,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row=row, col=col)
         self.name = str(name)
 
     def __str__(self) -> str:
@@ -129,9 +142,11 @@ class TypeNode(IdentNode):
        (при появлении составных типов данных должен быть расширен)
     """
 
+    __slots__ = ('type',)
+
     def __init__(self, name: str,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(name, row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(name, row=row, col=col)
         self.type = None
         with suppress(SemanticException):
             self.type = TypeDesc.from_str(name)
@@ -141,9 +156,11 @@ class TypeNode(IdentNode):
 
 
 class BoolNode(ValueNode):
+    __slots__ = ('value',)
+
     def __init__(self, value: bool,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.value = value
 
     def __str__(self) -> str:
@@ -158,9 +175,11 @@ class BoolNode(ValueNode):
 
 
 class BinOpNode(ExprNode):
+    __slots__ = ('op', 'arg1', 'arg2')
+
     def __init__(self, op: BinOp, arg1: ExprNode, arg2: ExprNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row=row, col=col)
         self.op = op
         self.arg1 = arg1
         self.arg2 = arg2
@@ -182,9 +201,11 @@ class CompareOp(Enum):
 
 
 class CompareOpNode(ExprNode):
+    __slots__ = ('op', 'arg1', 'arg2')
+
     def __init__(self, op: CompareOp, arg1: ValueNode, arg2: ValueNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.op = op
         self.arg1 = arg1
         self.arg2 = arg2
@@ -204,9 +225,11 @@ class LogOp(Enum):
 
 
 class LogOpNode(ExprNode):
+    __slots__ = ('op', 'arg1', 'arg2')
+
     def __init__(self, op: LogOp, arg1: ValueNode, arg2: Optional[ValueNode] = None,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.op = op
         self.arg1 = arg1
         self.arg2 = arg2
@@ -220,13 +243,15 @@ class LogOpNode(ExprNode):
 
 
 class StmtNode(AstNode, ABC):
-    pass
+    __slots__ = ()
 
 
 class InputNode(StmtNode):
+    __slots__ = ('var',)
+
     def __init__(self, var: IdentNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.var = var
 
     @property
@@ -238,9 +263,11 @@ class InputNode(StmtNode):
 
 
 class OutputNode(StmtNode):
+    __slots__ = ('args',)
+
     def __init__(self, arg: ExprNode, *args: ExprNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.args = (arg,) + args
 
     @property
@@ -252,9 +279,11 @@ class OutputNode(StmtNode):
 
 
 class AssignNode(ExprNode):
+    __slots__ = ('var', 'val')
+
     def __init__(self, var: IdentNode, val: ExprNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row=row, col=col)
         self.var = var
         if var.name == 'flag':
             pass
@@ -269,9 +298,11 @@ class AssignNode(ExprNode):
 
 
 class IfNode(StmtNode):
+    __slots__ = ('cond', 'then_stmt', 'else_stmt')
+
     def __init__(self, cond: ExprNode, then_stmt: StmtNode, else_stmt: Optional[StmtNode] = None,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.cond = cond
         self.then_stmt = then_stmt
         self.else_stmt = else_stmt
@@ -289,9 +320,11 @@ def not_none(value: Union[AstNode, None]) -> AstNode:
 
 
 class WhileNode(StmtNode):
+    __slots__ = ('cond', 'body')
+
     def __init__(self, cond: ExprNode, body: Optional[StmtNode],
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.cond = cond
         self.body = body
 
@@ -305,9 +338,12 @@ class WhileNode(StmtNode):
 
 
 class DoWhileNode(StmtNode):
-    def __init__(self, cond: ExprNode, body: Optional[StmtNode],
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+    __slots__ = ('cond', 'body')
+
+    # порядок аргументов - как в грамматике (нц тело кц_при условие)
+    def __init__(self, body: Optional[StmtNode], cond: ExprNode,
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.cond = cond
         self.body = body
 
@@ -320,9 +356,11 @@ class DoWhileNode(StmtNode):
 
 
 class ForNode(StmtNode):
+    __slots__ = ('init', 'cond', 'step', 'body')
+
     def __init__(self, init: Optional[StmtNode], cond: Optional[ExprNode], step: Optional[StmtNode], body: StmtNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.init = init
         self.cond = cond
         self.step = step
@@ -337,9 +375,11 @@ class ForNode(StmtNode):
 
 
 class StmtListNode(AstNode):
+    __slots__ = ('program', 'stmts')
+
     def __init__(self, *stmts: StmtNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.program = False
         self.stmts = stmts
 
@@ -352,9 +392,11 @@ class StmtListNode(AstNode):
 
 
 class FuncCallNode(ExprNode):
+    __slots__ = ('name', 'params')
+
     def __init__(self, name: IdentNode, *params: ExprNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.name = name
         self.params = params
 
@@ -367,9 +409,11 @@ class FuncCallNode(ExprNode):
 
 
 class ChildListNode(AstNode):
+    __slots__ = ('node_name', 'childs_')
+
     def __init__(self, node_name: str, childs: Optional[List[AstNode]],
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row=row, col=col)
         self.node_name = node_name
         self.childs_ = childs
 
@@ -390,13 +434,15 @@ class Type(Enum):
 
 
 class VarDeclNode(StmtNode):
+    __slots__ = ('type', 'vars')
+
     def __init__(self, type_: TypeNode,
     # vars_: AssignNode,
     *vars_,
     #Union[IdentNode, 'AssignNode'],
     # ident: IdentNode, assign: Optional[AssignNode] = None,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row=row, col=col)
         self.type = type_
         # self.ident = ident
         # self.assign = assign
@@ -425,9 +471,11 @@ class VarDeclNode(StmtNode):
 
 
 class ParamsNode(AstNode, ABC):
+    __slots__ = ('vars',)
+
     def __init__(self, *vars: VarDeclNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.vars = vars
 
     def __str__(self):
@@ -439,11 +487,13 @@ class ParamsNode(AstNode, ABC):
 
 
 class ResNode(StmtNode):
+    __slots__ = ('type', 'res', 'name')
+
     def __init__(self,
                  res: VarDeclNode,
                 #type: TypeNode, ident: IdentNode,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row=row, col=col)
         self.type = res.type
         self.res = res
         self.name = res.vars[0]
@@ -458,12 +508,14 @@ class ResNode(StmtNode):
 
 
 class FuncDeclNode(StmtNode):
+    __slots__ = ('name', 'params', 'res', 'body', 'type')
+
     def __init__(self, name: IdentNode, params: Optional[ParamsNode] = None, res: Optional[ResNode] = None,
                  body: Optional['StmtListNode'] = None,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row, col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row, col)
         self.name = name
-        self.params = ParamsNode(params=[])
+        self.params = ParamsNode()
         self.res = None
         self.body = None
         if params is not None:
@@ -506,9 +558,11 @@ class TypeConvertNode(ExprNode):
        (в языке программирования может быть как expression, так и statement)
     """
 
+    __slots__ = ('expr', 'type')
+
     def __init__(self, expr: ExprNode, type_: TypeDesc,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
-        super().__init__(row=row, col=col, **props)
+                 row: Optional[int] = None, col: Optional[int] = None) -> None:
+        super().__init__(row=row, col=col)
         self.expr = expr
         self.type = type_
         self.node_type = type_
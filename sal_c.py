@@ -0,0 +1,649 @@
+"""Генерация переносимого исходного текста C99 из проверенного AST, сборка gcc и запуск (app.py --emit-c, --run-c)
+
+Типы: цел - int32_t, вещ - double, лог - bool, сим - код символа (sal_char), лит - строка UTF-8 (sal_str) небольшой
+библиотеки времени выполнения, которая вставляется в начало каждой программы (RUNTIME). Каждая функция (алг) -
+функция C f_<имя>; результат (рез) возвращается через явный выходной параметр out: в теле он - обычная локальная
+переменная, перед выходом ее значение записывается в *out, а вызов в выражении - (f_<имя>(..., &t<n>), t<n>)
+с временной переменной вызывающей функции. Операторы вне функций - функция main.
+
+Семантика - как у MSIL и встроенной виртуальной машины (sal_vm): цел - 32-битные числа с переполнением
+(арифметика через uint32_t), деление отбрасывает дробную часть, деление на ноль - ошибка, и/или вычисляют оба
+операнда, вещественные >= и <= истинны для NaN, вывод вещественных - как Double.ToString() (format_float).
+Отличия: порядок вычисления операндов одного выражения в C не определен (важно только для вызовов функций,
+изменяющих глобальные переменные), глубина рекурсии ограничена стеком процесса, память строк не освобождается.
+"""
+
+import os
+import shutil
+import subprocess
+import time
+from typing import List, Optional, Sequence
+
+import visitor
+from sal_ast import AssignNode, AstNode, BinOpNode, BoolNode, CharacterNode, DoWhileNode, ForNode, FuncCallNode, \
+    FuncDeclNode, IdentNode, IfNode, InputNode, NumNode, OutputNode, StmtListNode, StringNode, TypeConvertNode, \
+    VarDeclNode, WhileNode
+from sal_ir import program_fields
+from sal_msil import decls_locals, find_vars_decls, func_locals, res_ident
+from sal_semantic_base import BaseType, BinOp, IdentDesc, ScopeType, TypeDesc
+
+C_TYPE_NAMES = {
+    BaseType.VOID: 'void',
+    BaseType.INT: 'int32_t',
+    BaseType.FLOAT: 'double',
+    BaseType.BOOL: 'bool',
+    BaseType.STR: 'sal_str',
+    BaseType.CHAR: 'sal_char',
+}
+
+C_ZERO_VALUES = {
+    BaseType.INT: '0',
+    BaseType.FLOAT: '0.0',
+    BaseType.BOOL: 'false',
+    BaseType.STR: '""',
+    BaseType.CHAR: '0',
+}
+
+# суффиксы функций времени выполнения по типу: sal_out_<тип>, sal_in_<тип>, sal_str_<тип>
+RUNTIME_SUFFIXES = {
+    BaseType.INT: 'int',
+    BaseType.FLOAT: 'float',
+    BaseType.BOOL: 'bool',
+    BaseType.STR: 'str',
+    BaseType.CHAR: 'char',
+}
+
+INT_OPS = {BinOp.ADD: 'sal_add', BinOp.SUB: 'sal_sub', BinOp.MUL: 'sal_mul', BinOp.DIV: 'sal_div'}
+
+OPS = {BinOp.ADD: '+', BinOp.SUB: '-', BinOp.MUL: '*', BinOp.DIV: '/', BinOp.GT: '>', BinOp.LT: '<', BinOp.GE: '>=',
+       BinOp.LE: '<=', BinOp.EQUALS: '==', BinOp.AND: '&', BinOp.OR: '|'}
+
+CC = 'gcc'
+CFLAGS = ('-std=c99', '-O2')
+
+RUNTIME = r'''#include <errno.h>
+#include <math.h>
+#include <stdbool.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+typedef const char *sal_str;
+typedef int32_t sal_char;
+
+static inline void sal_fail(const char *message)
+{
+    fflush(stdout);
+    printf("Ошибка: %s\n", message);
+    exit(1);
+}
+
+static inline void *sal_alloc(size_t size)
+{
+    void *res = malloc(size);
+    if (res == NULL)
+        sal_fail("Недостаточно памяти");
+    return res;
+}
+
+static inline int32_t sal_add(int32_t a, int32_t b) { return (int32_t)((uint32_t)a + (uint32_t)b); }
+static inline int32_t sal_sub(int32_t a, int32_t b) { return (int32_t)((uint32_t)a - (uint32_t)b); }
+static inline int32_t sal_mul(int32_t a, int32_t b) { return (int32_t)((uint32_t)a * (uint32_t)b); }
+
+static inline int32_t sal_div(int32_t a, int32_t b)
+{
+    if (b == 0)
+        sal_fail("Деление на ноль");
+    /* INT32_MIN / -1 - с переполнением */
+    return b == -1 ? sal_sub(0, a) : a / b;
+}
+
+static inline size_t sal_utf8_encode(sal_char c, char *buf)
+{
+    uint32_t u = (uint32_t)c;
+    if (u < 0x80) {
+        buf[0] = (char)u;
+        return 1;
+    }
+    if (u < 0x800) {
+        buf[0] = (char)(0xC0 | u >> 6);
+        buf[1] = (char)(0x80 | (u & 0x3F));
+        return 2;
+    }
+    if (u < 0x10000) {
+        buf[0] = (char)(0xE0 | u >> 12);
+        buf[1] = (char)(0x80 | (u >> 6 & 0x3F));
+        buf[2] = (char)(0x80 | (u & 0x3F));
+        return 3;
+    }
+    buf[0] = (char)(0xF0 | u >> 18);
+    buf[1] = (char)(0x80 | (u >> 12 & 0x3F));
+    buf[2] = (char)(0x80 | (u >> 6 & 0x3F));
+    buf[3] = (char)(0x80 | (u & 0x3F));
+    return 4;
+}
+
+static inline sal_char sal_utf8_decode(const char *s)
+{
+    const unsigned char *u = (const unsigned char *)s;
+    int count = u[0] < 0xC0 ? 0 : u[0] < 0xE0 ? 1 : u[0] < 0xF0 ? 2 : 3, i;
+    sal_char res = count ? u[0] & (0x3F >> count) : u[0];
+    for (i = 1; i <= count; i++) {
+        if ((u[i] & 0xC0) != 0x80)
+            return u[0];
+        res = res << 6 | (u[i] & 0x3F);
+    }
+    return res;
+}
+
+/* как Double.ToString() в .NET: кратчайшая запись, 1.0 -> 1, 1e+20 -> 1E+20 */
+static inline void sal_format_float(double value, char *buf)
+{
+    char tmp[32], digits[20];
+    int precision, exponent, count = 0, i;
+    const char *p = tmp;
+
+    if (isnan(value)) {
+        strcpy(buf, "NaN");
+        return;
+    }
+    if (isinf(value)) {
+        strcpy(buf, value > 0 ? "Infinity" : "-Infinity");
+        return;
+    }
+    for (precision = 1;; precision++) {
+        snprintf(tmp, sizeof tmp, "%.*e", precision - 1, value);
+        if (precision == 17 || strtod(tmp, NULL) == value)
+            break;
+    }
+    if (*p == '-')
+        *buf++ = *p++;
+    for (; *p != 'e'; p++)
+        if (*p != '.')
+            digits[count++] = *p;
+    exponent = atoi(p + 1);
+    while (count > 1 && digits[count - 1] == '0')
+        count--;
+    if (exponent < -4 || exponent >= 16) {
+        *buf++ = digits[0];
+        if (count > 1) {
+            *buf++ = '.';
+            memcpy(buf, digits + 1, count - 1);
+            buf += count - 1;
+        }
+        sprintf(buf, "E%c%02d", exponent < 0 ? '-' : '+', abs(exponent));
+    } else if (exponent < 0) {
+        *buf++ = '0';
+        *buf++ = '.';
+        for (i = -1; i > exponent; i--)
+            *buf++ = '0';
+        memcpy(buf, digits, count);
+        buf[count] = '\0';
+    } else {
+        for (i = 0; i <= exponent || i < count; i++) {
+            if (i == exponent + 1)
+                *buf++ = '.';
+            *buf++ = i < count ? digits[i] : '0';
+        }
+        *buf = '\0';
+    }
+}
+
+static inline sal_str sal_concat(sal_str a, sal_str b)
+{
+    size_t len_a = strlen(a), len_b = strlen(b);
+    char *res = sal_alloc(len_a + len_b + 1);
+    memcpy(res, a, len_a);
+    memcpy(res + len_a, b, len_b + 1);
+    return res;
+}
+
+static inline sal_str sal_str_int(int32_t value)
+{
+    char *res = sal_alloc(12);
+    snprintf(res, 12, "%ld", (long)value);
+    return res;
+}
+
+static inline sal_str sal_str_float(double value)
+{
+    char *res = sal_alloc(32);
+    sal_format_float(value, res);
+    return res;
+}
+
+static inline sal_str sal_str_bool(bool value) { return value ? "да" : "нет"; }
+
+static inline sal_str sal_str_char(sal_char value)
+{
+    char *res = sal_alloc(5);
+    res[sal_utf8_encode(value, res)] = '\0';
+    return res;
+}
+
+static inline void sal_out_int(FILE *f, int32_t value) { fprintf(f, "%ld", (long)value); }
+static inline void sal_out_bool(FILE *f, bool value) { fputs(value ? "да" : "нет", f); }
+static inline void sal_out_str(FILE *f, sal_str value) { fputs(value, f); }
+
+static inline void sal_out_float(FILE *f, double value)
+{
+    char buf[32];
+    sal_format_float(value, buf);
+    fputs(buf, f);
+}
+
+static inline void sal_out_char(FILE *f, sal_char value)
+{
+    char buf[4];
+    fwrite(buf, 1, sal_utf8_encode(value, buf), f);
+}
+
+static inline char *sal_read_line(void)
+{
+    size_t size = 64, len = 0;
+    char *line = sal_alloc(size);
+    int c;
+
+    while ((c = getchar()) != EOF && c != '\n') {
+        if (len + 1 == size) {
+            line = realloc(line, size *= 2);
+            if (line == NULL)
+                sal_fail("Недостаточно памяти");
+        }
+        line[len++] = (char)c;
+    }
+    if (c == EOF && len == 0)
+        sal_fail("Нет входных данных для ввода");
+    while (len > 0 && line[len - 1] == '\r')
+        len--;
+    line[len] = '\0';
+    return line;
+}
+
+static inline char *sal_strip(char *s)
+{
+    char *end = s + strlen(s);
+    while (*s == ' ' || *s == '\t')
+        s++;
+    while (end > s && (end[-1] == ' ' || end[-1] == '\t'))
+        end--;
+    *end = '\0';
+    return s;
+}
+
+static inline void sal_bad_input(const char *text, const char *type_name)
+{
+    fflush(stdout);
+    printf("Ошибка: Введено \"%s\", ожидалось значение типа %s\n", text, type_name);
+    exit(1);
+}
+
+static inline int32_t sal_in_int(void)
+{
+    char *text = sal_strip(sal_read_line()), *end;
+    long long value;
+
+    errno = 0;
+    value = strtoll(text, &end, 10);
+    if (*text == '\0' || *end != '\0' || errno != 0 || value < INT32_MIN || value > INT32_MAX)
+        sal_bad_input(text, "цел");
+    return (int32_t)value;
+}
+
+static inline double sal_in_float(void)
+{
+    char *text = sal_strip(sal_read_line()), *end, *p;
+    double value;
+
+    for (p = text; *p; p++)
+        if (*p == ',')
+            *p = '.';
+    value = strtod(text, &end);
+    if (*text == '\0' || *end != '\0')
+        sal_bad_input(text, "вещ");
+    return value;
+}
+
+static inline bool sal_in_bool(void)
+{
+    char *text = sal_strip(sal_read_line());
+    if (strcmp(text, "да") != 0 && strcmp(text, "нет") != 0)
+        sal_bad_input(text, "лог");
+    return strcmp(text, "да") == 0;
+}
+
+static inline sal_str sal_in_str(void) { return sal_read_line(); }
+
+static inline sal_char sal_in_char(void)
+{
+    char *line = sal_read_line();
+    if (*line == '\0')
+        sal_bad_input(line, "сим");
+    return sal_utf8_decode(line);
+}
+'''
+
+
+class CBuildException(Exception):
+    def __init__(self, message, *args: object) -> None:
+        self.message = message
+
+
+def c_string(value: str) -> str:
+    """Строковый литерал C (UTF-8; управляющие символы - восьмеричные escape-последовательности, ? - против
+       триграфов)
+    """
+
+    chars = []
+    for c in value:
+        if c in '\\"?':
+            chars.append('\\' + c)
+        elif ord(c) < 0x20 or ord(c) == 0x7f:
+            chars.append('\\{:03o}'.format(ord(c)))
+        else:
+            chars.append(c)
+    return '"{}"'.format(''.join(chars))
+
+
+def c_float(value: float) -> str:
+    if value != value:
+        return 'NAN'
+    if value in (float('inf'), float('-inf')):
+        return 'HUGE_VAL' if value > 0 else '(-HUGE_VAL)'
+    return repr(value) if value >= 0 else '({!r})'.format(value)
+
+
+def c_int(value: int) -> str:
+    # -2147483648 в C - унарный минус к литералу, не помещающемуся в int
+    if value == -2 ** 31:
+        return '(-2147483647 - 1)'
+    return str(value) if value >= 0 else '({})'.format(value)
+
+
+class CGenerator:
+    """Генератор исходного текста C; реализация для выражения возвращает текст выражения
+    """
+
+    def __init__(self, dump_globals: bool = False) -> None:
+        self.lines: List[str] = []
+        self.indent = 0
+        self.loop_depth = 0
+        self.temps: List[BaseType] = []
+        self.decls_pos = 0
+        self.dump_globals = dump_globals
+
+    def add(self, line: str) -> None:
+        self.lines.append('    ' * self.indent + line)
+
+    def name(self, ident: IdentDesc) -> str:
+        if ident.scope == ScopeType.PARAM:
+            return 'p{}'.format(ident.index)
+        if ident.scope == ScopeType.LOCAL:
+            return 'v{}'.format(ident.index)
+        return 'g{}'.format(ident.index)
+
+    def temp(self, type_: BaseType) -> str:
+        self.temps.append(type_)
+        return 't{}'.format(len(self.temps) - 1)
+
+    def block(self, node: Optional[AstNode]):
+        """Тело составного оператора с отступом (генератор для yield from), без фигурных скобок
+        """
+
+        self.indent += 1
+        if node is not None:
+            yield node
+        self.indent -= 1
+
+    def add_expr(self, node: AstNode, res: str) -> None:
+        # выражение-оператор (например, вызов функции с результатом)
+        if isinstance(node, FuncCallNode) and node.node_type == TypeDesc.VOID:
+            self.add(res + ';')
+        else:
+            self.add('(void) {};'.format(res))
+
+    def signature(self, node: FuncDeclNode) -> str:
+        params = ['{} {}'.format(C_TYPE_NAMES[var.node_ident.type.base_type], self.name(var.node_ident))
+                  for decl in node.params.vars for var in decl.vars]
+        if node.res is not None:
+            params.append('{} *out'.format(C_TYPE_NAMES[res_ident(node).type.base_type]))
+        return 'static void f_{}({})'.format(node.name.name, ', '.join(params) or 'void')
+
+    def start_function(self, header: str, locals_types: List[BaseType]) -> None:
+        self.add(header)
+        self.add('{')
+        self.indent += 1
+        self.loop_depth = 0
+        self.temps = []
+        # переменные, которые читаются до присваивания, равны нулю типа (как в .locals init)
+        for i, type_ in enumerate(locals_types):
+            self.add('{} v{} = {};'.format(C_TYPE_NAMES[type_], i, C_ZERO_VALUES[type_]))
+        self.decls_pos = len(self.lines)
+
+    def end_function(self) -> None:
+        # временные переменные для результатов вызовов известны только после генерации тела
+        self.lines[self.decls_pos:self.decls_pos] = ['    {} t{};'.format(C_TYPE_NAMES[type_], i)
+                                                     for i, type_ in enumerate(self.temps)]
+        self.indent -= 1
+        self.add('}')
+
+    def gen_program(self, prog: StmtListNode) -> str:
+        self.lines.extend(RUNTIME.splitlines())
+        fields = program_fields(prog)
+        if fields:
+            self.add('')
+        for ident in fields:
+            type_ = ident.type.base_type
+            self.add('static {} g{} = {};'.format(C_TYPE_NAMES[type_], ident.index, C_ZERO_VALUES[type_]))
+        funcs = [stmt for stmt in prog.stmts if isinstance(stmt, FuncDeclNode)]
+        if funcs:
+            self.add('')
+        for func in funcs:
+            self.add(self.signature(func) + ';')
+        for func in funcs:
+            self.add('')
+            self.c_gen(func)
+
+        main_stmts = [stmt for stmt in prog.stmts if not isinstance(stmt, FuncDeclNode)]
+        locals_types = decls_locals([decl for stmt in main_stmts
+                                     for decl in ([stmt] if isinstance(stmt, VarDeclNode) else find_vars_decls(stmt))])
+        self.add('')
+        self.start_function('int main(void)', locals_types)
+        for stmt in main_stmts:
+            res = self.c_gen(stmt)
+            if res is not None:
+                self.add_expr(stmt, res)
+        if self.dump_globals:
+            # значения глобальных переменных в stderr (для сравнения с другими способами выполнения)
+            for ident in fields:
+                self.add('fputs("g{}=", stderr);'.format(ident.index))
+                self.add('sal_out_{}(stderr, g{});'.format(RUNTIME_SUFFIXES[ident.type.base_type], ident.index))
+                self.add("fputc('\\n', stderr);")
+        self.add('return 0;')
+        self.end_function()
+        return '\n'.join(self.lines) + '\n'
+
+    @visitor.on('node')
+    def c_gen(self, node):
+        pass
+
+    @visitor.when(AstNode)
+    def c_gen(self, node: AstNode) -> None:
+        raise CBuildException('{} не поддерживается генератором C'.format(node))
+
+    @visitor.when(NumNode)
+    def c_gen(self, node: NumNode) -> str:
+        return c_float(node.value) if isinstance(node.value, float) else c_int(node.value)
+
+    @visitor.when(BoolNode)
+    def c_gen(self, node: BoolNode) -> str:
+        return 'true' if node.value else 'false'
+
+    @visitor.when(StringNode)
+    def c_gen(self, node: StringNode) -> str:
+        # значения строк и символов хранятся вместе с кавычками
+        return c_string(node.value[1:-1])
+
+    @visitor.when(CharacterNode)
+    def c_gen(self, node: CharacterNode) -> str:
+        return str(ord(node.value[1:-1]))
+
+    @visitor.when(IdentNode)
+    def c_gen(self, node: IdentNode) -> str:
+        return self.name(node.node_ident)
+
+    @visitor.when(BinOpNode)
+    def c_gen(self, node: BinOpNode) -> str:
+        a = yield node.arg1
+        b = yield node.arg2
+        type_ = node.arg1.node_type.base_type
+        if type_ == BaseType.INT and node.op in INT_OPS:
+            return '{}({}, {})'.format(INT_OPS[node.op], a, b)
+        if type_ == BaseType.STR:
+            if node.op == BinOp.ADD:
+                return 'sal_concat({}, {})'.format(a, b)
+            # как String.CompareOrdinal: порядок байтов UTF-8 совпадает с порядком кодов символов
+            return '(strcmp({}, {}) {} 0)'.format(a, b, OPS[node.op])
+        if type_ == BaseType.FLOAT and node.op in (BinOp.GE, BinOp.LE):
+            # как clt/cgt + ceq 0 в MSIL: для NaN истинно
+            return '!({} {} {})'.format(a, '<' if node.op == BinOp.GE else '>', b)
+        op = OPS.get(node.op)
+        if op is None:
+            raise CBuildException('Операция {} не поддерживается'.format(node.op.value))
+        return '({} {} {})'.format(a, op, b)
+
+    @visitor.when(TypeConvertNode)
+    def c_gen(self, node: TypeConvertNode) -> str:
+        a = yield node.expr
+        from_type, to_type = node.expr.node_type.base_type, node.node_type.base_type
+        if to_type == BaseType.STR and from_type in RUNTIME_SUFFIXES:
+            return 'sal_str_{}({})'.format(RUNTIME_SUFFIXES[from_type], a)
+        if (from_type, to_type) == (BaseType.INT, BaseType.FLOAT):
+            return '((double) {})'.format(a)
+        if (from_type, to_type) == (BaseType.INT, BaseType.BOOL):
+            return '({} != 0)'.format(a)
+        raise CBuildException('Преобразование {} в {} не поддерживается'.format(node.expr.node_type,
+                                                                               node.node_type))
+
+    @visitor.when(FuncCallNode)
+    def c_gen(self, node: FuncCallNode) -> str:
+        if node.name.node_ident.built_in:
+            raise CBuildException('Встроенная функция {} не поддерживается'.format(node.name.name))
+        args = []
+        for param in node.params:
+            args.append((yield param))
+        if node.node_type == TypeDesc.VOID:
+            return 'f_{}({})'.format(node.name.name, ', '.join(args))
+        res = self.temp(node.node_type.base_type)
+        return '(f_{}({}), {})'.format(node.name.name, ', '.join(args + ['&' + res]), res)
+
+    @visitor.when(AssignNode)
+    def c_gen(self, node: AssignNode) -> None:
+        value = yield node.val
+        self.add('{} = {};'.format(self.name(node.var.node_ident), value))
+
+    @visitor.when(VarDeclNode)
+    def c_gen(self, node: VarDeclNode) -> None:
+        for var in node.vars:
+            if isinstance(var, AssignNode) and var.val is not None:
+                yield var
+
+    @visitor.when(StmtListNode)
+    def c_gen(self, node: StmtListNode) -> None:
+        for stmt in node.stmts:
+            res = yield stmt
+            if res is not None:
+                self.add_expr(stmt, res)
+
+    @visitor.when(OutputNode)
+    def c_gen(self, node: OutputNode) -> None:
+        for arg in node.args:
+            value = yield arg
+            self.add('sal_out_{}(stdout, {});'.format(RUNTIME_SUFFIXES[arg.node_type.base_type], value))
+        self.add("putchar('\\n');")
+
+    @visitor.when(InputNode)
+    def c_gen(self, node: InputNode) -> None:
+        self.add('{} = sal_in_{}();'.format(self.name(node.var.node_ident),
+                                            RUNTIME_SUFFIXES[node.var.node_type.base_type]))
+
+    @visitor.when(IfNode)
+    def c_gen(self, node: IfNode) -> None:
+        cond = yield node.cond
+        self.add('if ({}) {{'.format(cond))
+        yield from self.block(node.then_stmt)
+        if node.else_stmt:
+            self.add('} else {')
+            yield from self.block(node.else_stmt)
+        self.add('}')
+
+    @visitor.when(WhileNode)
+    def c_gen(self, node: WhileNode) -> None:
+        cond = yield node.cond
+        self.add('while ({}) {{'.format(cond))
+        yield from self.block(node.body)
+        self.add('}')
+
+    @visitor.when(DoWhileNode)
+    def c_gen(self, node: DoWhileNode) -> None:
+        self.add('do {')
+        yield from self.block(node.body)
+        cond = yield node.cond
+        self.add('}} while ({});'.format(cond))
+
+    @visitor.when(ForNode)
+    def c_gen(self, node: ForNode) -> None:
+        name = self.name(node.init.node_ident)
+        bound = 'b{}'.format(self.loop_depth)
+        start = yield node.cond
+        self.add('{} = {};'.format(name, start))
+        # конечное значение вычисляется один раз, после присваивания начального
+        self.add('{')
+        self.indent += 1
+        end = yield node.step
+        self.add('const int32_t {} = {};'.format(bound, end))
+        self.add('for (; {0} <= {1}; {0} = sal_add({0}, 1)) {{'.format(name, bound))
+        self.loop_depth += 1
+        yield from self.block(node.body)
+        self.loop_depth -= 1
+        self.add('}')
+        self.indent -= 1
+        self.add('}')
+
+    @visitor.when(FuncDeclNode)
+    def c_gen(self, node: FuncDeclNode) -> None:
+        self.start_function(self.signature(node), func_locals(node))
+        if node.body is not None:
+            yield node.body
+        if node.res is not None:
+            self.add('*out = {};'.format(self.name(res_ident(node))))
+        self.end_function()
+
+
+def gen_program(prog: StmtListNode, dump_globals: bool = False) -> str:
+    return CGenerator(dump_globals).gen_program(prog)
+
+
+def find_compiler(cc: str = CC) -> Optional[str]:
+    return shutil.which(cc)
+
+
+def build(source: str, exe_path: str, cc: str = CC, flags: Sequence[str] = CFLAGS) -> float:
+    """Сборка исполняемого файла компилятором C (исходник записывается рядом: <exe_path>.c)
+    :return: время сборки в секундах
+    """
+
+    compiler = find_compiler(cc)
+    if compiler is None:
+        raise CBuildException('Компилятор C {} не найден'.format(cc))
+    c_path = exe_path + '.c'
+    with open(c_path, mode='w', encoding='utf-8', newline='\n') as f:
+        f.write(source)
+    start = time.perf_counter()
+    res = subprocess.run([compiler, *flags, '-o', exe_path, c_path, '-lm'], stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT, universal_newlines=True)
+    if res.returncode != 0:
+        raise CBuildException('{} завершился с кодом {}:{}{}'.format(cc, res.returncode, os.linesep, res.stdout))
+    return time.perf_counter() - start
+
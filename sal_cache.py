@@ -0,0 +1,206 @@
+"""Общие средства для кэшей компилятора на диске
+"""
+
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+# каталог кэшей (SAL_CACHE_DIR='' - не кэшировать на диске)
+CACHE_DIR = os.environ.get('SAL_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'sal_compiler'))
+
+# модули, от которых зависит результат компиляции (шаблоны имен): грамматика и построение AST, порядок проходов
+# в program.py, кэши и все генераторы - изменение любого из них меняет ключи кэша единиц трансляции и функций
+COMPILER_MODULES = ('sal_*.py', 'visitor.py', 'program.py')
+
+_compiler_version: Optional[str] = None
+
+
+def cache_path(*parts: str) -> Optional[str]:
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, *parts)
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Запись через временный файл в том же каталоге + os.replace:
+       параллельные процессы видят либо старый, либо полностью записанный файл
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode='wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def atomic_copy(src_path: str, path: str) -> None:
+    """Копирование файла по частям с заменой через os.replace (как atomic_write)
+    """
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode='wb') as f, open(src_path, mode='rb') as src:
+            shutil.copyfileobj(src, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def compiler_version() -> str:
+    """Хэш исходников модулей компилятора - меняется при любом изменении семантики или кодогенерации
+    """
+
+    global _compiler_version
+
+    if _compiler_version is None:
+        h = hashlib.sha256()
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        paths = sorted({path for pattern in COMPILER_MODULES for path in glob.glob(os.path.join(base_dir, pattern))})
+        for path in paths:
+            h.update(os.path.basename(path).encode('utf-8') + b'\0')
+            with open(path, mode='rb') as f:
+                h.update(f.read())
+        _compiler_version = h.hexdigest()[:16]
+    return _compiler_version
+
+
+DEFAULT_UNIT_CACHE_SIZE = int(os.environ.get('SAL_CACHE_SIZE_MB', '256')) * 1024 * 1024
+
+
+class UnitCache:
+    """Кэш результатов компиляции целых единиц трансляции (content-addressed):
+       ключ - хэш текста исходника, версии компилятора и флагов компиляции, значение - MSIL.
+       Размер ограничен, при превышении удаляются давно не использованные записи (LRU по mtime)
+    """
+
+    def __init__(self, max_size: int = DEFAULT_UNIT_CACHE_SIZE, directory: Optional[str] = None) -> None:
+        self.directory = directory or cache_path('units')
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        # оценка размера кэша (без обхода каталога на каждую запись)
+        self.total_size: Optional[int] = None
+
+    @staticmethod
+    def key(src: str, flags: str = '') -> str:
+        h = hashlib.sha256(compiler_version().encode())
+        h.update(b'\0' + flags.encode('utf-8') + b'\0')
+        h.update(src.encode('utf-8'))
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.msil')
+
+    def get(self, key: str) -> Optional[str]:
+        text = None
+        if self.directory:
+            path = self.path(key)
+            try:
+                with open(path, mode='rb') as f:
+                    # в файле записи текст хранится с завершающим переводом строки (как в .msil файлах)
+                    text = f.read().decode('utf-8')[:-1]
+                os.utime(path)
+            except OSError:
+                pass
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.bytes_saved += len(text.encode('utf-8'))
+        return text
+
+    def get_file(self, key: str, out_path: str) -> bool:
+        """Скопировать результат из кэша в out_path (без чтения в память целиком)
+        :return: найден ли результат в кэше
+        """
+
+        path = self.path(key) if self.directory else None
+        try:
+            if path is None:
+                raise FileNotFoundError(key)
+            atomic_copy(path, out_path)
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        self.bytes_saved += os.path.getsize(out_path)
+        return True
+
+    def put(self, key: str, text: str) -> None:
+        if not self.directory:
+            return
+        data = (text + '\n').encode('utf-8')
+        try:
+            atomic_write(self.path(key), data)
+        except OSError:
+            return
+        self.added(len(data))
+
+    def put_file(self, key: str, src_path: str) -> None:
+        if not self.directory:
+            return
+        try:
+            atomic_copy(src_path, self.path(key))
+        except OSError:
+            return
+        self.added(os.path.getsize(src_path))
+
+    def added(self, size: int) -> None:
+        if self.total_size is None:
+            self.total_size = self.usage()[0]
+        else:
+            self.total_size += size
+        if self.total_size > self.max_size:
+            self.evict()
+
+    def entries(self) -> list:
+        res = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return res
+        for name in names:
+            if not name.endswith('.msil'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            res.append((st.st_mtime, st.st_size, name))
+        return res
+
+    def usage(self) -> tuple:
+        """(размер в байтах, кол-во записей)
+        """
+
+        entries = self.entries()
+        return sum(size for _, size, _ in entries), len(entries)
+
+    def evict(self) -> None:
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+        self.total_size = total
+
+    def report(self) -> str:
+        size, count = self.usage() if self.directory else (0, 0)
+        return 'hits: {}, misses: {}, bytes saved: {}, cache: {} entries, {} / {} bytes'.format(
+            self.hits, self.misses, self.bytes_saved, count, size, self.max_size)
@@ -0,0 +1,75 @@
+"""Контекст одной компиляции: параметры, диагностики и счетчики оптимизаторов
+
+Разбор, проверка, оптимизация и генерация кода не изменяют состояние модулей и классов: позиции узлов берутся
+из токенов lark (row, col узла), ошибки записываются в диагностики контекста, счетчики peephole-оптимизатора,
+отчет о встраивании и время проходов IR - в объекты контекста. Поэтому несколько компиляций, каждая со своим
+контекстом, можно выполнять одновременно (пул потоков, run_in_executor в asyncio); общие объекты процесса -
+только парсеры и встроенные идентификаторы (создаются один раз под блокировкой и дальше только читаются)
+и кэши, записывающие файлы атомарно (см. program.compile_in_context).
+"""
+
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+
+import sal_parser
+from sal_inline import InlineOptions, InlineReport
+from sal_peephole import Peephole
+
+if TYPE_CHECKING:
+    from sal_ir_passes import PassManager
+
+# уровень оптимизации, начиная с которого MSIL-код методов проходит через peephole-оптимизатор
+PEEPHOLE_LEVEL = 2
+
+
+class CompileOptions(NamedTuple):
+    """Параметры компиляции
+       parser_engine - движок парсера (sal_parser.ENGINES)
+       opt_level - уровень оптимизации (0, 1, 2)
+       inline - параметры встраивания функций (-O2)
+       ir - генерировать MSIL через IR (sal_ir)
+       incremental - брать проверенные функции и их код из кэша функций процесса
+    """
+
+    parser_engine: str = sal_parser.DEFAULT_ENGINE
+    opt_level: int = 0
+    inline: InlineOptions = InlineOptions()
+    ir: bool = False
+    incremental: bool = False
+
+
+class Diagnostic(NamedTuple):
+    """Сообщение компилятора; message уже содержит позицию (как SemanticException.message)
+    """
+
+    message: str
+    row: Optional[int] = None
+    col: Optional[int] = None
+
+
+class CompileContext:
+    """Состояние одной компиляции (или последовательности компиляций одного потока)
+    """
+
+    def __init__(self, options: CompileOptions = CompileOptions()) -> None:
+        self.options = options
+        self.diagnostics: List[Diagnostic] = []
+        self.peephole: Optional[Peephole] = Peephole() if options.opt_level >= PEEPHOLE_LEVEL else None
+        self.inline_report = InlineReport()
+        # проходы IR нужны только при генерации через IR (модули IR импортируются только тогда)
+        self.ir_passes: Optional['PassManager'] = None
+        if options.ir:
+            from sal_ir_passes import PassManager
+
+            self.ir_passes = PassManager()
+        # время этапов компиляции в секундах (parse, check, optimize, codegen)
+        self.times: Dict[str, float] = {}
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    def error(self, message: str, row: Optional[int] = None, col: Optional[int] = None) -> None:
+        self.diagnostics.append(Diagnostic(message, row, col))
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.diagnostics)
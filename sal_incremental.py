@@ -0,0 +1,146 @@
+"""Инкрементальная компиляция на уровне функций.
+
+Для каждой функции (алг) вычисляется ключ: хэш ее текста (в виде AST) и описаний глобальных
+идентификаторов, которые она использует (сигнатуры вызываемых функций, глобальные переменные).
+Если ключ уже есть в кэше, тело функции не проверяется и код не генерируется заново -
+функция только объявляется в глобальной области видимости, а ее MSIL-код берется из кэша
+(метки в коде функции нумеруются с нуля, поэтому код не зависит от положения функции в программе).
+"""
+
+import hashlib
+import pickle
+import threading
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import sal_cache
+from sal_ast import AstNode, FuncCallNode, FuncDeclNode, IdentNode, StmtListNode, TypeNode
+from sal_msil import CodeGenerator
+from sal_optimizer import optimize
+from sal_peephole import Peephole
+from sal_semantic_checker import declare_funcs
+from sal_semantic_base import IdentDesc, IdentScope, SemanticException, TypeDesc
+
+
+class CachedFunc(NamedTuple):
+    return_type: str
+    params: Tuple[str, ...]
+    code: List[str]
+
+
+class FunctionCache:
+    """Кэш функций: в памяти процесса и (если задан SAL_CACHE_DIR) на диске; один кэш процесса используют
+       одновременные компиляции (program.compile_in_context), поэтому записи и счетчики изменяются под блокировкой
+       (чтение и запись файлов - вне ее, файлы записываются атомарно)
+    """
+
+    def __init__(self, use_disk: bool = True) -> None:
+        self.entries: Dict[str, CachedFunc] = {}
+        self.use_disk = use_disk
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def path(self, key: str) -> Optional[str]:
+        return sal_cache.cache_path('functions', key[:2], key + '.pickle') if self.use_disk else None
+
+    def get(self, key: str) -> Optional[CachedFunc]:
+        with self.lock:
+            entry = self.entries.get(key)
+        path = self.path(key)
+        loaded = False
+        if entry is None and path:
+            try:
+                with open(path, mode='rb') as f:
+                    entry = CachedFunc(*pickle.load(f))
+                loaded = True
+            except (OSError, pickle.UnpicklingError, EOFError, TypeError):
+                pass
+        with self.lock:
+            if loaded:
+                entry = self.entries.setdefault(key, entry)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: CachedFunc) -> None:
+        with self.lock:
+            self.entries[key] = entry
+        path = self.path(key)
+        if path:
+            try:
+                sal_cache.atomic_write(path, pickle.dumps(tuple(entry), pickle.HIGHEST_PROTOCOL))
+            except OSError:
+                pass
+
+    def report(self) -> str:
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        return 'функции: {}, из кэша: {}, скомпилировано: {}'.format(hits + misses, hits, misses)
+
+
+def walk(node: AstNode):
+    """Обход поддерева (в глубину, без рекурсии): пары (глубина, узел)
+    """
+
+    stack = [(0, node)]
+    while stack:
+        depth, n = stack.pop()
+        yield depth, n
+        stack.extend((depth + 1, child) for child in reversed(n.children) if child is not None)
+
+
+def func_key(node: FuncDeclNode, scope: IdentScope, opt_level: int = 0) -> str:
+    """Ключ функции в кэше
+    :param scope: область видимости, в которой объявляется функция
+    :param opt_level: уровень оптимизации, с которым генерируется код функции
+    """
+
+    h = hashlib.sha256(sal_cache.compiler_version().encode())
+    h.update('O{}\n'.format(opt_level).encode())
+    names: Set[str] = set()
+    for depth, n in walk(node):
+        h.update('{} {} {}\n'.format(depth, type(n).__name__, n).encode('utf-8'))
+        if isinstance(n, FuncCallNode):
+            names.add(n.name.name)
+        elif isinstance(n, IdentNode) and not isinstance(n, TypeNode):
+            names.add(n.name)
+    for name in sorted(names):
+        ident = scope.get_ident(name)
+        if ident is not None:
+            h.update('{} {} {} {} {}\n'.format(name, ident.type, ident.scope, ident.index, ident.built_in).encode('utf-8'))
+    return h.hexdigest()
+
+
+def check_program(checker, prog: StmtListNode, scope: IdentScope,
+                  cache: FunctionCache, opt_level: int = 0,
+                  peephole: Optional[Peephole] = None) -> Dict[FuncDeclNode, List[str]]:
+    """Семантический анализ программы с кэшированием функций
+    :param peephole: peephole-оптимизатор MSIL-кода функций (уровень оптимизации уже входит в ключ кэша)
+    :return: MSIL-код функций (для CodeGenerator.msil_gen_program)
+    """
+
+    if not prog.program:
+        scope = IdentScope(scope)
+    # сигнатуры всех функций известны до проверки (в т.ч. функций из кэша)
+    declare_funcs(prog, scope)
+    func_code: Dict[FuncDeclNode, List[str]] = {}
+    for stmt in prog.stmts:
+        if not isinstance(stmt, FuncDeclNode):
+            stmt.semantic_check(checker, scope)
+            continue
+        key = func_key(stmt, scope, opt_level)
+        entry = cache.get(key)
+        if entry is None:
+            stmt.semantic_check(checker, scope)
+            optimize(stmt, opt_level)
+            type_ = stmt.name.node_type
+            entry = CachedFunc(str(type_.return_type), tuple(str(p) for p in type_.params),
+                               CodeGenerator(peephole=peephole).msil_gen_func(stmt))
+            cache.put(key, entry)
+        else:
+            stmt.node_type = TypeDesc.VOID
+        func_code[stmt] = entry.code
+    prog.node_type = TypeDesc.VOID
+    return func_code
@@ -0,0 +1,307 @@
+"""Встраивание (inlining) небольших функций в места вызова (включается ключом -O2)
+
+Встраиваются вызовы-операторы (FuncCallNode непосредственно в списке операторов или в теле если/нц)
+функций только с арг-параметрами (без рез), тело которых не больше бюджета (InlineOptions.budget, узлов AST)
+и которые не вызывают сами себя (в том числе через другие функции). Функция определяется
+по семантической информации вызова (FuncCallNode.name.node_ident), поэтому встраивание выполняется
+после семантического анализа.
+
+Вызов заменяется блоком: параметры становятся новыми локальными переменными, инициализированными
+фактическими аргументами (в порядке аргументов, как при вызове), за ними следует копия тела функции,
+в которой все параметры и локальные переменные заменены новыми (глобальные переменные и функции общие).
+Локальные переменные без инициализации в копии явно обнуляются: .locals init обнуляет слот только
+при входе в метод, а встроенный код может выполняться в цикле.
+
+Функции обрабатываются снизу вверх по графу вызовов (сначала вызываемые), поэтому в копии тела уже встроены
+вызовы из нее. Функции, на которые не осталось вызовов, удаляются при InlineOptions.drop_unused.
+Слоты новых локальных переменных распределяет sal_regalloc (после остальных оптимизаций).
+"""
+
+import copy
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from sal_ast import AssignNode, AstNode, BoolNode, DoWhileNode, ForNode, FuncCallNode, FuncDeclNode, IdentNode, \
+    IfNode, NumNode, StmtListNode, VarDeclNode, WhileNode
+from sal_semantic_base import BaseType, IdentDesc, ScopeType, TypeDesc
+
+DEFAULT_BUDGET = 40
+
+
+class InlineOptions(NamedTuple):
+    """Параметры встраивания
+       budget - наибольший размер тела встраиваемой функции (узлов AST), 0 - встраивание выключено
+       drop_unused - удалять функции, на которые не осталось вызовов
+    """
+
+    budget: int = DEFAULT_BUDGET
+    drop_unused: bool = False
+
+
+class InlineReport:
+    """Что было встроено; накапливается по всем обработанным программам (как счетчики Peephole)
+    """
+
+    def __init__(self) -> None:
+        # (вызывающая функция, встроенная функция) -> количество встроенных вызовов
+        self.inlined: Counter = Counter()
+        self.dropped: List[str] = []
+        # вызовы пользовательских функций в тексте программы до и после встраивания
+        self.calls_before = 0
+        self.calls_after = 0
+
+    def merge(self, other: 'InlineReport') -> None:
+        self.inlined.update(other.inlined)
+        self.dropped.extend(other.dropped)
+        self.calls_before += other.calls_before
+        self.calls_after += other.calls_after
+
+    def __str__(self) -> str:
+        inlined = ', '.join('{} <- {} ({})'.format(caller, callee, count)
+                            for (caller, callee), count in sorted(self.inlined.items()))
+        res = 'inlined: {}; calls: {} -> {}'.format(inlined or '-', self.calls_before, self.calls_after)
+        if self.dropped:
+            res += '; dropped: ' + ', '.join(self.dropped)
+        return res
+
+
+MAIN_NAME = 'Main'
+
+
+def tree_size(node: Optional[AstNode]) -> int:
+    res = 0
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        res += 1
+        stack.extend(n.children)
+    return res
+
+
+def func_calls(node: Optional[AstNode]) -> List[FuncCallNode]:
+    """Вызовы в поддереве (объявления вложенных функций не просматриваются)
+    """
+
+    res = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n is None or isinstance(n, FuncDeclNode) and n is not node:
+            continue
+        if isinstance(n, FuncCallNode):
+            res.append(n)
+        stack.extend(n.children)
+    return res
+
+
+def param_idents(node: FuncDeclNode) -> List[IdentDesc]:
+    return [var.node_ident for decl in node.params.vars for var in decl.vars]
+
+
+def zero_literal(type_: TypeDesc) -> AstNode:
+    node = BoolNode(False) if type_.base_type == BaseType.BOOL else \
+        NumNode('0.0' if type_.base_type == BaseType.FLOAT else '0')
+    node.node_type = type_
+    return node
+
+
+class Inliner:
+    def __init__(self, prog: StmtListNode, options: InlineOptions, report: Optional[InlineReport] = None) -> None:
+        self.prog = prog
+        self.options = options
+        self.report = report if report is not None else InlineReport()
+        self.funcs: Dict[IdentDesc, FuncDeclNode] = {
+            stmt.name.node_ident: stmt for stmt in prog.stmts
+            if isinstance(stmt, FuncDeclNode) and stmt.name.node_ident is not None
+        }
+        self.callees: Dict[FuncDeclNode, Set[FuncDeclNode]] = {
+            func: self.user_callees(func.body) for func in self.funcs.values()
+        }
+        self.recursive = {func for func in self.funcs.values() if func in self.reachable(func)}
+        # встраиваемые функции (решение принимается, когда в тело функции уже встроены ее вызовы)
+        self.inlinable: Set[FuncDeclNode] = set()
+
+    def user_callees(self, node: Optional[AstNode]) -> Set[FuncDeclNode]:
+        return {self.funcs[call.name.node_ident] for call in func_calls(node) if call.name.node_ident in self.funcs}
+
+    def reachable(self, func: FuncDeclNode) -> Set[FuncDeclNode]:
+        res: Set[FuncDeclNode] = set()
+        stack = list(self.callees[func])
+        while stack:
+            f = stack.pop()
+            if f not in res:
+                res.add(f)
+                stack.extend(self.callees[f])
+        return res
+
+    def bottom_up(self) -> List[FuncDeclNode]:
+        """Функции в порядке обхода графа вызовов в глубину (вызываемые раньше вызывающих)
+        """
+
+        order: List[FuncDeclNode] = []
+        visited: Set[FuncDeclNode] = set()
+        for root in self.funcs.values():
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self.callees[root]))]
+            while stack:
+                func, it = stack[-1]
+                callee = next(it, None)
+                if callee is None:
+                    stack.pop()
+                    order.append(func)
+                elif callee not in visited:
+                    visited.add(callee)
+                    stack.append((callee, iter(self.callees[callee])))
+        return order
+
+    def can_inline(self, func: FuncDeclNode) -> bool:
+        if func.res is not None or func.body is None or func in self.recursive:
+            return False
+        if tree_size(func.body) > self.options.budget:
+            return False
+        # обнулить при встраивании можно только переменные простых типов (у лит/сим значение по умолчанию - null)
+        stack: List[AstNode] = [func.body]
+        while stack:
+            n = stack.pop()
+            if isinstance(n, VarDeclNode):
+                for var in n.vars:
+                    if isinstance(var, IdentNode) and var.node_ident is not None and \
+                            var.node_ident.type.base_type not in (BaseType.INT, BaseType.FLOAT, BaseType.BOOL):
+                        return False
+            stack.extend(child for child in n.children if child is not None)
+        return True
+
+    def expand(self, call: FuncCallNode, func: FuncDeclNode) -> StmtListNode:
+        """Блок, которым заменяется вызов call функции func
+        """
+
+        memo: Dict[int, object] = {}
+        idents: Dict[IdentDesc, IdentDesc] = {}
+
+        def fresh(ident: IdentDesc) -> IdentDesc:
+            if ident not in idents:
+                idents[ident] = IdentDesc('{}.{}'.format(func.name.name, ident.name), ident.type, ScopeType.LOCAL,
+                                          ident.index)
+                memo[id(ident)] = idents[ident]
+            return idents[ident]
+
+        stmts: List[AstNode] = []
+        for decl, param, arg in zip((decl for decl in func.params.vars for _ in decl.vars), param_idents(func),
+                                    call.params):
+            var = IdentNode(fresh(param).name, row=call.row, col=call.col)
+            var.node_ident, var.node_type = fresh(param), param.type
+            assign = AssignNode(var, arg, row=call.row, col=call.col)
+            assign.node_type = param.type
+            stmt = VarDeclNode(decl.type, assign, row=call.row, col=call.col)
+            stmt.node_type = TypeDesc.VOID
+            stmts.append(stmt)
+
+        # описания глобальных переменных и функций в копии общие, параметров и локальных переменных - новые
+        stack: List[AstNode] = [func.body]
+        while stack:
+            n = stack.pop()
+            ident = n.node_ident
+            if ident is not None and id(ident) not in memo:
+                if ident.scope in (ScopeType.PARAM, ScopeType.LOCAL):
+                    fresh(ident)
+                else:
+                    memo[id(ident)] = ident
+            if isinstance(n, FuncCallNode):
+                # имя функции не входит в children вызова
+                stack.append(n.name)
+            stack.extend(child for child in n.children if child is not None)
+        body = copy.deepcopy(func.body, memo)
+
+        stack = [body]
+        while stack:
+            n = stack.pop()
+            if isinstance(n, VarDeclNode):
+                n.vars = tuple(self.zero_init(var) for var in n.vars)
+            stack.extend(child for child in n.children if child is not None)
+
+        stmts.extend(body.stmts if isinstance(body, StmtListNode) else (body,))
+        res = StmtListNode(*stmts, row=call.row, col=call.col)
+        res.node_type = TypeDesc.VOID
+        return res
+
+    @staticmethod
+    def zero_init(var: AstNode) -> AstNode:
+        if not isinstance(var, IdentNode) or var.node_ident is None or var.node_ident.scope != ScopeType.LOCAL:
+            return var
+        assign = AssignNode(var, zero_literal(var.node_ident.type), row=var.row, col=var.col)
+        assign.node_type = var.node_ident.type
+        return assign
+
+    def inline_stmt(self, stmt: Optional[AstNode], caller: str) -> Optional[AstNode]:
+        if not isinstance(stmt, FuncCallNode):
+            return stmt
+        func = self.funcs.get(stmt.name.node_ident)
+        if func is None or func not in self.inlinable:
+            return stmt
+        self.report.inlined[(caller, func.name.name)] += 1
+        return self.expand(stmt, func)
+
+    def inline_calls(self, node: AstNode, caller: str) -> AstNode:
+        """Встраивание вызовов-операторов в поддереве (node - тело функции или оператор основной программы)
+        """
+
+        node = self.inline_stmt(node, caller)
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n is None or isinstance(n, FuncDeclNode):
+                continue
+            if isinstance(n, StmtListNode):
+                n.stmts = tuple(self.inline_stmt(stmt, caller) for stmt in n.stmts)
+            elif isinstance(n, IfNode):
+                n.then_stmt = self.inline_stmt(n.then_stmt, caller)
+                n.else_stmt = self.inline_stmt(n.else_stmt, caller)
+            elif isinstance(n, (WhileNode, DoWhileNode, ForNode)):
+                n.body = self.inline_stmt(n.body, caller)
+            stack.extend(n.children)
+        return node
+
+    def drop_unused(self) -> None:
+        """Удаление функций, на которые нет вызовов (кроме вызовов из самой функции), до неподвижной точки
+        """
+
+        stmts = list(self.prog.stmts)
+        while True:
+            used = {callee for stmt in stmts if not isinstance(stmt, FuncDeclNode)
+                    for callee in self.user_callees(stmt)}
+            used.update(callee for stmt in stmts if isinstance(stmt, FuncDeclNode)
+                        for callee in self.callees[stmt] if callee is not stmt)
+            unused = [stmt for stmt in stmts if isinstance(stmt, FuncDeclNode) and stmt not in used]
+            if not unused:
+                break
+            self.report.dropped.extend(func.name.name for func in unused)
+            stmts = [stmt for stmt in stmts if stmt not in unused]
+        self.prog.stmts = tuple(stmts)
+
+    def run(self) -> None:
+        self.report.calls_before += len(self.user_calls())
+        for func in self.bottom_up():
+            func.body = self.inline_calls(func.body, func.name.name)
+            self.callees[func] = self.user_callees(func.body)
+            if self.can_inline(func):
+                self.inlinable.add(func)
+        self.prog.stmts = tuple(stmt if isinstance(stmt, FuncDeclNode) else self.inline_calls(stmt, MAIN_NAME)
+                                for stmt in self.prog.stmts)
+        if self.options.drop_unused:
+            self.drop_unused()
+        self.report.calls_after += len(self.user_calls())
+
+    def user_calls(self) -> List[FuncCallNode]:
+        return [call for stmt in self.prog.stmts for call in func_calls(stmt) if call.name.node_ident in self.funcs]
+
+
+def inline_program(prog: StmtListNode, options: InlineOptions, report: Optional[InlineReport] = None) -> None:
+    """Встраивание функций в программе (корневой StmtListNode изменяется на месте)
+    """
+
+    if options.budget > 0:
+        Inliner(prog, options, report).run()
@@ -0,0 +1,439 @@
+"""Трехадресное промежуточное представление (IR) между проверенным AST и MSIL
+
+Программа - список функций: по одной на FuncDeclNode и Main (операторы вне функций). Функция - граф потока
+управления из базовых блоков (Block); блок - список инструкций (Instr) и завершающая инструкция
+(jump, branch или ret), переходы - ссылки на блоки. Порядок блоков в Function.blocks - порядок размещения кода.
+
+Операнды инструкций - значения с типом (TypeDesc):
+  - Temp - временная переменная (t0, t1, ...), в IR, построенном из AST, присваивается ровно один раз;
+  - Var - переменная программы (глобальная, параметр или локальная) по IdentDesc;
+  - Const - константа (литерал).
+
+Построение из AST (IrBuilder) сохраняет порядок вычислений MSIL-генератора: операнды инструкции вычисляются
+в порядке аргументов, поэтому переменная или константа, за которой следует сложный операнд, сначала копируется
+во временную переменную (чтение переменной остается до вызовов в следующих операндах). Так же временные
+переменные используются в порядке стека, и при генерации MSIL (sal_ir_msil) остаются на стеке.
+"""
+
+from enum import Enum
+from typing import Dict, List, Optional, Union
+
+import visitor
+from sal_ast import AssignNode, AstNode, BinOpNode, BoolNode, CharacterNode, DoWhileNode, ForNode, FuncCallNode, \
+    FuncDeclNode, IdentNode, IfNode, InputNode, NumNode, OutputNode, StmtListNode, StringNode, TypeConvertNode, VarDeclNode, \
+    WhileNode
+from sal_msil import MsilException, decl_idents, find_vars_decls, res_ident
+from sal_semantic_base import BaseType, BinOp, IdentDesc, ScopeType, TypeDesc
+
+
+class Temp:
+    __slots__ = ('index', 'type')
+
+    def __init__(self, index: int, type_: TypeDesc) -> None:
+        self.index = index
+        self.type = type_
+
+    def __str__(self) -> str:
+        return 't{}'.format(self.index)
+
+
+class Var:
+    __slots__ = ('ident',)
+
+    def __init__(self, ident: IdentDesc) -> None:
+        self.ident = ident
+
+    @property
+    def type(self) -> TypeDesc:
+        return self.ident.type
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Var) and other.ident is self.ident
+
+    def __hash__(self) -> int:
+        return hash(self.ident)
+
+    def __str__(self) -> str:
+        # глобальные - @имя, параметры - %имя, локальные - имя#слот
+        if self.ident.scope == ScopeType.PARAM:
+            return '%' + self.ident.name
+        if self.ident.scope == ScopeType.LOCAL:
+            return '{}#{}'.format(self.ident.name, self.ident.index)
+        return '@' + self.ident.name
+
+
+class Const:
+    __slots__ = ('type', 'value')
+
+    def __init__(self, type_: TypeDesc, value) -> None:
+        self.type = type_
+        # строки и символы хранятся вместе с кавычками (как в StringNode/CharacterNode)
+        self.value = value
+
+    def __str__(self) -> str:
+        if self.type == TypeDesc.BOOL:
+            return 'да' if self.value else 'нет'
+        return str(self.value)
+
+
+Operand = Union[Temp, Var, Const]
+
+
+class IrOp(Enum):
+    COPY = 'copy'        # dest = a
+    BINOP = 'binop'      # dest = a op b
+    CONVERT = 'convert'  # dest = convert a (библиотека времени выполнения)
+    CALL = 'call'        # [dest =] call f(args)
+    JUMP = 'jump'        # jump B
+    BRANCH = 'branch'    # branch a ? B1 : B2
+    RET = 'ret'          # ret [a]
+
+    def __str__(self):
+        return self.value
+
+
+TERMINATORS = (IrOp.JUMP, IrOp.BRANCH, IrOp.RET)
+
+
+class Instr:
+    __slots__ = ('op', 'dest', 'args', 'bin_op', 'func', 'targets')
+
+    def __init__(self, op: IrOp, dest: Optional[Union[Temp, Var]] = None, args: Optional[List[Operand]] = None,
+                 bin_op: Optional[BinOp] = None, func: Optional[IdentDesc] = None,
+                 targets: Optional[List['Block']] = None) -> None:
+        self.op = op
+        self.dest = dest
+        self.args = args or []
+        self.bin_op = bin_op
+        self.func = func
+        self.targets = targets or []
+
+    def __str__(self) -> str:
+        args = self.args
+        if self.op == IrOp.JUMP:
+            return 'jump {}'.format(self.targets[0].label)
+        if self.op == IrOp.BRANCH:
+            return 'branch {} ? {} : {}'.format(args[0], self.targets[0].label, self.targets[1].label)
+        if self.op == IrOp.RET:
+            return 'ret' + ''.join(' {}'.format(arg) for arg in args)
+        if self.op == IrOp.COPY:
+            value = str(args[0])
+        elif self.op == IrOp.BINOP:
+            value = '{} {} {}'.format(args[0], self.bin_op, args[1])
+        elif self.op == IrOp.CONVERT:
+            value = 'convert {}'.format(args[0])
+        else:
+            value = 'call {}({})'.format(self.func.name, ', '.join(str(arg) for arg in args))
+        if self.dest is None:
+            return value
+        dest = '{}: {}'.format(self.dest, self.dest.type) if isinstance(self.dest, Temp) else str(self.dest)
+        return '{} = {}'.format(dest, value)
+
+
+class Block:
+    __slots__ = ('index', 'instrs', 'term')
+
+    def __init__(self) -> None:
+        # номер назначается при размещении блока в функции
+        self.index = -1
+        self.instrs: List[Instr] = []
+        self.term: Optional[Instr] = None
+
+    @property
+    def label(self) -> str:
+        return 'B{}'.format(self.index)
+
+    @property
+    def successors(self) -> List['Block']:
+        return self.term.targets if self.term is not None else []
+
+
+class Function:
+    def __init__(self, name: str, params: List[IdentDesc], result: Optional[IdentDesc],
+                 return_type: TypeDesc) -> None:
+        self.name = name
+        self.params = params
+        self.result = result
+        self.return_type = return_type
+        self.blocks: List[Block] = []
+        self.temp_count = 0
+        self.block_count = 0
+
+    @property
+    def entry(self) -> Block:
+        return self.blocks[0]
+
+    def new_temp(self, type_: TypeDesc) -> Temp:
+        temp = Temp(self.temp_count, type_)
+        self.temp_count += 1
+        return temp
+
+    def place(self, block: Block) -> Block:
+        block.index = self.block_count
+        self.block_count += 1
+        self.blocks.append(block)
+        return block
+
+    def predecessors(self) -> Dict[Block, List[Block]]:
+        preds: Dict[Block, List[Block]] = {block: [] for block in self.blocks}
+        for block in self.blocks:
+            for succ in block.successors:
+                if block not in preds[succ]:
+                    preds[succ].append(block)
+        return preds
+
+    def dump(self) -> List[str]:
+        params = ', '.join('%{}: {}'.format(param.name, param.type) for param in self.params)
+        res = ['func {}({}) -> {}{}:'.format(self.name, params, self.return_type,
+                                             '' if self.result is None else ' [рез {}]'.format(Var(self.result)))]
+        preds = self.predecessors()
+        for block in self.blocks:
+            res.append('{}:{}'.format(block.label, '' if not preds[block] else
+                                      '  ; preds: ' + ', '.join(pred.label for pred in preds[block])))
+            res.extend('    {}'.format(instr) for instr in block.instrs)
+            if block.term is not None:
+                res.append('    {}'.format(block.term))
+        return res
+
+
+class IrProgram:
+    def __init__(self, fields: List[IdentDesc], functions: List[Function]) -> None:
+        # глобальные переменные (статические поля Program) в порядке объявления
+        self.fields = fields
+        # функции в порядке объявления, Main - последняя
+        self.functions = functions
+
+    def dump(self) -> List[str]:
+        res = ['field @{}: {}'.format(field.name, field.type) for field in self.fields]
+        for func in self.functions:
+            if res:
+                res.append('')
+            res.extend(func.dump())
+        return res
+
+
+MAIN_NAME = 'Main'
+LEAF_NODES = (IdentNode, NumNode, BoolNode, StringNode, CharacterNode)
+
+
+def program_fields(prog: StmtListNode) -> List[IdentDesc]:
+    """Глобальные переменные программы (в том же порядке, что и поля у CodeGenerator.msil_gen_program)
+    """
+
+    decls: List[VarDeclNode] = []
+    for stmt in prog.stmts:
+        if isinstance(stmt, VarDeclNode):
+            decls.append(stmt)
+        elif not isinstance(stmt, FuncDeclNode):
+            decls.extend(find_vars_decls(stmt))
+    return [ident for decl in decls for ident in decl_idents(decl)
+            if ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL)]
+
+
+class IrBuilder:
+    """Построение IR из проверенного AST; реализация для выражения возвращает операнд со значением выражения
+    """
+
+    def __init__(self) -> None:
+        self.func: Optional[Function] = None
+        self.block: Optional[Block] = None
+
+    def build_program(self, prog: StmtListNode) -> IrProgram:
+        functions = [self.build_function(stmt) for stmt in prog.stmts if isinstance(stmt, FuncDeclNode)]
+        main = self.start_function(Function(MAIN_NAME, [], None, TypeDesc.VOID))
+        for stmt in prog.stmts:
+            if not isinstance(stmt, FuncDeclNode):
+                self.lower(stmt)
+        self.finish(Instr(IrOp.RET))
+        functions.append(main)
+        return IrProgram(program_fields(prog), functions)
+
+    def build_function(self, node: FuncDeclNode) -> Function:
+        params = [var.node_ident for decl in node.params.vars for var in decl.vars]
+        result = res_ident(node) if node.res is not None else None
+        func = self.start_function(Function(node.name.name, params, result, node.type.type))
+        if node.body is not None:
+            self.lower(node.body)
+        self.finish(Instr(IrOp.RET, args=[] if result is None else [Var(result)]))
+        return func
+
+    def start_function(self, func: Function) -> Function:
+        self.func = func
+        self.block = func.place(Block())
+        return func
+
+    def start(self, block: Block) -> None:
+        self.block = self.func.place(block)
+
+    def emit(self, instr: Instr) -> Instr:
+        self.block.instrs.append(instr)
+        return instr
+
+    def finish(self, term: Instr) -> None:
+        self.block.term = term
+        self.block = None
+
+    def value(self, op: IrOp, type_: TypeDesc, args: List[Operand], **kwargs) -> Temp:
+        temp = self.func.new_temp(type_)
+        self.emit(Instr(op, temp, args, **kwargs))
+        return temp
+
+    def materialize(self, operand: Operand) -> Temp:
+        if isinstance(operand, Temp):
+            return operand
+        return self.value(IrOp.COPY, operand.type, [operand])
+
+    def assign(self, var: Var, value: Operand) -> None:
+        # t = ...; x = t -> x = ... (временная переменная только что создана и еще не использована)
+        instrs = self.block.instrs
+        if isinstance(value, Temp) and instrs and instrs[-1].dest is value:
+            instrs[-1].dest = var
+        else:
+            self.emit(Instr(IrOp.COPY, var, [value]))
+
+    @visitor.on('node')
+    def lower(self, node):
+        pass
+
+    @visitor.when(AstNode)
+    def lower(self, node: AstNode) -> None:
+        raise MsilException('{} не поддерживается в IR'.format(node))
+
+    @visitor.when(OutputNode)
+    def lower(self, node: OutputNode) -> None:
+        # как и в CodeGenerator, вывод пока не генерируется (выполняется только в sal_vm)
+        return None
+
+    @visitor.when(InputNode)
+    def lower(self, node: InputNode) -> None:
+        # ввод, как и вывод, не генерируется
+        return None
+
+    @visitor.when(NumNode)
+    def lower(self, node: NumNode) -> Operand:
+        return Const(node.node_type, node.value)
+
+    @visitor.when(BoolNode)
+    def lower(self, node: BoolNode) -> Operand:
+        return Const(TypeDesc.BOOL, bool(node.value))
+
+    @visitor.when(StringNode)
+    def lower(self, node: StringNode) -> Operand:
+        return Const(TypeDesc.STR, node.value)
+
+    @visitor.when(CharacterNode)
+    def lower(self, node: CharacterNode) -> Operand:
+        return Const(TypeDesc.CHAR, node.value)
+
+    @visitor.when(IdentNode)
+    def lower(self, node: IdentNode) -> Operand:
+        return Var(node.node_ident)
+
+    @visitor.when(BinOpNode)
+    def lower(self, node: BinOpNode) -> Operand:
+        a = yield node.arg1
+        if not isinstance(node.arg2, LEAF_NODES):
+            a = self.materialize(a)
+        b = yield node.arg2
+        return self.value(IrOp.BINOP, node.node_type, [a, b], bin_op=node.op)
+
+    @visitor.when(TypeConvertNode)
+    def lower(self, node: TypeConvertNode) -> Operand:
+        a = yield node.expr
+        return self.value(IrOp.CONVERT, node.node_type, [a])
+
+    @visitor.when(FuncCallNode)
+    def lower(self, node: FuncCallNode) -> Optional[Operand]:
+        args: List[Operand] = []
+        for i, param in enumerate(node.params):
+            arg = yield param
+            if any(not isinstance(p, LEAF_NODES) for p in node.params[i + 1:]):
+                arg = self.materialize(arg)
+            args.append(arg)
+        func = node.name.node_ident
+        if func.type.return_type == TypeDesc.VOID:
+            self.emit(Instr(IrOp.CALL, None, args, func=func))
+            return None
+        return self.value(IrOp.CALL, func.type.return_type, args, func=func)
+
+    @visitor.when(AssignNode)
+    def lower(self, node: AssignNode) -> None:
+        value = yield node.val
+        self.assign(Var(node.var.node_ident), value)
+
+    @visitor.when(VarDeclNode)
+    def lower(self, node: VarDeclNode) -> None:
+        for var in node.vars:
+            if isinstance(var, AssignNode) and var.val is not None:
+                yield var
+
+    @visitor.when(StmtListNode)
+    def lower(self, node: StmtListNode) -> None:
+        # значения выражений-операторов не используются (временная переменная без использований снимается со стека)
+        for stmt in node.stmts:
+            yield stmt
+
+    @visitor.when(IfNode)
+    def lower(self, node: IfNode) -> None:
+        cond = yield node.cond
+        then_block, end_block = Block(), Block()
+        else_block = Block() if node.else_stmt else end_block
+        self.finish(Instr(IrOp.BRANCH, args=[cond], targets=[then_block, else_block]))
+        self.start(then_block)
+        yield node.then_stmt
+        self.finish(Instr(IrOp.JUMP, targets=[end_block]))
+        if node.else_stmt:
+            self.start(else_block)
+            yield node.else_stmt
+            self.finish(Instr(IrOp.JUMP, targets=[end_block]))
+        self.start(end_block)
+
+    # циклы размещаются с проверкой условия в конце, как в CodeGenerator: тело, затем блок условия
+
+    @visitor.when(WhileNode)
+    def lower(self, node: WhileNode) -> None:
+        body_block, cond_block, exit_block = Block(), Block(), Block()
+        self.finish(Instr(IrOp.JUMP, targets=[cond_block]))
+        self.start(body_block)
+        if node.body is not None:
+            yield node.body
+        self.finish(Instr(IrOp.JUMP, targets=[cond_block]))
+        self.start(cond_block)
+        cond = yield node.cond
+        self.finish(Instr(IrOp.BRANCH, args=[cond], targets=[body_block, exit_block]))
+        self.start(exit_block)
+
+    @visitor.when(DoWhileNode)
+    def lower(self, node: DoWhileNode) -> None:
+        body_block, exit_block = Block(), Block()
+        self.finish(Instr(IrOp.JUMP, targets=[body_block]))
+        self.start(body_block)
+        if node.body is not None:
+            yield node.body
+        cond = yield node.cond
+        self.finish(Instr(IrOp.BRANCH, args=[cond], targets=[body_block, exit_block]))
+        self.start(exit_block)
+
+    @visitor.when(ForNode)
+    def lower(self, node: ForNode) -> None:
+        # нц для init от cond до step: конечное значение вычисляется один раз (константа или временная переменная)
+        var = Var(node.init.node_ident)
+        start = yield node.cond
+        self.assign(var, start)
+        bound = yield node.step
+        if not isinstance(bound, Const):
+            bound = self.materialize(bound)
+        body_block, cond_block, exit_block = Block(), Block(), Block()
+        self.finish(Instr(IrOp.JUMP, targets=[cond_block]))
+        self.start(body_block)
+        yield node.body
+        self.emit(Instr(IrOp.BINOP, var, [var, Const(TypeDesc.INT, 1)], bin_op=BinOp.ADD))
+        self.finish(Instr(IrOp.JUMP, targets=[cond_block]))
+        self.start(cond_block)
+        cond = self.value(IrOp.BINOP, TypeDesc.BOOL, [var, bound], bin_op=BinOp.LE)
+        self.finish(Instr(IrOp.BRANCH, args=[cond], targets=[body_block, exit_block]))
+        self.start(exit_block)
+
+
+def build_program(prog: StmtListNode) -> IrProgram:
+    return IrBuilder().build_program(prog)
@@ -0,0 +1,304 @@
+"""Генерация MSIL из IR (sal_ir) через CodeGenerator: те же заголовки методов, поля, load/store, метки и .locals init
+
+Временные переменные, которые используются один раз в том же блоке в порядке стека (так их создает IrBuilder),
+остаются на стеке; остальные получают слоты после локальных переменных функции (временные переменные,
+значение которых не используется, снимаются со стека). Порядок размещения блоков - порядок в Function.blocks:
+переход на следующий блок не генерируется, условный переход - brtrue/brfalse в зависимости от того,
+какой из блоков следует за текущим. Сравнение чисел прямо перед условным переходом объединяется с ним
+(bgt, blt, ble, ...; для вещественных обратные условия - с .un, как и отрицание сравнения у CodeGenerator).
+"""
+
+from typing import Dict, List, Optional, Set
+
+from sal_ir import Block, Function, Instr, IrOp, IrProgram, Temp, Var
+from sal_msil import BIN_OP_CMDS, MSIL_TYPE_NAMES, PROGRAM_CLASS_NAME, RUNTIME_CLASS_NAME, CodeGenerator, \
+    CodeLabel, MsilException, msil_func_type
+from sal_semantic_base import BaseType, BinOp, ScopeType, TypeDesc
+
+# условный переход по сравнению: (операция, тип операндов) -> (переход, если условие истинно; если ложно)
+COMPARE_BRANCHES = {}
+for _type in (BaseType.INT, BaseType.BOOL, BaseType.FLOAT):
+    _float = _type == BaseType.FLOAT
+    COMPARE_BRANCHES.update({
+        (BinOp.GT, _type): ('bgt', 'ble.un' if _float else 'ble'),
+        (BinOp.LT, _type): ('blt', 'bge.un' if _float else 'bge'),
+        # >= и <= у CodeGenerator - отрицание < и > (для NaN истинно)
+        (BinOp.GE, _type): ('bge.un' if _float else 'bge', 'blt'),
+        (BinOp.LE, _type): ('ble.un' if _float else 'ble', 'bgt'),
+        (BinOp.EQUALS, _type): ('beq', 'bne.un'),
+    })
+
+
+def temp_uses(func: Function) -> Dict[Temp, List[Block]]:
+    """Блоки использований временных переменных (по одному элементу на использование)
+    """
+
+    uses: Dict[Temp, List[Block]] = {}
+    for block in func.blocks:
+        for instr in block.instrs + ([block.term] if block.term is not None else []):
+            for arg in instr.args:
+                if isinstance(arg, Temp):
+                    uses.setdefault(arg, []).append(block)
+    return uses
+
+
+def stack_temps(func: Function) -> Set[Temp]:
+    """Временные переменные, которые остаются на стеке: одно определение и одно использование в том же блоке,
+       и использование в порядке стека (операнды на стеке - начало списка аргументов и вершина стека)
+    """
+
+    uses = temp_uses(func)
+    defs: Dict[Temp, int] = {}
+    for block in func.blocks:
+        for instr in block.instrs:
+            if isinstance(instr.dest, Temp):
+                defs[instr.dest] = defs.get(instr.dest, 0) + 1
+    candidates = {temp for temp, blocks in uses.items() if len(blocks) == 1 and defs.get(temp) == 1}
+    for block in func.blocks:
+        instrs = block.instrs + ([block.term] if block.term is not None else [])
+        changed = True
+        while changed:
+            changed = False
+            pending: List[Temp] = []
+            for instr in instrs:
+                prefix = 0
+                while prefix < len(instr.args) and instr.args[prefix] in candidates:
+                    prefix += 1
+                operands = instr.args[:prefix]
+                if prefix and pending[-prefix:] != operands:
+                    candidates.difference_update(operands)
+                    candidates.difference_update(pending)
+                    changed = True
+                    break
+                if prefix:
+                    del pending[-prefix:]
+                late = [arg for arg in instr.args[prefix:] if arg in candidates]
+                if late:
+                    candidates.difference_update(late)
+                    changed = True
+                    break
+                if instr.dest in candidates:
+                    if uses[instr.dest][0] is not block:
+                        candidates.discard(instr.dest)
+                    else:
+                        pending.append(instr.dest)
+            else:
+                if pending:
+                    candidates.difference_update(pending)
+                    changed = True
+    return candidates
+
+
+class IrCodeGenerator:
+    """MSIL-код из IR; строки добавляются в CodeGenerator (с его peephole-оптимизатором, если он задан)
+    """
+
+    def __init__(self, gen: CodeGenerator) -> None:
+        self.gen = gen
+
+    def gen_program(self, ir: IrProgram) -> None:
+        gen = self.gen
+        gen.start()
+        for field in ir.fields:
+            gen.add(f' .field public static {MSIL_TYPE_NAMES[field.type.base_type]} _gv{field.index}')
+        if ir.fields:
+            gen.add('')
+        for func in ir.functions[:-1]:
+            for line in self.gen_method(func):
+                gen.add(line)
+        gen.add('')
+        gen.add('  .method public static void Main()')
+        gen.add('  {')
+        gen.add('  .entrypoint')
+        for line in self.gen_body(ir.functions[-1], main=True):
+            gen.add(line)
+        gen.add('  }')
+        gen.end()
+        if gen.out is not None:
+            gen.flush()
+
+    def gen_method(self, func: Function) -> List[str]:
+        params = ', '.join(f'{MSIL_TYPE_NAMES[param.type.base_type]} {param.name}' for param in func.params)
+        lines = [f' .method public static {MSIL_TYPE_NAMES[func.return_type.base_type]} {func.name}({params}) '
+                 f'cil managed', '  {']
+        lines.extend(self.gen_body(func))
+        lines.append('  }')
+        return lines
+
+    def gen_body(self, func: Function, main: bool = False) -> List[str]:
+        """Тело метода: .locals init и код (метки нумеруются с нуля, как у CodeGenerator.msil_gen_func)
+        """
+
+        return FunctionEmitter(func, main).emit(self.gen.peephole)
+
+
+class FunctionEmitter:
+    def __init__(self, func: Function, main: bool = False) -> None:
+        self.func = func
+        self.main = main
+        self.gen = CodeGenerator()
+        self.uses = temp_uses(func)
+        self.stack = stack_temps(func)
+        self.labels: Dict[Block, CodeLabel] = {}
+        self.slots: Dict[Temp, int] = {}
+
+    def locals_types(self) -> List[BaseType]:
+        types: Dict[int, BaseType] = {}
+        for block in self.func.blocks:
+            for instr in block.instrs + ([block.term] if block.term is not None else []):
+                for value in instr.args + [instr.dest]:
+                    if isinstance(value, Var) and value.ident.scope == ScopeType.LOCAL:
+                        types[value.ident.index] = value.type.base_type
+        res = [types.get(i, BaseType.INT) for i in range(max(types) + 1)] if types else []
+        # слоты временных переменных, которые не остаются на стеке
+        temps = sorted({value for block in self.func.blocks for instr in block.instrs
+                        for value in [instr.dest] if isinstance(value, Temp) and value not in self.stack and
+                        value in self.uses}, key=lambda t: t.index)
+        for temp in temps:
+            self.slots[temp] = len(res)
+            res.append(temp.type.base_type)
+        return res
+
+    def emit(self, peephole=None) -> List[str]:
+        gen = self.gen
+        locals_types = self.locals_types()
+        if locals_types:
+            gen.add('      .locals init ({})'.format(
+                ', '.join(f'{MSIL_TYPE_NAMES[t]} V_{i}' for i, t in enumerate(locals_types))))
+        blocks = self.func.blocks
+        # метки только у блоков, на которые будет переход (на следующий блок переход не генерируется)
+        targets: Set[Block] = set()
+        for i, block in enumerate(blocks):
+            next_block = blocks[i + 1] if i + 1 < len(blocks) else None
+            if block.term is not None and block.term.op != IrOp.RET:
+                successors = set(block.term.targets)
+                targets.update(successors if len(successors) > 1 and next_block not in successors else
+                               (target for target in successors if target is not next_block))
+        for block in blocks:
+            if block in targets:
+                self.labels[block] = gen.label()
+        for i, block in enumerate(blocks):
+            if block in self.labels:
+                gen.add('', label=self.labels[block])
+            next_block = blocks[i + 1] if i + 1 < len(blocks) else None
+            fused = self.fused_compare(block)
+            for instr in block.instrs:
+                self.instr(instr, instr is fused)
+            if block.term is not None:
+                self.terminator(block.term, next_block, fused)
+        return peephole.run(gen.code) if peephole else gen.code
+
+    def fused_compare(self, block: Block) -> Optional[Instr]:
+        """Сравнение, которое объединяется с условным переходом в конце блока
+        """
+
+        term = block.term
+        if term is None or term.op != IrOp.BRANCH or not block.instrs or term.targets[0] is term.targets[1]:
+            return None
+        last = block.instrs[-1]
+        if last.op != IrOp.BINOP or last.dest is not term.args[0] or last.dest not in self.stack:
+            return None
+        if (last.bin_op, last.args[0].type.base_type) not in COMPARE_BRANCHES:
+            return None
+        return last
+
+    def load(self, value) -> None:
+        gen = self.gen
+        if isinstance(value, Temp):
+            if value not in self.stack:
+                gen.add('      ldloc', self.slots[value])
+        elif isinstance(value, Var):
+            gen.load(value.ident)
+        elif value.type == TypeDesc.BOOL:
+            gen.add('      ldc.i4', 1 if value.value else 0)
+        elif value.type == TypeDesc.STR:
+            gen.add(f'     ldstr {value.value}')
+        elif value.type == TypeDesc.CHAR:
+            gen.add(f'     ldstr "{value.value}"')
+        elif isinstance(value.value, int):
+            gen.add('      ldc.i4', value.value)
+        else:
+            gen.add('      ldc.r8', value.value)
+
+    def store(self, dest, produced: bool = True) -> None:
+        gen = self.gen
+        if dest is None:
+            if produced:
+                gen.add('      pop')
+        elif isinstance(dest, Var):
+            gen.store(dest.ident)
+        elif dest not in self.uses:
+            gen.add('      pop')
+        elif dest not in self.stack:
+            gen.add('      stloc', self.slots[dest])
+
+    def instr(self, instr: Instr, fused: bool = False) -> None:
+        gen = self.gen
+        for arg in instr.args:
+            self.load(arg)
+        if fused:
+            return
+        if instr.op == IrOp.BINOP:
+            if instr.args[0].type == TypeDesc.STR:
+                if instr.bin_op == BinOp.ADD:
+                    gen.add('      call string [mscorlib]System.String::Concat(string, string)')
+                elif instr.bin_op == BinOp.EQUALS:
+                    gen.add('      call bool [mscorlib]System.String::op_Equality(string, string)')
+                else:
+                    gen.add('      call int32 [mscorlib]System.String::CompareOrdinal(string, string)')
+                    gen.add('      ldc.i4', 0)
+                    self.bin_op_cmds(instr.bin_op)
+            else:
+                self.bin_op_cmds(instr.bin_op)
+        elif instr.op == IrOp.CONVERT:
+            gen.add(f'        call {MSIL_TYPE_NAMES[instr.dest.type.base_type]} class {RUNTIME_CLASS_NAME}::convert('
+                    f'{MSIL_TYPE_NAMES[instr.args[0].type.base_type]})')
+        elif instr.op == IrOp.CALL:
+            class_name = RUNTIME_CLASS_NAME if instr.func.built_in else PROGRAM_CLASS_NAME
+            return_type, param_types = msil_func_type(instr.func.type)
+            gen.add(f'        call {return_type} class {class_name}::{instr.func.name}({param_types})')
+            self.store(instr.dest, instr.func.type.return_type != TypeDesc.VOID)
+            return
+        self.store(instr.dest)
+
+    def bin_op_cmds(self, op: BinOp) -> None:
+        cmds = BIN_OP_CMDS.get(op)
+        if cmds is None:
+            raise MsilException('Операция {} не поддерживается'.format(op.value))
+        for cmd in cmds:
+            self.gen.add(cmd)
+
+    def terminator(self, term: Instr, next_block: Optional[Block], fused: Optional[Instr]) -> None:
+        gen = self.gen
+        if term.op == IrOp.RET:
+            for arg in term.args:
+                self.load(arg)
+            gen.add('  ret' if self.main else '      ret')
+            return
+        if term.op == IrOp.JUMP:
+            if term.targets[0] is not next_block:
+                gen.add('      br', self.labels[term.targets[0]])
+            return
+        then_block, else_block = term.targets
+        if then_block is else_block:
+            # без fold-branches: условие вычисляется, но не нужно
+            self.load(term.args[0])
+            gen.add('      pop')
+            self.terminator(Instr(IrOp.JUMP, targets=[then_block]), next_block, None)
+            return
+        if fused is not None:
+            if_true, if_false = COMPARE_BRANCHES[(fused.bin_op, fused.args[0].type.base_type)]
+        else:
+            self.load(term.args[0])
+            if_true, if_false = 'brtrue', 'brfalse'
+        if else_block is next_block:
+            gen.add('      ' + if_true, self.labels[then_block])
+        elif then_block is next_block:
+            gen.add('      ' + if_false, self.labels[else_block])
+        else:
+            gen.add('      ' + if_true, self.labels[then_block])
+            gen.add('      br', self.labels[else_block])
+
+
+def msil_gen_ir(gen: CodeGenerator, ir: IrProgram) -> None:
+    IrCodeGenerator(gen).gen_program(ir)
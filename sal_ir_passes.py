@@ -0,0 +1,174 @@
+"""Проходы над IR (sal_ir) и менеджер проходов с замером времени каждого прохода
+
+Проход - функция над Function, возвращающая True, если функция изменилась. Проходы по умолчанию (DEFAULT_PASSES):
+  - fold-branches: условный переход по константе или на один и тот же блок заменяется безусловным;
+  - thread-jumps: переход на пустой блок с безусловным переходом заменяется переходом на его цель;
+  - remove-unreachable: удаляются блоки, недостижимые из входного;
+  - merge-blocks: блок с единственным предшественником, который безусловно переходит на него,
+    присоединяется к предшественнику;
+  - remove-dead-temps: удаляются вычисления временных переменных без использований (кроме вызовов).
+Проходы повторяются, пока изменяют функции (не больше MAX_ROUNDS раз).
+"""
+
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from sal_ast import StmtListNode
+from sal_ir import Block, Const, Function, Instr, IrOp, IrProgram, Temp, build_program
+
+
+def fold_branches(func: Function) -> bool:
+    changed = False
+    for block in func.blocks:
+        term = block.term
+        if term is not None and term.op == IrOp.BRANCH:
+            if isinstance(term.args[0], Const):
+                block.term = Instr(IrOp.JUMP, targets=[term.targets[0] if term.args[0].value else term.targets[1]])
+                changed = True
+            elif term.targets[0] is term.targets[1]:
+                block.term = Instr(IrOp.JUMP, targets=[term.targets[0]])
+                changed = True
+    return changed
+
+
+def jump_target(block: Block) -> Block:
+    """Конечная цель цепочки пустых блоков с безусловным переходом (циклы из пустых блоков не проходятся)
+    """
+
+    seen: Set[Block] = set()
+    while not block.instrs and block.term is not None and block.term.op == IrOp.JUMP and block not in seen:
+        seen.add(block)
+        block = block.term.targets[0]
+    return block
+
+
+def thread_jumps(func: Function) -> bool:
+    changed = False
+    for block in func.blocks:
+        if block.term is None:
+            continue
+        targets = [jump_target(target) for target in block.term.targets]
+        if any(new is not old for new, old in zip(targets, block.term.targets)):
+            block.term.targets = targets
+            changed = True
+    return changed
+
+
+def remove_unreachable(func: Function) -> bool:
+    reachable: Set[Block] = set()
+    stack = [func.entry]
+    while stack:
+        block = stack.pop()
+        if block not in reachable:
+            reachable.add(block)
+            stack.extend(block.successors)
+    if len(reachable) == len(func.blocks):
+        return False
+    func.blocks = [block for block in func.blocks if block in reachable]
+    return True
+
+
+def merge_blocks(func: Function) -> bool:
+    changed = False
+    preds = func.predecessors()
+    i = 0
+    while i < len(func.blocks):
+        block = func.blocks[i]
+        term = block.term
+        if term is not None and term.op == IrOp.JUMP:
+            succ = term.targets[0]
+            if succ is not block and succ is not func.entry and preds[succ] == [block]:
+                block.instrs.extend(succ.instrs)
+                block.term = succ.term
+                func.blocks.remove(succ)
+                for target in block.successors:
+                    preds[target] = [block if pred is succ else pred for pred in preds[target]]
+                changed = True
+                continue
+        i += 1
+    return changed
+
+
+def remove_dead_temps(func: Function) -> bool:
+    changed = False
+    while True:
+        used: Set[Temp] = {arg for block in func.blocks
+                           for instr in block.instrs + ([block.term] if block.term is not None else [])
+                           for arg in instr.args if isinstance(arg, Temp)}
+        removed = False
+        for block in func.blocks:
+            instrs = [instr for instr in block.instrs
+                      if not (isinstance(instr.dest, Temp) and instr.dest not in used and instr.op != IrOp.CALL)]
+            if len(instrs) != len(block.instrs):
+                block.instrs = instrs
+                removed = True
+        if not removed:
+            return changed
+        changed = True
+
+
+Pass = Callable[[Function], bool]
+
+MAX_ROUNDS = 4
+
+DEFAULT_PASSES: Tuple[Tuple[str, Pass], ...] = (
+    ('fold-branches', fold_branches),
+    ('thread-jumps', thread_jumps),
+    ('remove-unreachable', remove_unreachable),
+    ('merge-blocks', merge_blocks),
+    ('remove-dead-temps', remove_dead_temps),
+)
+
+
+class PassManager:
+    """Выполнение проходов над всеми функциями программы; время и количество изменений каждого прохода
+       накапливаются по всем обработанным программам (как счетчики Peephole)
+    """
+
+    def __init__(self, passes: Sequence[Tuple[str, Pass]] = DEFAULT_PASSES) -> None:
+        self.passes = list(passes)
+        # время построения IR из AST (build) и каждого прохода
+        self.times: Dict[str, float] = {'build': 0.0}
+        self.times.update((name, 0.0) for name, _ in self.passes)
+        self.changes: Counter = Counter()
+
+    def merge(self, other: 'PassManager') -> None:
+        for name, seconds in other.times.items():
+            self.times[name] = self.times.get(name, 0.0) + seconds
+        self.changes.update(other.changes)
+
+    def build(self, prog: StmtListNode) -> IrProgram:
+        """Построение IR проверенной (и оптимизированной) программы и выполнение проходов
+        """
+
+        start = time.perf_counter()
+        program = build_program(prog)
+        self.times['build'] += time.perf_counter() - start
+        self.run(program)
+        return program
+
+    def run(self, program: IrProgram, names: Optional[List[str]] = None) -> None:
+        """
+        :param names: выполняемые проходы (по умолчанию - все)
+        """
+
+        for _ in range(MAX_ROUNDS):
+            changed = False
+            for name, pass_ in self.passes:
+                if names is not None and name not in names:
+                    continue
+                start = time.perf_counter()
+                for func in program.functions:
+                    if pass_(func):
+                        self.changes[name] += 1
+                        changed = True
+                self.times[name] += time.perf_counter() - start
+            if not changed:
+                break
+
+    def report(self) -> str:
+        return ', '.join('{}: {:.2f} ms{}'.format(name, seconds * 1000,
+                                                  ' ({} changed)'.format(self.changes[name]) if name in self.changes
+                                                  else '')
+                         for name, seconds in self.times.items())
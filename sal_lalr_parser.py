@@ -0,0 +1,3574 @@
+# Сгенерировано: python sal_parser.py --build-standalone
+GRAMMAR_HASH = '5e0126bd56942d6203b38b399597877c8ba154c9316367bc67f575de70200404'
+# The file was automatically generated by Lark v1.3.1
+__version__ = "1.3.1"
+
+#
+#
+#   Lark Stand-alone Generator Tool
+# ----------------------------------
+# Generates a stand-alone LALR(1) parser
+#
+# Git:    https://github.com/erezsh/lark
+# Author: Erez Shinan (erezshin@gmail.com)
+#
+#
+#    >>> LICENSE
+#
+#    This tool and its generated code use a separate license from Lark,
+#    and are subject to the terms of the Mozilla Public License, v. 2.0.
+#    If a copy of the MPL was not distributed with this
+#    file, You can obtain one at https://mozilla.org/MPL/2.0/.
+#
+#    If you wish to purchase a commercial license for this tool and its
+#    generated code, you may contact me via email or otherwise.
+#
+#    If MPL2 is incompatible with your free or open-source project,
+#    contact me and we'll work it out.
+#
+#
+
+from copy import deepcopy
+from abc import ABC, abstractmethod
+from types import ModuleType
+from typing import (
+    TypeVar, Generic, Type, Tuple, List, Dict, Iterator, Collection, Callable, Optional, FrozenSet, Any,
+    Union, Iterable, IO, TYPE_CHECKING, overload, Sequence,
+    Pattern as REPattern, ClassVar, Set, Mapping
+)
+
+
+class LarkError(Exception):
+    pass
+
+
+class ConfigurationError(LarkError, ValueError):
+    pass
+
+
+def assert_config(value, options: Collection, msg='Got %r, expected one of %s'):
+    if value not in options:
+        raise ConfigurationError(msg % (value, options))
+
+
+class GrammarError(LarkError):
+    pass
+
+
+class ParseError(LarkError):
+    pass
+
+
+class LexError(LarkError):
+    pass
+
+T = TypeVar('T')
+
+class UnexpectedInput(LarkError):
+    #--
+    line: int
+    column: int
+    pos_in_stream = None
+    state: Any
+    _terminals_by_name = None
+    interactive_parser: 'InteractiveParser'
+
+    def get_context(self, text: str, span: int=40) -> str:
+        #--
+        pos = self.pos_in_stream or 0
+        start = max(pos - span, 0)
+        end = pos + span
+        if not isinstance(text, bytes):
+            before = text[start:pos].rsplit('\n', 1)[-1]
+            after = text[pos:end].split('\n', 1)[0]
+            return before + after + '\n' + ' ' * len(before.expandtabs()) + '^\n'
+        else:
+            before = text[start:pos].rsplit(b'\n', 1)[-1]
+            after = text[pos:end].split(b'\n', 1)[0]
+            return (before + after + b'\n' + b' ' * len(before.expandtabs()) + b'^\n').decode("ascii", "backslashreplace")
+
+    def match_examples(self, parse_fn: 'Callable[[str], Tree]',
+                             examples: Union[Mapping[T, Iterable[str]], Iterable[Tuple[T, Iterable[str]]]],
+                             token_type_match_fallback: bool=False,
+                             use_accepts: bool=True
+                         ) -> Optional[T]:
+        #--
+        assert self.state is not None, "Not supported for this exception"
+
+        if isinstance(examples, Mapping):
+            examples = examples.items()
+
+        candidate = (None, False)
+        for i, (label, example) in enumerate(examples):
+            assert not isinstance(example, str), "Expecting a list"
+
+            for j, malformed in enumerate(example):
+                try:
+                    parse_fn(malformed)
+                except UnexpectedInput as ut:
+                    if ut.state == self.state:
+                        if (
+                            use_accepts
+                            and isinstance(self, UnexpectedToken)
+                            and isinstance(ut, UnexpectedToken)
+                            and ut.accepts != self.accepts
+                        ):
+                            logger.debug("Different accepts with same state[%d]: %s != %s at example [%s][%s]" %
+                                         (self.state, self.accepts, ut.accepts, i, j))
+                            continue
+                        if (
+                            isinstance(self, (UnexpectedToken, UnexpectedEOF))
+                            and isinstance(ut, (UnexpectedToken, UnexpectedEOF))
+                        ):
+                            if ut.token == self.token:  ##
+
+                                logger.debug("Exact Match at example [%s][%s]" % (i, j))
+                                return label
+
+                            if token_type_match_fallback:
+                                ##
+
+                                if (ut.token.type == self.token.type) and not candidate[-1]:
+                                    logger.debug("Token Type Fallback at example [%s][%s]" % (i, j))
+                                    candidate = label, True
+
+                        if candidate[0] is None:
+                            logger.debug("Same State match at example [%s][%s]" % (i, j))
+                            candidate = label, False
+
+        return candidate[0]
+
+    def _format_expected(self, expected):
+        if self._terminals_by_name:
+            d = self._terminals_by_name
+            expected = [d[t_name].user_repr() if t_name in d else t_name for t_name in expected]
+        return "Expected one of: \n\t* %s\n" % '\n\t* '.join(expected)
+
+
+class UnexpectedEOF(ParseError, UnexpectedInput):
+    #--
+    expected: 'List[Token]'
+
+    def __init__(self, expected, state=None, terminals_by_name=None):
+        super(UnexpectedEOF, self).__init__()
+
+        self.expected = expected
+        self.state = state
+        from .lexer import Token
+        self.token = Token("<EOF>", "")  ##
+
+        self.pos_in_stream = -1
+        self.line = -1
+        self.column = -1
+        self._terminals_by_name = terminals_by_name
+
+
+    def __str__(self):
+        message = "Unexpected end-of-input. "
+        message += self._format_expected(self.expected)
+        return message
+
+
+class UnexpectedCharacters(LexError, UnexpectedInput):
+    #--
+
+    allowed: Set[str]
+    considered_tokens: Set[Any]
+
+    def __init__(self, seq, lex_pos, line, column, allowed=None, considered_tokens=None, state=None, token_history=None,
+                 terminals_by_name=None, considered_rules=None):
+        super(UnexpectedCharacters, self).__init__()
+
+        ##
+
+        self.line = line
+        self.column = column
+        self.pos_in_stream = lex_pos
+        self.state = state
+        self._terminals_by_name = terminals_by_name
+
+        self.allowed = allowed
+        self.considered_tokens = considered_tokens
+        self.considered_rules = considered_rules
+        self.token_history = token_history
+
+        if isinstance(seq, bytes):
+            self.char = seq[lex_pos:lex_pos + 1].decode("ascii", "backslashreplace")
+        else:
+            self.char = seq[lex_pos]
+        self._context = self.get_context(seq)
+
+
+    def __str__(self):
+        message = "No terminal matches '%s' in the current parser context, at line %d col %d" % (self.char, self.line, self.column)
+        message += '\n\n' + self._context
+        if self.allowed:
+            message += self._format_expected(self.allowed)
+        if self.token_history:
+            message += '\nPrevious tokens: %s\n' % ', '.join(repr(t) for t in self.token_history)
+        return message
+
+
+class UnexpectedToken(ParseError, UnexpectedInput):
+    #--
+
+    expected: Set[str]
+    considered_rules: Set[str]
+
+    def __init__(self, token, expected, considered_rules=None, state=None, interactive_parser=None, terminals_by_name=None, token_history=None):
+        super(UnexpectedToken, self).__init__()
+
+        ##
+
+        self.line = getattr(token, 'line', '?')
+        self.column = getattr(token, 'column', '?')
+        self.pos_in_stream = getattr(token, 'start_pos', None)
+        self.state = state
+
+        self.token = token
+        self.expected = expected  ##
+
+        self._accepts = NO_VALUE
+        self.considered_rules = considered_rules
+        self.interactive_parser = interactive_parser
+        self._terminals_by_name = terminals_by_name
+        self.token_history = token_history
+
+
+    @property
+    def accepts(self) -> Set[str]:
+        if self._accepts is NO_VALUE:
+            self._accepts = self.interactive_parser and self.interactive_parser.accepts()
+        return self._accepts
+
+    def __str__(self):
+        message = ("Unexpected token %r at line %s, column %s.\n%s"
+                   % (self.token, self.line, self.column, self._format_expected(self.accepts or self.expected)))
+        if self.token_history:
+            message += "Previous tokens: %r\n" % self.token_history
+
+        return message
+
+
+
+class VisitError(LarkError):
+    #--
+
+    obj: 'Union[Tree, Token]'
+    orig_exc: Exception
+
+    def __init__(self, rule, obj, orig_exc):
+        message = 'Error trying to process rule "%s":\n\n%s' % (rule, orig_exc)
+        super(VisitError, self).__init__(message)
+
+        self.rule = rule
+        self.obj = obj
+        self.orig_exc = orig_exc
+
+
+class MissingVariableError(LarkError):
+    pass
+
+
+import sys, re
+import logging
+from dataclasses import dataclass
+from typing import Generic, AnyStr
+
+logger: logging.Logger = logging.getLogger("lark")
+logger.addHandler(logging.StreamHandler())
+##
+
+##
+
+logger.setLevel(logging.CRITICAL)
+
+
+NO_VALUE = object()
+
+T = TypeVar("T")
+
+
+def classify(seq: Iterable, key: Optional[Callable] = None, value: Optional[Callable] = None) -> Dict:
+    d: Dict[Any, Any] = {}
+    for item in seq:
+        k = key(item) if (key is not None) else item
+        v = value(item) if (value is not None) else item
+        try:
+            d[k].append(v)
+        except KeyError:
+            d[k] = [v]
+    return d
+
+
+def _deserialize(data: Any, namespace: Dict[str, Any], memo: Dict) -> Any:
+    if isinstance(data, dict):
+        if '__type__' in data:  ##
+
+            class_ = namespace[data['__type__']]
+            return class_.deserialize(data, memo)
+        elif '@' in data:
+            return memo[data['@']]
+        return {key:_deserialize(value, namespace, memo) for key, value in data.items()}
+    elif isinstance(data, list):
+        return [_deserialize(value, namespace, memo) for value in data]
+    return data
+
+
+_T = TypeVar("_T", bound="Serialize")
+
+class Serialize:
+    #--
+
+    def memo_serialize(self, types_to_memoize: List) -> Any:
+        memo = SerializeMemoizer(types_to_memoize)
+        return self.serialize(memo), memo.serialize()
+
+    def serialize(self, memo = None) -> Dict[str, Any]:
+        if memo and memo.in_types(self):
+            return {'@': memo.memoized.get(self)}
+
+        fields = getattr(self, '__serialize_fields__')
+        res = {f: _serialize(getattr(self, f), memo) for f in fields}
+        res['__type__'] = type(self).__name__
+        if hasattr(self, '_serialize'):
+            self._serialize(res, memo)
+        return res
+
+    @classmethod
+    def deserialize(cls: Type[_T], data: Dict[str, Any], memo: Dict[int, Any]) -> _T:
+        namespace = getattr(cls, '__serialize_namespace__', [])
+        namespace = {c.__name__:c for c in namespace}
+
+        fields = getattr(cls, '__serialize_fields__')
+
+        if '@' in data:
+            return memo[data['@']]
+
+        inst = cls.__new__(cls)
+        for f in fields:
+            try:
+                setattr(inst, f, _deserialize(data[f], namespace, memo))
+            except KeyError as e:
+                raise KeyError("Cannot find key for class", cls, e)
+
+        if hasattr(inst, '_deserialize'):
+            inst._deserialize()
+
+        return inst
+
+
+class SerializeMemoizer(Serialize):
+    #--
+
+    __serialize_fields__ = 'memoized',
+
+    def __init__(self, types_to_memoize: List) -> None:
+        self.types_to_memoize = tuple(types_to_memoize)
+        self.memoized = Enumerator()
+
+    def in_types(self, value: Serialize) -> bool:
+        return isinstance(value, self.types_to_memoize)
+
+    def serialize(self) -> Dict[int, Any]:  ##
+
+        return _serialize(self.memoized.reversed(), None)
+
+    @classmethod
+    def deserialize(cls, data: Dict[int, Any], namespace: Dict[str, Any], memo: Dict[Any, Any]) -> Dict[int, Any]:  ##
+
+        return _deserialize(data, namespace, memo)
+
+
+try:
+    import regex
+    _has_regex = True
+except ImportError:
+    _has_regex = False
+
+if sys.version_info >= (3, 11):
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+else:
+    import sre_parse
+    import sre_constants
+
+categ_pattern = re.compile(r'\\p{[A-Za-z_]+}')
+
+def get_regexp_width(expr: str) -> Union[Tuple[int, int], List[int]]:
+    if _has_regex:
+        ##
+
+        ##
+
+        ##
+
+        regexp_final = re.sub(categ_pattern, 'A', expr)
+    else:
+        if re.search(categ_pattern, expr):
+            raise ImportError('`regex` module must be installed in order to use Unicode categories.', expr)
+        regexp_final = expr
+    try:
+        ##
+
+        return [int(x) for x in sre_parse.parse(regexp_final).getwidth()]
+    except sre_constants.error:
+        if not _has_regex:
+            raise ValueError(expr)
+        else:
+            ##
+
+            ##
+
+            c = regex.compile(regexp_final)
+            ##
+
+            ##
+
+            MAXWIDTH = getattr(sre_parse, "MAXWIDTH", sre_constants.MAXREPEAT)
+            if c.match('') is None:
+                ##
+
+                return 1, int(MAXWIDTH)
+            else:
+                return 0, int(MAXWIDTH)
+
+
+@dataclass(frozen=True)
+class TextSlice(Generic[AnyStr]):
+    #--
+    text: AnyStr
+    start: int
+    end: int
+
+    def __post_init__(self):
+        if not isinstance(self.text, (str, bytes)):
+            raise TypeError("text must be str or bytes")
+
+        if self.start < 0:
+            object.__setattr__(self, 'start', self.start + len(self.text))
+            assert self.start >=0
+
+        if self.end is None:
+            object.__setattr__(self, 'end', len(self.text))
+        elif self.end < 0:
+            object.__setattr__(self, 'end', self.end + len(self.text))
+            assert self.end <= len(self.text)
+
+    @classmethod
+    def cast_from(cls, text: 'TextOrSlice') -> 'TextSlice[AnyStr]':
+        if isinstance(text, TextSlice):
+            return text
+
+        return cls(text, 0, len(text))
+
+    def is_complete_text(self):
+        return self.start == 0 and self.end == len(self.text)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def count(self, substr: AnyStr):
+        return self.text.count(substr, self.start, self.end)
+
+    def rindex(self, substr: AnyStr):
+        return self.text.rindex(substr, self.start, self.end)
+
+
+TextOrSlice = Union[AnyStr, 'TextSlice[AnyStr]']
+LarkInput = Union[AnyStr, TextSlice[AnyStr], Any]
+
+
+
+class Meta:
+
+    empty: bool
+    line: int
+    column: int
+    start_pos: int
+    end_line: int
+    end_column: int
+    end_pos: int
+    orig_expansion: 'List[TerminalDef]'
+    match_tree: bool
+
+    def __init__(self):
+        self.empty = True
+
+
+_Leaf_T = TypeVar("_Leaf_T")
+Branch = Union[_Leaf_T, 'Tree[_Leaf_T]']
+
+
+class Tree(Generic[_Leaf_T]):
+    #--
+
+    data: str
+    children: 'List[Branch[_Leaf_T]]'
+
+    def __init__(self, data: str, children: 'List[Branch[_Leaf_T]]', meta: Optional[Meta]=None) -> None:
+        self.data = data
+        self.children = children
+        self._meta = meta
+
+    @property
+    def meta(self) -> Meta:
+        if self._meta is None:
+            self._meta = Meta()
+        return self._meta
+
+    def __repr__(self):
+        return 'Tree(%r, %r)' % (self.data, self.children)
+
+    __match_args__ = ("data", "children")
+
+    def _pretty_label(self):
+        return self.data
+
+    def _pretty(self, level, indent_str):
+        yield f'{indent_str*level}{self._pretty_label()}'
+        if len(self.children) == 1 and not isinstance(self.children[0], Tree):
+            yield f'\t{self.children[0]}\n'
+        else:
+            yield '\n'
+            for n in self.children:
+                if isinstance(n, Tree):
+                    yield from n._pretty(level+1, indent_str)
+                else:
+                    yield f'{indent_str*(level+1)}{n}\n'
+
+    def pretty(self, indent_str: str='  ') -> str:
+        #--
+        return ''.join(self._pretty(0, indent_str))
+
+    def __rich__(self, parent:Optional['rich.tree.Tree']=None) -> 'rich.tree.Tree':
+        #--
+        return self._rich(parent)
+
+    def _rich(self, parent):
+        if parent:
+            tree = parent.add(f'[bold]{self.data}[/bold]')
+        else:
+            import rich.tree
+            tree = rich.tree.Tree(self.data)
+
+        for c in self.children:
+            if isinstance(c, Tree):
+                c._rich(tree)
+            else:
+                tree.add(f'[green]{c}[/green]')
+
+        return tree
+
+    def __eq__(self, other):
+        try:
+            return self.data == other.data and self.children == other.children
+        except AttributeError:
+            return False
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __hash__(self) -> int:
+        return hash((self.data, tuple(self.children)))
+
+    def iter_subtrees(self) -> 'Iterator[Tree[_Leaf_T]]':
+        #--
+        queue = [self]
+        subtrees = dict()
+        for subtree in queue:
+            subtrees[id(subtree)] = subtree
+            queue += [c for c in reversed(subtree.children)
+                      if isinstance(c, Tree) and id(c) not in subtrees]
+
+        del queue
+        return reversed(list(subtrees.values()))
+
+    def iter_subtrees_topdown(self):
+        #--
+        stack = [self]
+        stack_append = stack.append
+        stack_pop = stack.pop
+        while stack:
+            node = stack_pop()
+            if not isinstance(node, Tree):
+                continue
+            yield node
+            for child in reversed(node.children):
+                stack_append(child)
+
+    def find_pred(self, pred: 'Callable[[Tree[_Leaf_T]], bool]') -> 'Iterator[Tree[_Leaf_T]]':
+        #--
+        return filter(pred, self.iter_subtrees())
+
+    def find_data(self, data: str) -> 'Iterator[Tree[_Leaf_T]]':
+        #--
+        return self.find_pred(lambda t: t.data == data)
+
+
+from functools import wraps, update_wrapper
+from inspect import getmembers, getmro
+
+_Return_T = TypeVar('_Return_T')
+_Return_V = TypeVar('_Return_V')
+_Leaf_T = TypeVar('_Leaf_T')
+_Leaf_U = TypeVar('_Leaf_U')
+_R = TypeVar('_R')
+_FUNC = Callable[..., _Return_T]
+_DECORATED = Union[_FUNC, type]
+
+class _DiscardType:
+    #--
+
+    def __repr__(self):
+        return "lark.visitors.Discard"
+
+Discard = _DiscardType()
+
+##
+
+
+class _Decoratable:
+    #--
+
+    @classmethod
+    def _apply_v_args(cls, visit_wrapper):
+        mro = getmro(cls)
+        assert mro[0] is cls
+        libmembers = {name for _cls in mro[1:] for name, _ in getmembers(_cls)}
+        for name, value in getmembers(cls):
+
+            ##
+
+            if name.startswith('_') or (name in libmembers and name not in cls.__dict__):
+                continue
+            if not callable(value):
+                continue
+
+            ##
+
+            if isinstance(cls.__dict__[name], _VArgsWrapper):
+                continue
+
+            setattr(cls, name, _VArgsWrapper(cls.__dict__[name], visit_wrapper))
+        return cls
+
+    def __class_getitem__(cls, _):
+        return cls
+
+
+class Transformer(_Decoratable, ABC, Generic[_Leaf_T, _Return_T]):
+    #--
+    __visit_tokens__ = True   ##
+
+
+    def __init__(self,  visit_tokens: bool=True) -> None:
+        self.__visit_tokens__ = visit_tokens
+
+    def _call_userfunc(self, tree, new_children=None):
+        ##
+
+        children = new_children if new_children is not None else tree.children
+        try:
+            f = getattr(self, tree.data)
+        except AttributeError:
+            return self.__default__(tree.data, children, tree.meta)
+        else:
+            try:
+                wrapper = getattr(f, 'visit_wrapper', None)
+                if wrapper is not None:
+                    return f.visit_wrapper(f, tree.data, children, tree.meta)
+                else:
+                    return f(children)
+            except GrammarError:
+                raise
+            except Exception as e:
+                raise VisitError(tree.data, tree, e)
+
+    def _call_userfunc_token(self, token):
+        try:
+            f = getattr(self, token.type)
+        except AttributeError:
+            return self.__default_token__(token)
+        else:
+            try:
+                return f(token)
+            except GrammarError:
+                raise
+            except Exception as e:
+                raise VisitError(token.type, token, e)
+
+    def _transform_children(self, children):
+        for c in children:
+            if isinstance(c, Tree):
+                res = self._transform_tree(c)
+            elif self.__visit_tokens__ and isinstance(c, Token):
+                res = self._call_userfunc_token(c)
+            else:
+                res = c
+
+            if res is not Discard:
+                yield res
+
+    def _transform_tree(self, tree):
+        children = list(self._transform_children(tree.children))
+        return self._call_userfunc(tree, children)
+
+    def transform(self, tree: Tree[_Leaf_T]) -> _Return_T:
+        #--
+        res = list(self._transform_children([tree]))
+        if not res:
+            return None     ##
+
+        assert len(res) == 1
+        return res[0]
+
+    def __mul__(
+            self: 'Transformer[_Leaf_T, Tree[_Leaf_U]]',
+            other: 'Union[Transformer[_Leaf_U, _Return_V], TransformerChain[_Leaf_U, _Return_V,]]'
+    ) -> 'TransformerChain[_Leaf_T, _Return_V]':
+        #--
+        return TransformerChain(self, other)
+
+    def __default__(self, data, children, meta):
+        #--
+        return Tree(data, children, meta)
+
+    def __default_token__(self, token):
+        #--
+        return token
+
+
+def merge_transformers(base_transformer=None, **transformers_to_merge):
+    #--
+    if base_transformer is None:
+        base_transformer = Transformer()
+    for prefix, transformer in transformers_to_merge.items():
+        for method_name in dir(transformer):
+            method = getattr(transformer, method_name)
+            if not callable(method):
+                continue
+            if method_name.startswith("_") or method_name == "transform":
+                continue
+            prefixed_method = prefix + "__" + method_name
+            if hasattr(base_transformer, prefixed_method):
+                raise AttributeError("Cannot merge: method '%s' appears more than once" % prefixed_method)
+
+            setattr(base_transformer, prefixed_method, method)
+
+    return base_transformer
+
+
+class InlineTransformer(Transformer):   ##
+
+    def _call_userfunc(self, tree, new_children=None):
+        ##
+
+        children = new_children if new_children is not None else tree.children
+        try:
+            f = getattr(self, tree.data)
+        except AttributeError:
+            return self.__default__(tree.data, children, tree.meta)
+        else:
+            return f(*children)
+
+
+class TransformerChain(Generic[_Leaf_T, _Return_T]):
+
+    transformers: 'Tuple[Union[Transformer, TransformerChain], ...]'
+
+    def __init__(self, *transformers: 'Union[Transformer, TransformerChain]') -> None:
+        self.transformers = transformers
+
+    def transform(self, tree: Tree[_Leaf_T]) -> _Return_T:
+        for t in self.transformers:
+            tree = t.transform(tree)
+        return cast(_Return_T, tree)
+
+    def __mul__(
+            self: 'TransformerChain[_Leaf_T, Tree[_Leaf_U]]',
+            other: 'Union[Transformer[_Leaf_U, _Return_V], TransformerChain[_Leaf_U, _Return_V]]'
+    ) -> 'TransformerChain[_Leaf_T, _Return_V]':
+        return TransformerChain(*self.transformers + (other,))
+
+
+class Transformer_InPlace(Transformer[_Leaf_T, _Return_T]):
+    #--
+    def _transform_tree(self, tree):           ##
+
+        return self._call_userfunc(tree)
+
+    def transform(self, tree: Tree[_Leaf_T]) -> _Return_T:
+        for subtree in tree.iter_subtrees():
+            subtree.children = list(self._transform_children(subtree.children))
+
+        return self._transform_tree(tree)
+
+
+class Transformer_NonRecursive(Transformer[_Leaf_T, _Return_T]):
+    #--
+
+    def transform(self, tree: Tree[_Leaf_T]) -> _Return_T:
+        ##
+
+        rev_postfix = []
+        q: List[Branch[_Leaf_T]] = [tree]
+        while q:
+            t = q.pop()
+            rev_postfix.append(t)
+            if isinstance(t, Tree):
+                q += t.children
+
+        ##
+
+        stack: List = []
+        for x in reversed(rev_postfix):
+            if isinstance(x, Tree):
+                size = len(x.children)
+                if size:
+                    args = stack[-size:]
+                    del stack[-size:]
+                else:
+                    args = []
+
+                res = self._call_userfunc(x, args)
+                if res is not Discard:
+                    stack.append(res)
+
+            elif self.__visit_tokens__ and isinstance(x, Token):
+                res = self._call_userfunc_token(x)
+                if res is not Discard:
+                    stack.append(res)
+            else:
+                stack.append(x)
+
+        result, = stack  ##
+
+        ##
+
+        ##
+
+        ##
+
+        return cast(_Return_T, result)
+
+
+class Transformer_InPlaceRecursive(Transformer[_Leaf_T, _Return_T]):
+    #--
+    def _transform_tree(self, tree):
+        tree.children = list(self._transform_children(tree.children))
+        return self._call_userfunc(tree)
+
+
+##
+
+
+class VisitorBase:
+    def _call_userfunc(self, tree):
+        return getattr(self, tree.data, self.__default__)(tree)
+
+    def __default__(self, tree):
+        #--
+        return tree
+
+    def __class_getitem__(cls, _):
+        return cls
+
+
+class Visitor(VisitorBase, ABC, Generic[_Leaf_T]):
+    #--
+
+    def visit(self, tree: Tree[_Leaf_T]) -> Tree[_Leaf_T]:
+        #--
+        for subtree in tree.iter_subtrees():
+            self._call_userfunc(subtree)
+        return tree
+
+    def visit_topdown(self, tree: Tree[_Leaf_T]) -> Tree[_Leaf_T]:
+        #--
+        for subtree in tree.iter_subtrees_topdown():
+            self._call_userfunc(subtree)
+        return tree
+
+
+class Visitor_Recursive(VisitorBase, Generic[_Leaf_T]):
+    #--
+
+    def visit(self, tree: Tree[_Leaf_T]) -> Tree[_Leaf_T]:
+        #--
+        for child in tree.children:
+            if isinstance(child, Tree):
+                self.visit(child)
+
+        self._call_userfunc(tree)
+        return tree
+
+    def visit_topdown(self,tree: Tree[_Leaf_T]) -> Tree[_Leaf_T]:
+        #--
+        self._call_userfunc(tree)
+
+        for child in tree.children:
+            if isinstance(child, Tree):
+                self.visit_topdown(child)
+
+        return tree
+
+
+class Interpreter(_Decoratable, ABC, Generic[_Leaf_T, _Return_T]):
+    #--
+
+    def visit(self, tree: Tree[_Leaf_T]) -> _Return_T:
+        ##
+
+        ##
+
+        ##
+
+        return self._visit_tree(tree)
+
+    def _visit_tree(self, tree: Tree[_Leaf_T]):
+        f = getattr(self, tree.data)
+        wrapper = getattr(f, 'visit_wrapper', None)
+        if wrapper is not None:
+            return f.visit_wrapper(f, tree.data, tree.children, tree.meta)
+        else:
+            return f(tree)
+
+    def visit_children(self, tree: Tree[_Leaf_T]) -> List:
+        return [self._visit_tree(child) if isinstance(child, Tree) else child
+                for child in tree.children]
+
+    def __getattr__(self, name):
+        return self.__default__
+
+    def __default__(self, tree):
+        return self.visit_children(tree)
+
+
+_InterMethod = Callable[[Type[Interpreter], _Return_T], _R]
+
+def visit_children_decor(func: _InterMethod) -> _InterMethod:
+    #--
+    @wraps(func)
+    def inner(cls, tree):
+        values = cls.visit_children(tree)
+        return func(cls, values)
+    return inner
+
+##
+
+
+def _apply_v_args(obj, visit_wrapper):
+    try:
+        _apply = obj._apply_v_args
+    except AttributeError:
+        return _VArgsWrapper(obj, visit_wrapper)
+    else:
+        return _apply(visit_wrapper)
+
+
+class _VArgsWrapper:
+    #--
+    base_func: Callable
+
+    def __init__(self, func: Callable, visit_wrapper: Callable[[Callable, str, list, Any], Any]):
+        if isinstance(func, _VArgsWrapper):
+            func = func.base_func
+        self.base_func = func
+        self.visit_wrapper = visit_wrapper
+        update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        return self.base_func(*args, **kwargs)
+
+    def __get__(self, instance, owner=None):
+        try:
+            ##
+
+            ##
+
+            g = type(self.base_func).__get__
+        except AttributeError:
+            return self
+        else:
+            return _VArgsWrapper(g(self.base_func, instance, owner), self.visit_wrapper)
+
+    def __set_name__(self, owner, name):
+        try:
+            f = type(self.base_func).__set_name__
+        except AttributeError:
+            return
+        else:
+            f(self.base_func, owner, name)
+
+
+def _vargs_inline(f, _data, children, _meta):
+    return f(*children)
+def _vargs_meta_inline(f, _data, children, meta):
+    return f(meta, *children)
+def _vargs_meta(f, _data, children, meta):
+    return f(meta, children)
+def _vargs_tree(f, data, children, meta):
+    return f(Tree(data, children, meta))
+
+
+def v_args(inline: bool = False, meta: bool = False, tree: bool = False, wrapper: Optional[Callable] = None) -> Callable[[_DECORATED], _DECORATED]:
+    #--
+    if tree and (meta or inline):
+        raise ValueError("Visitor functions cannot combine 'tree' with 'meta' or 'inline'.")
+
+    func = None
+    if meta:
+        if inline:
+            func = _vargs_meta_inline
+        else:
+            func = _vargs_meta
+    elif inline:
+        func = _vargs_inline
+    elif tree:
+        func = _vargs_tree
+
+    if wrapper is not None:
+        if func is not None:
+            raise ValueError("Cannot use 'wrapper' along with 'tree', 'meta' or 'inline'.")
+        func = wrapper
+
+    def _visitor_args_dec(obj):
+        return _apply_v_args(obj, func)
+    return _visitor_args_dec
+
+
+
+TOKEN_DEFAULT_PRIORITY = 0
+
+
+class Symbol(Serialize):
+    __slots__ = ('name',)
+
+    name: str
+    is_term: ClassVar[bool] = NotImplemented
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __eq__(self, other):
+        if not isinstance(other, Symbol):
+            return NotImplemented
+        return self.is_term == other.is_term and self.name == other.name
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.name)
+
+    fullrepr = property(__repr__)
+
+    def renamed(self, f):
+        return type(self)(f(self.name))
+
+
+class Terminal(Symbol):
+    __serialize_fields__ = 'name', 'filter_out'
+
+    is_term: ClassVar[bool] = True
+
+    def __init__(self, name: str, filter_out: bool = False) -> None:
+        self.name = name
+        self.filter_out = filter_out
+
+    @property
+    def fullrepr(self):
+        return '%s(%r, %r)' % (type(self).__name__, self.name, self.filter_out)
+
+    def renamed(self, f):
+        return type(self)(f(self.name), self.filter_out)
+
+
+class NonTerminal(Symbol):
+    __serialize_fields__ = 'name',
+
+    is_term: ClassVar[bool] = False
+
+    def serialize(self, memo=None) -> Dict[str, Any]:
+        ##
+
+        ##
+
+        return {'name': str(self.name), '__type__': 'NonTerminal'}
+
+
+class RuleOptions(Serialize):
+    __serialize_fields__ = 'keep_all_tokens', 'expand1', 'priority', 'template_source', 'empty_indices'
+
+    keep_all_tokens: bool
+    expand1: bool
+    priority: Optional[int]
+    template_source: Optional[str]
+    empty_indices: Tuple[bool, ...]
+
+    def __init__(self, keep_all_tokens: bool=False, expand1: bool=False, priority: Optional[int]=None, template_source: Optional[str]=None, empty_indices: Tuple[bool, ...]=()) -> None:
+        self.keep_all_tokens = keep_all_tokens
+        self.expand1 = expand1
+        self.priority = priority
+        self.template_source = template_source
+        self.empty_indices = empty_indices
+
+    def __repr__(self):
+        return 'RuleOptions(%r, %r, %r, %r)' % (
+            self.keep_all_tokens,
+            self.expand1,
+            self.priority,
+            self.template_source
+        )
+
+
+class Rule(Serialize):
+    #--
+    __slots__ = ('origin', 'expansion', 'alias', 'options', 'order', '_hash')
+
+    __serialize_fields__ = 'origin', 'expansion', 'order', 'alias', 'options'
+    __serialize_namespace__ = Terminal, NonTerminal, RuleOptions
+
+    origin: NonTerminal
+    expansion: Sequence[Symbol]
+    order: int
+    alias: Optional[str]
+    options: RuleOptions
+    _hash: int
+
+    def __init__(self, origin: NonTerminal, expansion: Sequence[Symbol],
+                 order: int=0, alias: Optional[str]=None, options: Optional[RuleOptions]=None):
+        self.origin = origin
+        self.expansion = expansion
+        self.alias = alias
+        self.order = order
+        self.options = options or RuleOptions()
+        self._hash = hash((self.origin, tuple(self.expansion)))
+
+    def _deserialize(self):
+        self._hash = hash((self.origin, tuple(self.expansion)))
+
+    def __str__(self):
+        return '<%s : %s>' % (self.origin.name, ' '.join(x.name for x in self.expansion))
+
+    def __repr__(self):
+        return 'Rule(%r, %r, %r, %r)' % (self.origin, self.expansion, self.alias, self.options)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, Rule):
+            return False
+        return self.origin == other.origin and self.expansion == other.expansion
+
+
+
+from contextlib import suppress
+from copy import copy
+
+try:  ##
+
+    has_interegular = bool(interegular)
+except NameError:
+    has_interegular = False
+
+class Pattern(Serialize, ABC):
+    #--
+
+    value: str
+    flags: Collection[str]
+    raw: Optional[str]
+    type: ClassVar[str]
+
+    def __init__(self, value: str, flags: Collection[str] = (), raw: Optional[str] = None) -> None:
+        self.value = value
+        self.flags = frozenset(flags)
+        self.raw = raw
+
+    def __repr__(self):
+        return repr(self.to_regexp())
+
+    ##
+
+    def __hash__(self):
+        return hash((type(self), self.value, self.flags))
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.value == other.value and self.flags == other.flags
+
+    @abstractmethod
+    def to_regexp(self) -> str:
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def min_width(self) -> int:
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def max_width(self) -> int:
+        raise NotImplementedError()
+
+    def _get_flags(self, value):
+        for f in self.flags:
+            value = ('(?%s:%s)' % (f, value))
+        return value
+
+
+class PatternStr(Pattern):
+    __serialize_fields__ = 'value', 'flags', 'raw'
+
+    type: ClassVar[str] = "str"
+
+    def to_regexp(self) -> str:
+        return self._get_flags(re.escape(self.value))
+
+    @property
+    def min_width(self) -> int:
+        return len(self.value)
+
+    @property
+    def max_width(self) -> int:
+        return len(self.value)
+
+
+class PatternRE(Pattern):
+    __serialize_fields__ = 'value', 'flags', 'raw', '_width'
+
+    type: ClassVar[str] = "re"
+
+    def to_regexp(self) -> str:
+        return self._get_flags(self.value)
+
+    _width = None
+    def _get_width(self):
+        if self._width is None:
+            self._width = get_regexp_width(self.to_regexp())
+        return self._width
+
+    @property
+    def min_width(self) -> int:
+        return self._get_width()[0]
+
+    @property
+    def max_width(self) -> int:
+        return self._get_width()[1]
+
+
+class TerminalDef(Serialize):
+    #--
+    __serialize_fields__ = 'name', 'pattern', 'priority'
+    __serialize_namespace__ = PatternStr, PatternRE
+
+    name: str
+    pattern: Pattern
+    priority: int
+
+    def __init__(self, name: str, pattern: Pattern, priority: int = TOKEN_DEFAULT_PRIORITY) -> None:
+        assert isinstance(pattern, Pattern), pattern
+        self.name = name
+        self.pattern = pattern
+        self.priority = priority
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (type(self).__name__, self.name, self.pattern)
+
+    def user_repr(self) -> str:
+        if self.name.startswith('__'):  ##
+
+            return self.pattern.raw or self.name
+        else:
+            return self.name
+
+_T = TypeVar('_T', bound="Token")
+
+class Token(str):
+    #--
+    __slots__ = ('type', 'start_pos', 'value', 'line', 'column', 'end_line', 'end_column', 'end_pos')
+
+    __match_args__ = ('type', 'value')
+
+    type: str
+    start_pos: Optional[int]
+    value: Any
+    line: Optional[int]
+    column: Optional[int]
+    end_line: Optional[int]
+    end_column: Optional[int]
+    end_pos: Optional[int]
+
+
+    @overload
+    def __new__(
+            cls,
+            type: str,
+            value: Any,
+            start_pos: Optional[int] = None,
+            line: Optional[int] = None,
+            column: Optional[int] = None,
+            end_line: Optional[int] = None,
+            end_column: Optional[int] = None,
+            end_pos: Optional[int] = None
+    ) -> 'Token':
+        ...
+
+    @overload
+    def __new__(
+            cls,
+            type_: str,
+            value: Any,
+            start_pos: Optional[int] = None,
+            line: Optional[int] = None,
+            column: Optional[int] = None,
+            end_line: Optional[int] = None,
+            end_column: Optional[int] = None,
+            end_pos: Optional[int] = None
+    ) -> 'Token':        ...
+
+    def __new__(cls, *args, **kwargs):
+        if "type_" in kwargs:
+            warnings.warn("`type_` is deprecated use `type` instead", DeprecationWarning)
+
+            if "type" in kwargs:
+                raise TypeError("Error: using both 'type' and the deprecated 'type_' as arguments.")
+            kwargs["type"] = kwargs.pop("type_")
+
+        return cls._future_new(*args, **kwargs)
+
+
+    @classmethod
+    def _future_new(cls, type, value, start_pos=None, line=None, column=None, end_line=None, end_column=None, end_pos=None):
+        inst = super(Token, cls).__new__(cls, value)
+
+        inst.type = type
+        inst.start_pos = start_pos
+        inst.value = value
+        inst.line = line
+        inst.column = column
+        inst.end_line = end_line
+        inst.end_column = end_column
+        inst.end_pos = end_pos
+        return inst
+
+    @overload
+    def update(self, type: Optional[str] = None, value: Optional[Any] = None) -> 'Token':
+        ...
+
+    @overload
+    def update(self, type_: Optional[str] = None, value: Optional[Any] = None) -> 'Token':
+        ...
+
+    def update(self, *args, **kwargs):
+        if "type_" in kwargs:
+            warnings.warn("`type_` is deprecated use `type` instead", DeprecationWarning)
+
+            if "type" in kwargs:
+                raise TypeError("Error: using both 'type' and the deprecated 'type_' as arguments.")
+            kwargs["type"] = kwargs.pop("type_")
+
+        return self._future_update(*args, **kwargs)
+
+    def _future_update(self, type: Optional[str] = None, value: Optional[Any] = None) -> 'Token':
+        return Token.new_borrow_pos(
+            type if type is not None else self.type,
+            value if value is not None else self.value,
+            self
+        )
+
+    @classmethod
+    def new_borrow_pos(cls: Type[_T], type_: str, value: Any, borrow_t: 'Token') -> _T:
+        return cls(type_, value, borrow_t.start_pos, borrow_t.line, borrow_t.column, borrow_t.end_line, borrow_t.end_column, borrow_t.end_pos)
+
+    def __reduce__(self):
+        return (self.__class__, (self.type, self.value, self.start_pos, self.line, self.column))
+
+    def __repr__(self):
+        return 'Token(%r, %r)' % (self.type, self.value)
+
+    def __deepcopy__(self, memo):
+        return Token(self.type, self.value, self.start_pos, self.line, self.column)
+
+    def __eq__(self, other):
+        if isinstance(other, Token) and self.type != other.type:
+            return False
+
+        return str.__eq__(self, other)
+
+    __hash__ = str.__hash__
+
+
+class LineCounter:
+    #--
+
+    __slots__ = 'char_pos', 'line', 'column', 'line_start_pos', 'newline_char'
+
+    def __init__(self, newline_char):
+        self.newline_char = newline_char
+        self.char_pos = 0
+        self.line = 1
+        self.column = 1
+        self.line_start_pos = 0
+
+    def __eq__(self, other):
+        if not isinstance(other, LineCounter):
+            return NotImplemented
+
+        return self.char_pos == other.char_pos and self.newline_char == other.newline_char
+
+    def feed(self, token: TextOrSlice, test_newline=True):
+        #--
+        if test_newline:
+            newlines = token.count(self.newline_char)
+            if newlines:
+                self.line += newlines
+                self.line_start_pos = self.char_pos + token.rindex(self.newline_char) + 1
+
+        self.char_pos += len(token)
+        self.column = self.char_pos - self.line_start_pos + 1
+
+
+class UnlessCallback:
+    def __init__(self, scanner: 'Scanner'):
+        self.scanner = scanner
+
+    def __call__(self, t: Token):
+        res = self.scanner.fullmatch(t.value)
+        if res is not None:
+            t.type = res
+        return t
+
+
+class CallChain:
+    def __init__(self, callback1, callback2, cond):
+        self.callback1 = callback1
+        self.callback2 = callback2
+        self.cond = cond
+
+    def __call__(self, t):
+        t2 = self.callback1(t)
+        return self.callback2(t) if self.cond(t2) else t2
+
+
+def _get_match(re_, regexp, s, flags):
+    m = re_.match(regexp, s, flags)
+    if m:
+        return m.group(0)
+
+def _create_unless(terminals, g_regex_flags, re_, use_bytes):
+    tokens_by_type = classify(terminals, lambda t: type(t.pattern))
+    assert len(tokens_by_type) <= 2, tokens_by_type.keys()
+    embedded_strs = set()
+    callback = {}
+    for retok in tokens_by_type.get(PatternRE, []):
+        unless = []
+        for strtok in tokens_by_type.get(PatternStr, []):
+            if strtok.priority != retok.priority:
+                continue
+            s = strtok.pattern.value
+            if s == _get_match(re_, retok.pattern.to_regexp(), s, g_regex_flags):
+                unless.append(strtok)
+                if strtok.pattern.flags <= retok.pattern.flags:
+                    embedded_strs.add(strtok)
+        if unless:
+            callback[retok.name] = UnlessCallback(Scanner(unless, g_regex_flags, re_, use_bytes=use_bytes))
+
+    new_terminals = [t for t in terminals if t not in embedded_strs]
+    return new_terminals, callback
+
+
+class Scanner:
+    def __init__(self, terminals, g_regex_flags, re_, use_bytes):
+        self.terminals = terminals
+        self.g_regex_flags = g_regex_flags
+        self.re_ = re_
+        self.use_bytes = use_bytes
+
+        self.allowed_types = {t.name for t in self.terminals}
+
+        self._mres = self._build_mres(terminals, len(terminals))
+
+    def _build_mres(self, terminals, max_size):
+        ##
+
+        ##
+
+        ##
+
+        mres = []
+        while terminals:
+            pattern = u'|'.join(u'(?P<%s>%s)' % (t.name, t.pattern.to_regexp()) for t in terminals[:max_size])
+            if self.use_bytes:
+                pattern = pattern.encode('latin-1')
+            try:
+                mre = self.re_.compile(pattern, self.g_regex_flags)
+            except AssertionError:  ##
+
+                return self._build_mres(terminals, max_size // 2)
+
+            mres.append(mre)
+            terminals = terminals[max_size:]
+        return mres
+
+    def match(self, text: TextSlice, pos):
+        for mre in self._mres:
+            m = mre.match(text.text, pos, text.end)
+            if m:
+                return m.group(0), m.lastgroup
+
+
+    def fullmatch(self, text: str) -> Optional[str]:
+        for mre in self._mres:
+            m = mre.fullmatch(text)
+            if m:
+                return m.lastgroup
+        return None
+
+def _regexp_has_newline(r: str):
+    #--
+    return '\n' in r or '\\n' in r or '\\s' in r or '[^' in r or ('(?s' in r and '.' in r)
+
+
+class LexerState:
+    #--
+
+    __slots__ = 'text', 'line_ctr', 'last_token'
+
+    text: TextSlice
+    line_ctr: LineCounter
+    last_token: Optional[Token]
+
+    def __init__(self, text: TextSlice, line_ctr: Optional[LineCounter] = None, last_token: Optional[Token]=None):
+        if isinstance(text, TextSlice):
+            if line_ctr is None:
+                line_ctr = LineCounter(b'\n' if isinstance(text.text, bytes) else '\n')
+
+                if text.start > 0:
+                    ##
+
+                    line_ctr.feed(TextSlice(text.text, 0, text.start))
+
+            if not (text.start <= line_ctr.char_pos <= text.end):
+                raise ValueError("LineCounter.char_pos is out of bounds")
+
+        self.text = text
+        self.line_ctr = line_ctr
+        self.last_token = last_token
+
+
+    def __eq__(self, other):
+        if not isinstance(other, LexerState):
+            return NotImplemented
+
+        return self.text == other.text and self.line_ctr == other.line_ctr and self.last_token == other.last_token
+
+    def __copy__(self):
+        return type(self)(self.text, copy(self.line_ctr), self.last_token)
+
+
+class LexerThread:
+    #--
+
+    def __init__(self, lexer: 'Lexer', lexer_state: Optional[LexerState]):
+        self.lexer = lexer
+        self.state = lexer_state
+
+    @classmethod
+    def from_text(cls, lexer: 'Lexer', text_or_slice: TextOrSlice) -> 'LexerThread':
+        text = TextSlice.cast_from(text_or_slice)
+        return cls(lexer, LexerState(text))
+
+    @classmethod
+    def from_custom_input(cls, lexer: 'Lexer', text: Any) -> 'LexerThread':
+        return cls(lexer, LexerState(text))
+
+    def lex(self, parser_state):
+        if self.state is None:
+            raise TypeError("Cannot lex: No text assigned to lexer state")
+        return self.lexer.lex(self.state, parser_state)
+
+    def __copy__(self):
+        return type(self)(self.lexer, copy(self.state))
+
+    _Token = Token
+
+
+_Callback = Callable[[Token], Token]
+
+class Lexer(ABC):
+    #--
+    @abstractmethod
+    def lex(self, lexer_state: LexerState, parser_state: Any) -> Iterator[Token]:
+        return NotImplemented
+
+    def make_lexer_state(self, text: str):
+        #--
+        return LexerState(TextSlice.cast_from(text))
+
+
+def _check_regex_collisions(terminal_to_regexp: Dict[TerminalDef, str], comparator, strict_mode, max_collisions_to_show=8):
+    if not comparator:
+        comparator = interegular.Comparator.from_regexes(terminal_to_regexp)
+
+    ##
+
+    ##
+
+    max_time = 2 if strict_mode else 0.2
+
+    ##
+
+    if comparator.count_marked_pairs() >= max_collisions_to_show:
+        return
+    for group in classify(terminal_to_regexp, lambda t: t.priority).values():
+        for a, b in comparator.check(group, skip_marked=True):
+            assert a.priority == b.priority
+            ##
+
+            comparator.mark(a, b)
+
+            ##
+
+            message = f"Collision between Terminals {a.name} and {b.name}. "
+            try:
+                example = comparator.get_example_overlap(a, b, max_time).format_multiline()
+            except ValueError:
+                ##
+
+                example = "No example could be found fast enough. However, the collision does still exists"
+            if strict_mode:
+                raise LexError(f"{message}\n{example}")
+            logger.warning("%s The lexer will choose between them arbitrarily.\n%s", message, example)
+            if comparator.count_marked_pairs() >= max_collisions_to_show:
+                logger.warning("Found 8 regex collisions, will not check for more.")
+                return
+
+
+class AbstractBasicLexer(Lexer):
+    terminals_by_name: Dict[str, TerminalDef]
+
+    @abstractmethod
+    def __init__(self, conf: 'LexerConf', comparator=None) -> None:
+        ...
+
+    @abstractmethod
+    def next_token(self, lex_state: LexerState, parser_state: Any = None) -> Token:
+        ...
+
+    def lex(self, state: LexerState, parser_state: Any) -> Iterator[Token]:
+        with suppress(EOFError):
+            while True:
+                yield self.next_token(state, parser_state)
+
+
+class BasicLexer(AbstractBasicLexer):
+    terminals: Collection[TerminalDef]
+    ignore_types: FrozenSet[str]
+    newline_types: FrozenSet[str]
+    user_callbacks: Dict[str, _Callback]
+    callback: Dict[str, _Callback]
+    re: ModuleType
+
+    def __init__(self, conf: 'LexerConf', comparator=None) -> None:
+        terminals = list(conf.terminals)
+        assert all(isinstance(t, TerminalDef) for t in terminals), terminals
+
+        self.re = conf.re_module
+
+        if not conf.skip_validation:
+            ##
+
+            terminal_to_regexp = {}
+            for t in terminals:
+                regexp = t.pattern.to_regexp()
+                try:
+                    self.re.compile(regexp, conf.g_regex_flags)
+                except self.re.error:
+                    raise LexError("Cannot compile token %s: %s" % (t.name, t.pattern))
+
+                if t.pattern.min_width == 0:
+                    raise LexError("Lexer does not allow zero-width terminals. (%s: %s)" % (t.name, t.pattern))
+                if t.pattern.type == "re":
+                    terminal_to_regexp[t] = regexp
+
+            if not (set(conf.ignore) <= {t.name for t in terminals}):
+                raise LexError("Ignore terminals are not defined: %s" % (set(conf.ignore) - {t.name for t in terminals}))
+
+            if has_interegular:
+                _check_regex_collisions(terminal_to_regexp, comparator, conf.strict)
+            elif conf.strict:
+                raise LexError("interegular must be installed for strict mode. Use `pip install 'lark[interegular]'`.")
+
+        ##
+
+        self.newline_types = frozenset(t.name for t in terminals if _regexp_has_newline(t.pattern.to_regexp()))
+        self.ignore_types = frozenset(conf.ignore)
+
+        terminals.sort(key=lambda x: (-x.priority, -x.pattern.max_width, -len(x.pattern.value), x.name))
+        self.terminals = terminals
+        self.user_callbacks = conf.callbacks
+        self.g_regex_flags = conf.g_regex_flags
+        self.use_bytes = conf.use_bytes
+        self.terminals_by_name = conf.terminals_by_name
+
+        self._scanner: Optional[Scanner] = None
+
+    def _build_scanner(self) -> Scanner:
+        terminals, self.callback = _create_unless(self.terminals, self.g_regex_flags, self.re, self.use_bytes)
+        assert all(self.callback.values())
+
+        for type_, f in self.user_callbacks.items():
+            if type_ in self.callback:
+                ##
+
+                self.callback[type_] = CallChain(self.callback[type_], f, lambda t: t.type == type_)
+            else:
+                self.callback[type_] = f
+
+        return Scanner(terminals, self.g_regex_flags, self.re, self.use_bytes)
+
+    @property
+    def scanner(self) -> Scanner:
+        if self._scanner is None:
+            self._scanner = self._build_scanner()
+        return self._scanner
+
+    def match(self, text, pos):
+        return self.scanner.match(text, pos)
+
+    def next_token(self, lex_state: LexerState, parser_state: Any = None) -> Token:
+        line_ctr = lex_state.line_ctr
+        while line_ctr.char_pos < lex_state.text.end:
+            res = self.match(lex_state.text, line_ctr.char_pos)
+            if not res:
+                allowed = self.scanner.allowed_types - self.ignore_types
+                if not allowed:
+                    allowed = {"<END-OF-FILE>"}
+                raise UnexpectedCharacters(lex_state.text.text, line_ctr.char_pos, line_ctr.line, line_ctr.column,
+                                           allowed=allowed, token_history=lex_state.last_token and [lex_state.last_token],
+                                           state=parser_state, terminals_by_name=self.terminals_by_name)
+
+            value, type_ = res
+
+            ignored = type_ in self.ignore_types
+            t = None
+            if not ignored or type_ in self.callback:
+                t = Token(type_, value, line_ctr.char_pos, line_ctr.line, line_ctr.column)
+            line_ctr.feed(value, type_ in self.newline_types)
+            if t is not None:
+                t.end_line = line_ctr.line
+                t.end_column = line_ctr.column
+                t.end_pos = line_ctr.char_pos
+                if t.type in self.callback:
+                    t = self.callback[t.type](t)
+                if not ignored:
+                    if not isinstance(t, Token):
+                        raise LexError("Callbacks must return a token (returned %r)" % t)
+                    lex_state.last_token = t
+                    return t
+
+        ##
+
+        raise EOFError(self)
+
+
+class ContextualLexer(Lexer):
+    lexers: Dict[int, AbstractBasicLexer]
+    root_lexer: AbstractBasicLexer
+
+    BasicLexer: Type[AbstractBasicLexer] = BasicLexer
+
+    def __init__(self, conf: 'LexerConf', states: Dict[int, Collection[str]], always_accept: Collection[str]=()) -> None:
+        terminals = list(conf.terminals)
+        terminals_by_name = conf.terminals_by_name
+
+        trad_conf = copy(conf)
+        trad_conf.terminals = terminals
+
+        if has_interegular and not conf.skip_validation:
+            comparator = interegular.Comparator.from_regexes({t: t.pattern.to_regexp() for t in terminals})
+        else:
+            comparator = None
+        lexer_by_tokens: Dict[FrozenSet[str], AbstractBasicLexer] = {}
+        self.lexers = {}
+        for state, accepts in states.items():
+            key = frozenset(accepts)
+            try:
+                lexer = lexer_by_tokens[key]
+            except KeyError:
+                accepts = set(accepts) | set(conf.ignore) | set(always_accept)
+                lexer_conf = copy(trad_conf)
+                lexer_conf.terminals = [terminals_by_name[n] for n in accepts if n in terminals_by_name]
+                lexer = self.BasicLexer(lexer_conf, comparator)
+                lexer_by_tokens[key] = lexer
+
+            self.lexers[state] = lexer
+
+        assert trad_conf.terminals is terminals
+        trad_conf.skip_validation = True  ##
+
+        self.root_lexer = self.BasicLexer(trad_conf, comparator)
+
+    def lex(self, lexer_state: LexerState, parser_state: 'ParserState') -> Iterator[Token]:
+        try:
+            while True:
+                lexer = self.lexers[parser_state.position]
+                yield lexer.next_token(lexer_state, parser_state)
+        except EOFError:
+            pass
+        except UnexpectedCharacters as e:
+            ##
+
+            ##
+
+            try:
+                last_token = lexer_state.last_token  ##
+
+                token = self.root_lexer.next_token(lexer_state, parser_state)
+                raise UnexpectedToken(token, e.allowed, state=parser_state, token_history=[last_token], terminals_by_name=self.root_lexer.terminals_by_name)
+            except UnexpectedCharacters:
+                raise e  ##
+
+
+
+
+_ParserArgType: 'TypeAlias' = 'Literal["earley", "lalr", "cyk", "auto"]'
+_LexerArgType: 'TypeAlias' = 'Union[Literal["auto", "basic", "contextual", "dynamic", "dynamic_complete"], Type[Lexer]]'
+_LexerCallback = Callable[[Token], Token]
+ParserCallbacks = Dict[str, Callable]
+
+class LexerConf(Serialize):
+    __serialize_fields__ = 'terminals', 'ignore', 'g_regex_flags', 'use_bytes', 'lexer_type'
+    __serialize_namespace__ = TerminalDef,
+
+    terminals: Collection[TerminalDef]
+    re_module: ModuleType
+    ignore: Collection[str]
+    postlex: 'Optional[PostLex]'
+    callbacks: Dict[str, _LexerCallback]
+    g_regex_flags: int
+    skip_validation: bool
+    use_bytes: bool
+    lexer_type: Optional[_LexerArgType]
+    strict: bool
+
+    def __init__(self, terminals: Collection[TerminalDef], re_module: ModuleType, ignore: Collection[str]=(), postlex: 'Optional[PostLex]'=None,
+                 callbacks: Optional[Dict[str, _LexerCallback]]=None, g_regex_flags: int=0, skip_validation: bool=False, use_bytes: bool=False, strict: bool=False):
+        self.terminals = terminals
+        self.terminals_by_name = {t.name: t for t in self.terminals}
+        assert len(self.terminals) == len(self.terminals_by_name)
+        self.ignore = ignore
+        self.postlex = postlex
+        self.callbacks = callbacks or {}
+        self.g_regex_flags = g_regex_flags
+        self.re_module = re_module
+        self.skip_validation = skip_validation
+        self.use_bytes = use_bytes
+        self.strict = strict
+        self.lexer_type = None
+
+    def _deserialize(self):
+        self.terminals_by_name = {t.name: t for t in self.terminals}
+
+    def __deepcopy__(self, memo=None):
+        return type(self)(
+            deepcopy(self.terminals, memo),
+            self.re_module,
+            deepcopy(self.ignore, memo),
+            deepcopy(self.postlex, memo),
+            deepcopy(self.callbacks, memo),
+            deepcopy(self.g_regex_flags, memo),
+            deepcopy(self.skip_validation, memo),
+            deepcopy(self.use_bytes, memo),
+        )
+
+class ParserConf(Serialize):
+    __serialize_fields__ = 'rules', 'start', 'parser_type'
+
+    rules: List['Rule']
+    callbacks: ParserCallbacks
+    start: List[str]
+    parser_type: _ParserArgType
+
+    def __init__(self, rules: List['Rule'], callbacks: ParserCallbacks, start: List[str]):
+        assert isinstance(start, list)
+        self.rules = rules
+        self.callbacks = callbacks
+        self.start = start
+
+
+from functools import partial, wraps
+from itertools import product
+
+
+class ExpandSingleChild:
+    def __init__(self, node_builder):
+        self.node_builder = node_builder
+
+    def __call__(self, children):
+        if len(children) == 1:
+            return children[0]
+        else:
+            return self.node_builder(children)
+
+
+
+class PropagatePositions:
+    def __init__(self, node_builder, node_filter=None):
+        self.node_builder = node_builder
+        self.node_filter = node_filter
+
+    def __call__(self, children):
+        res = self.node_builder(children)
+
+        if isinstance(res, Tree):
+            ##
+
+            ##
+
+            ##
+
+            ##
+
+
+            res_meta = res.meta
+
+            first_meta = self._pp_get_meta(children)
+            if first_meta is not None:
+                if not hasattr(res_meta, 'line'):
+                    ##
+
+                    res_meta.line = getattr(first_meta, 'container_line', first_meta.line)
+                    res_meta.column = getattr(first_meta, 'container_column', first_meta.column)
+                    res_meta.start_pos = getattr(first_meta, 'container_start_pos', first_meta.start_pos)
+                    res_meta.empty = False
+
+                res_meta.container_line = getattr(first_meta, 'container_line', first_meta.line)
+                res_meta.container_column = getattr(first_meta, 'container_column', first_meta.column)
+                res_meta.container_start_pos = getattr(first_meta, 'container_start_pos', first_meta.start_pos)
+
+            last_meta = self._pp_get_meta(reversed(children))
+            if last_meta is not None:
+                if not hasattr(res_meta, 'end_line'):
+                    res_meta.end_line = getattr(last_meta, 'container_end_line', last_meta.end_line)
+                    res_meta.end_column = getattr(last_meta, 'container_end_column', last_meta.end_column)
+                    res_meta.end_pos = getattr(last_meta, 'container_end_pos', last_meta.end_pos)
+                    res_meta.empty = False
+
+                res_meta.container_end_line = getattr(last_meta, 'container_end_line', last_meta.end_line)
+                res_meta.container_end_column = getattr(last_meta, 'container_end_column', last_meta.end_column)
+                res_meta.container_end_pos = getattr(last_meta, 'container_end_pos', last_meta.end_pos)
+
+        return res
+
+    def _pp_get_meta(self, children):
+        for c in children:
+            if self.node_filter is not None and not self.node_filter(c):
+                continue
+            if isinstance(c, Tree):
+                if not c.meta.empty:
+                    return c.meta
+            elif isinstance(c, Token):
+                return c
+            elif hasattr(c, '__lark_meta__'):
+                return c.__lark_meta__()
+
+def make_propagate_positions(option):
+    if callable(option):
+        return partial(PropagatePositions, node_filter=option)
+    elif option is True:
+        return PropagatePositions
+    elif option is False:
+        return None
+
+    raise ConfigurationError('Invalid option for propagate_positions: %r' % option)
+
+
+class ChildFilter:
+    def __init__(self, to_include, append_none, node_builder):
+        self.node_builder = node_builder
+        self.to_include = to_include
+        self.append_none = append_none
+
+    def __call__(self, children):
+        filtered = []
+
+        for i, to_expand, add_none in self.to_include:
+            if add_none:
+                filtered += [None] * add_none
+            if to_expand:
+                filtered += children[i].children
+            else:
+                filtered.append(children[i])
+
+        if self.append_none:
+            filtered += [None] * self.append_none
+
+        return self.node_builder(filtered)
+
+
+class ChildFilterLALR(ChildFilter):
+    #--
+
+    def __call__(self, children):
+        filtered = []
+        for i, to_expand, add_none in self.to_include:
+            if add_none:
+                filtered += [None] * add_none
+            if to_expand:
+                if filtered:
+                    filtered += children[i].children
+                else:   ##
+
+                    filtered = children[i].children
+            else:
+                filtered.append(children[i])
+
+        if self.append_none:
+            filtered += [None] * self.append_none
+
+        return self.node_builder(filtered)
+
+
+class ChildFilterLALR_NoPlaceholders(ChildFilter):
+    #--
+    def __init__(self, to_include, node_builder):
+        self.node_builder = node_builder
+        self.to_include = to_include
+
+    def __call__(self, children):
+        filtered = []
+        for i, to_expand in self.to_include:
+            if to_expand:
+                if filtered:
+                    filtered += children[i].children
+                else:   ##
+
+                    filtered = children[i].children
+            else:
+                filtered.append(children[i])
+        return self.node_builder(filtered)
+
+
+def _should_expand(sym):
+    return not sym.is_term and sym.name.startswith('_')
+
+
+def maybe_create_child_filter(expansion, keep_all_tokens, ambiguous, _empty_indices: List[bool]):
+    ##
+
+    if _empty_indices:
+        assert _empty_indices.count(False) == len(expansion)
+        s = ''.join(str(int(b)) for b in _empty_indices)
+        empty_indices = [len(ones) for ones in s.split('0')]
+        assert len(empty_indices) == len(expansion)+1, (empty_indices, len(expansion))
+    else:
+        empty_indices = [0] * (len(expansion)+1)
+
+    to_include = []
+    nones_to_add = 0
+    for i, sym in enumerate(expansion):
+        nones_to_add += empty_indices[i]
+        if keep_all_tokens or not (sym.is_term and sym.filter_out):
+            to_include.append((i, _should_expand(sym), nones_to_add))
+            nones_to_add = 0
+
+    nones_to_add += empty_indices[len(expansion)]
+
+    if _empty_indices or len(to_include) < len(expansion) or any(to_expand for i, to_expand,_ in to_include):
+        if _empty_indices or ambiguous:
+            return partial(ChildFilter if ambiguous else ChildFilterLALR, to_include, nones_to_add)
+        else:
+            ##
+
+            return partial(ChildFilterLALR_NoPlaceholders, [(i, x) for i,x,_ in to_include])
+
+
+class AmbiguousExpander:
+    #--
+    def __init__(self, to_expand, tree_class, node_builder):
+        self.node_builder = node_builder
+        self.tree_class = tree_class
+        self.to_expand = to_expand
+
+    def __call__(self, children):
+        def _is_ambig_tree(t):
+            return hasattr(t, 'data') and t.data == '_ambig'
+
+        ##
+
+        ##
+
+        ##
+
+        ##
+
+        ambiguous = []
+        for i, child in enumerate(children):
+            if _is_ambig_tree(child):
+                if i in self.to_expand:
+                    ambiguous.append(i)
+
+                child.expand_kids_by_data('_ambig')
+
+        if not ambiguous:
+            return self.node_builder(children)
+
+        expand = [child.children if i in ambiguous else (child,) for i, child in enumerate(children)]
+        return self.tree_class('_ambig', [self.node_builder(list(f)) for f in product(*expand)])
+
+
+def maybe_create_ambiguous_expander(tree_class, expansion, keep_all_tokens):
+    to_expand = [i for i, sym in enumerate(expansion)
+                 if keep_all_tokens or ((not (sym.is_term and sym.filter_out)) and _should_expand(sym))]
+    if to_expand:
+        return partial(AmbiguousExpander, to_expand, tree_class)
+
+
+class AmbiguousIntermediateExpander:
+    #--
+
+    def __init__(self, tree_class, node_builder):
+        self.node_builder = node_builder
+        self.tree_class = tree_class
+
+    def __call__(self, children):
+        def _is_iambig_tree(child):
+            return hasattr(child, 'data') and child.data == '_iambig'
+
+        def _collapse_iambig(children):
+            #--
+
+            ##
+
+            ##
+
+            if children and _is_iambig_tree(children[0]):
+                iambig_node = children[0]
+                result = []
+                for grandchild in iambig_node.children:
+                    collapsed = _collapse_iambig(grandchild.children)
+                    if collapsed:
+                        for child in collapsed:
+                            child.children += children[1:]
+                        result += collapsed
+                    else:
+                        new_tree = self.tree_class('_inter', grandchild.children + children[1:])
+                        result.append(new_tree)
+                return result
+
+        collapsed = _collapse_iambig(children)
+        if collapsed:
+            processed_nodes = [self.node_builder(c.children) for c in collapsed]
+            return self.tree_class('_ambig', processed_nodes)
+
+        return self.node_builder(children)
+
+
+
+def inplace_transformer(func):
+    @wraps(func)
+    def f(children):
+        ##
+
+        tree = Tree(func.__name__, children)
+        return func(tree)
+    return f
+
+
+def apply_visit_wrapper(func, name, wrapper):
+    if wrapper is _vargs_meta or wrapper is _vargs_meta_inline:
+        raise NotImplementedError("Meta args not supported for internal transformer; use YourTransformer().transform(parser.parse()) instead")
+
+    @wraps(func)
+    def f(children):
+        return wrapper(func, name, children, None)
+    return f
+
+
+class ParseTreeBuilder:
+    def __init__(self, rules, tree_class, propagate_positions=False, ambiguous=False, maybe_placeholders=False):
+        self.tree_class = tree_class
+        self.propagate_positions = propagate_positions
+        self.ambiguous = ambiguous
+        self.maybe_placeholders = maybe_placeholders
+
+        self.rule_builders = list(self._init_builders(rules))
+
+    def _init_builders(self, rules):
+        propagate_positions = make_propagate_positions(self.propagate_positions)
+
+        for rule in rules:
+            options = rule.options
+            keep_all_tokens = options.keep_all_tokens
+            expand_single_child = options.expand1
+
+            wrapper_chain = list(filter(None, [
+                (expand_single_child and not rule.alias) and ExpandSingleChild,
+                maybe_create_child_filter(rule.expansion, keep_all_tokens, self.ambiguous, options.empty_indices if self.maybe_placeholders else None),
+                propagate_positions,
+                self.ambiguous and maybe_create_ambiguous_expander(self.tree_class, rule.expansion, keep_all_tokens),
+                self.ambiguous and partial(AmbiguousIntermediateExpander, self.tree_class)
+            ]))
+
+            yield rule, wrapper_chain
+
+    def create_callback(self, transformer=None):
+        callbacks = {}
+
+        default_handler = getattr(transformer, '__default__', None)
+        if default_handler:
+            def default_callback(data, children):
+                return default_handler(data, children, None)
+        else:
+            default_callback = self.tree_class
+
+        for rule, wrapper_chain in self.rule_builders:
+
+            user_callback_name = rule.alias or rule.options.template_source or rule.origin.name
+            try:
+                f = getattr(transformer, user_callback_name)
+                wrapper = getattr(f, 'visit_wrapper', None)
+                if wrapper is not None:
+                    f = apply_visit_wrapper(f, user_callback_name, wrapper)
+                elif isinstance(transformer, Transformer_InPlace):
+                    f = inplace_transformer(f)
+            except AttributeError:
+                f = partial(default_callback, user_callback_name)
+
+            for w in wrapper_chain:
+                f = w(f)
+
+            if rule in callbacks:
+                raise GrammarError("Rule '%s' already exists" % (rule,))
+
+            callbacks[rule] = f
+
+        return callbacks
+
+
+
+class Action:
+    def __init__(self, name):
+        self.name = name
+    def __str__(self):
+        return self.name
+    def __repr__(self):
+        return str(self)
+
+Shift = Action('Shift')
+Reduce = Action('Reduce')
+
+StateT = TypeVar("StateT")
+
+class ParseTableBase(Generic[StateT]):
+    states: Dict[StateT, Dict[str, Tuple]]
+    start_states: Dict[str, StateT]
+    end_states: Dict[str, StateT]
+
+    def __init__(self, states, start_states, end_states):
+        self.states = states
+        self.start_states = start_states
+        self.end_states = end_states
+
+    def serialize(self, memo):
+        tokens = Enumerator()
+
+        states = {
+            state: {tokens.get(token): ((1, arg.serialize(memo)) if action is Reduce else (0, arg))
+                    for token, (action, arg) in actions.items()}
+            for state, actions in self.states.items()
+        }
+
+        return {
+            'tokens': tokens.reversed(),
+            'states': states,
+            'start_states': self.start_states,
+            'end_states': self.end_states,
+        }
+
+    @classmethod
+    def deserialize(cls, data, memo):
+        tokens = data['tokens']
+        states = {
+            state: {tokens[token]: ((Reduce, Rule.deserialize(arg, memo)) if action==1 else (Shift, arg))
+                    for token, (action, arg) in actions.items()}
+            for state, actions in data['states'].items()
+        }
+        return cls(states, data['start_states'], data['end_states'])
+
+class ParseTable(ParseTableBase['State']):
+    #--
+    pass
+
+
+class IntParseTable(ParseTableBase[int]):
+    #--
+
+    @classmethod
+    def from_ParseTable(cls, parse_table: ParseTable):
+        enum = list(parse_table.states)
+        state_to_idx: Dict['State', int] = {s:i for i,s in enumerate(enum)}
+        int_states = {}
+
+        for s, la in parse_table.states.items():
+            la = {k:(v[0], state_to_idx[v[1]]) if v[0] is Shift else v
+                  for k,v in la.items()}
+            int_states[ state_to_idx[s] ] = la
+
+
+        start_states = {start:state_to_idx[s] for start, s in parse_table.start_states.items()}
+        end_states = {start:state_to_idx[s] for start, s in parse_table.end_states.items()}
+        return cls(int_states, start_states, end_states)
+
+
+
+class ParseConf(Generic[StateT]):
+    __slots__ = 'parse_table', 'callbacks', 'start', 'start_state', 'end_state', 'states'
+
+    parse_table: ParseTableBase[StateT]
+    callbacks: ParserCallbacks
+    start: str
+
+    start_state: StateT
+    end_state: StateT
+    states: Dict[StateT, Dict[str, tuple]]
+
+    def __init__(self, parse_table: ParseTableBase[StateT], callbacks: ParserCallbacks, start: str):
+        self.parse_table = parse_table
+
+        self.start_state = self.parse_table.start_states[start]
+        self.end_state = self.parse_table.end_states[start]
+        self.states = self.parse_table.states
+
+        self.callbacks = callbacks
+        self.start = start
+
+class ParserState(Generic[StateT]):
+    __slots__ = 'parse_conf', 'lexer', 'state_stack', 'value_stack'
+
+    parse_conf: ParseConf[StateT]
+    lexer: LexerThread
+    state_stack: List[StateT]
+    value_stack: list
+
+    def __init__(self, parse_conf: ParseConf[StateT], lexer: LexerThread, state_stack=None, value_stack=None):
+        self.parse_conf = parse_conf
+        self.lexer = lexer
+        self.state_stack = state_stack or [self.parse_conf.start_state]
+        self.value_stack = value_stack or []
+
+    @property
+    def position(self) -> StateT:
+        return self.state_stack[-1]
+
+    ##
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ParserState):
+            return NotImplemented
+        return len(self.state_stack) == len(other.state_stack) and self.position == other.position
+
+    def __copy__(self):
+        return self.copy()
+
+    def copy(self, deepcopy_values=True) -> 'ParserState[StateT]':
+        return type(self)(
+            self.parse_conf,
+            self.lexer, ##
+
+            copy(self.state_stack),
+            deepcopy(self.value_stack) if deepcopy_values else copy(self.value_stack),
+        )
+
+    def feed_token(self, token: Token, is_end=False) -> Any:
+        state_stack = self.state_stack
+        value_stack = self.value_stack
+        states = self.parse_conf.states
+        end_state = self.parse_conf.end_state
+        callbacks = self.parse_conf.callbacks
+
+        while True:
+            state = state_stack[-1]
+            try:
+                action, arg = states[state][token.type]
+            except KeyError:
+                expected = {s for s in states[state].keys() if s.isupper()}
+                raise UnexpectedToken(token, expected, state=self, interactive_parser=None)
+
+            assert arg != end_state
+
+            if action is Shift:
+                ##
+
+                assert not is_end
+                state_stack.append(arg)
+                value_stack.append(token if token.type not in callbacks else callbacks[token.type](token))
+                return
+            else:
+                ##
+
+                rule = arg
+                size = len(rule.expansion)
+                if size:
+                    s = value_stack[-size:]
+                    del state_stack[-size:]
+                    del value_stack[-size:]
+                else:
+                    s = []
+
+                value = callbacks[rule](s) if callbacks else s
+
+                _action, new_state = states[state_stack[-1]][rule.origin.name]
+                assert _action is Shift
+                state_stack.append(new_state)
+                value_stack.append(value)
+
+                if is_end and state_stack[-1] == end_state:
+                    return value_stack[-1]
+
+
+class LALR_Parser(Serialize):
+    def __init__(self, parser_conf: ParserConf, debug: bool=False, strict: bool=False):
+        analysis = LALR_Analyzer(parser_conf, debug=debug, strict=strict)
+        analysis.compute_lalr()
+        callbacks = parser_conf.callbacks
+
+        self._parse_table = analysis.parse_table
+        self.parser_conf = parser_conf
+        self.parser = _Parser(analysis.parse_table, callbacks, debug)
+
+    @classmethod
+    def deserialize(cls, data, memo, callbacks, debug=False):
+        inst = cls.__new__(cls)
+        inst._parse_table = IntParseTable.deserialize(data, memo)
+        inst.parser = _Parser(inst._parse_table, callbacks, debug)
+        return inst
+
+    def serialize(self, memo: Any = None) -> Dict[str, Any]:
+        return self._parse_table.serialize(memo)
+
+    def parse_interactive(self, lexer: LexerThread, start: str):
+        return self.parser.parse(lexer, start, start_interactive=True)
+
+    def parse(self, lexer, start, on_error=None):
+        try:
+            return self.parser.parse(lexer, start)
+        except UnexpectedInput as e:
+            if on_error is None:
+                raise
+
+            while True:
+                if isinstance(e, UnexpectedCharacters):
+                    s = e.interactive_parser.lexer_thread.state
+                    p = s.line_ctr.char_pos
+
+                if not on_error(e):
+                    raise e
+
+                if isinstance(e, UnexpectedCharacters):
+                    ##
+
+                    if p == s.line_ctr.char_pos:
+                        s.line_ctr.feed(s.text.text[p:p+1])
+
+                try:
+                    return e.interactive_parser.resume_parse()
+                except UnexpectedToken as e2:
+                    if (isinstance(e, UnexpectedToken)
+                        and e.token.type == e2.token.type == '$END'
+                        and e.interactive_parser == e2.interactive_parser):
+                        ##
+
+                        raise e2
+                    e = e2
+                except UnexpectedCharacters as e2:
+                    e = e2
+
+
+class _Parser:
+    parse_table: ParseTableBase
+    callbacks: ParserCallbacks
+    debug: bool
+
+    def __init__(self, parse_table: ParseTableBase, callbacks: ParserCallbacks, debug: bool=False):
+        self.parse_table = parse_table
+        self.callbacks = callbacks
+        self.debug = debug
+
+    def parse(self, lexer: LexerThread, start: str, value_stack=None, state_stack=None, start_interactive=False):
+        parse_conf = ParseConf(self.parse_table, self.callbacks, start)
+        parser_state = ParserState(parse_conf, lexer, state_stack, value_stack)
+        if start_interactive:
+            return InteractiveParser(self, parser_state, parser_state.lexer)
+        return self.parse_from_state(parser_state)
+
+
+    def parse_from_state(self, state: ParserState, last_token: Optional[Token]=None):
+        #--
+        try:
+            token = last_token
+            for token in state.lexer.lex(state):
+                assert token is not None
+                state.feed_token(token)
+
+            end_token = Token.new_borrow_pos('$END', '', token) if token else Token('$END', '', 0, 1, 1)
+            return state.feed_token(end_token, True)
+        except UnexpectedInput as e:
+            try:
+                e.interactive_parser = InteractiveParser(self, state, state.lexer)
+            except NameError:
+                pass
+            raise e
+        except Exception as e:
+            if self.debug:
+                print("")
+                print("STATE STACK DUMP")
+                print("----------------")
+                for i, s in enumerate(state.state_stack):
+                    print('%d)' % i , s)
+                print("")
+
+            raise
+
+
+class InteractiveParser:
+    #--
+    def __init__(self, parser, parser_state: ParserState, lexer_thread: LexerThread):
+        self.parser = parser
+        self.parser_state = parser_state
+        self.lexer_thread = lexer_thread
+        self.result = None
+
+    @property
+    def lexer_state(self) -> LexerThread:
+        warnings.warn("lexer_state will be removed in subsequent releases. Use lexer_thread instead.", DeprecationWarning)
+        return self.lexer_thread
+
+    def feed_token(self, token: Token):
+        #--
+        return self.parser_state.feed_token(token, token.type == '$END')
+
+    def iter_parse(self) -> Iterator[Token]:
+        #--
+        for token in self.lexer_thread.lex(self.parser_state):
+            yield token
+            self.result = self.feed_token(token)
+
+    def exhaust_lexer(self) -> List[Token]:
+        #--
+        return list(self.iter_parse())
+
+
+    def feed_eof(self, last_token=None):
+        #--
+        eof = Token.new_borrow_pos('$END', '', last_token) if last_token is not None else self.lexer_thread._Token('$END', '', 0, 1, 1)
+        return self.feed_token(eof)
+
+
+    def __copy__(self):
+        #--
+        return self.copy()
+
+    def copy(self, deepcopy_values=True):
+        return type(self)(
+            self.parser,
+            self.parser_state.copy(deepcopy_values=deepcopy_values),
+            copy(self.lexer_thread),
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, InteractiveParser):
+            return False
+
+        return self.parser_state == other.parser_state and self.lexer_thread == other.lexer_thread
+
+    def as_immutable(self):
+        #--
+        p = copy(self)
+        return ImmutableInteractiveParser(p.parser, p.parser_state, p.lexer_thread)
+
+    def pretty(self):
+        #--
+        out = ["Parser choices:"]
+        for k, v in self.choices().items():
+            out.append('\t- %s -> %r' % (k, v))
+        out.append('stack size: %s' % len(self.parser_state.state_stack))
+        return '\n'.join(out)
+
+    def choices(self):
+        #--
+        return self.parser_state.parse_conf.parse_table.states[self.parser_state.position]
+
+    def accepts(self):
+        #--
+        accepts = set()
+        conf_no_callbacks = copy(self.parser_state.parse_conf)
+        ##
+
+        ##
+
+        conf_no_callbacks.callbacks = {}
+        for t in self.choices():
+            if t.isupper(): ##
+
+                new_cursor = self.copy(deepcopy_values=False)
+                new_cursor.parser_state.parse_conf = conf_no_callbacks
+                try:
+                    new_cursor.feed_token(self.lexer_thread._Token(t, ''))
+                except UnexpectedToken:
+                    pass
+                else:
+                    accepts.add(t)
+        return accepts
+
+    def resume_parse(self):
+        #--
+        return self.parser.parse_from_state(self.parser_state, last_token=self.lexer_thread.state.last_token)
+
+
+
+class ImmutableInteractiveParser(InteractiveParser):
+    #--
+
+    result = None
+
+    def __hash__(self):
+        return hash((self.parser_state, self.lexer_thread))
+
+    def feed_token(self, token):
+        c = copy(self)
+        c.result = InteractiveParser.feed_token(c, token)
+        return c
+
+    def exhaust_lexer(self):
+        #--
+        cursor = self.as_mutable()
+        cursor.exhaust_lexer()
+        return cursor.as_immutable()
+
+    def as_mutable(self):
+        #--
+        p = copy(self)
+        return InteractiveParser(p.parser, p.parser_state, p.lexer_thread)
+
+
+
+def _wrap_lexer(lexer_class):
+    future_interface = getattr(lexer_class, '__future_interface__', 0)
+    if future_interface == 2:
+        return lexer_class
+    elif future_interface == 1:
+        class CustomLexerWrapper1(Lexer):
+            def __init__(self, lexer_conf):
+                self.lexer = lexer_class(lexer_conf)
+            def lex(self, lexer_state, parser_state):
+                if isinstance(lexer_state.text, TextSlice) and not lexer_state.text.is_complete_text():
+                    raise TypeError("Interface=1 Custom Lexer don't support TextSlice")
+                lexer_state.text = lexer_state.text
+                return self.lexer.lex(lexer_state, parser_state)
+        return CustomLexerWrapper1
+    elif future_interface == 0:
+        class CustomLexerWrapper0(Lexer):
+            def __init__(self, lexer_conf):
+                self.lexer = lexer_class(lexer_conf)
+
+            def lex(self, lexer_state, parser_state):
+                if isinstance(lexer_state.text, TextSlice):
+                    if not lexer_state.text.is_complete_text():
+                        raise TypeError("Interface=0 Custom Lexer don't support TextSlice")
+                    return self.lexer.lex(lexer_state.text.text)
+                return self.lexer.lex(lexer_state.text)
+        return CustomLexerWrapper0
+    else:
+        raise ValueError(f"Unknown __future_interface__ value {future_interface}, integer 0-2 expected")
+
+
+def _deserialize_parsing_frontend(data, memo, lexer_conf, callbacks, options):
+    parser_conf = ParserConf.deserialize(data['parser_conf'], memo)
+    cls = (options and options._plugins.get('LALR_Parser')) or LALR_Parser
+    parser = cls.deserialize(data['parser'], memo, callbacks, options.debug)
+    parser_conf.callbacks = callbacks
+    return ParsingFrontend(lexer_conf, parser_conf, options, parser=parser)
+
+
+_parser_creators: 'Dict[str, Callable[[LexerConf, Any, Any], Any]]' = {}
+
+
+class ParsingFrontend(Serialize):
+    __serialize_fields__ = 'lexer_conf', 'parser_conf', 'parser'
+
+    lexer_conf: LexerConf
+    parser_conf: ParserConf
+    options: Any
+
+    def __init__(self, lexer_conf: LexerConf, parser_conf: ParserConf, options, parser=None):
+        self.parser_conf = parser_conf
+        self.lexer_conf = lexer_conf
+        self.options = options
+
+        ##
+
+        if parser:  ##
+
+            self.parser = parser
+        else:
+            create_parser = _parser_creators.get(parser_conf.parser_type)
+            assert create_parser is not None, "{} is not supported in standalone mode".format(
+                    parser_conf.parser_type
+                )
+            self.parser = create_parser(lexer_conf, parser_conf, options)
+
+        ##
+
+        lexer_type = lexer_conf.lexer_type
+        self.skip_lexer = False
+        if lexer_type in ('dynamic', 'dynamic_complete'):
+            assert lexer_conf.postlex is None
+            self.skip_lexer = True
+            return
+
+        if isinstance(lexer_type, type):
+            assert issubclass(lexer_type, Lexer)
+            self.lexer = _wrap_lexer(lexer_type)(lexer_conf)
+        elif isinstance(lexer_type, str):
+            create_lexer = {
+                'basic': create_basic_lexer,
+                'contextual': create_contextual_lexer,
+            }[lexer_type]
+            self.lexer = create_lexer(lexer_conf, self.parser, lexer_conf.postlex, options)
+        else:
+            raise TypeError("Bad value for lexer_type: {lexer_type}")
+
+        if lexer_conf.postlex:
+            self.lexer = PostLexConnector(self.lexer, lexer_conf.postlex)
+
+    def _verify_start(self, start=None):
+        if start is None:
+            start_decls = self.parser_conf.start
+            if len(start_decls) > 1:
+                raise ConfigurationError("Lark initialized with more than 1 possible start rule. Must specify which start rule to parse", start_decls)
+            start ,= start_decls
+        elif start not in self.parser_conf.start:
+            raise ConfigurationError("Unknown start rule %s. Must be one of %r" % (start, self.parser_conf.start))
+        return start
+
+    def _make_lexer_thread(self, text: Optional[LarkInput]) -> Union[LarkInput, LexerThread, None]:
+        cls = (self.options and self.options._plugins.get('LexerThread')) or LexerThread
+        if self.skip_lexer:
+            return text
+        if text is None:
+            return cls(self.lexer, None)
+        if isinstance(text, (str, bytes, TextSlice)):
+            return cls.from_text(self.lexer, text)
+        return cls.from_custom_input(self.lexer, text)
+
+    def parse(self, text: Optional[LarkInput], start=None, on_error=None):
+        if self.lexer_conf.lexer_type in ("dynamic", "dynamic_complete"):
+            if isinstance(text, TextSlice) and not text.is_complete_text():
+                raise TypeError(f"Lexer {self.lexer_conf.lexer_type} does not support text slices.")
+
+        chosen_start = self._verify_start(start)
+        kw = {} if on_error is None else {'on_error': on_error}
+        stream = self._make_lexer_thread(text)
+        return self.parser.parse(stream, chosen_start, **kw)
+
+    def parse_interactive(self, text: Optional[TextOrSlice]=None, start=None):
+        ##
+
+        ##
+
+        chosen_start = self._verify_start(start)
+        if self.parser_conf.parser_type != 'lalr':
+            raise ConfigurationError("parse_interactive() currently only works with parser='lalr' ")
+        stream = self._make_lexer_thread(text)
+        return self.parser.parse_interactive(stream, chosen_start)
+
+
+def _validate_frontend_args(parser, lexer) -> None:
+    assert_config(parser, ('lalr', 'earley', 'cyk'))
+    if not isinstance(lexer, type):     ##
+
+        expected = {
+            'lalr': ('basic', 'contextual'),
+            'earley': ('basic', 'dynamic', 'dynamic_complete'),
+            'cyk': ('basic', ),
+         }[parser]
+        assert_config(lexer, expected, 'Parser %r does not support lexer %%r, expected one of %%s' % parser)
+
+
+def _get_lexer_callbacks(transformer, terminals):
+    result = {}
+    for terminal in terminals:
+        callback = getattr(transformer, terminal.name, None)
+        if callback is not None:
+            result[terminal.name] = callback
+    return result
+
+class PostLexConnector:
+    def __init__(self, lexer, postlexer):
+        self.lexer = lexer
+        self.postlexer = postlexer
+
+    def lex(self, lexer_state, parser_state):
+        i = self.lexer.lex(lexer_state, parser_state)
+        return self.postlexer.process(i)
+
+
+
+def create_basic_lexer(lexer_conf, parser, postlex, options) -> BasicLexer:
+    cls = (options and options._plugins.get('BasicLexer')) or BasicLexer
+    return cls(lexer_conf)
+
+def create_contextual_lexer(lexer_conf: LexerConf, parser, postlex, options) -> ContextualLexer:
+    cls = (options and options._plugins.get('ContextualLexer')) or ContextualLexer
+    parse_table: ParseTableBase[int] = parser._parse_table
+    states: Dict[int, Collection[str]] = {idx:list(t.keys()) for idx, t in parse_table.states.items()}
+    always_accept: Collection[str] = postlex.always_accept if postlex else ()
+    return cls(lexer_conf, states, always_accept=always_accept)
+
+def create_lalr_parser(lexer_conf: LexerConf, parser_conf: ParserConf, options=None) -> LALR_Parser:
+    debug = options.debug if options else False
+    strict = options.strict if options else False
+    cls = (options and options._plugins.get('LALR_Parser')) or LALR_Parser
+    return cls(parser_conf, debug=debug, strict=strict)
+
+_parser_creators['lalr'] = create_lalr_parser
+
+
+
+
+class PostLex(ABC):
+    @abstractmethod
+    def process(self, stream: Iterator[Token]) -> Iterator[Token]:
+        return stream
+
+    always_accept: Iterable[str] = ()
+
+class LarkOptions(Serialize):
+    #--
+
+    start: List[str]
+    debug: bool
+    strict: bool
+    transformer: 'Optional[Transformer]'
+    propagate_positions: Union[bool, str]
+    maybe_placeholders: bool
+    cache: Union[bool, str]
+    cache_grammar: bool
+    regex: bool
+    g_regex_flags: int
+    keep_all_tokens: bool
+    tree_class: Optional[Callable[[str, List], Any]]
+    parser: _ParserArgType
+    lexer: _LexerArgType
+    ambiguity: 'Literal["auto", "resolve", "explicit", "forest"]'
+    postlex: Optional[PostLex]
+    priority: 'Optional[Literal["auto", "normal", "invert"]]'
+    lexer_callbacks: Dict[str, Callable[[Token], Token]]
+    use_bytes: bool
+    ordered_sets: bool
+    edit_terminals: Optional[Callable[[TerminalDef], TerminalDef]]
+    import_paths: 'List[Union[str, Callable[[Union[None, str, PackageResource], str], Tuple[str, str]]]]'
+    source_path: Optional[str]
+
+    OPTIONS_DOC = r"""
+    **===  General Options  ===**
+
+    start
+            The start symbol. Either a string, or a list of strings for multiple possible starts (Default: "start")
+    debug
+            Display debug information and extra warnings. Use only when debugging (Default: ``False``)
+            When used with Earley, it generates a forest graph as "sppf.png", if 'dot' is installed.
+    strict
+            Throw an exception on any potential ambiguity, including shift/reduce conflicts, and regex collisions.
+    transformer
+            Applies the transformer to every parse tree (equivalent to applying it after the parse, but faster)
+    propagate_positions
+            Propagates positional attributes into the 'meta' attribute of all tree branches.
+            Sets attributes: (line, column, end_line, end_column, start_pos, end_pos,
+                              container_line, container_column, container_end_line, container_end_column)
+            Accepts ``False``, ``True``, or a callable, which will filter which nodes to ignore when propagating.
+    maybe_placeholders
+            When ``True``, the ``[]`` operator returns ``None`` when not matched.
+            When ``False``,  ``[]`` behaves like the ``?`` operator, and returns no value at all.
+            (default= ``True``)
+    cache
+            Cache the results of the Lark grammar analysis, for x2 to x3 faster loading. LALR only for now.
+
+            - When ``False``, does nothing (default)
+            - When ``True``, caches to a temporary file in the local directory
+            - When given a string, caches to the path pointed by the string
+    cache_grammar
+            For use with ``cache`` option. When ``True``, the unanalyzed grammar is also included in the cache.
+            Useful for classes that require the ``Lark.grammar`` to be present (e.g. Reconstructor).
+            (default= ``False``)
+    regex
+            When True, uses the ``regex`` module instead of the stdlib ``re``.
+    g_regex_flags
+            Flags that are applied to all terminals (both regex and strings)
+    keep_all_tokens
+            Prevent the tree builder from automagically removing "punctuation" tokens (Default: ``False``)
+    tree_class
+            Lark will produce trees comprised of instances of this class instead of the default ``lark.Tree``.
+
+    **=== Algorithm Options ===**
+
+    parser
+            Decides which parser engine to use. Accepts "earley" or "lalr". (Default: "earley").
+            (there is also a "cyk" option for legacy)
+    lexer
+            Decides whether or not to use a lexer stage
+
+            - "auto" (default): Choose for me based on the parser
+            - "basic": Use a basic lexer
+            - "contextual": Stronger lexer (only works with parser="lalr")
+            - "dynamic": Flexible and powerful (only with parser="earley")
+            - "dynamic_complete": Same as dynamic, but tries *every* variation of tokenizing possible.
+    ambiguity
+            Decides how to handle ambiguity in the parse. Only relevant if parser="earley"
+
+            - "resolve": The parser will automatically choose the simplest derivation
+              (it chooses consistently: greedy for tokens, non-greedy for rules)
+            - "explicit": The parser will return all derivations wrapped in "_ambig" tree nodes (i.e. a forest).
+            - "forest": The parser will return the root of the shared packed parse forest.
+
+    **=== Misc. / Domain Specific Options ===**
+
+    postlex
+            Lexer post-processing (Default: ``None``) Only works with the basic and contextual lexers.
+    priority
+            How priorities should be evaluated - "auto", ``None``, "normal", "invert" (Default: "auto")
+    lexer_callbacks
+            Dictionary of callbacks for the lexer. May alter tokens during lexing. Use with caution.
+    use_bytes
+            Accept an input of type ``bytes`` instead of ``str``.
+    ordered_sets
+            Should Earley use ordered-sets to achieve stable output (~10% slower than regular sets. Default: True)
+    edit_terminals
+            A callback for editing the terminals before parse.
+    import_paths
+            A List of either paths or loader functions to specify from where grammars are imported
+    source_path
+            Override the source of from where the grammar was loaded. Useful for relative imports and unconventional grammar loading
+    **=== End of Options ===**
+    """
+    if __doc__:
+        __doc__ += OPTIONS_DOC
+
+
+    ##
+
+    ##
+
+    ##
+
+    ##
+
+    ##
+
+    ##
+
+    _defaults: Dict[str, Any] = {
+        'debug': False,
+        'strict': False,
+        'keep_all_tokens': False,
+        'tree_class': None,
+        'cache': False,
+        'cache_grammar': False,
+        'postlex': None,
+        'parser': 'earley',
+        'lexer': 'auto',
+        'transformer': None,
+        'start': 'start',
+        'priority': 'auto',
+        'ambiguity': 'auto',
+        'regex': False,
+        'propagate_positions': False,
+        'lexer_callbacks': {},
+        'maybe_placeholders': True,
+        'edit_terminals': None,
+        'g_regex_flags': 0,
+        'use_bytes': False,
+        'ordered_sets': True,
+        'import_paths': [],
+        'source_path': None,
+        '_plugins': {},
+    }
+
+    def __init__(self, options_dict: Dict[str, Any]) -> None:
+        o = dict(options_dict)
+
+        options = {}
+        for name, default in self._defaults.items():
+            if name in o:
+                value = o.pop(name)
+                if isinstance(default, bool) and name not in ('cache', 'use_bytes', 'propagate_positions'):
+                    value = bool(value)
+            else:
+                value = default
+
+            options[name] = value
+
+        if isinstance(options['start'], str):
+            options['start'] = [options['start']]
+
+        self.__dict__['options'] = options
+
+
+        assert_config(self.parser, ('earley', 'lalr', 'cyk', None))
+
+        if self.parser == 'earley' and self.transformer:
+            raise ConfigurationError('Cannot specify an embedded transformer when using the Earley algorithm. '
+                             'Please use your transformer on the resulting parse tree, or use a different algorithm (i.e. LALR)')
+
+        if self.cache_grammar and not self.cache:
+            raise ConfigurationError('cache_grammar cannot be set when cache is disabled')
+
+        if o:
+            raise ConfigurationError("Unknown options: %s" % o.keys())
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self.__dict__['options'][name]
+        except KeyError as e:
+            raise AttributeError(e)
+
+    def __setattr__(self, name: str, value: str) -> None:
+        assert_config(name, self.options.keys(), "%r isn't a valid option. Expected one of: %s")
+        self.options[name] = value
+
+    def serialize(self, memo = None) -> Dict[str, Any]:
+        return self.options
+
+    @classmethod
+    def deserialize(cls, data: Dict[str, Any], memo: Dict[int, Union[TerminalDef, Rule]]) -> "LarkOptions":
+        return cls(data)
+
+
+##
+
+##
+
+_LOAD_ALLOWED_OPTIONS = {'postlex', 'transformer', 'lexer_callbacks', 'use_bytes', 'debug', 'g_regex_flags', 'regex', 'propagate_positions', 'tree_class', '_plugins'}
+
+_VALID_PRIORITY_OPTIONS = ('auto', 'normal', 'invert', None)
+_VALID_AMBIGUITY_OPTIONS = ('auto', 'resolve', 'explicit', 'forest')
+
+
+_T = TypeVar('_T', bound="Lark")
+
+class Lark(Serialize):
+    #--
+
+    source_path: str
+    source_grammar: str
+    grammar: 'Grammar'
+    options: LarkOptions
+    lexer: Lexer
+    parser: 'ParsingFrontend'
+    terminals: Collection[TerminalDef]
+
+    __serialize_fields__ = ['parser', 'rules', 'options']
+
+    def __init__(self, grammar: 'Union[Grammar, str, IO[str]]', **options) -> None:
+        self.options = LarkOptions(options)
+        re_module: types.ModuleType
+
+        ##
+
+        if self.options.cache_grammar:
+            self.__serialize_fields__ = self.__serialize_fields__ + ['grammar']
+
+        ##
+
+        use_regex = self.options.regex
+        if use_regex:
+            if _has_regex:
+                re_module = regex
+            else:
+                raise ImportError('`regex` module must be installed if calling `Lark(regex=True)`.')
+        else:
+            re_module = re
+
+        ##
+
+        if self.options.source_path is None:
+            try:
+                self.source_path = grammar.name  ##
+
+            except AttributeError:
+                self.source_path = '<string>'
+        else:
+            self.source_path = self.options.source_path
+
+        ##
+
+        try:
+            read = grammar.read  ##
+
+        except AttributeError:
+            pass
+        else:
+            grammar = read()
+
+        cache_fn = None
+        cache_sha256 = None
+        if isinstance(grammar, str):
+            self.source_grammar = grammar
+            if self.options.use_bytes:
+                if not grammar.isascii():
+                    raise ConfigurationError("Grammar must be ascii only, when use_bytes=True")
+
+            if self.options.cache:
+                if self.options.parser != 'lalr':
+                    raise ConfigurationError("cache only works with parser='lalr' for now")
+
+                unhashable = ('transformer', 'postlex', 'lexer_callbacks', 'edit_terminals', '_plugins')
+                options_str = ''.join(k+str(v) for k, v in options.items() if k not in unhashable)
+                from . import __version__
+                s = grammar + options_str + __version__ + str(sys.version_info[:2])
+                cache_sha256 = sha256_digest(s)
+
+                if isinstance(self.options.cache, str):
+                    cache_fn = self.options.cache
+                else:
+                    if self.options.cache is not True:
+                        raise ConfigurationError("cache argument must be bool or str")
+
+                    try:
+                        username = getpass.getuser()
+                    except Exception:
+                        ##
+
+                        ##
+
+                        ##
+
+                        username = "unknown"
+
+
+                    cache_fn = tempfile.gettempdir() + "/.lark_%s_%s_%s_%s_%s.tmp" % (
+                        "cache_grammar" if self.options.cache_grammar else "cache", username, cache_sha256, *sys.version_info[:2])
+
+                old_options = self.options
+                try:
+                    with FS.open(cache_fn, 'rb') as f:
+                        logger.debug('Loading grammar from cache: %s', cache_fn)
+                        ##
+
+                        for name in (set(options) - _LOAD_ALLOWED_OPTIONS):
+                            del options[name]
+                        file_sha256 = f.readline().rstrip(b'\n')
+                        cached_used_files = pickle.load(f)
+                        if file_sha256 == cache_sha256.encode('utf8') and verify_used_files(cached_used_files):
+                            cached_parser_data = pickle.load(f)
+                            self._load(cached_parser_data, **options)
+                            return
+                except FileNotFoundError:
+                    ##
+
+                    pass
+                except Exception: ##
+
+                    logger.exception("Failed to load Lark from cache: %r. We will try to carry on.", cache_fn)
+
+                    ##
+
+                    ##
+
+                    self.options = old_options
+
+
+            ##
+
+            self.grammar, used_files = load_grammar(grammar, self.source_path, self.options.import_paths, self.options.keep_all_tokens)
+        else:
+            assert isinstance(grammar, Grammar)
+            self.grammar = grammar
+
+
+        if self.options.lexer == 'auto':
+            if self.options.parser == 'lalr':
+                self.options.lexer = 'contextual'
+            elif self.options.parser == 'earley':
+                if self.options.postlex is not None:
+                    logger.info("postlex can't be used with the dynamic lexer, so we use 'basic' instead. "
+                                "Consider using lalr with contextual instead of earley")
+                    self.options.lexer = 'basic'
+                else:
+                    self.options.lexer = 'dynamic'
+            elif self.options.parser == 'cyk':
+                self.options.lexer = 'basic'
+            else:
+                assert False, self.options.parser
+        lexer = self.options.lexer
+        if isinstance(lexer, type):
+            assert issubclass(lexer, Lexer)     ##
+
+        else:
+            assert_config(lexer, ('basic', 'contextual', 'dynamic', 'dynamic_complete'))
+            if self.options.postlex is not None and 'dynamic' in lexer:
+                raise ConfigurationError("Can't use postlex with a dynamic lexer. Use basic or contextual instead")
+
+        if self.options.ambiguity == 'auto':
+            if self.options.parser == 'earley':
+                self.options.ambiguity = 'resolve'
+        else:
+            assert_config(self.options.parser, ('earley', 'cyk'), "%r doesn't support disambiguation. Use one of these parsers instead: %s")
+
+        if self.options.priority == 'auto':
+            self.options.priority = 'normal'
+
+        if self.options.priority not in _VALID_PRIORITY_OPTIONS:
+            raise ConfigurationError("invalid priority option: %r. Must be one of %r" % (self.options.priority, _VALID_PRIORITY_OPTIONS))
+        if self.options.ambiguity not in _VALID_AMBIGUITY_OPTIONS:
+            raise ConfigurationError("invalid ambiguity option: %r. Must be one of %r" % (self.options.ambiguity, _VALID_AMBIGUITY_OPTIONS))
+
+        if self.options.parser is None:
+            terminals_to_keep = '*'     ##
+
+        elif self.options.postlex is not None:
+            terminals_to_keep = set(self.options.postlex.always_accept)
+        else:
+            terminals_to_keep = set()
+
+        ##
+
+        self.terminals, self.rules, self.ignore_tokens = self.grammar.compile(self.options.start, terminals_to_keep)
+
+        if self.options.edit_terminals:
+            for t in self.terminals:
+                self.options.edit_terminals(t)
+
+        self._terminals_dict = {t.name: t for t in self.terminals}
+
+        ##
+
+        if self.options.priority == 'invert':
+            for rule in self.rules:
+                if rule.options.priority is not None:
+                    rule.options.priority = -rule.options.priority
+            for term in self.terminals:
+                term.priority = -term.priority
+        ##
+
+        ##
+
+        ##
+
+        elif self.options.priority is None:
+            for rule in self.rules:
+                if rule.options.priority is not None:
+                    rule.options.priority = None
+            for term in self.terminals:
+                term.priority = 0
+
+        ##
+
+        self.lexer_conf = LexerConf(
+                self.terminals, re_module, self.ignore_tokens, self.options.postlex,
+                self.options.lexer_callbacks, self.options.g_regex_flags, use_bytes=self.options.use_bytes, strict=self.options.strict
+            )
+
+        if self.options.parser:
+            self.parser = self._build_parser()
+        elif lexer:
+            self.lexer = self._build_lexer()
+
+        if cache_fn:
+            logger.debug('Saving grammar to cache: %s', cache_fn)
+            try:
+                with FS.open(cache_fn, 'wb') as f:
+                    assert cache_sha256 is not None
+                    f.write(cache_sha256.encode('utf8') + b'\n')
+                    pickle.dump(used_files, f)
+                    self.save(f, _LOAD_ALLOWED_OPTIONS)
+            except IOError as e:
+                logger.exception("Failed to save Lark to cache: %r.", cache_fn, e)
+
+    if __doc__:
+        __doc__ += "\n\n" + LarkOptions.OPTIONS_DOC
+
+    def _build_lexer(self, dont_ignore: bool=False) -> BasicLexer:
+        lexer_conf = self.lexer_conf
+        if dont_ignore:
+            from copy import copy
+            lexer_conf = copy(lexer_conf)
+            lexer_conf.ignore = ()
+        return BasicLexer(lexer_conf)
+
+    def _prepare_callbacks(self) -> None:
+        self._callbacks = {}
+        ##
+
+        if self.options.ambiguity != 'forest':
+            self._parse_tree_builder = ParseTreeBuilder(
+                    self.rules,
+                    self.options.tree_class or Tree,
+                    self.options.propagate_positions,
+                    self.options.parser != 'lalr' and self.options.ambiguity == 'explicit',
+                    self.options.maybe_placeholders
+                )
+            self._callbacks = self._parse_tree_builder.create_callback(self.options.transformer)
+        self._callbacks.update(_get_lexer_callbacks(self.options.transformer, self.terminals))
+
+    def _build_parser(self) -> "ParsingFrontend":
+        self._prepare_callbacks()
+        _validate_frontend_args(self.options.parser, self.options.lexer)
+        parser_conf = ParserConf(self.rules, self._callbacks, self.options.start)
+        return _construct_parsing_frontend(
+            self.options.parser,
+            self.options.lexer,
+            self.lexer_conf,
+            parser_conf,
+            options=self.options
+        )
+
+    def save(self, f, exclude_options: Collection[str] = ()) -> None:
+        #--
+        if self.options.parser != 'lalr':
+            raise NotImplementedError("Lark.save() is only implemented for the LALR(1) parser.")
+        data, m = self.memo_serialize([TerminalDef, Rule])
+        if exclude_options:
+            data["options"] = {n: v for n, v in data["options"].items() if n not in exclude_options}
+        pickle.dump({'data': data, 'memo': m}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls: Type[_T], f) -> _T:
+        #--
+        inst = cls.__new__(cls)
+        return inst._load(f)
+
+    def _deserialize_lexer_conf(self, data: Dict[str, Any], memo: Dict[int, Union[TerminalDef, Rule]], options: LarkOptions) -> LexerConf:
+        lexer_conf = LexerConf.deserialize(data['lexer_conf'], memo)
+        lexer_conf.callbacks = options.lexer_callbacks or {}
+        lexer_conf.re_module = regex if options.regex else re
+        lexer_conf.use_bytes = options.use_bytes
+        lexer_conf.g_regex_flags = options.g_regex_flags
+        lexer_conf.skip_validation = True
+        lexer_conf.postlex = options.postlex
+        return lexer_conf
+
+    def _load(self: _T, f: Any, **kwargs) -> _T:
+        if isinstance(f, dict):
+            d = f
+        else:
+            d = pickle.load(f)
+        memo_json = d['memo']
+        data = d['data']
+
+        assert memo_json
+        memo = SerializeMemoizer.deserialize(memo_json, {'Rule': Rule, 'TerminalDef': TerminalDef}, {})
+        if 'grammar' in data:
+            self.grammar = Grammar.deserialize(data['grammar'], memo)
+        options = dict(data['options'])
+        if (set(kwargs) - _LOAD_ALLOWED_OPTIONS) & set(LarkOptions._defaults):
+            raise ConfigurationError("Some options are not allowed when loading a Parser: {}"
+                             .format(set(kwargs) - _LOAD_ALLOWED_OPTIONS))
+        options.update(kwargs)
+        self.options = LarkOptions.deserialize(options, memo)
+        self.rules = [Rule.deserialize(r, memo) for r in data['rules']]
+        self.source_path = '<deserialized>'
+        _validate_frontend_args(self.options.parser, self.options.lexer)
+        self.lexer_conf = self._deserialize_lexer_conf(data['parser'], memo, self.options)
+        self.terminals = self.lexer_conf.terminals
+        self._prepare_callbacks()
+        self._terminals_dict = {t.name: t for t in self.terminals}
+        self.parser = _deserialize_parsing_frontend(
+            data['parser'],
+            memo,
+            self.lexer_conf,
+            self._callbacks,
+            self.options,  ##
+
+        )
+        return self
+
+    @classmethod
+    def _load_from_dict(cls, data, memo, **kwargs):
+        inst = cls.__new__(cls)
+        return inst._load({'data': data, 'memo': memo}, **kwargs)
+
+    @classmethod
+    def open(cls: Type[_T], grammar_filename: str, rel_to: Optional[str]=None, **options) -> _T:
+        #--
+        if rel_to:
+            basepath = os.path.dirname(rel_to)
+            grammar_filename = os.path.join(basepath, grammar_filename)
+        with open(grammar_filename, encoding='utf8') as f:
+            return cls(f, **options)
+
+    @classmethod
+    def open_from_package(cls: Type[_T], package: str, grammar_path: str, search_paths: 'Sequence[str]'=[""], **options) -> _T:
+        #--
+        package_loader = FromPackageLoader(package, search_paths)
+        full_path, text = package_loader(None, grammar_path)
+        options.setdefault('source_path', full_path)
+        options.setdefault('import_paths', [])
+        options['import_paths'].append(package_loader)
+        return cls(text, **options)
+
+    def __repr__(self):
+        return 'Lark(open(%r), parser=%r, lexer=%r, ...)' % (self.source_path, self.options.parser, self.options.lexer)
+
+
+    def lex(self, text: TextOrSlice, dont_ignore: bool=False) -> Iterator[Token]:
+        #--
+        lexer: Lexer
+        if not hasattr(self, 'lexer') or dont_ignore:
+            lexer = self._build_lexer(dont_ignore)
+        else:
+            lexer = self.lexer
+        lexer_thread = LexerThread.from_text(lexer, text)
+        stream = lexer_thread.lex(None)
+        if self.options.postlex:
+            return self.options.postlex.process(stream)
+        return stream
+
+    def get_terminal(self, name: str) -> TerminalDef:
+        #--
+        return self._terminals_dict[name]
+
+    def parse_interactive(self, text: Optional[LarkInput]=None, start: Optional[str]=None) -> 'InteractiveParser':
+        #--
+        return self.parser.parse_interactive(text, start=start)
+
+    def parse(self, text: LarkInput, start: Optional[str]=None, on_error: 'Optional[Callable[[UnexpectedInput], bool]]'=None) -> 'ParseTree':
+        #--
+        if on_error is not None and self.options.parser != 'lalr':
+            raise NotImplementedError("The on_error option is only implemented for the LALR(1) parser.")
+        return self.parser.parse(text, start=start, on_error=on_error)
+
+
+
+
+class DedentError(LarkError):
+    pass
+
+class Indenter(PostLex, ABC):
+    #--
+    paren_level: int
+    indent_level: List[int]
+
+    def __init__(self) -> None:
+        self.paren_level = 0
+        self.indent_level = [0]
+        assert self.tab_len > 0
+
+    def handle_NL(self, token: Token) -> Iterator[Token]:
+        if self.paren_level > 0:
+            return
+
+        yield token
+
+        indent_str = token.rsplit('\n', 1)[1] ##
+
+        indent = indent_str.count(' ') + indent_str.count('\t') * self.tab_len
+
+        if indent > self.indent_level[-1]:
+            self.indent_level.append(indent)
+            yield Token.new_borrow_pos(self.INDENT_type, indent_str, token)
+        else:
+            while indent < self.indent_level[-1]:
+                self.indent_level.pop()
+                yield Token.new_borrow_pos(self.DEDENT_type, indent_str, token)
+
+            if indent != self.indent_level[-1]:
+                raise DedentError('Unexpected dedent to column %s. Expected dedent to %s' % (indent, self.indent_level[-1]))
+
+    def _process(self, stream):
+        token = None
+        for token in stream:
+            if token.type == self.NL_type:
+                yield from self.handle_NL(token)
+            else:
+                yield token
+
+            if token.type in self.OPEN_PAREN_types:
+                self.paren_level += 1
+            elif token.type in self.CLOSE_PAREN_types:
+                self.paren_level -= 1
+                assert self.paren_level >= 0
+
+        while len(self.indent_level) > 1:
+            self.indent_level.pop()
+            yield Token.new_borrow_pos(self.DEDENT_type, '', token) if token else Token(self.DEDENT_type, '', 0, 0, 0, 0, 0, 0)
+
+        assert self.indent_level == [0], self.indent_level
+
+    def process(self, stream):
+        self.paren_level = 0
+        self.indent_level = [0]
+        return self._process(stream)
+
+    ##
+
+    @property
+    def always_accept(self):
+        return (self.NL_type,)
+
+    @property
+    @abstractmethod
+    def NL_type(self) -> str:
+        #--
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def OPEN_PAREN_types(self) -> List[str]:
+        #--
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def CLOSE_PAREN_types(self) -> List[str]:
+        #--
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def INDENT_type(self) -> str:
+        #--
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def DEDENT_type(self) -> str:
+        #--
+        raise NotImplementedError()
+
+    @property
+    @abstractmethod
+    def tab_len(self) -> int:
+        #--
+        raise NotImplementedError()
+
+
+class PythonIndenter(Indenter):
+    #--
+
+    NL_type = '_NEWLINE'
+    OPEN_PAREN_types = ['LPAR', 'LSQB', 'LBRACE']
+    CLOSE_PAREN_types = ['RPAR', 'RSQB', 'RBRACE']
+    INDENT_type = '_INDENT'
+    DEDENT_type = '_DEDENT'
+    tab_len = 8
+
+
+import pickle, zlib, base64
+DATA = (
+{'parser': {'lexer_conf': {'terminals': [{'@': 0}, {'@': 1}, {'@': 2}, {'@': 3}, {'@': 4}, {'@': 5}, {'@': 6}, {'@': 7}, {'@': 8}, {'@': 9}, {'@': 10}, {'@': 11}, {'@': 12}, {'@': 13}, {'@': 14}, {'@': 15}, {'@': 16}, {'@': 17}, {'@': 18}, {'@': 19}, {'@': 20}, {'@': 21}, {'@': 22}, {'@': 23}, {'@': 24}, {'@': 25}, {'@': 26}, {'@': 27}, {'@': 28}, {'@': 29}, {'@': 30}, {'@': 31}, {'@': 32}, {'@': 33}, {'@': 34}, {'@': 35}, {'@': 36}, {'@': 37}, {'@': 38}, {'@': 39}, {'@': 40}, {'@': 41}, {'@': 42}, {'@': 43}, {'@': 44}, {'@': 45}, {'@': 46}], 'ignore': ['WS', 'COMMENT'], 'g_regex_flags': 0, 'use_bytes': False, 'lexer_type': 'contextual', '__type__': 'LexerConf'}, 'parser_conf': {'rules': [{'@': 47}, {'@': 48}, {'@': 49}, {'@': 50}, {'@': 51}, {'@': 52}, {'@': 53}, {'@': 54}, {'@': 55}, {'@': 56}, {'@': 57}, {'@': 58}, {'@': 59}, {'@': 60}, {'@': 61}, {'@': 62}, {'@': 63}, {'@': 64}, {'@': 65}, {'@': 66}, {'@': 67}, {'@': 68}, {'@': 69}, {'@': 70}, {'@': 71}, {'@': 72}, {'@': 73}, {'@': 74}, {'@': 75}, {'@': 76}, {'@': 77}, {'@': 78}, {'@': 79}, {'@': 80}, {'@': 81}, {'@': 82}, {'@': 83}, {'@': 84}, {'@': 85}, {'@': 86}, {'@': 87}, {'@': 88}, {'@': 89}, {'@': 90}, {'@': 91}, {'@': 92}, {'@': 93}, {'@': 94}, {'@': 95}, {'@': 96}, {'@': 97}, {'@': 98}, {'@': 99}, {'@': 100}, {'@': 101}, {'@': 102}, {'@': 103}, {'@': 104}, {'@': 105}, {'@': 106}, {'@': 107}, {'@': 108}, {'@': 109}, {'@': 110}, {'@': 111}, {'@': 112}, {'@': 113}, {'@': 114}, {'@': 115}, {'@': 116}, {'@': 117}, {'@': 118}, {'@': 119}, {'@': 120}, {'@': 121}, {'@': 122}], 'start': ['start'], 'parser_type': 'lalr', '__type__': 'ParserConf'}, 'parser': {'tokens': {0: 'true_false', 1: 'or', 2: 'and', 3: 'string', 4: 'mult', 5: 'func_call', 6: 'not', 7: 'compare', 8: 'add', 9: 'НЕТ', 10: 'expr', 11: 'ident', 12: '__ANON_1', 13: 'NUMBER', 14: 'group', 15: 'НЕ', 16: 'CNAME', 17: 'num', 18: 'ДА', 19: 'character', 20: '__ANON_0', 21: 'LPAR', 22: 'АЛГ', 23: 'ЦЕЛ', 24: 'SLASH', 25: 'ИЛИ', 26: 'ВЕЩ', 27: 'НЦ', 28: 'PLUS', 29: 'ЛИТ', 30: 'STAR', 31: 'КЦ', 32: 'LESSTHAN', 33: 'EQUAL', 34: '__ANON_2', 35: 'ЛОГ', 36: '__ANON_3', 37: 'MINUS', 38: 'MORETHAN', 39: 'ЕСЛИ', 40: 'ВВОД', 41: 'И', 42: 'СИМ', 43: 'ВЫВОД', 44: 'COMMA', 45: 'ТО', 46: 'ДО', 47: 'ВСЕ', 48: 'КЦ_ПРИ', 49: 'КОН', 50: 'ИНАЧЕ', 51: 'RPAR', 52: '$END', 53: 'var_decl', 54: 'if', 55: 'assign', 56: '__stmt_list_star_1', 57: 'start', 58: 'for', 59: 'func_decl', 60: 'do_while', 61: 'stmt', 62: 'while', 63: 'stmt_list', 64: '__ANON_4', 65: 'ОТ', 66: 'НАЧ', 67: '__func_call_star_0', 68: 'ДЛЯ', 69: 'ПОКА', 70: 'res', 71: 'РЕЗ', 72: 'АРГ', 73: 'params'}, 'states': {0: {0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 10: (0, 82), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 1: {22: (1, {'@': 58}), 23: (1, {'@': 58}), 24: (1, {'@': 58}), 16: (1, {'@': 58}), 25: (1, {'@': 58}), 12: (1, {'@': 58}), 26: (1, {'@': 58}), 27: (1, {'@': 58}), 28: (1, {'@': 58}), 18: (1, {'@': 58}), 29: (1, {'@': 58}), 30: (1, {'@': 58}), 20: (1, {'@': 58}), 21: (1, {'@': 58}), 31: (1, {'@': 58}), 32: (1, {'@': 58}), 33: (1, {'@': 58}), 34: (1, {'@': 58}), 35: (1, {'@': 58}), 36: (1, {'@': 58}), 9: (1, {'@': 58}), 37: (1, {'@': 58}), 38: (1, {'@': 58}), 39: (1, {'@': 58}), 13: (1, {'@': 58}), 40: (1, {'@': 58}), 41: (1, {'@': 58}), 42: (1, {'@': 58}), 43: (1, {'@': 58}), 15: (1, {'@': 58}), 44: (1, {'@': 58}), 45: (1, {'@': 58}), 46: (1, {'@': 58}), 47: (1, {'@': 58}), 48: (1, {'@': 58}), 49: (1, {'@': 58}), 50: (1, {'@': 58}), 51: (1, {'@': 58}), 52: (1, {'@': 58})}, 2: {22: (1, {'@': 103}), 23: (1, {'@': 103}), 16: (1, {'@': 103}), 12: (1, {'@': 103}), 26: (1, {'@': 103}), 27: (1, {'@': 103}), 18: (1, {'@': 103}), 29: (1, {'@': 103}), 20: (1, {'@': 103}), 21: (1, {'@': 103}), 35: (1, {'@': 103}), 9: (1, {'@': 103}), 39: (1, {'@': 103}), 13: (1, {'@': 103}), 40: (1, {'@': 103}), 52: (1, {'@': 103}), 42: (1, {'@': 103}), 43: (1, {'@': 103}), 15: (1, {'@': 103}), 49: (1, {'@': 103}), 47: (1, {'@': 103}), 31: (1, {'@': 103}), 48: (1, {'@': 103}), 50: (1, {'@': 103})}, 3: {0: (0, 67), 3: (0, 1), 4: (0, 51), 5: (0, 8), 8: (0, 27), 9: (0, 47), 7: (0, 118), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 4: {44: (1, {'@': 119}), 51: (1, {'@': 119}), 16: (1, {'@': 119}), 18: (1, {'@': 119}), 26: (1, {'@': 119}), 27: (1, {'@': 119}), 20: (1, {'@': 119}), 21: (1, {'@': 119}), 31: (1, {'@': 119}), 9: (1, {'@': 119}), 47: (1, {'@': 119}), 48: (1, {'@': 119}), 49: (1, {'@': 119}), 50: (1, {'@': 119}), 15: (1, {'@': 119}), 22: (1, {'@': 119}), 23: (1, {'@': 119}), 12: (1, {'@': 119}), 29: (1, {'@': 119}), 35: (1, {'@': 119}), 39: (1, {'@': 119}), 13: (1, {'@': 119}), 40: (1, {'@': 119}), 52: (1, {'@': 119}), 42: (1, {'@': 119}), 43: (1, {'@': 119})}, 5: {0: (0, 67), 3: (0, 1), 4: (0, 51), 5: (0, 8), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 6: (0, 128), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 6: {22: (1, {'@': 121}), 23: (1, {'@': 121}), 16: (1, {'@': 121}), 12: (1, {'@': 121}), 26: (1, {'@': 121}), 27: (1, {'@': 121}), 18: (1, {'@': 121}), 29: (1, {'@': 121}), 20: (1, {'@': 121}), 21: (1, {'@': 121}), 35: (1, {'@': 121}), 9: (1, {'@': 121}), 39: (1, {'@': 121}), 13: (1, {'@': 121}), 40: (1, {'@': 121}), 52: (1, {'@': 121}), 42: (1, {'@': 121}), 43: (1, {'@': 121}), 15: (1, {'@': 121}), 49: (1, {'@': 121}), 47: (1, {'@': 121}), 48: (1, {'@': 121}), 31: (1, {'@': 121}), 50: (1, {'@': 121})}, 7: {51: (0, 62)}, 8: {22: (1, {'@': 57}), 23: (1, {'@': 57}), 24: (1, {'@': 57}), 16: (1, {'@': 57}), 25: (1, {'@': 57}), 12: (1, {'@': 57}), 26: (1, {'@': 57}), 27: (1, {'@': 57}), 28: (1, {'@': 57}), 18: (1, {'@': 57}), 29: (1, {'@': 57}), 30: (1, {'@': 57}), 20: (1, {'@': 57}), 21: (1, {'@': 57}), 31: (1, {'@': 57}), 32: (1, {'@': 57}), 33: (1, {'@': 57}), 34: (1, {'@': 57}), 35: (1, {'@': 57}), 36: (1, {'@': 57}), 9: (1, {'@': 57}), 37: (1, {'@': 57}), 38: (1, {'@': 57}), 39: (1, {'@': 57}), 13: (1, {'@': 57}), 40: (1, {'@': 57}), 41: (1, {'@': 57}), 42: (1, {'@': 57}), 43: (1, {'@': 57}), 15: (1, {'@': 57}), 44: (1, {'@': 57}), 45: (1, {'@': 57}), 46: (1, {'@': 57}), 47: (1, {'@': 57}), 48: (1, {'@': 57}), 49: (1, {'@': 57}), 50: (1, {'@': 57}), 51: (1, {'@': 57}), 52: (1, {'@': 57})}, 9: {22: (1, {'@': 108}), 23: (1, {'@': 108}), 16: (1, {'@': 108}), 12: (1, {'@': 108}), 26: (1, {'@': 108}), 27: (1, {'@': 108}), 18: (1, {'@': 108}), 29: (1, {'@': 108}), 20: (1, {'@': 108}), 21: (1, {'@': 108}), 35: (1, {'@': 108}), 9: (1, {'@': 108}), 39: (1, {'@': 108}), 13: (1, {'@': 108}), 40: (1, {'@': 108}), 52: (1, {'@': 108}), 42: (1, {'@': 108}), 43: (1, {'@': 108}), 15: (1, {'@': 108}), 49: (1, {'@': 108}), 47: (1, {'@': 108}), 31: (1, {'@': 108}), 48: (1, {'@': 108}), 50: (1, {'@': 108})}, 10: {10: (0, 109), 0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 11: {22: (1, {'@': 60}), 23: (1, {'@': 60}), 24: (1, {'@': 60}), 16: (1, {'@': 60}), 25: (1, {'@': 60}), 12: (1, {'@': 60}), 26: (1, {'@': 60}), 27: (1, {'@': 60}), 28: (1, {'@': 60}), 18: (1, {'@': 60}), 29: (1, {'@': 60}), 30: (1, {'@': 60}), 20: (1, {'@': 60}), 21: (1, {'@': 60}), 31: (1, {'@': 60}), 32: (1, {'@': 60}), 33: (1, {'@': 60}), 34: (1, {'@': 60}), 35: (1, {'@': 60}), 36: (1, {'@': 60}), 9: (1, {'@': 60}), 37: (1, {'@': 60}), 38: (1, {'@': 60}), 39: (1, {'@': 60}), 13: (1, {'@': 60}), 40: (1, {'@': 60}), 41: (1, {'@': 60}), 42: (1, {'@': 60}), 43: (1, {'@': 60}), 15: (1, {'@': 60}), 44: (1, {'@': 60}), 45: (1, {'@': 60}), 46: (1, {'@': 60}), 47: (1, {'@': 60}), 48: (1, {'@': 60}), 49: (1, {'@': 60}), 50: (1, {'@': 60}), 51: (1, {'@': 60}), 52: (1, {'@': 60})}, 12: {22: (1, {'@': 94}), 23: (1, {'@': 94}), 16: (1, {'@': 94}), 12: (1, {'@': 94}), 26: (1, {'@': 94}), 27: (1, {'@': 94}), 18: (1, {'@': 94}), 29: (1, {'@': 94}), 20: (1, {'@': 94}), 21: (1, {'@': 94}), 35: (1, {'@': 94}), 9: (1, {'@': 94}), 39: (1, {'@': 94}), 13: (1, {'@': 94}), 40: (1, {'@': 94}), 52: (1, {'@': 94}), 42: (1, {'@': 94}), 43: (1, {'@': 94}), 15: (1, {'@': 94}), 49: (1, {'@': 94}), 47: (1, {'@': 94}), 31: (1, {'@': 94}), 48: (1, {'@': 94}), 50: (1, {'@': 94})}, 13: {52: (1, {'@': 118})}, 14: {22: (1, {'@': 51}), 23: (1, {'@': 51}), 24: (1, {'@': 51}), 16: (1, {'@': 51}), 25: (1, {'@': 51}), 12: (1, {'@': 51}), 26: (1, {'@': 51}), 27: (1, {'@': 51}), 28: (1, {'@': 51}), 18: (1, {'@': 51}), 29: (1, {'@': 51}), 30: (1, {'@': 51}), 20: (1, {'@': 51}), 21: (1, {'@': 51}), 31: (1, {'@': 51}), 32: (1, {'@': 51}), 33: (1, {'@': 51}), 34: (1, {'@': 51}), 35: (1, {'@': 51}), 36: (1, {'@': 51}), 9: (1, {'@': 51}), 37: (1, {'@': 51}), 38: (1, {'@': 51}), 39: (1, {'@': 51}), 13: (1, {'@': 51}), 40: (1, {'@': 51}), 41: (1, {'@': 51}), 42: (1, {'@': 51}), 43: (1, {'@': 51}), 15: (1, {'@': 51}), 44: (1, {'@': 51}), 45: (1, {'@': 51}), 46: (1, {'@': 51}), 47: (1, {'@': 51}), 48: (1, {'@': 51}), 49: (1, {'@': 51}), 50: (1, {'@': 51}), 51: (1, {'@': 51}), 52: (1, {'@': 51})}, 15: {22: (1, {'@': 59}), 23: (1, {'@': 59}), 24: (1, {'@': 59}), 16: (1, {'@': 59}), 25: (1, {'@': 59}), 12: (1, {'@': 59}), 26: (1, {'@': 59}), 27: (1, {'@': 59}), 28: (1, {'@': 59}), 18: (1, {'@': 59}), 29: (1, {'@': 59}), 30: (1, {'@': 59}), 20: (1, {'@': 59}), 21: (1, {'@': 59}), 31: (1, {'@': 59}), 32: (1, {'@': 59}), 33: (1, {'@': 59}), 34: (1, {'@': 59}), 35: (1, {'@': 59}), 36: (1, {'@': 59}), 9: (1, {'@': 59}), 37: (1, {'@': 59}), 38: (1, {'@': 59}), 39: (1, {'@': 59}), 13: (1, {'@': 59}), 40: (1, {'@': 59}), 41: (1, {'@': 59}), 42: (1, {'@': 59}), 43: (1, {'@': 59}), 15: (1, {'@': 59}), 44: (1, {'@': 59}), 45: (1, {'@': 59}), 46: (1, {'@': 59}), 47: (1, {'@': 59}), 48: (1, {'@': 59}), 49: (1, {'@': 59}), 50: (1, {'@': 59}), 51: (1, {'@': 59}), 52: (1, {'@': 59})}, 16: {22: (1, {'@': 112}), 23: (1, {'@': 112}), 16: (1, {'@': 112}), 12: (1, {'@': 112}), 26: (1, {'@': 112}), 27: (1, {'@': 112}), 18: (1, {'@': 112}), 29: (1, {'@': 112}), 20: (1, {'@': 112}), 21: (1, {'@': 112}), 35: (1, {'@': 112}), 9: (1, {'@': 112}), 39: (1, {'@': 112}), 13: (1, {'@': 112}), 40: (1, {'@': 112}), 52: (1, {'@': 112}), 42: (1, {'@': 112}), 43: (1, {'@': 112}), 15: (1, {'@': 112}), 49: (1, {'@': 112}), 47: (1, {'@': 112}), 31: (1, {'@': 112}), 48: (1, {'@': 112}), 50: (1, {'@': 112})}, 17: {0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 10: (0, 75), 21: (0, 54)}, 18: {22: (1, {'@': 80}), 23: (1, {'@': 80}), 24: (1, {'@': 80}), 16: (1, {'@': 80}), 25: (1, {'@': 80}), 12: (1, {'@': 80}), 26: (1, {'@': 80}), 27: (1, {'@': 80}), 28: (1, {'@': 80}), 18: (1, {'@': 80}), 29: (1, {'@': 80}), 30: (1, {'@': 80}), 20: (1, {'@': 80}), 21: (1, {'@': 80}), 31: (1, {'@': 80}), 32: (1, {'@': 80}), 33: (1, {'@': 80}), 34: (1, {'@': 80}), 35: (1, {'@': 80}), 36: (1, {'@': 80}), 9: (1, {'@': 80}), 37: (1, {'@': 80}), 38: (1, {'@': 80}), 39: (1, {'@': 80}), 13: (1, {'@': 80}), 40: (1, {'@': 80}), 41: (1, {'@': 80}), 42: (1, {'@': 80}), 43: (1, {'@': 80}), 15: (1, {'@': 80}), 44: (1, {'@': 80}), 45: (1, {'@': 80}), 46: (1, {'@': 80}), 47: (1, {'@': 80}), 48: (1, {'@': 80}), 49: (1, {'@': 80}), 50: (1, {'@': 80}), 51: (1, {'@': 80}), 52: (1, {'@': 80})}, 19: {35: (0, 139), 23: (0, 99), 29: (0, 64), 42: (0, 87), 26: (0, 137), 53: (0, 108)}, 20: {49: (0, 55)}, 21: {22: (1, {'@': 110}), 23: (1, {'@': 110}), 16: (1, {'@': 110}), 12: (1, {'@': 110}), 26: (1, {'@': 110}), 27: (1, {'@': 110}), 18: (1, {'@': 110}), 29: (1, {'@': 110}), 20: (1, {'@': 110}), 21: (1, {'@': 110}), 35: (1, {'@': 110}), 9: (1, {'@': 110}), 39: (1, {'@': 110}), 13: (1, {'@': 110}), 40: (1, {'@': 110}), 52: (1, {'@': 110}), 42: (1, {'@': 110}), 43: (1, {'@': 110}), 15: (1, {'@': 110}), 49: (1, {'@': 110}), 47: (1, {'@': 110}), 31: (1, {'@': 110}), 48: (1, {'@': 110}), 50: (1, {'@': 110})}, 22: {44: (1, {'@': 99}), 51: (1, {'@': 99})}, 23: {22: (1, {'@': 111}), 23: (1, {'@': 111}), 16: (1, {'@': 111}), 12: (1, {'@': 111}), 26: (1, {'@': 111}), 27: (1, {'@': 111}), 18: (1, {'@': 111}), 29: (1, {'@': 111}), 20: (1, {'@': 111}), 21: (1, {'@': 111}), 35: (1, {'@': 111}), 9: (1, {'@': 111}), 39: (1, {'@': 111}), 13: (1, {'@': 111}), 40: (1, {'@': 111}), 52: (1, {'@': 111}), 42: (1, {'@': 111}), 43: (1, {'@': 111}), 15: (1, {'@': 111}), 49: (1, {'@': 111}), 47: (1, {'@': 111}), 31: (1, {'@': 111}), 48: (1, {'@': 111}), 50: (1, {'@': 111})}, 24: {37: (0, 115), 28: (0, 143), 22: (1, {'@': 68}), 23: (1, {'@': 68}), 16: (1, {'@': 68}), 25: (1, {'@': 68}), 12: (1, {'@': 68}), 26: (1, {'@': 68}), 27: (1, {'@': 68}), 18: (1, {'@': 68}), 29: (1, {'@': 68}), 20: (1, {'@': 68}), 21: (1, {'@': 68}), 31: (1, {'@': 68}), 35: (1, {'@': 68}), 9: (1, {'@': 68}), 39: (1, {'@': 68}), 13: (1, {'@': 68}), 40: (1, {'@': 68}), 41: (1, {'@': 68}), 42: (1, {'@': 68}), 43: (1, {'@': 68}), 15: (1, {'@': 68}), 44: (1, {'@': 68}), 45: (1, {'@': 68}), 46: (1, {'@': 68}), 47: (1, {'@': 68}), 48: (1, {'@': 68}), 50: (1, {'@': 68}), 49: (1, {'@': 68}), 51: (1, {'@': 68}), 52: (1, {'@': 68})}, 25: {}, 26: {22: (1, {'@': 97}), 23: (1, {'@': 97}), 16: (1, {'@': 97}), 12: (1, {'@': 97}), 26: (1, {'@': 97}), 27: (1, {'@': 97}), 18: (1, {'@': 97}), 29: (1, {'@': 97}), 20: (1, {'@': 97}), 21: (1, {'@': 97}), 35: (1, {'@': 97}), 9: (1, {'@': 97}), 39: (1, {'@': 97}), 13: (1, {'@': 97}), 40: (1, {'@': 97}), 52: (1, {'@': 97}), 42: (1, {'@': 97}), 43: (1, {'@': 97}), 15: (1, {'@': 97}), 49: (1, {'@': 97}), 47: (1, {'@': 97}), 31: (1, {'@': 97}), 48: (1, {'@': 97}), 50: (1, {'@': 97})}, 27: {36: (0, 56), 28: (0, 143), 33: (0, 107), 32: (0, 135), 38: (0, 120), 37: (0, 115), 34: (0, 65), 22: (1, {'@': 66}), 23: (1, {'@': 66}), 16: (1, {'@': 66}), 25: (1, {'@': 66}), 12: (1, {'@': 66}), 26: (1, {'@': 66}), 27: (1, {'@': 66}), 18: (1, {'@': 66}), 29: (1, {'@': 66}), 20: (1, {'@': 66}), 21: (1, {'@': 66}), 31: (1, {'@': 66}), 35: (1, {'@': 66}), 9: (1, {'@': 66}), 39: (1, {'@': 66}), 13: (1, {'@': 66}), 40: (1, {'@': 66}), 41: (1, {'@': 66}), 42: (1, {'@': 66}), 43: (1, {'@': 66}), 15: (1, {'@': 66}), 44: (1, {'@': 66}), 45: (1, {'@': 66}), 46: (1, {'@': 66}), 47: (1, {'@': 66}), 48: (1, {'@': 66}), 50: (1, {'@': 66}), 49: (1, {'@': 66}), 51: (1, {'@': 66}), 52: (1, {'@': 66})}, 28: {51: (1, {'@': 87}), 22: (1, {'@': 87}), 23: (1, {'@': 87}), 16: (1, {'@': 87}), 12: (1, {'@': 87}), 26: (1, {'@': 87}), 27: (1, {'@': 87}), 18: (1, {'@': 87}), 29: (1, {'@': 87}), 20: (1, {'@': 87}), 21: (1, {'@': 87}), 35: (1, {'@': 87}), 9: (1, {'@': 87}), 39: (1, {'@': 87}), 13: (1, {'@': 87}), 40: (1, {'@': 87}), 52: (1, {'@': 87}), 42: (1, {'@': 87}), 43: (1, {'@': 87}), 15: (1, {'@': 87}), 49: (1, {'@': 87}), 47: (1, {'@': 87}), 44: (1, {'@': 87}), 31: (1, {'@': 87}), 48: (1, {'@': 87}), 50: (1, {'@': 87})}, 29: {22: (1, {'@': 78}), 23: (1, {'@': 78}), 24: (1, {'@': 78}), 16: (1, {'@': 78}), 25: (1, {'@': 78}), 12: (1, {'@': 78}), 26: (1, {'@': 78}), 27: (1, {'@': 78}), 28: (1, {'@': 78}), 18: (1, {'@': 78}), 29: (1, {'@': 78}), 30: (1, {'@': 78}), 20: (1, {'@': 78}), 21: (1, {'@': 78}), 31: (1, {'@': 78}), 32: (1, {'@': 78}), 33: (1, {'@': 78}), 34: (1, {'@': 78}), 35: (1, {'@': 78}), 36: (1, {'@': 78}), 9: (1, {'@': 78}), 37: (1, {'@': 78}), 38: (1, {'@': 78}), 39: (1, {'@': 78}), 13: (1, {'@': 78}), 40: (1, {'@': 78}), 41: (1, {'@': 78}), 42: (1, {'@': 78}), 43: (1, {'@': 78}), 15: (1, {'@': 78}), 44: (1, {'@': 78}), 45: (1, {'@': 78}), 46: (1, {'@': 78}), 47: (1, {'@': 78}), 48: (1, {'@': 78}), 49: (1, {'@': 78}), 50: (1, {'@': 78}), 51: (1, {'@': 78}), 52: (1, {'@': 78})}, 30: {49: (0, 2)}, 31: {0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 10: (0, 132), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 32: {22: (1, {'@': 115}), 23: (1, {'@': 115}), 16: (1, {'@': 115}), 12: (1, {'@': 115}), 26: (1, {'@': 115}), 27: (1, {'@': 115}), 18: (1, {'@': 115}), 29: (1, {'@': 115}), 20: (1, {'@': 115}), 21: (1, {'@': 115}), 35: (1, {'@': 115}), 9: (1, {'@': 115}), 39: (1, {'@': 115}), 13: (1, {'@': 115}), 40: (1, {'@': 115}), 52: (1, {'@': 115}), 42: (1, {'@': 115}), 43: (1, {'@': 115}), 15: (1, {'@': 115}), 49: (1, {'@': 115}), 47: (1, {'@': 115}), 31: (1, {'@': 115}), 48: (1, {'@': 115}), 50: (1, {'@': 115})}, 33: {22: (1, {'@': 113}), 23: (1, {'@': 113}), 16: (1, {'@': 113}), 12: (1, {'@': 113}), 26: (1, {'@': 113}), 27: (1, {'@': 113}), 18: (1, {'@': 113}), 29: (1, {'@': 113}), 20: (1, {'@': 113}), 21: (1, {'@': 113}), 35: (1, {'@': 113}), 9: (1, {'@': 113}), 39: (1, {'@': 113}), 13: (1, {'@': 113}), 40: (1, {'@': 113}), 52: (1, {'@': 113}), 42: (1, {'@': 113}), 43: (1, {'@': 113}), 15: (1, {'@': 113}), 49: (1, {'@': 113}), 47: (1, {'@': 113}), 31: (1, {'@': 113}), 48: (1, {'@': 113}), 50: (1, {'@': 113})}, 34: {49: (0, 106)}, 35: {31: (0, 26)}, 36: {22: (1, {'@': 114}), 23: (1, {'@': 114}), 16: (1, {'@': 114}), 12: (1, {'@': 114}), 26: (1, {'@': 114}), 27: (1, {'@': 114}), 18: (1, {'@': 114}), 29: (1, {'@': 114}), 20: (1, {'@': 114}), 21: (1, {'@': 114}), 35: (1, {'@': 114}), 9: (1, {'@': 114}), 39: (1, {'@': 114}), 13: (1, {'@': 114}), 40: (1, {'@': 114}), 52: (1, {'@': 114}), 42: (1, {'@': 114}), 43: (1, {'@': 114}), 15: (1, {'@': 114}), 49: (1, {'@': 114}), 47: (1, {'@': 114}), 31: (1, {'@': 114}), 48: (1, {'@': 114}), 50: (1, {'@': 114})}, 37: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 57: (0, 25), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 63: (0, 13), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 52: (1, {'@': 117})}, 38: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 63: (0, 20), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 49: (1, {'@': 117})}, 39: {16: (0, 41), 11: (0, 116)}, 40: {22: (1, {'@': 50}), 23: (1, {'@': 50}), 24: (1, {'@': 50}), 16: (1, {'@': 50}), 25: (1, {'@': 50}), 12: (1, {'@': 50}), 26: (1, {'@': 50}), 27: (1, {'@': 50}), 28: (1, {'@': 50}), 18: (1, {'@': 50}), 29: (1, {'@': 50}), 30: (1, {'@': 50}), 20: (1, {'@': 50}), 21: (1, {'@': 50}), 31: (1, {'@': 50}), 32: (1, {'@': 50}), 33: (1, {'@': 50}), 34: (1, {'@': 50}), 35: (1, {'@': 50}), 36: (1, {'@': 50}), 9: (1, {'@': 50}), 37: (1, {'@': 50}), 38: (1, {'@': 50}), 39: (1, {'@': 50}), 13: (1, {'@': 50}), 40: (1, {'@': 50}), 41: (1, {'@': 50}), 42: (1, {'@': 50}), 43: (1, {'@': 50}), 15: (1, {'@': 50}), 44: (1, {'@': 50}), 45: (1, {'@': 50}), 46: (1, {'@': 50}), 47: (1, {'@': 50}), 48: (1, {'@': 50}), 49: (1, {'@': 50}), 50: (1, {'@': 50}), 51: (1, {'@': 50}), 52: (1, {'@': 50})}, 41: {22: (1, {'@': 48}), 23: (1, {'@': 48}), 24: (1, {'@': 48}), 16: (1, {'@': 48}), 25: (1, {'@': 48}), 12: (1, {'@': 48}), 26: (1, {'@': 48}), 27: (1, {'@': 48}), 28: (1, {'@': 48}), 18: (1, {'@': 48}), 29: (1, {'@': 48}), 30: (1, {'@': 48}), 21: (1, {'@': 48}), 20: (1, {'@': 48}), 31: (1, {'@': 48}), 32: (1, {'@': 48}), 33: (1, {'@': 48}), 34: (1, {'@': 48}), 35: (1, {'@': 48}), 36: (1, {'@': 48}), 9: (1, {'@': 48}), 37: (1, {'@': 48}), 38: (1, {'@': 48}), 39: (1, {'@': 48}), 13: (1, {'@': 48}), 40: (1, {'@': 48}), 41: (1, {'@': 48}), 42: (1, {'@': 48}), 43: (1, {'@': 48}), 15: (1, {'@': 48}), 44: (1, {'@': 48}), 45: (1, {'@': 48}), 46: (1, {'@': 48}), 47: (1, {'@': 48}), 48: (1, {'@': 48}), 49: (1, {'@': 48}), 51: (1, {'@': 48}), 52: (1, {'@': 48}), 50: (1, {'@': 48}), 64: (1, {'@': 48}), 65: (1, {'@': 48})}, 42: {22: (1, {'@': 73}), 23: (1, {'@': 73}), 16: (1, {'@': 73}), 25: (1, {'@': 73}), 12: (1, {'@': 73}), 26: (1, {'@': 73}), 27: (1, {'@': 73}), 18: (1, {'@': 73}), 29: (1, {'@': 73}), 20: (1, {'@': 73}), 21: (1, {'@': 73}), 31: (1, {'@': 73}), 35: (1, {'@': 73}), 9: (1, {'@': 73}), 39: (1, {'@': 73}), 13: (1, {'@': 73}), 40: (1, {'@': 73}), 41: (1, {'@': 73}), 42: (1, {'@': 73}), 43: (1, {'@': 73}), 15: (1, {'@': 73}), 44: (1, {'@': 73}), 45: (1, {'@': 73}), 46: (1, {'@': 73}), 47: (1, {'@': 73}), 48: (1, {'@': 73}), 49: (1, {'@': 73}), 50: (1, {'@': 73}), 51: (1, {'@': 73}), 52: (1, {'@': 73})}, 43: {22: (1, {'@': 74}), 23: (1, {'@': 74}), 16: (1, {'@': 74}), 25: (1, {'@': 74}), 12: (1, {'@': 74}), 26: (1, {'@': 74}), 27: (1, {'@': 74}), 18: (1, {'@': 74}), 29: (1, {'@': 74}), 20: (1, {'@': 74}), 21: (1, {'@': 74}), 31: (1, {'@': 74}), 35: (1, {'@': 74}), 9: (1, {'@': 74}), 39: (1, {'@': 74}), 13: (1, {'@': 74}), 40: (1, {'@': 74}), 41: (1, {'@': 74}), 42: (1, {'@': 74}), 43: (1, {'@': 74}), 15: (1, {'@': 74}), 45: (1, {'@': 74}), 47: (1, {'@': 74}), 48: (1, {'@': 74}), 52: (1, {'@': 74}), 49: (1, {'@': 74}), 50: (1, {'@': 74}), 44: (1, {'@': 74}), 51: (1, {'@': 74}), 46: (1, {'@': 74})}, 44: {22: (1, {'@': 47}), 23: (1, {'@': 47}), 24: (1, {'@': 47}), 16: (1, {'@': 47}), 25: (1, {'@': 47}), 12: (1, {'@': 47}), 26: (1, {'@': 47}), 27: (1, {'@': 47}), 28: (1, {'@': 47}), 18: (1, {'@': 47}), 29: (1, {'@': 47}), 30: (1, {'@': 47}), 20: (1, {'@': 47}), 21: (1, {'@': 47}), 31: (1, {'@': 47}), 32: (1, {'@': 47}), 33: (1, {'@': 47}), 34: (1, {'@': 47}), 35: (1, {'@': 47}), 36: (1, {'@': 47}), 9: (1, {'@': 47}), 37: (1, {'@': 47}), 38: (1, {'@': 47}), 39: (1, {'@': 47}), 13: (1, {'@': 47}), 40: (1, {'@': 47}), 41: (1, {'@': 47}), 42: (1, {'@': 47}), 43: (1, {'@': 47}), 15: (1, {'@': 47}), 44: (1, {'@': 47}), 45: (1, {'@': 47}), 46: (1, {'@': 47}), 47: (1, {'@': 47}), 48: (1, {'@': 47}), 49: (1, {'@': 47}), 50: (1, {'@': 47}), 51: (1, {'@': 47}), 52: (1, {'@': 47})}, 45: {22: (1, {'@': 53}), 23: (1, {'@': 53}), 24: (1, {'@': 53}), 16: (1, {'@': 53}), 25: (1, {'@': 53}), 12: (1, {'@': 53}), 26: (1, {'@': 53}), 27: (1, {'@': 53}), 28: (1, {'@': 53}), 18: (1, {'@': 53}), 29: (1, {'@': 53}), 30: (1, {'@': 53}), 20: (1, {'@': 53}), 21: (1, {'@': 53}), 31: (1, {'@': 53}), 32: (1, {'@': 53}), 33: (1, {'@': 53}), 34: (1, {'@': 53}), 35: (1, {'@': 53}), 36: (1, {'@': 53}), 9: (1, {'@': 53}), 37: (1, {'@': 53}), 38: (1, {'@': 53}), 39: (1, {'@': 53}), 13: (1, {'@': 53}), 40: (1, {'@': 53}), 41: (1, {'@': 53}), 42: (1, {'@': 53}), 43: (1, {'@': 53}), 15: (1, {'@': 53}), 44: (1, {'@': 53}), 45: (1, {'@': 53}), 46: (1, {'@': 53}), 47: (1, {'@': 53}), 48: (1, {'@': 53}), 49: (1, {'@': 53}), 50: (1, {'@': 53}), 51: (1, {'@': 53}), 52: (1, {'@': 53})}, 46: {22: (1, {'@': 49}), 23: (1, {'@': 49}), 24: (1, {'@': 49}), 16: (1, {'@': 49}), 25: (1, {'@': 49}), 12: (1, {'@': 49}), 26: (1, {'@': 49}), 27: (1, {'@': 49}), 28: (1, {'@': 49}), 18: (1, {'@': 49}), 29: (1, {'@': 49}), 30: (1, {'@': 49}), 20: (1, {'@': 49}), 21: (1, {'@': 49}), 31: (1, {'@': 49}), 32: (1, {'@': 49}), 33: (1, {'@': 49}), 34: (1, {'@': 49}), 35: (1, {'@': 49}), 36: (1, {'@': 49}), 9: (1, {'@': 49}), 37: (1, {'@': 49}), 38: (1, {'@': 49}), 39: (1, {'@': 49}), 13: (1, {'@': 49}), 40: (1, {'@': 49}), 41: (1, {'@': 49}), 42: (1, {'@': 49}), 43: (1, {'@': 49}), 15: (1, {'@': 49}), 44: (1, {'@': 49}), 45: (1, {'@': 49}), 46: (1, {'@': 49}), 47: (1, {'@': 49}), 48: (1, {'@': 49}), 49: (1, {'@': 49}), 50: (1, {'@': 49}), 51: (1, {'@': 49}), 52: (1, {'@': 49})}, 47: {22: (1, {'@': 52}), 23: (1, {'@': 52}), 24: (1, {'@': 52}), 16: (1, {'@': 52}), 25: (1, {'@': 52}), 12: (1, {'@': 52}), 26: (1, {'@': 52}), 27: (1, {'@': 52}), 28: (1, {'@': 52}), 18: (1, {'@': 52}), 29: (1, {'@': 52}), 30: (1, {'@': 52}), 20: (1, {'@': 52}), 21: (1, {'@': 52}), 31: (1, {'@': 52}), 32: (1, {'@': 52}), 33: (1, {'@': 52}), 34: (1, {'@': 52}), 35: (1, {'@': 52}), 36: (1, {'@': 52}), 9: (1, {'@': 52}), 37: (1, {'@': 52}), 38: (1, {'@': 52}), 39: (1, {'@': 52}), 13: (1, {'@': 52}), 40: (1, {'@': 52}), 41: (1, {'@': 52}), 42: (1, {'@': 52}), 43: (1, {'@': 52}), 15: (1, {'@': 52}), 44: (1, {'@': 52}), 45: (1, {'@': 52}), 46: (1, {'@': 52}), 47: (1, {'@': 52}), 48: (1, {'@': 52}), 49: (1, {'@': 52}), 50: (1, {'@': 52}), 51: (1, {'@': 52}), 52: (1, {'@': 52})}, 48: {11: (0, 100), 16: (0, 41)}, 49: {0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 10: (0, 68), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 50: {31: (0, 91)}, 51: {24: (0, 119), 30: (0, 93), 22: (1, {'@': 63}), 23: (1, {'@': 63}), 16: (1, {'@': 63}), 25: (1, {'@': 63}), 12: (1, {'@': 63}), 26: (1, {'@': 63}), 27: (1, {'@': 63}), 28: (1, {'@': 63}), 18: (1, {'@': 63}), 29: (1, {'@': 63}), 20: (1, {'@': 63}), 21: (1, {'@': 63}), 31: (1, {'@': 63}), 32: (1, {'@': 63}), 33: (1, {'@': 63}), 34: (1, {'@': 63}), 35: (1, {'@': 63}), 36: (1, {'@': 63}), 9: (1, {'@': 63}), 37: (1, {'@': 63}), 38: (1, {'@': 63}), 39: (1, {'@': 63}), 13: (1, {'@': 63}), 40: (1, {'@': 63}), 41: (1, {'@': 63}), 42: (1, {'@': 63}), 43: (1, {'@': 63}), 15: (1, {'@': 63}), 44: (1, {'@': 63}), 45: (1, {'@': 63}), 46: (1, {'@': 63}), 47: (1, {'@': 63}), 48: (1, {'@': 63}), 49: (1, {'@': 63}), 51: (1, {'@': 63}), 52: (1, {'@': 63}), 50: (1, {'@': 63})}, 52: {51: (1, {'@': 85}), 22: (1, {'@': 85}), 23: (1, {'@': 85}), 16: (1, {'@': 85}), 12: (1, {'@': 85}), 26: (1, {'@': 85}), 27: (1, {'@': 85}), 18: (1, {'@': 85}), 29: (1, {'@': 85}), 20: (1, {'@': 85}), 21: (1, {'@': 85}), 35: (1, {'@': 85}), 9: (1, {'@': 85}), 39: (1, {'@': 85}), 13: (1, {'@': 85}), 40: (1, {'@': 85}), 52: (1, {'@': 85}), 42: (1, {'@': 85}), 43: (1, {'@': 85}), 15: (1, {'@': 85}), 49: (1, {'@': 85}), 47: (1, {'@': 85}), 44: (1, {'@': 85}), 31: (1, {'@': 85}), 48: (1, {'@': 85}), 50: (1, {'@': 85})}, 53: {51: (0, 29), 44: (0, 61)}, 54: {0: (0, 67), 1: (0, 130), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 55: {22: (1, {'@': 101}), 23: (1, {'@': 101}), 16: (1, {'@': 101}), 12: (1, {'@': 101}), 26: (1, {'@': 101}), 27: (1, {'@': 101}), 18: (1, {'@': 101}), 29: (1, {'@': 101}), 20: (1, {'@': 101}), 21: (1, {'@': 101}), 35: (1, {'@': 101}), 9: (1, {'@': 101}), 39: (1, {'@': 101}), 13: (1, {'@': 101}), 40: (1, {'@': 101}), 52: (1, {'@': 101}), 42: (1, {'@': 101}), 43: (1, {'@': 101}), 15: (1, {'@': 101}), 49: (1, {'@': 101}), 47: (1, {'@': 101}), 31: (1, {'@': 101}), 48: (1, {'@': 101}), 50: (1, {'@': 101})}, 56: {0: (0, 67), 3: (0, 1), 4: (0, 51), 5: (0, 8), 9: (0, 47), 11: (0, 133), 12: (0, 40), 8: (0, 105), 13: (0, 44), 14: (0, 11), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 57: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 63: (0, 83), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 49: (1, {'@': 117})}, 58: {0: (0, 67), 2: (0, 76), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 8: (0, 27), 7: (0, 42), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 59: {21: (0, 129), 64: (0, 72), 22: (1, {'@': 54}), 23: (1, {'@': 54}), 24: (1, {'@': 54}), 16: (1, {'@': 54}), 25: (1, {'@': 54}), 12: (1, {'@': 54}), 26: (1, {'@': 54}), 27: (1, {'@': 54}), 28: (1, {'@': 54}), 18: (1, {'@': 54}), 29: (1, {'@': 54}), 30: (1, {'@': 54}), 20: (1, {'@': 54}), 32: (1, {'@': 54}), 33: (1, {'@': 54}), 34: (1, {'@': 54}), 35: (1, {'@': 54}), 36: (1, {'@': 54}), 9: (1, {'@': 54}), 37: (1, {'@': 54}), 38: (1, {'@': 54}), 39: (1, {'@': 54}), 13: (1, {'@': 54}), 40: (1, {'@': 54}), 52: (1, {'@': 54}), 41: (1, {'@': 54}), 42: (1, {'@': 54}), 43: (1, {'@': 54}), 15: (1, {'@': 54}), 49: (1, {'@': 54}), 47: (1, {'@': 54}), 31: (1, {'@': 54}), 48: (1, {'@': 54}), 50: (1, {'@': 54})}, 60: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 63: (0, 74), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 47: (1, {'@': 117})}, 61: {0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 10: (0, 111), 21: (0, 54)}, 62: {66: (0, 134)}, 63: {22: (1, {'@': 104}), 23: (1, {'@': 104}), 16: (1, {'@': 104}), 12: (1, {'@': 104}), 26: (1, {'@': 104}), 27: (1, {'@': 104}), 18: (1, {'@': 104}), 29: (1, {'@': 104}), 20: (1, {'@': 104}), 21: (1, {'@': 104}), 35: (1, {'@': 104}), 9: (1, {'@': 104}), 39: (1, {'@': 104}), 13: (1, {'@': 104}), 40: (1, {'@': 104}), 52: (1, {'@': 104}), 42: (1, {'@': 104}), 43: (1, {'@': 104}), 15: (1, {'@': 104}), 49: (1, {'@': 104}), 47: (1, {'@': 104}), 31: (1, {'@': 104}), 48: (1, {'@': 104}), 50: (1, {'@': 104})}, 64: {55: (0, 52), 16: (0, 41), 11: (0, 144)}, 65: {0: (0, 67), 3: (0, 1), 4: (0, 51), 8: (0, 24), 5: (0, 8), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 66: {67: (0, 53), 44: (0, 131), 51: (0, 94)}, 67: {22: (1, {'@': 56}), 23: (1, {'@': 56}), 24: (1, {'@': 56}), 16: (1, {'@': 56}), 25: (1, {'@': 56}), 12: (1, {'@': 56}), 26: (1, {'@': 56}), 27: (1, {'@': 56}), 28: (1, {'@': 56}), 18: (1, {'@': 56}), 29: (1, {'@': 56}), 30: (1, {'@': 56}), 20: (1, {'@': 56}), 21: (1, {'@': 56}), 31: (1, {'@': 56}), 32: (1, {'@': 56}), 33: (1, {'@': 56}), 34: (1, {'@': 56}), 35: (1, {'@': 56}), 36: (1, {'@': 56}), 9: (1, {'@': 56}), 37: (1, {'@': 56}), 38: (1, {'@': 56}), 39: (1, {'@': 56}), 13: (1, {'@': 56}), 40: (1, {'@': 56}), 41: (1, {'@': 56}), 42: (1, {'@': 56}), 43: (1, {'@': 56}), 15: (1, {'@': 56}), 44: (1, {'@': 56}), 45: (1, {'@': 56}), 46: (1, {'@': 56}), 47: (1, {'@': 56}), 48: (1, {'@': 56}), 49: (1, {'@': 56}), 50: (1, {'@': 56}), 51: (1, {'@': 56}), 52: (1, {'@': 56})}, 68: {67: (0, 136), 44: (0, 131), 22: (1, {'@': 107}), 23: (1, {'@': 107}), 16: (1, {'@': 107}), 12: (1, {'@': 107}), 26: (1, {'@': 107}), 27: (1, {'@': 107}), 18: (1, {'@': 107}), 29: (1, {'@': 107}), 20: (1, {'@': 107}), 21: (1, {'@': 107}), 35: (1, {'@': 107}), 9: (1, {'@': 107}), 39: (1, {'@': 107}), 13: (1, {'@': 107}), 40: (1, {'@': 107}), 52: (1, {'@': 107}), 42: (1, {'@': 107}), 43: (1, {'@': 107}), 15: (1, {'@': 107}), 49: (1, {'@': 107}), 47: (1, {'@': 107}), 31: (1, {'@': 107}), 48: (1, {'@': 107}), 50: (1, {'@': 107})}, 69: {44: (0, 125), 51: (0, 126)}, 70: {66: (0, 38)}, 71: {64: (0, 72), 51: (1, {'@': 90}), 22: (1, {'@': 90}), 23: (1, {'@': 90}), 16: (1, {'@': 90}), 12: (1, {'@': 90}), 26: (1, {'@': 90}), 27: (1, {'@': 90}), 18: (1, {'@': 90}), 29: (1, {'@': 90}), 20: (1, {'@': 90}), 21: (1, {'@': 90}), 35: (1, {'@': 90}), 9: (1, {'@': 90}), 39: (1, {'@': 90}), 13: (1, {'@': 90}), 40: (1, {'@': 90}), 52: (1, {'@': 90}), 42: (1, {'@': 90}), 43: (1, {'@': 90}), 15: (1, {'@': 90}), 49: (1, {'@': 90}), 47: (1, {'@': 90}), 44: (1, {'@': 90}), 31: (1, {'@': 90}), 48: (1, {'@': 90}), 50: (1, {'@': 90})}, 72: {0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54), 10: (0, 138)}, 73: {66: (0, 57)}, 74: {47: (0, 78)}, 75: {22: (1, {'@': 96}), 23: (1, {'@': 96}), 16: (1, {'@': 96}), 12: (1, {'@': 96}), 26: (1, {'@': 96}), 27: (1, {'@': 96}), 18: (1, {'@': 96}), 29: (1, {'@': 96}), 20: (1, {'@': 96}), 21: (1, {'@': 96}), 35: (1, {'@': 96}), 9: (1, {'@': 96}), 39: (1, {'@': 96}), 13: (1, {'@': 96}), 40: (1, {'@': 96}), 52: (1, {'@': 96}), 42: (1, {'@': 96}), 43: (1, {'@': 96}), 15: (1, {'@': 96}), 49: (1, {'@': 96}), 47: (1, {'@': 96}), 31: (1, {'@': 96}), 48: (1, {'@': 96}), 50: (1, {'@': 96})}, 76: {41: (0, 5), 22: (1, {'@': 77}), 23: (1, {'@': 77}), 16: (1, {'@': 77}), 25: (1, {'@': 77}), 12: (1, {'@': 77}), 26: (1, {'@': 77}), 27: (1, {'@': 77}), 18: (1, {'@': 77}), 29: (1, {'@': 77}), 20: (1, {'@': 77}), 21: (1, {'@': 77}), 31: (1, {'@': 77}), 35: (1, {'@': 77}), 9: (1, {'@': 77}), 39: (1, {'@': 77}), 13: (1, {'@': 77}), 40: (1, {'@': 77}), 42: (1, {'@': 77}), 43: (1, {'@': 77}), 15: (1, {'@': 77}), 45: (1, {'@': 77}), 47: (1, {'@': 77}), 48: (1, {'@': 77}), 52: (1, {'@': 77}), 49: (1, {'@': 77}), 50: (1, {'@': 77}), 44: (1, {'@': 77}), 51: (1, {'@': 77}), 46: (1, {'@': 77})}, 77: {35: (0, 139), 23: (0, 99), 29: (0, 64), 42: (0, 87), 26: (0, 137), 53: (0, 112)}, 78: {22: (1, {'@': 93}), 23: (1, {'@': 93}), 16: (1, {'@': 93}), 12: (1, {'@': 93}), 26: (1, {'@': 93}), 27: (1, {'@': 93}), 18: (1, {'@': 93}), 29: (1, {'@': 93}), 20: (1, {'@': 93}), 21: (1, {'@': 93}), 35: (1, {'@': 93}), 9: (1, {'@': 93}), 39: (1, {'@': 93}), 13: (1, {'@': 93}), 40: (1, {'@': 93}), 52: (1, {'@': 93}), 42: (1, {'@': 93}), 43: (1, {'@': 93}), 15: (1, {'@': 93}), 49: (1, {'@': 93}), 47: (1, {'@': 93}), 31: (1, {'@': 93}), 48: (1, {'@': 93}), 50: (1, {'@': 93})}, 79: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 59: (0, 36), 35: (0, 139), 60: (0, 16), 11: (0, 59), 12: (0, 40), 62: (0, 23), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 61: (0, 95), 52: (1, {'@': 116}), 49: (1, {'@': 116}), 47: (1, {'@': 116}), 48: (1, {'@': 116}), 31: (1, {'@': 116}), 50: (1, {'@': 116})}, 80: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 68: (0, 122), 62: (0, 23), 63: (0, 89), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 69: (0, 0), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 48: (1, {'@': 117})}, 81: {37: (0, 115), 28: (0, 143), 22: (1, {'@': 70}), 23: (1, {'@': 70}), 16: (1, {'@': 70}), 25: (1, {'@': 70}), 12: (1, {'@': 70}), 26: (1, {'@': 70}), 27: (1, {'@': 70}), 18: (1, {'@': 70}), 29: (1, {'@': 70}), 20: (1, {'@': 70}), 21: (1, {'@': 70}), 31: (1, {'@': 70}), 35: (1, {'@': 70}), 9: (1, {'@': 70}), 39: (1, {'@': 70}), 13: (1, {'@': 70}), 40: (1, {'@': 70}), 41: (1, {'@': 70}), 42: (1, {'@': 70}), 43: (1, {'@': 70}), 15: (1, {'@': 70}), 44: (1, {'@': 70}), 45: (1, {'@': 70}), 46: (1, {'@': 70}), 47: (1, {'@': 70}), 48: (1, {'@': 70}), 50: (1, {'@': 70}), 49: (1, {'@': 70}), 51: (1, {'@': 70}), 52: (1, {'@': 70})}, 82: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 63: (0, 50), 31: (1, {'@': 117})}, 83: {49: (0, 63)}, 84: {22: (1, {'@': 109}), 23: (1, {'@': 109}), 16: (1, {'@': 109}), 12: (1, {'@': 109}), 26: (1, {'@': 109}), 27: (1, {'@': 109}), 18: (1, {'@': 109}), 29: (1, {'@': 109}), 20: (1, {'@': 109}), 21: (1, {'@': 109}), 35: (1, {'@': 109}), 9: (1, {'@': 109}), 39: (1, {'@': 109}), 13: (1, {'@': 109}), 40: (1, {'@': 109}), 52: (1, {'@': 109}), 42: (1, {'@': 109}), 43: (1, {'@': 109}), 15: (1, {'@': 109}), 49: (1, {'@': 109}), 47: (1, {'@': 109}), 31: (1, {'@': 109}), 48: (1, {'@': 109}), 50: (1, {'@': 109})}, 85: {41: (0, 5), 22: (1, {'@': 76}), 23: (1, {'@': 76}), 16: (1, {'@': 76}), 25: (1, {'@': 76}), 12: (1, {'@': 76}), 26: (1, {'@': 76}), 27: (1, {'@': 76}), 18: (1, {'@': 76}), 29: (1, {'@': 76}), 20: (1, {'@': 76}), 21: (1, {'@': 76}), 31: (1, {'@': 76}), 35: (1, {'@': 76}), 9: (1, {'@': 76}), 39: (1, {'@': 76}), 13: (1, {'@': 76}), 40: (1, {'@': 76}), 42: (1, {'@': 76}), 43: (1, {'@': 76}), 15: (1, {'@': 76}), 45: (1, {'@': 76}), 47: (1, {'@': 76}), 48: (1, {'@': 76}), 52: (1, {'@': 76}), 49: (1, {'@': 76}), 50: (1, {'@': 76}), 44: (1, {'@': 76}), 51: (1, {'@': 76}), 46: (1, {'@': 76})}, 86: {51: (1, {'@': 89}), 22: (1, {'@': 89}), 23: (1, {'@': 89}), 16: (1, {'@': 89}), 12: (1, {'@': 89}), 26: (1, {'@': 89}), 27: (1, {'@': 89}), 18: (1, {'@': 89}), 29: (1, {'@': 89}), 20: (1, {'@': 89}), 21: (1, {'@': 89}), 35: (1, {'@': 89}), 9: (1, {'@': 89}), 39: (1, {'@': 89}), 13: (1, {'@': 89}), 40: (1, {'@': 89}), 52: (1, {'@': 89}), 42: (1, {'@': 89}), 43: (1, {'@': 89}), 15: (1, {'@': 89}), 49: (1, {'@': 89}), 47: (1, {'@': 89}), 44: (1, {'@': 89}), 31: (1, {'@': 89}), 48: (1, {'@': 89}), 50: (1, {'@': 89})}, 87: {55: (0, 88), 11: (0, 113), 16: (0, 41)}, 88: {51: (1, {'@': 83}), 22: (1, {'@': 83}), 23: (1, {'@': 83}), 16: (1, {'@': 83}), 12: (1, {'@': 83}), 26: (1, {'@': 83}), 27: (1, {'@': 83}), 18: (1, {'@': 83}), 29: (1, {'@': 83}), 20: (1, {'@': 83}), 21: (1, {'@': 83}), 35: (1, {'@': 83}), 9: (1, {'@': 83}), 39: (1, {'@': 83}), 13: (1, {'@': 83}), 40: (1, {'@': 83}), 52: (1, {'@': 83}), 42: (1, {'@': 83}), 43: (1, {'@': 83}), 15: (1, {'@': 83}), 49: (1, {'@': 83}), 47: (1, {'@': 83}), 44: (1, {'@': 83}), 31: (1, {'@': 83}), 48: (1, {'@': 83}), 50: (1, {'@': 83})}, 89: {48: (0, 17)}, 90: {51: (1, {'@': 91}), 22: (1, {'@': 91}), 23: (1, {'@': 91}), 16: (1, {'@': 91}), 12: (1, {'@': 91}), 26: (1, {'@': 91}), 27: (1, {'@': 91}), 18: (1, {'@': 91}), 29: (1, {'@': 91}), 20: (1, {'@': 91}), 21: (1, {'@': 91}), 35: (1, {'@': 91}), 9: (1, {'@': 91}), 39: (1, {'@': 91}), 13: (1, {'@': 91}), 40: (1, {'@': 91}), 52: (1, {'@': 91}), 42: (1, {'@': 91}), 43: (1, {'@': 91}), 15: (1, {'@': 91}), 49: (1, {'@': 91}), 47: (1, {'@': 91}), 44: (1, {'@': 91}), 31: (1, {'@': 91}), 48: (1, {'@': 91}), 50: (1, {'@': 91})}, 91: {22: (1, {'@': 95}), 23: (1, {'@': 95}), 16: (1, {'@': 95}), 12: (1, {'@': 95}), 26: (1, {'@': 95}), 27: (1, {'@': 95}), 18: (1, {'@': 95}), 29: (1, {'@': 95}), 20: (1, {'@': 95}), 21: (1, {'@': 95}), 35: (1, {'@': 95}), 9: (1, {'@': 95}), 39: (1, {'@': 95}), 13: (1, {'@': 95}), 40: (1, {'@': 95}), 52: (1, {'@': 95}), 42: (1, {'@': 95}), 43: (1, {'@': 95}), 15: (1, {'@': 95}), 49: (1, {'@': 95}), 47: (1, {'@': 95}), 31: (1, {'@': 95}), 48: (1, {'@': 95}), 50: (1, {'@': 95})}, 92: {64: (0, 72), 51: (1, {'@': 86}), 22: (1, {'@': 86}), 23: (1, {'@': 86}), 16: (1, {'@': 86}), 12: (1, {'@': 86}), 26: (1, {'@': 86}), 27: (1, {'@': 86}), 18: (1, {'@': 86}), 29: (1, {'@': 86}), 20: (1, {'@': 86}), 21: (1, {'@': 86}), 35: (1, {'@': 86}), 9: (1, {'@': 86}), 39: (1, {'@': 86}), 13: (1, {'@': 86}), 40: (1, {'@': 86}), 52: (1, {'@': 86}), 42: (1, {'@': 86}), 43: (1, {'@': 86}), 15: (1, {'@': 86}), 49: (1, {'@': 86}), 47: (1, {'@': 86}), 44: (1, {'@': 86}), 31: (1, {'@': 86}), 48: (1, {'@': 86}), 50: (1, {'@': 86})}, 93: {0: (0, 67), 17: (0, 45), 9: (0, 47), 18: (0, 14), 13: (0, 44), 16: (0, 41), 3: (0, 1), 19: (0, 15), 20: (0, 46), 21: (0, 54), 11: (0, 133), 12: (0, 40), 5: (0, 8), 14: (0, 97)}, 94: {22: (1, {'@': 79}), 23: (1, {'@': 79}), 24: (1, {'@': 79}), 16: (1, {'@': 79}), 25: (1, {'@': 79}), 12: (1, {'@': 79}), 26: (1, {'@': 79}), 27: (1, {'@': 79}), 28: (1, {'@': 79}), 18: (1, {'@': 79}), 29: (1, {'@': 79}), 30: (1, {'@': 79}), 20: (1, {'@': 79}), 21: (1, {'@': 79}), 31: (1, {'@': 79}), 32: (1, {'@': 79}), 33: (1, {'@': 79}), 34: (1, {'@': 79}), 35: (1, {'@': 79}), 36: (1, {'@': 79}), 9: (1, {'@': 79}), 37: (1, {'@': 79}), 38: (1, {'@': 79}), 39: (1, {'@': 79}), 13: (1, {'@': 79}), 40: (1, {'@': 79}), 41: (1, {'@': 79}), 42: (1, {'@': 79}), 43: (1, {'@': 79}), 15: (1, {'@': 79}), 44: (1, {'@': 79}), 45: (1, {'@': 79}), 46: (1, {'@': 79}), 47: (1, {'@': 79}), 48: (1, {'@': 79}), 49: (1, {'@': 79}), 50: (1, {'@': 79}), 51: (1, {'@': 79}), 52: (1, {'@': 79})}, 95: {22: (1, {'@': 122}), 23: (1, {'@': 122}), 16: (1, {'@': 122}), 12: (1, {'@': 122}), 26: (1, {'@': 122}), 27: (1, {'@': 122}), 18: (1, {'@': 122}), 29: (1, {'@': 122}), 20: (1, {'@': 122}), 21: (1, {'@': 122}), 35: (1, {'@': 122}), 9: (1, {'@': 122}), 39: (1, {'@': 122}), 13: (1, {'@': 122}), 40: (1, {'@': 122}), 52: (1, {'@': 122}), 42: (1, {'@': 122}), 43: (1, {'@': 122}), 15: (1, {'@': 122}), 49: (1, {'@': 122}), 47: (1, {'@': 122}), 48: (1, {'@': 122}), 31: (1, {'@': 122}), 50: (1, {'@': 122})}, 96: {37: (0, 115), 28: (0, 143), 22: (1, {'@': 69}), 23: (1, {'@': 69}), 16: (1, {'@': 69}), 25: (1, {'@': 69}), 12: (1, {'@': 69}), 26: (1, {'@': 69}), 27: (1, {'@': 69}), 18: (1, {'@': 69}), 29: (1, {'@': 69}), 20: (1, {'@': 69}), 21: (1, {'@': 69}), 31: (1, {'@': 69}), 35: (1, {'@': 69}), 9: (1, {'@': 69}), 39: (1, {'@': 69}), 13: (1, {'@': 69}), 40: (1, {'@': 69}), 41: (1, {'@': 69}), 42: (1, {'@': 69}), 43: (1, {'@': 69}), 15: (1, {'@': 69}), 44: (1, {'@': 69}), 45: (1, {'@': 69}), 46: (1, {'@': 69}), 47: (1, {'@': 69}), 48: (1, {'@': 69}), 50: (1, {'@': 69}), 49: (1, {'@': 69}), 51: (1, {'@': 69}), 52: (1, {'@': 69})}, 97: {22: (1, {'@': 61}), 23: (1, {'@': 61}), 24: (1, {'@': 61}), 16: (1, {'@': 61}), 25: (1, {'@': 61}), 12: (1, {'@': 61}), 26: (1, {'@': 61}), 27: (1, {'@': 61}), 28: (1, {'@': 61}), 18: (1, {'@': 61}), 29: (1, {'@': 61}), 30: (1, {'@': 61}), 20: (1, {'@': 61}), 21: (1, {'@': 61}), 31: (1, {'@': 61}), 32: (1, {'@': 61}), 33: (1, {'@': 61}), 34: (1, {'@': 61}), 35: (1, {'@': 61}), 36: (1, {'@': 61}), 9: (1, {'@': 61}), 37: (1, {'@': 61}), 38: (1, {'@': 61}), 39: (1, {'@': 61}), 13: (1, {'@': 61}), 40: (1, {'@': 61}), 41: (1, {'@': 61}), 42: (1, {'@': 61}), 43: (1, {'@': 61}), 15: (1, {'@': 61}), 44: (1, {'@': 61}), 45: (1, {'@': 61}), 46: (1, {'@': 61}), 47: (1, {'@': 61}), 48: (1, {'@': 61}), 49: (1, {'@': 61}), 50: (1, {'@': 61}), 51: (1, {'@': 61}), 52: (1, {'@': 61})}, 98: {24: (0, 119), 30: (0, 93), 22: (1, {'@': 64}), 23: (1, {'@': 64}), 16: (1, {'@': 64}), 25: (1, {'@': 64}), 12: (1, {'@': 64}), 26: (1, {'@': 64}), 27: (1, {'@': 64}), 28: (1, {'@': 64}), 18: (1, {'@': 64}), 29: (1, {'@': 64}), 20: (1, {'@': 64}), 21: (1, {'@': 64}), 31: (1, {'@': 64}), 32: (1, {'@': 64}), 33: (1, {'@': 64}), 34: (1, {'@': 64}), 35: (1, {'@': 64}), 36: (1, {'@': 64}), 9: (1, {'@': 64}), 37: (1, {'@': 64}), 38: (1, {'@': 64}), 39: (1, {'@': 64}), 13: (1, {'@': 64}), 40: (1, {'@': 64}), 41: (1, {'@': 64}), 42: (1, {'@': 64}), 43: (1, {'@': 64}), 15: (1, {'@': 64}), 44: (1, {'@': 64}), 45: (1, {'@': 64}), 46: (1, {'@': 64}), 47: (1, {'@': 64}), 48: (1, {'@': 64}), 49: (1, {'@': 64}), 51: (1, {'@': 64}), 52: (1, {'@': 64}), 50: (1, {'@': 64})}, 99: {11: (0, 92), 16: (0, 41), 55: (0, 28)}, 100: {21: (0, 124)}, 101: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 63: (0, 140), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 50: (1, {'@': 117}), 47: (1, {'@': 117})}, 102: {24: (0, 119), 30: (0, 93), 22: (1, {'@': 65}), 23: (1, {'@': 65}), 16: (1, {'@': 65}), 25: (1, {'@': 65}), 12: (1, {'@': 65}), 26: (1, {'@': 65}), 27: (1, {'@': 65}), 28: (1, {'@': 65}), 18: (1, {'@': 65}), 29: (1, {'@': 65}), 20: (1, {'@': 65}), 21: (1, {'@': 65}), 31: (1, {'@': 65}), 32: (1, {'@': 65}), 33: (1, {'@': 65}), 34: (1, {'@': 65}), 35: (1, {'@': 65}), 36: (1, {'@': 65}), 9: (1, {'@': 65}), 37: (1, {'@': 65}), 38: (1, {'@': 65}), 39: (1, {'@': 65}), 13: (1, {'@': 65}), 40: (1, {'@': 65}), 41: (1, {'@': 65}), 42: (1, {'@': 65}), 43: (1, {'@': 65}), 15: (1, {'@': 65}), 44: (1, {'@': 65}), 45: (1, {'@': 65}), 46: (1, {'@': 65}), 47: (1, {'@': 65}), 48: (1, {'@': 65}), 49: (1, {'@': 65}), 51: (1, {'@': 65}), 52: (1, {'@': 65}), 50: (1, {'@': 65})}, 103: {46: (0, 31)}, 104: {0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 10: (0, 103), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 105: {37: (0, 115), 28: (0, 143), 22: (1, {'@': 71}), 23: (1, {'@': 71}), 16: (1, {'@': 71}), 25: (1, {'@': 71}), 12: (1, {'@': 71}), 26: (1, {'@': 71}), 27: (1, {'@': 71}), 18: (1, {'@': 71}), 29: (1, {'@': 71}), 20: (1, {'@': 71}), 21: (1, {'@': 71}), 31: (1, {'@': 71}), 35: (1, {'@': 71}), 9: (1, {'@': 71}), 39: (1, {'@': 71}), 13: (1, {'@': 71}), 40: (1, {'@': 71}), 41: (1, {'@': 71}), 42: (1, {'@': 71}), 43: (1, {'@': 71}), 15: (1, {'@': 71}), 44: (1, {'@': 71}), 45: (1, {'@': 71}), 46: (1, {'@': 71}), 47: (1, {'@': 71}), 48: (1, {'@': 71}), 50: (1, {'@': 71}), 49: (1, {'@': 71}), 51: (1, {'@': 71}), 52: (1, {'@': 71})}, 106: {22: (1, {'@': 102}), 23: (1, {'@': 102}), 16: (1, {'@': 102}), 12: (1, {'@': 102}), 26: (1, {'@': 102}), 27: (1, {'@': 102}), 18: (1, {'@': 102}), 29: (1, {'@': 102}), 20: (1, {'@': 102}), 21: (1, {'@': 102}), 35: (1, {'@': 102}), 9: (1, {'@': 102}), 39: (1, {'@': 102}), 13: (1, {'@': 102}), 40: (1, {'@': 102}), 52: (1, {'@': 102}), 42: (1, {'@': 102}), 43: (1, {'@': 102}), 15: (1, {'@': 102}), 49: (1, {'@': 102}), 47: (1, {'@': 102}), 31: (1, {'@': 102}), 48: (1, {'@': 102}), 50: (1, {'@': 102})}, 107: {0: (0, 67), 3: (0, 1), 8: (0, 96), 4: (0, 51), 5: (0, 8), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 108: {51: (1, {'@': 100})}, 109: {45: (0, 101)}, 110: {64: (0, 72), 51: (1, {'@': 88}), 22: (1, {'@': 88}), 23: (1, {'@': 88}), 16: (1, {'@': 88}), 12: (1, {'@': 88}), 26: (1, {'@': 88}), 27: (1, {'@': 88}), 18: (1, {'@': 88}), 29: (1, {'@': 88}), 20: (1, {'@': 88}), 21: (1, {'@': 88}), 35: (1, {'@': 88}), 9: (1, {'@': 88}), 39: (1, {'@': 88}), 13: (1, {'@': 88}), 40: (1, {'@': 88}), 52: (1, {'@': 88}), 42: (1, {'@': 88}), 43: (1, {'@': 88}), 15: (1, {'@': 88}), 49: (1, {'@': 88}), 47: (1, {'@': 88}), 44: (1, {'@': 88}), 31: (1, {'@': 88}), 48: (1, {'@': 88}), 50: (1, {'@': 88})}, 111: {44: (1, {'@': 120}), 51: (1, {'@': 120}), 16: (1, {'@': 120}), 18: (1, {'@': 120}), 26: (1, {'@': 120}), 27: (1, {'@': 120}), 20: (1, {'@': 120}), 21: (1, {'@': 120}), 31: (1, {'@': 120}), 9: (1, {'@': 120}), 47: (1, {'@': 120}), 48: (1, {'@': 120}), 49: (1, {'@': 120}), 50: (1, {'@': 120}), 15: (1, {'@': 120}), 22: (1, {'@': 120}), 23: (1, {'@': 120}), 12: (1, {'@': 120}), 29: (1, {'@': 120}), 35: (1, {'@': 120}), 39: (1, {'@': 120}), 13: (1, {'@': 120}), 40: (1, {'@': 120}), 52: (1, {'@': 120}), 42: (1, {'@': 120}), 43: (1, {'@': 120})}, 112: {44: (1, {'@': 98}), 51: (1, {'@': 98})}, 113: {64: (0, 72), 51: (1, {'@': 82}), 22: (1, {'@': 82}), 23: (1, {'@': 82}), 16: (1, {'@': 82}), 12: (1, {'@': 82}), 26: (1, {'@': 82}), 27: (1, {'@': 82}), 18: (1, {'@': 82}), 29: (1, {'@': 82}), 20: (1, {'@': 82}), 21: (1, {'@': 82}), 35: (1, {'@': 82}), 9: (1, {'@': 82}), 39: (1, {'@': 82}), 13: (1, {'@': 82}), 40: (1, {'@': 82}), 52: (1, {'@': 82}), 42: (1, {'@': 82}), 43: (1, {'@': 82}), 15: (1, {'@': 82}), 49: (1, {'@': 82}), 47: (1, {'@': 82}), 44: (1, {'@': 82}), 31: (1, {'@': 82}), 48: (1, {'@': 82}), 50: (1, {'@': 82})}, 114: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 63: (0, 30), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 49: (1, {'@': 117})}, 115: {0: (0, 67), 3: (0, 1), 4: (0, 102), 5: (0, 8), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 116: {22: (1, {'@': 105}), 23: (1, {'@': 105}), 16: (1, {'@': 105}), 12: (1, {'@': 105}), 26: (1, {'@': 105}), 27: (1, {'@': 105}), 18: (1, {'@': 105}), 29: (1, {'@': 105}), 20: (1, {'@': 105}), 21: (1, {'@': 105}), 35: (1, {'@': 105}), 9: (1, {'@': 105}), 39: (1, {'@': 105}), 13: (1, {'@': 105}), 40: (1, {'@': 105}), 52: (1, {'@': 105}), 42: (1, {'@': 105}), 43: (1, {'@': 105}), 15: (1, {'@': 105}), 49: (1, {'@': 105}), 47: (1, {'@': 105}), 31: (1, {'@': 105}), 48: (1, {'@': 105}), 50: (1, {'@': 105})}, 117: {37: (0, 115), 28: (0, 143), 22: (1, {'@': 67}), 23: (1, {'@': 67}), 16: (1, {'@': 67}), 25: (1, {'@': 67}), 12: (1, {'@': 67}), 26: (1, {'@': 67}), 27: (1, {'@': 67}), 18: (1, {'@': 67}), 29: (1, {'@': 67}), 20: (1, {'@': 67}), 21: (1, {'@': 67}), 31: (1, {'@': 67}), 35: (1, {'@': 67}), 9: (1, {'@': 67}), 39: (1, {'@': 67}), 13: (1, {'@': 67}), 40: (1, {'@': 67}), 41: (1, {'@': 67}), 42: (1, {'@': 67}), 43: (1, {'@': 67}), 15: (1, {'@': 67}), 44: (1, {'@': 67}), 45: (1, {'@': 67}), 46: (1, {'@': 67}), 47: (1, {'@': 67}), 48: (1, {'@': 67}), 50: (1, {'@': 67}), 49: (1, {'@': 67}), 51: (1, {'@': 67}), 52: (1, {'@': 67})}, 118: {22: (1, {'@': 72}), 23: (1, {'@': 72}), 16: (1, {'@': 72}), 25: (1, {'@': 72}), 12: (1, {'@': 72}), 26: (1, {'@': 72}), 27: (1, {'@': 72}), 18: (1, {'@': 72}), 29: (1, {'@': 72}), 20: (1, {'@': 72}), 21: (1, {'@': 72}), 31: (1, {'@': 72}), 35: (1, {'@': 72}), 9: (1, {'@': 72}), 39: (1, {'@': 72}), 13: (1, {'@': 72}), 40: (1, {'@': 72}), 41: (1, {'@': 72}), 42: (1, {'@': 72}), 43: (1, {'@': 72}), 15: (1, {'@': 72}), 44: (1, {'@': 72}), 45: (1, {'@': 72}), 46: (1, {'@': 72}), 47: (1, {'@': 72}), 48: (1, {'@': 72}), 49: (1, {'@': 72}), 50: (1, {'@': 72}), 51: (1, {'@': 72}), 52: (1, {'@': 72})}, 119: {14: (0, 141), 0: (0, 67), 17: (0, 45), 9: (0, 47), 18: (0, 14), 13: (0, 44), 16: (0, 41), 3: (0, 1), 19: (0, 15), 20: (0, 46), 21: (0, 54), 11: (0, 133), 12: (0, 40), 5: (0, 8)}, 120: {0: (0, 67), 3: (0, 1), 4: (0, 51), 5: (0, 8), 9: (0, 47), 11: (0, 133), 12: (0, 40), 8: (0, 117), 13: (0, 44), 14: (0, 11), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 121: {25: (0, 58), 22: (1, {'@': 92}), 23: (1, {'@': 92}), 16: (1, {'@': 92}), 12: (1, {'@': 92}), 26: (1, {'@': 92}), 27: (1, {'@': 92}), 18: (1, {'@': 92}), 29: (1, {'@': 92}), 20: (1, {'@': 92}), 21: (1, {'@': 92}), 31: (1, {'@': 92}), 35: (1, {'@': 92}), 9: (1, {'@': 92}), 39: (1, {'@': 92}), 13: (1, {'@': 92}), 40: (1, {'@': 92}), 42: (1, {'@': 92}), 43: (1, {'@': 92}), 15: (1, {'@': 92}), 45: (1, {'@': 92}), 47: (1, {'@': 92}), 48: (1, {'@': 92}), 49: (1, {'@': 92}), 50: (1, {'@': 92}), 52: (1, {'@': 92}), 44: (1, {'@': 92}), 51: (1, {'@': 92}), 46: (1, {'@': 92})}, 122: {11: (0, 123), 16: (0, 41)}, 123: {65: (0, 104)}, 124: {70: (0, 7), 71: (0, 19), 72: (0, 77), 51: (0, 73), 73: (0, 69)}, 125: {35: (0, 139), 23: (0, 99), 71: (0, 19), 29: (0, 64), 42: (0, 87), 70: (0, 142), 26: (0, 137), 53: (0, 22)}, 126: {66: (0, 114)}, 127: {22: (1, {'@': 55}), 23: (1, {'@': 55}), 24: (1, {'@': 55}), 16: (1, {'@': 55}), 25: (1, {'@': 55}), 12: (1, {'@': 55}), 26: (1, {'@': 55}), 27: (1, {'@': 55}), 28: (1, {'@': 55}), 18: (1, {'@': 55}), 29: (1, {'@': 55}), 30: (1, {'@': 55}), 20: (1, {'@': 55}), 21: (1, {'@': 55}), 31: (1, {'@': 55}), 32: (1, {'@': 55}), 33: (1, {'@': 55}), 34: (1, {'@': 55}), 35: (1, {'@': 55}), 36: (1, {'@': 55}), 9: (1, {'@': 55}), 37: (1, {'@': 55}), 38: (1, {'@': 55}), 39: (1, {'@': 55}), 13: (1, {'@': 55}), 40: (1, {'@': 55}), 41: (1, {'@': 55}), 42: (1, {'@': 55}), 43: (1, {'@': 55}), 15: (1, {'@': 55}), 44: (1, {'@': 55}), 45: (1, {'@': 55}), 46: (1, {'@': 55}), 47: (1, {'@': 55}), 48: (1, {'@': 55}), 49: (1, {'@': 55}), 50: (1, {'@': 55}), 51: (1, {'@': 55}), 52: (1, {'@': 55})}, 128: {22: (1, {'@': 75}), 23: (1, {'@': 75}), 16: (1, {'@': 75}), 25: (1, {'@': 75}), 12: (1, {'@': 75}), 26: (1, {'@': 75}), 27: (1, {'@': 75}), 18: (1, {'@': 75}), 29: (1, {'@': 75}), 20: (1, {'@': 75}), 21: (1, {'@': 75}), 31: (1, {'@': 75}), 35: (1, {'@': 75}), 9: (1, {'@': 75}), 39: (1, {'@': 75}), 13: (1, {'@': 75}), 40: (1, {'@': 75}), 41: (1, {'@': 75}), 42: (1, {'@': 75}), 43: (1, {'@': 75}), 15: (1, {'@': 75}), 45: (1, {'@': 75}), 47: (1, {'@': 75}), 48: (1, {'@': 75}), 52: (1, {'@': 75}), 49: (1, {'@': 75}), 50: (1, {'@': 75}), 44: (1, {'@': 75}), 51: (1, {'@': 75}), 46: (1, {'@': 75})}, 129: {0: (0, 67), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 51: (0, 18), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54), 10: (0, 66)}, 130: {25: (0, 58), 51: (0, 127)}, 131: {0: (0, 67), 10: (0, 4), 1: (0, 121), 2: (0, 85), 3: (0, 1), 4: (0, 51), 5: (0, 8), 6: (0, 43), 7: (0, 42), 8: (0, 27), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 15: (0, 3), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 132: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 63: (0, 35), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 31: (1, {'@': 117})}, 133: {21: (0, 129), 22: (1, {'@': 54}), 23: (1, {'@': 54}), 24: (1, {'@': 54}), 16: (1, {'@': 54}), 25: (1, {'@': 54}), 12: (1, {'@': 54}), 26: (1, {'@': 54}), 27: (1, {'@': 54}), 28: (1, {'@': 54}), 18: (1, {'@': 54}), 29: (1, {'@': 54}), 30: (1, {'@': 54}), 20: (1, {'@': 54}), 31: (1, {'@': 54}), 32: (1, {'@': 54}), 33: (1, {'@': 54}), 34: (1, {'@': 54}), 35: (1, {'@': 54}), 36: (1, {'@': 54}), 9: (1, {'@': 54}), 37: (1, {'@': 54}), 38: (1, {'@': 54}), 39: (1, {'@': 54}), 13: (1, {'@': 54}), 40: (1, {'@': 54}), 41: (1, {'@': 54}), 42: (1, {'@': 54}), 43: (1, {'@': 54}), 15: (1, {'@': 54}), 44: (1, {'@': 54}), 45: (1, {'@': 54}), 46: (1, {'@': 54}), 47: (1, {'@': 54}), 48: (1, {'@': 54}), 49: (1, {'@': 54}), 50: (1, {'@': 54}), 51: (1, {'@': 54}), 52: (1, {'@': 54})}, 134: {27: (0, 80), 23: (0, 99), 0: (0, 67), 42: (0, 87), 29: (0, 64), 1: (0, 121), 54: (0, 21), 2: (0, 85), 55: (0, 84), 56: (0, 79), 3: (0, 1), 4: (0, 51), 58: (0, 33), 26: (0, 137), 5: (0, 8), 22: (0, 48), 6: (0, 43), 7: (0, 42), 39: (0, 10), 43: (0, 49), 8: (0, 27), 9: (0, 47), 63: (0, 34), 59: (0, 36), 35: (0, 139), 60: (0, 16), 61: (0, 6), 11: (0, 59), 12: (0, 40), 62: (0, 23), 13: (0, 44), 40: (0, 39), 14: (0, 11), 16: (0, 41), 15: (0, 3), 53: (0, 9), 17: (0, 45), 18: (0, 14), 10: (0, 32), 19: (0, 15), 20: (0, 46), 21: (0, 54), 49: (1, {'@': 117})}, 135: {0: (0, 67), 3: (0, 1), 4: (0, 51), 5: (0, 8), 9: (0, 47), 11: (0, 133), 12: (0, 40), 8: (0, 81), 13: (0, 44), 14: (0, 11), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 136: {44: (0, 61), 22: (1, {'@': 106}), 23: (1, {'@': 106}), 16: (1, {'@': 106}), 12: (1, {'@': 106}), 26: (1, {'@': 106}), 27: (1, {'@': 106}), 18: (1, {'@': 106}), 29: (1, {'@': 106}), 20: (1, {'@': 106}), 21: (1, {'@': 106}), 35: (1, {'@': 106}), 9: (1, {'@': 106}), 39: (1, {'@': 106}), 13: (1, {'@': 106}), 40: (1, {'@': 106}), 52: (1, {'@': 106}), 42: (1, {'@': 106}), 43: (1, {'@': 106}), 15: (1, {'@': 106}), 49: (1, {'@': 106}), 47: (1, {'@': 106}), 31: (1, {'@': 106}), 48: (1, {'@': 106}), 50: (1, {'@': 106})}, 137: {11: (0, 71), 16: (0, 41), 55: (0, 90)}, 138: {22: (1, {'@': 81}), 23: (1, {'@': 81}), 16: (1, {'@': 81}), 12: (1, {'@': 81}), 26: (1, {'@': 81}), 27: (1, {'@': 81}), 18: (1, {'@': 81}), 29: (1, {'@': 81}), 20: (1, {'@': 81}), 21: (1, {'@': 81}), 35: (1, {'@': 81}), 9: (1, {'@': 81}), 39: (1, {'@': 81}), 13: (1, {'@': 81}), 40: (1, {'@': 81}), 52: (1, {'@': 81}), 42: (1, {'@': 81}), 43: (1, {'@': 81}), 15: (1, {'@': 81}), 49: (1, {'@': 81}), 47: (1, {'@': 81}), 44: (1, {'@': 81}), 31: (1, {'@': 81}), 48: (1, {'@': 81}), 51: (1, {'@': 81}), 50: (1, {'@': 81})}, 139: {11: (0, 110), 55: (0, 86), 16: (0, 41)}, 140: {50: (0, 60), 47: (0, 12)}, 141: {22: (1, {'@': 62}), 23: (1, {'@': 62}), 24: (1, {'@': 62}), 16: (1, {'@': 62}), 25: (1, {'@': 62}), 12: (1, {'@': 62}), 26: (1, {'@': 62}), 27: (1, {'@': 62}), 28: (1, {'@': 62}), 18: (1, {'@': 62}), 29: (1, {'@': 62}), 30: (1, {'@': 62}), 20: (1, {'@': 62}), 21: (1, {'@': 62}), 31: (1, {'@': 62}), 32: (1, {'@': 62}), 33: (1, {'@': 62}), 34: (1, {'@': 62}), 35: (1, {'@': 62}), 36: (1, {'@': 62}), 9: (1, {'@': 62}), 37: (1, {'@': 62}), 38: (1, {'@': 62}), 39: (1, {'@': 62}), 13: (1, {'@': 62}), 40: (1, {'@': 62}), 41: (1, {'@': 62}), 42: (1, {'@': 62}), 43: (1, {'@': 62}), 15: (1, {'@': 62}), 44: (1, {'@': 62}), 45: (1, {'@': 62}), 46: (1, {'@': 62}), 47: (1, {'@': 62}), 48: (1, {'@': 62}), 49: (1, {'@': 62}), 50: (1, {'@': 62}), 51: (1, {'@': 62}), 52: (1, {'@': 62})}, 142: {51: (0, 70)}, 143: {4: (0, 98), 0: (0, 67), 3: (0, 1), 5: (0, 8), 9: (0, 47), 11: (0, 133), 12: (0, 40), 13: (0, 44), 14: (0, 11), 16: (0, 41), 17: (0, 45), 18: (0, 14), 19: (0, 15), 20: (0, 46), 21: (0, 54)}, 144: {64: (0, 72), 51: (1, {'@': 84}), 22: (1, {'@': 84}), 23: (1, {'@': 84}), 16: (1, {'@': 84}), 12: (1, {'@': 84}), 26: (1, {'@': 84}), 27: (1, {'@': 84}), 18: (1, {'@': 84}), 29: (1, {'@': 84}), 20: (1, {'@': 84}), 21: (1, {'@': 84}), 35: (1, {'@': 84}), 9: (1, {'@': 84}), 39: (1, {'@': 84}), 13: (1, {'@': 84}), 40: (1, {'@': 84}), 52: (1, {'@': 84}), 42: (1, {'@': 84}), 43: (1, {'@': 84}), 15: (1, {'@': 84}), 49: (1, {'@': 84}), 47: (1, {'@': 84}), 44: (1, {'@': 84}), 31: (1, {'@': 84}), 48: (1, {'@': 84}), 50: (1, {'@': 84})}}, 'start_states': {'start': 37}, 'end_states': {'start': 25}}, '__type__': 'ParsingFrontend'}, 'rules': [{'@': 47}, {'@': 48}, {'@': 49}, {'@': 50}, {'@': 51}, {'@': 52}, {'@': 53}, {'@': 54}, {'@': 55}, {'@': 56}, {'@': 57}, {'@': 58}, {'@': 59}, {'@': 60}, {'@': 61}, {'@': 62}, {'@': 63}, {'@': 64}, {'@': 65}, {'@': 66}, {'@': 67}, {'@': 68}, {'@': 69}, {'@': 70}, {'@': 71}, {'@': 72}, {'@': 73}, {'@': 74}, {'@': 75}, {'@': 76}, {'@': 77}, {'@': 78}, {'@': 79}, {'@': 80}, {'@': 81}, {'@': 82}, {'@': 83}, {'@': 84}, {'@': 85}, {'@': 86}, {'@': 87}, {'@': 88}, {'@': 89}, {'@': 90}, {'@': 91}, {'@': 92}, {'@': 93}, {'@': 94}, {'@': 95}, {'@': 96}, {'@': 97}, {'@': 98}, {'@': 99}, {'@': 100}, {'@': 101}, {'@': 102}, {'@': 103}, {'@': 104}, {'@': 105}, {'@': 106}, {'@': 107}, {'@': 108}, {'@': 109}, {'@': 110}, {'@': 111}, {'@': 112}, {'@': 113}, {'@': 114}, {'@': 115}, {'@': 116}, {'@': 117}, {'@': 118}, {'@': 119}, {'@': 120}, {'@': 121}, {'@': 122}], 'options': {'debug': False, 'strict': False, 'keep_all_tokens': False, 'tree_class': None, 'cache': False, 'cache_grammar': False, 'postlex': None, 'parser': 'lalr', 'lexer': 'contextual', 'transformer': None, 'start': ['start'], 'priority': 'normal', 'ambiguity': 'auto', 'regex': False, 'propagate_positions': False, 'lexer_callbacks': {}, 'maybe_placeholders': True, 'edit_terminals': None, 'g_regex_flags': 0, 'use_bytes': False, 'ordered_sets': True, 'import_paths': [], 'source_path': None, '_plugins': {}}, '__type__': 'Lark'}
+)
+MEMO = (
+{0: {'name': 'NUMBER', 'pattern': {'value': '(?:(?:(?:[0-9])+(?:e|E)(?:(?:\\+|\\-))?(?:[0-9])+|(?:(?:[0-9])+\\.(?:(?:[0-9])+)?|\\.(?:[0-9])+)(?:(?:e|E)(?:(?:\\+|\\-))?(?:[0-9])+)?)|(?:[0-9])+)', 'flags': [], 'raw': None, '_width': [1, 18446744073709551616], '__type__': 'PatternRE'}, 'priority': 0, '__type__': 'TerminalDef'}, 1: {'name': 'CNAME', 'pattern': {'value': '(?:(?:[A-Z]|[a-z])|_)(?:(?:(?:[A-Z]|[a-z])|[0-9]|_))*', 'flags': [], 'raw': None, '_width': [1, 18446744073709551616], '__type__': 'PatternRE'}, 'priority': 0, '__type__': 'TerminalDef'}, 2: {'name': 'WS', 'pattern': {'value': '(?:[ \t\x0c\r\n])+', 'flags': [], 'raw': None, '_width': [1, 18446744073709551616], '__type__': 'PatternRE'}, 'priority': 0, '__type__': 'TerminalDef'}, 3: {'name': 'COMMENT', 'pattern': {'value': '(?:/\\*(.|\n|\r)+\\*/|//(.)+(?:(?:\r)?\n)+)', 'flags': [], 'raw': None, '_width': [4, 18446744073709551616], '__type__': 'PatternRE'}, 'priority': 0, '__type__': 'TerminalDef'}, 4: {'name': '__ANON_0', 'pattern': {'value': '".*"+', 'flags': [], 'raw': '/".*"+/', '_width': [2, 18446744073709551616], '__type__': 'PatternRE'}, 'priority': 0, '__type__': 'TerminalDef'}, 5: {'name': '__ANON_1', 'pattern': {'value': "'.?'+", 'flags': [], 'raw': "/'.?'+/", '_width': [2, 18446744073709551616], '__type__': 'PatternRE'}, 'priority': 0, '__type__': 'TerminalDef'}, 6: {'name': 'ДА', 'pattern': {'value': 'да', 'flags': [], 'raw': '"да"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 7: {'name': 'НЕТ', 'pattern': {'value': 'нет', 'flags': [], 'raw': '"нет"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 8: {'name': 'LPAR', 'pattern': {'value': '(', 'flags': [], 'raw': '"("', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 9: {'name': 'RPAR', 'pattern': {'value': ')', 'flags': [], 'raw': '")"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 10: {'name': 'STAR', 'pattern': {'value': '*', 'flags': [], 'raw': '"*"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 11: {'name': 'SLASH', 'pattern': {'value': '/', 'flags': [], 'raw': '"/"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 12: {'name': 'PLUS', 'pattern': {'value': '+', 'flags': [], 'raw': '"+"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 13: {'name': 'MINUS', 'pattern': {'value': '-', 'flags': [], 'raw': '"-"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 14: {'name': 'MORETHAN', 'pattern': {'value': '>', 'flags': [], 'raw': '">"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 15: {'name': '__ANON_2', 'pattern': {'value': '>=', 'flags': [], 'raw': '">="', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 16: {'name': 'EQUAL', 'pattern': {'value': '=', 'flags': [], 'raw': '"="', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 17: {'name': 'LESSTHAN', 'pattern': {'value': '<', 'flags': [], 'raw': '"<"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 18: {'name': '__ANON_3', 'pattern': {'value': '<=', 'flags': [], 'raw': '"<="', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 19: {'name': 'НЕ', 'pattern': {'value': 'не', 'flags': [], 'raw': '"не"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 20: {'name': 'И', 'pattern': {'value': 'и', 'flags': [], 'raw': '"и"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 21: {'name': 'ИЛИ', 'pattern': {'value': 'или', 'flags': [], 'raw': '"или"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 22: {'name': 'COMMA', 'pattern': {'value': ',', 'flags': [], 'raw': '","', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 23: {'name': '__ANON_4', 'pattern': {'value': ':=', 'flags': [], 'raw': '":="', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 24: {'name': 'СИМ', 'pattern': {'value': 'сим', 'flags': [], 'raw': '"сим"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 25: {'name': 'ЛИТ', 'pattern': {'value': 'лит', 'flags': [], 'raw': '"лит"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 26: {'name': 'ЦЕЛ', 'pattern': {'value': 'цел', 'flags': [], 'raw': '"цел"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 27: {'name': 'ЛОГ', 'pattern': {'value': 'лог', 'flags': [], 'raw': '"лог"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 28: {'name': 'ВЕЩ', 'pattern': {'value': 'вещ', 'flags': [], 'raw': '"вещ"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 29: {'name': 'ЕСЛИ', 'pattern': {'value': 'если', 'flags': [], 'raw': '"если"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 30: {'name': 'ТО', 'pattern': {'value': 'то', 'flags': [], 'raw': '"то"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 31: {'name': 'ИНАЧЕ', 'pattern': {'value': 'иначе', 'flags': [], 'raw': '"иначе"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 32: {'name': 'ВСЕ', 'pattern': {'value': 'все', 'flags': [], 'raw': '"все"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 33: {'name': 'НЦ', 'pattern': {'value': 'нц', 'flags': [], 'raw': '"нц"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 34: {'name': 'ПОКА', 'pattern': {'value': 'пока', 'flags': [], 'raw': '"пока"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 35: {'name': 'КЦ', 'pattern': {'value': 'кц', 'flags': [], 'raw': '"кц"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 36: {'name': 'КЦ_ПРИ', 'pattern': {'value': 'кц_при', 'flags': [], 'raw': '"кц_при"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 37: {'name': 'ДЛЯ', 'pattern': {'value': 'для', 'flags': [], 'raw': '"для"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 38: {'name': 'ОТ', 'pattern': {'value': 'от', 'flags': [], 'raw': '"от"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 39: {'name': 'ДО', 'pattern': {'value': 'до', 'flags': [], 'raw': '"до"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 40: {'name': 'АРГ', 'pattern': {'value': 'арг', 'flags': [], 'raw': '"арг"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 41: {'name': 'РЕЗ', 'pattern': {'value': 'рез', 'flags': [], 'raw': '"рез"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 42: {'name': 'АЛГ', 'pattern': {'value': 'алг', 'flags': [], 'raw': '"алг"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 43: {'name': 'НАЧ', 'pattern': {'value': 'нач', 'flags': [], 'raw': '"нач"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 44: {'name': 'КОН', 'pattern': {'value': 'кон', 'flags': [], 'raw': '"кон"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 45: {'name': 'ВВОД', 'pattern': {'value': 'ввод', 'flags': [], 'raw': '"ввод"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 46: {'name': 'ВЫВОД', 'pattern': {'value': 'вывод', 'flags': [], 'raw': '"вывод"', '__type__': 'PatternStr'}, 'priority': 0, '__type__': 'TerminalDef'}, 47: {'origin': {'name': 'num', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'NUMBER', 'filter_out': False, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 48: {'origin': {'name': 'ident', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'CNAME', 'filter_out': False, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 49: {'origin': {'name': 'string', '__type__': 'NonTerminal'}, 'expansion': [{'name': '__ANON_0', 'filter_out': False, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 50: {'origin': {'name': 'character', '__type__': 'NonTerminal'}, 'expansion': [{'name': '__ANON_1', 'filter_out': False, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 51: {'origin': {'name': 'true_false', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ДА', 'filter_out': True, '__type__': 'Terminal'}], 'order': 0, 'alias': 'true', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 52: {'origin': {'name': 'true_false', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'НЕТ', 'filter_out': True, '__type__': 'Terminal'}], 'order': 1, 'alias': 'false', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 53: {'origin': {'name': 'group', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'num', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 54: {'origin': {'name': 'group', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ident', '__type__': 'NonTerminal'}], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 55: {'origin': {'name': 'group', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'LPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'or', '__type__': 'NonTerminal'}, {'name': 'RPAR', 'filter_out': True, '__type__': 'Terminal'}], 'order': 2, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 56: {'origin': {'name': 'group', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'true_false', '__type__': 'NonTerminal'}], 'order': 3, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 57: {'origin': {'name': 'group', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'func_call', '__type__': 'NonTerminal'}], 'order': 4, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 58: {'origin': {'name': 'group', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'string', '__type__': 'NonTerminal'}], 'order': 5, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 59: {'origin': {'name': 'group', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'character', '__type__': 'NonTerminal'}], 'order': 6, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 60: {'origin': {'name': 'mult', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'group', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 61: {'origin': {'name': 'mult', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'mult', '__type__': 'NonTerminal'}, {'name': 'STAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'group', '__type__': 'NonTerminal'}], 'order': 1, 'alias': 'mul', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 62: {'origin': {'name': 'mult', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'mult', '__type__': 'NonTerminal'}, {'name': 'SLASH', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'group', '__type__': 'NonTerminal'}], 'order': 2, 'alias': 'div', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 63: {'origin': {'name': 'add', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'mult', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 64: {'origin': {'name': 'add', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'add', '__type__': 'NonTerminal'}, {'name': 'PLUS', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'mult', '__type__': 'NonTerminal'}], 'order': 1, 'alias': 'add', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 65: {'origin': {'name': 'add', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'add', '__type__': 'NonTerminal'}, {'name': 'MINUS', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'mult', '__type__': 'NonTerminal'}], 'order': 2, 'alias': 'sub', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 66: {'origin': {'name': 'compare', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'add', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 67: {'origin': {'name': 'compare', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'add', '__type__': 'NonTerminal'}, {'name': 'MORETHAN', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'add', '__type__': 'NonTerminal'}], 'order': 1, 'alias': 'gt', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 68: {'origin': {'name': 'compare', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'add', '__type__': 'NonTerminal'}, {'name': '__ANON_2', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'add', '__type__': 'NonTerminal'}], 'order': 2, 'alias': 'ge', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 69: {'origin': {'name': 'compare', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'add', '__type__': 'NonTerminal'}, {'name': 'EQUAL', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'add', '__type__': 'NonTerminal'}], 'order': 3, 'alias': 'equals', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 70: {'origin': {'name': 'compare', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'add', '__type__': 'NonTerminal'}, {'name': 'LESSTHAN', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'add', '__type__': 'NonTerminal'}], 'order': 4, 'alias': 'lt', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 71: {'origin': {'name': 'compare', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'add', '__type__': 'NonTerminal'}, {'name': '__ANON_3', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'add', '__type__': 'NonTerminal'}], 'order': 5, 'alias': 'le', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 72: {'origin': {'name': 'not', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'НЕ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'compare', '__type__': 'NonTerminal'}], 'order': 0, 'alias': 'not', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 73: {'origin': {'name': 'not', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'compare', '__type__': 'NonTerminal'}], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 74: {'origin': {'name': 'and', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'not', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 75: {'origin': {'name': 'and', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'and', '__type__': 'NonTerminal'}, {'name': 'И', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'not', '__type__': 'NonTerminal'}], 'order': 1, 'alias': 'and', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 76: {'origin': {'name': 'or', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'and', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 77: {'origin': {'name': 'or', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'or', '__type__': 'NonTerminal'}, {'name': 'ИЛИ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'and', '__type__': 'NonTerminal'}], 'order': 1, 'alias': 'or', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 78: {'origin': {'name': 'func_call', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ident', '__type__': 'NonTerminal'}, {'name': 'LPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}, {'name': '__func_call_star_0', '__type__': 'NonTerminal'}, {'name': 'RPAR', 'filter_out': True, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 79: {'origin': {'name': 'func_call', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ident', '__type__': 'NonTerminal'}, {'name': 'LPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}, {'name': 'RPAR', 'filter_out': True, '__type__': 'Terminal'}], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 80: {'origin': {'name': 'func_call', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ident', '__type__': 'NonTerminal'}, {'name': 'LPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'RPAR', 'filter_out': True, '__type__': 'Terminal'}], 'order': 2, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 81: {'origin': {'name': 'assign', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ident', '__type__': 'NonTerminal'}, {'name': '__ANON_4', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 82: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'СИМ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}], 'order': 0, 'alias': 'char', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 83: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'СИМ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'assign', '__type__': 'NonTerminal'}], 'order': 1, 'alias': 'char', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 84: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ЛИТ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}], 'order': 2, 'alias': 'str', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 85: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ЛИТ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'assign', '__type__': 'NonTerminal'}], 'order': 3, 'alias': 'str', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 86: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ЦЕЛ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}], 'order': 4, 'alias': 'int', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 87: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ЦЕЛ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'assign', '__type__': 'NonTerminal'}], 'order': 5, 'alias': 'int', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 88: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ЛОГ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}], 'order': 6, 'alias': 'bool', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 89: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ЛОГ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'assign', '__type__': 'NonTerminal'}], 'order': 7, 'alias': 'bool', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 90: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ВЕЩ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}], 'order': 8, 'alias': 'float', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 91: {'origin': {'name': 'var_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ВЕЩ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'assign', '__type__': 'NonTerminal'}], 'order': 9, 'alias': 'float', 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 92: {'origin': {'name': 'expr', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'or', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 93: {'origin': {'name': 'if', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ЕСЛИ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}, {'name': 'ТО', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'ИНАЧЕ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'ВСЕ', 'filter_out': True, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 94: {'origin': {'name': 'if', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ЕСЛИ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}, {'name': 'ТО', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'ВСЕ', 'filter_out': True, '__type__': 'Terminal'}], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 95: {'origin': {'name': 'while', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'НЦ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ПОКА', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'КЦ', 'filter_out': True, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 96: {'origin': {'name': 'do_while', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'НЦ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'КЦ_ПРИ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 97: {'origin': {'name': 'for', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'НЦ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ДЛЯ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}, {'name': 'ОТ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}, {'name': 'ДО', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'КЦ', 'filter_out': True, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 98: {'origin': {'name': 'params', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'АРГ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'var_decl', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 99: {'origin': {'name': 'params', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'params', '__type__': 'NonTerminal'}, {'name': 'COMMA', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'var_decl', '__type__': 'NonTerminal'}], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 100: {'origin': {'name': 'res', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'РЕЗ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'var_decl', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 101: {'origin': {'name': 'func_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'АЛГ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}, {'name': 'LPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'params', '__type__': 'NonTerminal'}, {'name': 'COMMA', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'res', '__type__': 'NonTerminal'}, {'name': 'RPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'НАЧ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'КОН', 'filter_out': True, '__type__': 'Terminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 102: {'origin': {'name': 'func_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'АЛГ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}, {'name': 'LPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'res', '__type__': 'NonTerminal'}, {'name': 'RPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'НАЧ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'КОН', 'filter_out': True, '__type__': 'Terminal'}], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 103: {'origin': {'name': 'func_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'АЛГ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}, {'name': 'LPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'params', '__type__': 'NonTerminal'}, {'name': 'RPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'НАЧ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'КОН', 'filter_out': True, '__type__': 'Terminal'}], 'order': 2, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 104: {'origin': {'name': 'func_decl', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'АЛГ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}, {'name': 'LPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'RPAR', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'НАЧ', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'stmt_list', '__type__': 'NonTerminal'}, {'name': 'КОН', 'filter_out': True, '__type__': 'Terminal'}], 'order': 3, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 105: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ВВОД', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'ident', '__type__': 'NonTerminal'}], 'order': 0, 'alias': 'input', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 106: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ВЫВОД', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}, {'name': '__func_call_star_0', '__type__': 'NonTerminal'}], 'order': 1, 'alias': 'output', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 107: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'ВЫВОД', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}], 'order': 2, 'alias': 'output', 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 108: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'var_decl', '__type__': 'NonTerminal'}], 'order': 3, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 109: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'assign', '__type__': 'NonTerminal'}], 'order': 4, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 110: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'if', '__type__': 'NonTerminal'}], 'order': 5, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 111: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'while', '__type__': 'NonTerminal'}], 'order': 6, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 112: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'do_while', '__type__': 'NonTerminal'}], 'order': 7, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 113: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'for', '__type__': 'NonTerminal'}], 'order': 8, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 114: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'func_decl', '__type__': 'NonTerminal'}], 'order': 9, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 115: {'origin': {'name': 'stmt', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'expr', '__type__': 'NonTerminal'}], 'order': 10, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 116: {'origin': {'name': 'stmt_list', '__type__': 'NonTerminal'}, 'expansion': [{'name': '__stmt_list_star_1', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 117: {'origin': {'name': 'stmt_list', '__type__': 'NonTerminal'}, 'expansion': [], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 118: {'origin': {'name': 'start', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'stmt_list', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': True, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 119: {'origin': {'name': '__func_call_star_0', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'COMMA', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 120: {'origin': {'name': '__func_call_star_0', '__type__': 'NonTerminal'}, 'expansion': [{'name': '__func_call_star_0', '__type__': 'NonTerminal'}, {'name': 'COMMA', 'filter_out': True, '__type__': 'Terminal'}, {'name': 'expr', '__type__': 'NonTerminal'}], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 121: {'origin': {'name': '__stmt_list_star_1', '__type__': 'NonTerminal'}, 'expansion': [{'name': 'stmt', '__type__': 'NonTerminal'}], 'order': 0, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}, 122: {'origin': {'name': '__stmt_list_star_1', '__type__': 'NonTerminal'}, 'expansion': [{'name': '__stmt_list_star_1', '__type__': 'NonTerminal'}, {'name': 'stmt', '__type__': 'NonTerminal'}], 'order': 1, 'alias': None, 'options': {'keep_all_tokens': False, 'expand1': False, 'priority': None, 'template_source': None, 'empty_indices': (), '__type__': 'RuleOptions'}, '__type__': 'Rule'}}
+)
+Shift = 0
+Reduce = 1
+def Lark_StandAlone(**kwargs):
+  return Lark._load_from_dict(DATA, MEMO, **kwargs)
@@ -1,36 +1,20 @@
-from ast import If
-from ctypes import Union
-from re import L
-from typing import List
+from functools import lru_cache
+from typing import Dict, List, Optional, TextIO, Tuple, Union
 from sal_ast import *
-from sal_semantic_base import BaseType, ScopeType
+from sal_semantic_base import BaseType, IdentDesc, ScopeType
+from sal_peephole import Peephole
 import visitor
 
 RUNTIME_CLASS_NAME = 'CompilerDemo.Runtime'
 PROGRAM_CLASS_NAME = 'Program'
 
 class CodeLabel:
-    def __init__(self):
-        self.index = None
-    
+    def __init__(self, index: int) -> None:
+        self.index = index
+
     def __str__(self):
         return 'IL_' + str(self.index)
 
-class CodeLine:
-    def __init__(self, code: str, *params: Union[str, CodeLabel], label: CodeLabel) -> None:
-        self.code = code
-        self.label = label
-        self.params = params
-
-    def __str__(self) -> str:
-        line = ''
-        if self.label:
-            line += str(self.label) + ': '
-        line += self.code
-        for p in self.params:
-            line += ' ' + str(p)
-        return line
-
 class MsilException(Exception):
     def __init__(self, message, *args: object) -> None:
         self.message = message
@@ -46,42 +30,160 @@ MSIL_TYPE_NAMES = {
 }
 
 
+@lru_cache(maxsize=None)
+def msil_func_type(type_: TypeDesc) -> Tuple[str, str]:
+    """MSIL-имена типа результата и типов параметров функции (типы интернированы, поэтому кэшируется по типу)
+    """
+
+    return MSIL_TYPE_NAMES[type_.return_type.base_type], ', '.join(MSIL_TYPE_NAMES[p.base_type] for p in type_.params)
+
+
 def find_vars_decls(node: AstNode) -> List[VarDeclNode]:
     var_nodes: List[VarDeclNode] = []
-
-    def find(node: AstNode) -> None:
+    # обход с явным стеком; объявления в поддеревьях VarDeclNode не ищутся
+    stack = list(reversed(node.children or [])) if node is not None else []
+    while stack:
+        node = stack.pop()
         if node is None:
-            return
-        for n in (node.children or []):
-            if isinstance(n, VarDeclNode):
-                var_nodes.append(n)
-            else:
-                find(n)
-
-    find(node)
+            continue
+        if isinstance(node, VarDeclNode):
+            var_nodes.append(node)
+        else:
+            stack.extend(reversed(node.children or []))
     return var_nodes
 
 
+def decl_idents(node: VarDeclNode) -> List[IdentDesc]:
+    res = []
+    for var in node.vars:
+        if var is None:
+            continue
+        if isinstance(var, AssignNode):
+            var = var.var
+        if var.node_ident is not None:
+            res.append(var.node_ident)
+    return res
+
+
+def res_ident(node: FuncDeclNode) -> IdentDesc:
+    """Переменная-результат функции (рез)
+    """
+
+    return decl_idents(node.res.res)[0]
+
+
+def func_locals(node: FuncDeclNode) -> List[BaseType]:
+    """Типы слотов локальных переменных функции (для .locals init) по индексам переменных;
+       переменные с одним индексом (см. sal_regalloc) должны иметь один тип
+    """
+
+    return decls_locals(find_vars_decls(node.body) + ([node.res.res] if node.res is not None else []))
+
+
+def decls_locals(decls: List[VarDeclNode]) -> List[BaseType]:
+    types: Dict[int, BaseType] = {}
+    for decl in decls:
+        for ident in decl_idents(decl):
+            if ident.scope == ScopeType.LOCAL:
+                types[ident.index] = ident.type.base_type
+    # пропуски (переменные удалены оптимизацией) заполняются int32
+    return [types.get(i, BaseType.INT) for i in range(max(types) + 1)] if types else []
+
+
+# команды бинарных операций над числами и логическими значениями (после вычисления обоих операндов);
+# >= и <= - отрицание < и >, и/или - без сокращенного вычисления
+BIN_OP_CMDS = {
+    BinOp.ADD: ('      add',),
+    BinOp.SUB: ('      sub',),
+    BinOp.MUL: ('      mul',),
+    BinOp.DIV: ('      div',),
+    BinOp.GT: ('      cgt',),
+    BinOp.LT: ('      clt',),
+    BinOp.GE: ('      clt', '      ldc.i4 0', '      ceq'),
+    BinOp.LE: ('      cgt', '      ldc.i4 0', '      ceq'),
+    BinOp.EQUALS: ('      ceq',),
+    BinOp.AND: ('      and',),
+    BinOp.OR: ('      or',),
+}
+
+
+def value_unused(stmt: AstNode) -> bool:
+    """Выражение-оператор, значение которого остается на стеке и должно быть снято (pop)
+    """
+
+    return isinstance(stmt, ExprNode) and not isinstance(stmt, AssignNode) and \
+        stmt.node_type is not None and stmt.node_type != TypeDesc.VOID
+
+
+def for_depth(node: Optional[AstNode]) -> int:
+    """Наибольшая вложенность циклов для в поддереве (столько скрытых переменных нужно для конечных значений)
+    """
+
+    res = 0
+    stack = [(node, 0)]
+    while stack:
+        n, depth = stack.pop()
+        if n is None or isinstance(n, FuncDeclNode) and n is not node:
+            continue
+        if isinstance(n, ForNode):
+            depth += 1
+            res = max(res, depth)
+        stack.extend((child, depth) for child in n.children)
+    return res
+
+
 class CodeGenerator:
-    def __init__(self) -> None:
-        self.code_lines: List[CodeLine] = []
+    """Генератор MSIL-кода
+
+    Метки нумеруются при создании (label()), поэтому каждая строка кода окончательна сразу после add().
+    Без out строки накапливаются в списке (свойство code), с out - пишутся в файл через буфер
+    размером buffer_size символов, и память не зависит от размера программы.
+    С peephole код каждого метода перед выводом целиком проходит через Peephole.run
+    """
+
+    def __init__(self, out: Optional[TextIO] = None, buffer_size: int = 64 * 1024,
+                 peephole: Optional[Peephole] = None) -> None:
+        self.lines: List[str] = []
+        self.out = out
+        self.buffer: List[str] = []
+        self.buffered = 0
+        self.buffer_size = buffer_size
+        self.label_index = 0
+        self.peephole = peephole
+        # скрытые переменные циклов для (конечные значения): первый слот и текущая вложенность
+        self.loop_slots_base = 0
+        self.loop_depth = 0
+
+    def label(self) -> CodeLabel:
+        label = CodeLabel(self.label_index)
+        self.label_index += 1
+        return label
 
     def add(self, code: str, *params: Union[str, int, CodeLabel], label: CodeLabel = None):
-        self.code_lines.append(CodeLine(code, *params, label=label))
-    
+        line = code
+        if label:
+            line = str(label) + ': ' + line
+        for p in params:
+            line += ' ' + str(p)
+        if self.out is None:
+            self.lines.append(line)
+        else:
+            self.buffer.append(line)
+            self.buffered += len(line) + 1
+            if self.buffered >= self.buffer_size:
+                self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.buffer.append('')
+            self.out.write('\n'.join(self.buffer))
+            self.buffer.clear()
+            self.buffered = 0
+
     @property
     def code(self) -> [str, ...]:
-        index = 0
-        for cl in self.code_lines:
-            line = cl.code
-            if cl.label:
-                cl.label.index = index
-                index += 1
-        code: List[str] = []
-        for cl in self.code_lines:
-            code.append(str(cl))
-        return code
-    
+        return self.lines
+
     def start(self) -> None:
         self.add('.assembly program')
         self.add('{')
@@ -107,89 +209,104 @@ class CodeGenerator:
     def msil_gen(self, node: StringNode) -> None:
         self.add(f'     ldstr "{node.value}"')
 
-    @visitor.when(BoolNode)
+    @visitor.when(StringNode)
     def msil_gen(self, node: StringNode) -> None:
-        self.add(f'     ldc.i4 "{node.value}"')
+        # значение строки хранится вместе с кавычками
+        self.add(f'     ldstr {node.value}')
+
+    @visitor.when(BoolNode)
+    def msil_gen(self, node: BoolNode) -> None:
+        self.add('      ldc.i4', 1 if node.value else 0)
+
+    def load(self, ident: IdentDesc) -> None:
+        if ident.scope == ScopeType.LOCAL:
+            self.add('      ldloc', ident.index)
+        elif ident.scope == ScopeType.PARAM:
+            self.add('      ldarg', ident.index)
+        elif ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
+            self.add(f'     ldsfld {MSIL_TYPE_NAMES[ident.type.base_type]} {PROGRAM_CLASS_NAME}::_gv{ident.index}')
+
+    def store(self, ident: IdentDesc) -> None:
+        if ident.scope == ScopeType.LOCAL:
+            self.add('      stloc', ident.index)
+        elif ident.scope == ScopeType.PARAM:
+            self.add('      starg', ident.index)
+        elif ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
+            self.add(f'     stsfld {MSIL_TYPE_NAMES[ident.type.base_type]} {PROGRAM_CLASS_NAME}::_gv{ident.index}')
 
     @visitor.when(IdentNode)
     def msil_gen(self, node: IdentNode) -> None:
-        if node.node_ident.scope == ScopeType.LOCAL:
-            self.add('      ldloc', node.node_ident.index)
-        elif node.node_ident.scope == ScopeType.PARAM:
-            self.add('      ldarg', node.node_ident.index)
-        elif node.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
-            self.add(f'     ldsfld {MSIL_TYPE_NAMES[node.node_ident.type.base_type]} {PROGRAM_CLASS_NAME}::_gv{node.node_ident.index}')
+        self.load(node.node_ident)
     
     @visitor.when(AssignNode)
     def msil_gen(self, node: AssignNode) -> None:
         if node is None:
             return
-        node.val.msil_gen(self)
-        var = node.var
-        if var.node_ident.scope == ScopeType.LOCAL:
-            self.add('      stloc', var.node_ident.index)
-        elif var.node_ident.scope == ScopeType.PARAM:
-            self.add('      starg', var.node_ident.index)
-        elif var.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
-            self.add(f'     stsfld {MSIL_TYPE_NAMES[var.node_ident.type.base_type]} Program::_gv{var.node_ident.index}')
+        yield node.val
+        self.store(node.var.node_ident)
     
     @visitor.when(VarDeclNode)
     def msil_gen(self, node: VarDeclNode) -> None:
         for var in node.vars:
             if isinstance(var, AssignNode):
                 if var.val is None:
-                    var.var.msil_gen(self)
+                    yield var.var
                 else:
-                    var.msil_gen(self)
+                    yield var
 
     @visitor.when(BinOpNode)
     def msil_gen(self, node: BinOpNode) -> None:
-        node.arg1.msil_gen(self)
-        node.arg2.msil_gen(self)
-        #TODO add
-        if node.op == BinOp.EQUALS:
-            if node.arg1.node_type == TypeDesc.STR:
-                self.add('      call bool [mscorlib]System.String::op_Inequality(string, string')
-        elif node.op == BinOp.GT:
-            self.add('      cgt')
-        elif node.op == BinOp.ADD:
-            self.add('      add')
-        else:
-            pass
+        yield node.arg1
+        yield node.arg2
+        if node.arg1.node_type == TypeDesc.STR:
+            if node.op == BinOp.ADD:
+                self.add('      call string [mscorlib]System.String::Concat(string, string)')
+                return
+            if node.op == BinOp.EQUALS:
+                self.add('      call bool [mscorlib]System.String::op_Equality(string, string)')
+                return
+            # сравнение строк на больше/меньше - через String.CompareOrdinal и сравнение результата с нулем
+            self.add('      call int32 [mscorlib]System.String::CompareOrdinal(string, string)')
+            self.add('      ldc.i4', 0)
+        cmds = BIN_OP_CMDS.get(node.op)
+        if cmds is None:
+            raise MsilException('Операция {} не поддерживается'.format(node.op.value))
+        for cmd in cmds:
+            self.add(cmd)
     
     @visitor.when(TypeConvertNode)
     def msil_gen(self, node: TypeConvertNode) -> None:
-        node.expr.msil_gen(self)
+        yield node.expr
         cmd = f'        call {MSIL_TYPE_NAMES[node.node_type.base_type]} class {RUNTIME_CLASS_NAME}::convert({MSIL_TYPE_NAMES[node.expr.node_type.base_type]})'
         self.add(cmd)
 
     @visitor.when(FuncCallNode)
     def msil_gen(self, node: FuncCallNode) -> None:
         for param in node.params:
-            param.msil_gen(self)
-        class_name = RUNTIME_CLASS_NAME if node.func.node_ident.built_in else PROGRAM_CLASS_NAME
-        param_types = ', '.join(MSIL_TYPE_NAMES[param.node_type.base_type] for param in node.params)
-        cmd = f'        call {MSIL_TYPE_NAMES[node.node_type.base_type]} class {class_name}::{node.func.name}({param_types})'
+            yield param
+        class_name = RUNTIME_CLASS_NAME if node.name.node_ident.built_in else PROGRAM_CLASS_NAME
+        return_type, param_types = msil_func_type(node.name.node_type)
+        cmd = f'        call {return_type} class {class_name}::{node.name.name}({param_types})'
         self.add(cmd)
 
     @visitor.when(ResNode)
     def msil_gen(self, node: ResNode) -> None:
-        node.res.msil_gen(self)
+        yield node.res
         self.add('      ret')
 
     @visitor.when(IfNode)
     def msil_gen(self, node: IfNode) -> None:
-        node.cond.msil_gen(self)
+        yield node.cond
         self.add('      ldc.i4', 0)
         self.add('      ceq')
-        else_label = CodeLabel()
-        end_label = CodeLabel()
+        else_label = self.label()
+        end_label = self.label()
         self.add('      brtrue', else_label)
-        node.then_stmt.msil_gen(self)
+        yield node.then_stmt
         self.add('      br', end_label)
         self.add('', label=else_label)
         if node.else_stmt:
-            node.else_stmt.msil_gen(self)
+            yield node.else_stmt
         self.add('', label=end_label)
     
     @visitor.when(FuncDeclNode)
@@ -201,21 +318,113 @@ class CodeGenerator:
             params += f'{MSIL_TYPE_NAMES[p.type.type.base_type]} {str(p.vars[0].name)}'
         self.add(f' .method public static {MSIL_TYPE_NAMES[node.type.type.base_type]} {node.name}({params}) cil managed')
         self.add('  {')
-        node.body.msil_gen(self)
+        locals_types = func_locals(node)
+        self.loop_slots_base = len(locals_types)
+        locals_types += [BaseType.INT] * for_depth(node.body)
+        if locals_types:
+            self.add('      .locals init ({})'.format(
+                ', '.join(f'{MSIL_TYPE_NAMES[t]} V_{i}' for i, t in enumerate(locals_types))))
+        yield node.body
 
-        if node.res is None:
-            self.add('      ret')
+        if node.res is not None:
+            self.add('      ldloc', res_ident(node).index)
+        self.add('      ret')
         
         self.add('  }')
 
+    # циклы генерируются с проверкой условия в конце (один переход на итерацию):
+    #       br cond_label           (только для пока и для)
+    # body_label:
+    #       <тело>
+    # cond_label:
+    #       <условие>; brtrue body_label
+
+    @visitor.when(WhileNode)
+    def msil_gen(self, node: WhileNode) -> None:
+        body_label = self.label()
+        cond_label = self.label()
+        self.add('      br', cond_label)
+        self.add('', label=body_label)
+        if node.body is not None:
+            yield node.body
+        self.add('', label=cond_label)
+        yield node.cond
+        self.add('      brtrue', body_label)
+
+    @visitor.when(DoWhileNode)
+    def msil_gen(self, node: DoWhileNode) -> None:
+        body_label = self.label()
+        self.add('', label=body_label)
+        if node.body is not None:
+            yield node.body
+        yield node.cond
+        self.add('      brtrue', body_label)
+
+    @visitor.when(ForNode)
+    def msil_gen(self, node: ForNode) -> None:
+        # конечное значение вычисляется один раз в скрытую переменную (слот после переменных функции,
+        # у вложенных циклов - разные слоты)
+        var = node.init.node_ident
+        bound = self.loop_slots_base + self.loop_depth
+        yield node.cond
+        self.store(var)
+        yield node.step
+        self.add('      stloc', bound)
+        body_label = self.label()
+        cond_label = self.label()
+        self.add('      br', cond_label)
+        self.add('', label=body_label)
+        self.loop_depth += 1
+        yield node.body
+        self.loop_depth -= 1
+        self.load(var)
+        self.add('      ldc.i4', 1)
+        self.add('      add')
+        self.store(var)
+        self.add('', label=cond_label)
+        self.load(var)
+        self.add('      ldloc', bound)
+        self.add('      ble', body_label)
+
+    # ввод и вывод выполняет только встроенная виртуальная машина (sal_vm), в MSIL узлы пропускаются
+
+    @visitor.when(OutputNode)
+    def msil_gen(self, node: OutputNode) -> None:
+        pass
+
+    @visitor.when(InputNode)
+    def msil_gen(self, node: InputNode) -> None:
+        pass
+
     @visitor.when(StmtListNode)
     def msil_gen(self, node: StmtListNode) -> None:
         for stmt in node.stmts:
-            stmt.msil_gen(self)
+            yield stmt
+            if value_unused(stmt):
+                self.add('      pop')
+
+    def msil_gen_func(self, node: FuncDeclNode) -> List[str]:
+        """MSIL-код функции; метки нумеруются с нуля в пределах функции,
+           поэтому код не зависит от положения функции в программе (и может кэшироваться)
+        """
+
+        gen = CodeGenerator()
+        gen.msil_gen(node)
+        return self.peephole.run(gen.code) if self.peephole else gen.code
+
+    def msil_gen_program(self, prog: StmtListNode, func_code: Optional[Dict[FuncDeclNode, List[str]]] = None):
+        """
+        :param func_code: уже сгенерированный (например, взятый из кэша) код функций
+        """
 
-    def msil_gen_program(self, prog: StmtListNode):
         self.start()
-        global_vars_decls = find_vars_decls(prog)
+        # глобальные переменные объявляются только вне функций
+        global_vars_decls: List[VarDeclNode] = []
+        for stmt in prog.stmts:
+            if isinstance(stmt, VarDeclNode):
+                global_vars_decls.append(stmt)
+            elif not isinstance(stmt, FuncDeclNode):
+                global_vars_decls.extend(find_vars_decls(stmt))
         for node in global_vars_decls:
             for var in node.vars:
                 if var is None: continue
@@ -223,20 +432,46 @@ class CodeGenerator:
                     var = var.var
                 if var.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
                     self.add(f' .field public static {MSIL_TYPE_NAMES[var.node_type.base_type]} _gv{var.node_ident.index}')
-        if node.vars and len(node.vars) > 0:
+        if global_vars_decls:
             self.add('')
         for stmt in prog.stmts:
             if isinstance(stmt, FuncDeclNode):
-                self.msil_gen(stmt)
+                lines = func_code.get(stmt) if func_code else None
+                if lines is None and self.peephole:
+                    lines = self.msil_gen_func(stmt)
+                if lines is not None:
+                    for line in lines:
+                        self.add(line)
+                else:
+                    # метки нумеруются с нуля в каждой функции, как в msil_gen_func
+                    self.label_index = 0
+                    self.msil_gen(stmt)
+        self.label_index = 0
         self.add('')
         self.add('  .method public static void Main()')
         self.add('  {')
         self.add('  .entrypoint')
-        for stmt in prog.children:
-            if not isinstance(stmt, FuncDeclNode):
-                self.msil_gen(stmt)
+        gen = CodeGenerator() if self.peephole else self
+        main_stmts = [stmt for stmt in prog.children if not isinstance(stmt, FuncDeclNode)]
+        # локальные переменные Main - только от встроенных функций (sal_inline), за ними - скрытые переменные циклов
+        locals_types = decls_locals([decl for stmt in main_stmts
+                                     for decl in ([stmt] if isinstance(stmt, VarDeclNode) else find_vars_decls(stmt))])
+        gen.loop_slots_base = len(locals_types)
+        locals_types += [BaseType.INT] * max((for_depth(stmt) for stmt in main_stmts), default=0)
+        if locals_types:
+            gen.add('      .locals init ({})'.format(
+                ', '.join(f'{MSIL_TYPE_NAMES[t]} V_{i}' for i, t in enumerate(locals_types))))
+        for stmt in main_stmts:
+            gen.msil_gen(stmt)
+            if value_unused(stmt):
+                gen.add('      pop')
         
-        self.add('  ret')
+        gen.add('  ret')
+        if gen is not self:
+            for line in self.peephole.run(gen.code):
+                self.add(line)
 
         self.add('  }')
         self.end()
+        if self.out is not None:
+            self.flush()
@@ -0,0 +1,460 @@
+"""Оптимизации AST-дерева после семантического анализа (перед генерацией кода), включаются ключом -O1.
+
+Свертка констант: BinOpNode/TypeConvertNode, все операнды которых - литералы (NumNode, BoolNode, StringNode),
+заменяются литералом результата. Свертка выполняется только для сочетаний типов из BIN_OP_TYPE_COMPATIBILITY
+и только если результат во время выполнения однозначен (целые - 32-битные, деление с отбрасыванием дробной части,
+деление на ноль не сворачивается). Из операций над строками сворачиваются только сцепление и равенство
+(String::op_Equality сравнивает по значению), остальные сравнения строк не сворачиваются.
+
+Распространение констант: локальные переменные (цел, вещ, лог), которые инициализируются константой при объявлении
+и больше нигде не изменяются, заменяются в выражениях литералом; объявления таких переменных, которые после
+этого больше нигде не читаются, удаляются (например, параметры встроенной функции с аргументами-литералами).
+
+Удаление мертвого кода: ветви если с константным условием, циклы нц пока нет и операторы после бесконечного цикла
+нц пока да (выхода из цикла в языке нет) удаляются, вложенные блоки без объявлений переменных встраиваются
+в охватывающий список операторов. Блоки с объявлениями остаются отдельными StmtListNode (своя область видимости).
+
+На -O2 перед остальными оптимизациями небольшие функции встраиваются в места вызова (sal_inline).
+После оптимизаций дерева слоты локальных переменных распределяются заново (sal_regalloc).
+"""
+
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+import visitor
+from sal_ast import AstNode, AssignNode, BinOpNode, BoolNode, DoWhileNode, ExprNode, ForNode, FuncCallNode, \
+    FuncDeclNode, IdentNode, IfNode, InputNode, NumNode, OutputNode, StmtListNode, StringNode, TypeConvertNode, \
+    VarDeclNode, WhileNode
+from sal_inline import InlineOptions, InlineReport, inline_program
+from sal_regalloc import allocate_program
+from sal_semantic_base import BIN_OP_TYPE_COMPATIBILITY, BaseType, BinOp, IdentDesc, ScopeType, TypeDesc
+
+PROPAGATED_TYPES = (BaseType.INT, BaseType.FLOAT, BaseType.BOOL)
+# после удаления мертвого кода присваивания в удаленных ветвях исчезают, и свертка повторяется
+MAX_ROUNDS = 3
+# уровень оптимизации, начиная с которого функции встраиваются
+INLINE_LEVEL = 2
+
+
+def int32(value: int) -> int:
+    return (value + 2 ** 31) % 2 ** 32 - 2 ** 31
+
+
+def int_div(a: int, b: int) -> int:
+    # деление в MSIL (div) отбрасывает дробную часть, а не округляет вниз, как //
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def fold_bin_op(op: BinOp, a, b, type_: BaseType, result_type: BaseType):
+    """Значение операции над константами или None, если операция не сворачивается
+    """
+
+    if type_ == BaseType.STR and op != BinOp.ADD and op != BinOp.EQUALS:
+        return None
+    if op == BinOp.ADD:
+        res = a + b
+    elif op == BinOp.SUB:
+        res = a - b
+    elif op == BinOp.MUL:
+        res = a * b
+    elif op == BinOp.DIV:
+        if b == 0:
+            return None
+        res = int_div(a, b) if type_ == BaseType.INT else a / b
+    elif op == BinOp.GT:
+        res = a > b
+    elif op == BinOp.LT:
+        res = a < b
+    elif op == BinOp.GE:
+        res = a >= b
+    elif op == BinOp.LE:
+        res = a <= b
+    elif op == BinOp.EQUALS:
+        res = a == b
+    elif op == BinOp.AND:
+        res = a and b
+    elif op == BinOp.OR:
+        res = a or b
+    else:
+        return None
+    if result_type == BaseType.INT:
+        res = int32(res)
+    elif result_type == BaseType.FLOAT and not math.isfinite(res):
+        # ldc.r8 не принимает inf/nan в текстовом виде
+        return None
+    return res
+
+
+def const_value(node: AstNode) -> Optional[Tuple[BaseType, object]]:
+    """(базовый тип, значение) литерала или None
+    """
+
+    if node.node_type is None:
+        return None
+    cls = node.__class__
+    if cls is NumNode:
+        return node.node_type.base_type, node.value
+    if cls is BoolNode:
+        return BaseType.BOOL, bool(node.value)
+    if cls is StringNode:
+        return BaseType.STR, node.value[1:-1]
+    return None
+
+
+def make_literal(type_: BaseType, value, origin: AstNode) -> ExprNode:
+    if type_ == BaseType.BOOL:
+        node = BoolNode(bool(value), row=origin.row, col=origin.col)
+    elif type_ == BaseType.STR:
+        node = StringNode('"' + value + '"', row=origin.row, col=origin.col)
+    else:
+        node = NumNode('0', row=origin.row, col=origin.col)
+        node.value = value
+    node.node_type = TypeDesc.from_base_type(type_)
+    return node
+
+
+def constant_candidates(node: AstNode) -> Set[IdentDesc]:
+    """Локальные переменные, которые присваиваются только при объявлении (кандидаты для распространения констант)
+    """
+
+    writes: Dict[IdentDesc, int] = {}
+    initialized: Set[IdentDesc] = set()
+    # имена, которые изменяются в непроверенных узлах (описание идентификатора неизвестно)
+    blocked: Set[str] = set()
+
+    def write(var: IdentNode) -> None:
+        if var.node_ident is None:
+            blocked.add(var.name)
+        else:
+            writes[var.node_ident] = writes.get(var.node_ident, 0) + 1
+
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        if isinstance(n, VarDeclNode):
+            for var in n.vars:
+                if isinstance(var, AssignNode):
+                    if var.var.node_ident is not None:
+                        initialized.add(var.var.node_ident)
+                    stack.append(var.val)
+            continue
+        if isinstance(n, AssignNode):
+            write(n.var)
+        elif isinstance(n, ForNode) and isinstance(n.init, IdentNode):
+            write(n.init)
+        elif isinstance(n, InputNode):
+            write(n.var)
+        stack.extend(n.children)
+    return {ident for ident in initialized
+            if ident.scope == ScopeType.LOCAL and ident.type.is_simple and
+            ident.type.base_type in PROPAGATED_TYPES and not writes.get(ident) and ident.name not in blocked}
+
+
+class ConstantFolder:
+    """Свертка и распространение констант; реализация для узла возвращает узел, которым его нужно заменить
+    """
+
+    def __init__(self, candidates: Set[IdentDesc], skip: Optional[Dict[FuncDeclNode, List[str]]] = None) -> None:
+        self.candidates = candidates
+        self.skip = skip
+        self.values: Dict[IdentDesc, Tuple[BaseType, object]] = {}
+
+    @visitor.on('node')
+    def fold(self, node):
+        pass
+
+    @visitor.when(AstNode)
+    def fold(self, node: AstNode) -> AstNode:
+        return node
+
+    @visitor.when(IdentNode)
+    def fold(self, node: IdentNode) -> AstNode:
+        value = self.values.get(node.node_ident) if node.node_ident is not None else None
+        if value is None:
+            return node
+        return make_literal(value[0], value[1], node)
+
+    @visitor.when(BinOpNode)
+    def fold(self, node: BinOpNode) -> AstNode:
+        node.arg1 = yield node.arg1
+        node.arg2 = yield node.arg2
+        a, b = const_value(node.arg1), const_value(node.arg2)
+        if a is None or b is None or node.node_type is None:
+            return node
+        result_type = BIN_OP_TYPE_COMPATIBILITY.get(node.op, {}).get((a[0], b[0]))
+        if result_type is None:
+            return node
+        value = fold_bin_op(node.op, a[1], b[1], a[0], result_type)
+        if value is None:
+            return node
+        return make_literal(result_type, value, node)
+
+    @visitor.when(TypeConvertNode)
+    def fold(self, node: TypeConvertNode) -> AstNode:
+        node.expr = yield node.expr
+        value = const_value(node.expr)
+        # сворачивается только цел -> вещ (остальные преобразования выполняет библиотека времени выполнения)
+        if value is not None and value[0] == BaseType.INT and node.node_type == TypeDesc.FLOAT:
+            return make_literal(BaseType.FLOAT, float(value[1]), node)
+        return node
+
+    @visitor.when(OutputNode)
+    def fold(self, node: OutputNode) -> AstNode:
+        args: List[ExprNode] = []
+        for arg in node.args:
+            args.append((yield arg))
+        node.args = tuple(args)
+        return node
+
+    @visitor.when(AssignNode)
+    def fold(self, node: AssignNode) -> AstNode:
+        node.val = yield node.val
+        return node
+
+    @visitor.when(VarDeclNode)
+    def fold(self, node: VarDeclNode) -> AstNode:
+        for var in node.vars:
+            if isinstance(var, AssignNode):
+                var.val = yield var.val
+                ident = var.var.node_ident
+                if ident in self.candidates:
+                    value = const_value(var.val)
+                    if value is not None:
+                        self.values[ident] = value
+        return node
+
+    @visitor.when(FuncCallNode)
+    def fold(self, node: FuncCallNode) -> AstNode:
+        params: List[ExprNode] = []
+        for param in node.params:
+            params.append((yield param))
+        node.params = tuple(params)
+        return node
+
+    @visitor.when(IfNode)
+    def fold(self, node: IfNode) -> AstNode:
+        node.cond = yield node.cond
+        node.then_stmt = yield node.then_stmt
+        if node.else_stmt:
+            node.else_stmt = yield node.else_stmt
+        return node
+
+    @visitor.when(WhileNode)
+    def fold(self, node: WhileNode) -> AstNode:
+        node.cond = yield node.cond
+        node.body = yield node.body
+        return node
+
+    @visitor.when(DoWhileNode)
+    def fold(self, node: DoWhileNode) -> AstNode:
+        if node.body is not None:
+            node.body = yield node.body
+        node.cond = yield node.cond
+        return node
+
+    @visitor.when(ForNode)
+    def fold(self, node: ForNode) -> AstNode:
+        node.cond = yield node.cond
+        node.step = yield node.step
+        node.body = yield node.body
+        return node
+
+    @visitor.when(StmtListNode)
+    def fold(self, node: StmtListNode) -> AstNode:
+        stmts: List[AstNode] = []
+        for stmt in node.stmts:
+            stmts.append((yield stmt))
+        node.stmts = tuple(stmts)
+        return node
+
+    @visitor.when(FuncDeclNode)
+    def fold(self, node: FuncDeclNode) -> AstNode:
+        if self.skip and node in self.skip:
+            return node
+        node.body = yield node.body
+        return node
+
+
+def remove_unread_decls(node: AstNode, propagated: Set[IdentDesc],
+                        skip: Optional[Dict[FuncDeclNode, List[str]]] = None) -> None:
+    """Удаление объявлений распространенных констант, которые больше не читаются
+    (инициализация - литерал, поэтому удаление не меняет поведение)
+    """
+
+    if not propagated:
+        return
+    read: Set[IdentDesc] = set()
+    lists: List[StmtListNode] = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n is None or isinstance(n, FuncDeclNode) and skip and n in skip:
+            continue
+        if isinstance(n, VarDeclNode):
+            stack.extend(var.val for var in n.vars if isinstance(var, AssignNode))
+            continue
+        if isinstance(n, StmtListNode):
+            lists.append(n)
+        elif isinstance(n, IdentNode):
+            read.add(n.node_ident)
+        stack.extend(n.children)
+    dead = propagated - read
+    if not dead:
+        return
+    for stmt_list in lists:
+        stmts: List[AstNode] = []
+        for stmt in stmt_list.stmts:
+            if isinstance(stmt, VarDeclNode):
+                vars_ = tuple(var for var in stmt.vars
+                              if not (isinstance(var, AssignNode) and var.var.node_ident in dead))
+                if not vars_:
+                    continue
+                stmt.vars = vars_
+            stmts.append(stmt)
+        stmt_list.stmts = tuple(stmts)
+
+
+def bool_const(node: Optional[AstNode]) -> Optional[bool]:
+    """Значение условия-литерала или None
+    """
+
+    if node is not None and node.__class__ is BoolNode:
+        return bool(node.value)
+    return None
+
+
+def is_block(node: AstNode) -> bool:
+    """Список операторов со своей областью видимости (см. SemanticChecker.semantic_check(StmtListNode))
+    """
+
+    return any(isinstance(stmt, VarDeclNode) for stmt in node.stmts)
+
+
+class DeadCodeEliminator:
+    """Удаление недостижимого кода; реализация для узла возвращает узел, которым его нужно заменить,
+       или None, если узел удаляется
+    """
+
+    def __init__(self, skip: Optional[Dict[FuncDeclNode, List[str]]] = None) -> None:
+        self.skip = skip
+        self.removed = 0
+
+    def stmt_list(self, node: Optional[AstNode]) -> StmtListNode:
+        if node is None:
+            return StmtListNode()
+        if isinstance(node, StmtListNode):
+            return node
+        return StmtListNode(node, row=node.row, col=node.col)
+
+    @visitor.on('node')
+    def prune(self, node):
+        pass
+
+    @visitor.when(AstNode)
+    def prune(self, node: AstNode) -> Optional[AstNode]:
+        return node
+
+    @visitor.when(IfNode)
+    def prune(self, node: IfNode) -> Optional[AstNode]:
+        cond = bool_const(node.cond)
+        if cond is None:
+            node.then_stmt = self.stmt_list((yield node.then_stmt))
+            if node.else_stmt:
+                node.else_stmt = yield node.else_stmt
+            return node
+        self.removed += 1
+        branch = node.then_stmt if cond else node.else_stmt
+        if branch is None:
+            return None
+        return (yield branch)
+
+    @visitor.when(WhileNode)
+    def prune(self, node: WhileNode) -> Optional[AstNode]:
+        if bool_const(node.cond) is False:
+            self.removed += 1
+            return None
+        if node.body is not None:
+            node.body = yield node.body
+        return node
+
+    @visitor.when(DoWhileNode)
+    def prune(self, node: DoWhileNode) -> Optional[AstNode]:
+        if node.body is not None:
+            node.body = yield node.body
+        return node
+
+    @visitor.when(ForNode)
+    def prune(self, node: ForNode) -> Optional[AstNode]:
+        node.body = self.stmt_list((yield node.body))
+        return node
+
+    @visitor.when(StmtListNode)
+    def prune(self, node: StmtListNode) -> Optional[AstNode]:
+        stmts: List[AstNode] = []
+        unreachable = False
+        for stmt in node.stmts:
+            if unreachable and not isinstance(stmt, (FuncDeclNode, VarDeclNode)):
+                # объявления остаются: глобальные переменные и функции видны из других мест программы
+                self.removed += 1
+                continue
+            stmt = yield stmt
+            if stmt is None:
+                continue
+            if isinstance(stmt, StmtListNode) and not is_block(stmt):
+                stmts.extend(stmt.stmts)
+            else:
+                stmts.append(stmt)
+            if isinstance(stmt, WhileNode) and bool_const(stmt.cond):
+                unreachable = True
+        node.stmts = tuple(stmts)
+        return node
+
+    @visitor.when(FuncDeclNode)
+    def prune(self, node: FuncDeclNode) -> Optional[AstNode]:
+        if self.skip and node in self.skip:
+            return node
+        node.body = self.stmt_list((yield node.body))
+        return node
+
+
+def optimize(node: AstNode, level: int = 1, skip: Optional[Dict[FuncDeclNode, List[str]]] = None) -> AstNode:
+    """Оптимизация проверенного поддерева (программы, функции или оператора)
+    :param skip: функции, код которых уже сгенерирован (инкрементальная компиляция)
+    :return: узел, которым нужно заменить node (пустой StmtListNode, если весь код удален)
+    """
+
+    if level < 1:
+        return node
+    for _ in range(MAX_ROUNDS):
+        folder = ConstantFolder(constant_candidates(node), skip)
+        node = folder.fold(node)
+        remove_unread_decls(node, set(folder.values), skip)
+        eliminator = DeadCodeEliminator(skip)
+        node = eliminator.prune(node)
+        if node is None:
+            return StmtListNode()
+        if not eliminator.removed:
+            break
+    allocate_program(node, skip)
+    return node
+
+
+def inline_enabled(level: int, inline: InlineOptions = InlineOptions()) -> bool:
+    return level >= INLINE_LEVEL and inline.budget > 0
+
+
+def optimize_program(prog: StmtListNode, level: int = 1, skip: Optional[Dict[FuncDeclNode, List[str]]] = None,
+                     inline: InlineOptions = InlineOptions(), inline_report: Optional[InlineReport] = None) -> None:
+    """Оптимизация программы (корневой StmtListNode изменяется на месте)
+    :param skip: функции, код которых уже сгенерирован (инкрементальная компиляция)
+    :param inline: параметры встраивания функций (-O2); при инкрементальной компиляции функции не встраиваются:
+                   код вызывающей функции зависел бы от тел вызываемых
+    :param inline_report: куда добавить отчет о встроенных функциях
+    """
+
+    if inline_enabled(level, inline) and skip is None:
+        inline_program(prog, inline, inline_report)
+    optimize(prog, level, skip)
@@ -1,9 +1,20 @@
+import functools
+import hashlib
+import importlib
+import io
+import pickle
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+import lark
 from lark import Lark
 from lark.visitors import InlineTransformer
 
+import sal_cache
 from sal_ast import *
 
-parser = Lark('''
+GRAMMAR = '''
     %import common.NUMBER
     %import common.CNAME
     %import common.NEWLINE
@@ -114,24 +125,156 @@ parser = Lark('''
     ?prog: stmt_list
 
     ?start: prog
-''', start="start", debug=True)
+'''
 
-loc = None
+# LALR(1)-совместимый вариант грамматики: без дублирующихся правил (if/if2, while/do_while/for и cycle),
+# тело блоков - всегда stmt_list (возможно пустой), params - леворекурсивный список
+# (чтобы отличить "," перед следующим параметром от "," перед "рез")
+LALR_GRAMMAR = '''
+    %import common.NUMBER
+    %import common.CNAME
+    %import common.NEWLINE
+    %import common.WS
+
+    %ignore WS
+
+    COMMENT: "/*" /(.|\\n|\\r)+/ "*/"
+        |  "//" /(.)+/ NEWLINE
+    %ignore COMMENT
+
+    num: NUMBER
+    ident: CNAME
+    string: /\".*\"+/
+    character: /'.?'+/
+
+    true_false: "да"  -> true
+            | "нет" -> false
+
+    ?group: num
+        | ident
+        | "(" or ")"
+        | true_false
+        | func_call
+        | string
+        | character
+
+    ?mult: group
+        | mult "*" group    -> mul
+        | mult "/" group    -> div
+
+    ?add: mult
+        | add "+" mult      -> add
+        | add "-" mult      -> sub
+
+    ?compare: add
+        | add ">" add -> gt
+        | add ">=" add -> ge
+        | add "=" add  -> equals
+        | add "<" add  -> lt
+        | add "<=" add -> le
+
+    ?not: "не" compare -> not
+        | compare
+
+    ?and: not
+        | and "и" not -> and
+
+    ?or: and
+        | or "или" and -> or
+
+    func_call: ident "(" (expr ("," expr)*)? ")"
+
+    assign: ident ":=" expr
+
+    var_decl: "сим" ident   -> char
+        | "сим" assign  -> char
+        | "лит" ident       -> str
+        | "лит" assign       -> str
+        | "цел" ident        -> int
+        | "цел" assign        -> int
+        | "лог" ident        -> bool
+        | "лог" assign       -> bool
+        | "вещ" ident        -> float
+        | "вещ" assign        -> float
+
+    ?expr: or
+
+    if: "если" expr "то" stmt_list "иначе" stmt_list "все"
+        | "если" expr "то" stmt_list "все"
+
+    while: "нц" "пока" expr stmt_list "кц"
+
+    do_while: "нц" stmt_list "кц_при" expr
+
+    for: "нц" "для" ident "от" expr "до" expr stmt_list "кц"
+
+    params: "арг" var_decl
+        | params "," var_decl
+
+    res: "рез" var_decl
+
+    func_decl: "алг" ident "(" params "," res ")" "нач" stmt_list "кон"
+        | "алг" ident "(" res ")" "нач" stmt_list "кон"
+        | "алг" ident "(" params? ")" "нач" stmt_list "кон"
+
+    ?stmt: "ввод" ident                 -> input
+        | "вывод" expr ("," expr)*      -> output
+        | var_decl
+        | assign
+        | if
+        | while
+        | do_while
+        | for
+        | func_decl
+        | expr
+
+    stmt_list: stmt*
+
+    ?start: stmt_list
+'''
+
+ENGINES = ('earley', 'lalr', 'standalone')
+DEFAULT_ENGINE = 'lalr'
+
+STANDALONE_MODULE = 'sal_lalr_parser'
+LALR_GRAMMAR_HASH = hashlib.sha256(LALR_GRAMMAR.encode('utf-8')).hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def node_class(rule: str) -> type:
+    return eval(''.join(x.capitalize() or '_' for x in rule.split('_')) + 'Node')
+
+
+def position(args: tuple) -> Tuple[Optional[int], Optional[int]]:
+    """Позиция (строка, столбец) узла - позиция первого токена или узла среди его потомков
+       (строку и столбец токена уже вычисляет лексер lark, отдельная таблица позиций не нужна)
+    """
+
+    for arg in args:
+        line = getattr(arg, 'line', None)
+        if line is not None:
+            return line, arg.column
+        row = getattr(arg, 'row', None)
+        if row is not None:
+            return row, arg.col
+    return None, None
 
 
 class MelASTBuilder(InlineTransformer):
     def __getattr__(self, item):
+        if item.startswith('__'):
+            raise AttributeError(item)
         if isinstance(item, str) and item.upper() == item:
             return lambda x: x
         if item in ('true', 'false'):
-            return lambda: BoolNode(item == 'true', loc=loc)
+            return lambda: BoolNode(item == 'true')
 
         if item in ('mul', 'div', 'add', 'sub',
                     'gt', 'lt', 'equals', 'le', 'ge',
                     'not', 'or', 'and'):
             def get_bin_op_node(*args):
                 op = BinOp[item.upper()]
-                return BinOpNode(op, *args, loc=loc)
+                row, col = position(args)
+                return BinOpNode(op, *args, row=row, col=col)
 
             return get_bin_op_node
         if item in ('char', 'str', 'int', 'bool', 'float'):
@@ -139,8 +282,9 @@ class MelASTBuilder(InlineTransformer):
                 anode = None
                 if len(args) == 2:
                     anode = AssignNode(args[0], args[1])
-                op = TypeNode(Type[item.upper()].value, *args, loc=loc)
-                return VarDeclNode(op, args[0], loc=loc)
+                row, col = position(args)
+                op = TypeNode(Type[item.upper()].value, row=row, col=col)
+                return VarDeclNode(op, args[0], row=row, col=col)
 
             return get_type_node
         # if item in ('gt', 'lt', 'equals', 'le', 'ge'):
@@ -165,40 +309,165 @@ class MelASTBuilder(InlineTransformer):
 
         else:
             def get_node(*args):
-                cls = eval(
-                    ''.join(x.capitalize() or '_' for x in item.split('_')) + 'Node')
-                return cls(*args, loc=loc)
+                cls = node_class(item)
+                row, col = position(args)
+                return cls(*args, row=row, col=col)
 
             return get_node
 
+    def params(self, *args):
+        # в LALR-грамматике params леворекурсивный: params(params(a), b) -> params(a, b)
+        if args and isinstance(args[0], ParamsNode):
+            args = args[0].vars + args[1:]
+        row, col = position(args)
+        return ParamsNode(*args, row=row, col=col)
+
+
+class ParserCallbacks:
+    """Адаптер MelASTBuilder для построения AST непосредственно во время LALR-разбора (без промежуточного Tree)
+    """
+
+    def __init__(self, builder: MelASTBuilder) -> None:
+        self.builder = builder
+
+    def __getattr__(self, item):
+        # служебные (_...) правила и терминалы остаются на усмотрение lark
+        if item.startswith('_') or item.upper() == item:
+            raise AttributeError(item)
+        func = getattr(self.builder, item)
+        return lambda children: func(*children)
+
+
+_parsers: Dict[str, object] = {}
+# парсер строится один раз под блокировкой; разбор им реентерабелен (состояние лексера и LALR - на вызов parse)
+_parsers_lock = threading.Lock()
+# откуда взят парсер: 'built' - построен по грамматике, 'cache' - загружен из кэша, 'module' - standalone-модуль
+parsers_origin: Dict[str, str] = {}
+
+
+def __getattr__(name: str):
+    # sal_parser.parser (Earley) по-прежнему доступен, но строится только при первом обращении
+    if name == 'parser':
+        return get_parser('earley')
+    raise AttributeError(name)
+
+
+def parser_cache_path() -> Optional[str]:
+    """Путь к кэшу LALR-парсера (ключ - хэш грамматики и версия lark)
+    """
 
-def parse(prog: str) -> StmtListNode:
-    locs = []
-    row, col = 0, 0
-    for c in prog:
-        if c == '\n':
-            row += 1
-            col = 0
-        elif c == '\r':
+    return sal_cache.cache_path('sal_lalr_{}_lark{}.pickle'.format(LALR_GRAMMAR_HASH[:16], lark.__version__))
+
+
+def load_lalr_parser() -> Lark:
+    transformer = ParserCallbacks(MelASTBuilder())
+    path = parser_cache_path()
+    if path:
+        try:
+            with open(path, mode='rb') as f:
+                inst = Lark.__new__(Lark)._load(f, transformer=transformer)
+            parsers_origin['lalr'] = 'cache'
+            return inst
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
             pass
-        else:
-            col += 1
-        locs.append((row, col))
-
-    old_init_action = AstNode.init_action
-
-    def init_action(node: AstNode) -> None:
-        loc = getattr(node, 'loc', None)
-        if isinstance(loc, int):
-            node.row = locs[loc][0] + 1
-            node.col = locs[loc][1] + 1
-
-    AstNode.init_action = init_action
-    try:
-        prog: StmtListNode = parser.parse(str(prog))
-        prog.program = True
-        prog = MelASTBuilder().transform(prog)
-        return prog
-    finally:
-        AstNode.init_action = old_init_action
-    # return prog
+
+    inst = Lark(LALR_GRAMMAR, start="start", parser='lalr', transformer=transformer)
+    parsers_origin['lalr'] = 'built'
+    if path:
+        try:
+            f = io.BytesIO()
+            inst.save(f, exclude_options=('transformer',))
+            sal_cache.atomic_write(path, f.getvalue())
+        except OSError:
+            pass
+    return inst
+
+
+def build_standalone(path: str) -> None:
+    """Генерация standalone-модуля LALR-парсера (не требует lark во время выполнения)
+    :param path: путь к генерируемому модулю
+    """
+
+    from lark.tools.standalone import gen_standalone
+
+    lark_inst = Lark(LALR_GRAMMAR, start="start", parser='lalr')
+    with open(path, mode='w', encoding='utf-8') as f:
+        f.write('# Сгенерировано: python sal_parser.py --build-standalone\n')
+        f.write('GRAMMAR_HASH = \'{}\'\n'.format(LALR_GRAMMAR_HASH))
+        gen_standalone(lark_inst, out=f)
+
+
+def get_parser(engine: str = DEFAULT_ENGINE):
+    """Парсер для указанного движка (создается при первом обращении)
+    :param engine: 'earley', 'lalr' или 'standalone'
+    """
+
+    parser = _parsers.get(engine)
+    if parser is None:
+        with _parsers_lock:
+            if engine not in _parsers:
+                if engine == 'earley':
+                    _parsers[engine] = Lark(GRAMMAR, start="start", debug=True)
+                    parsers_origin[engine] = 'built'
+                elif engine == 'lalr':
+                    _parsers[engine] = load_lalr_parser()
+                elif engine == 'standalone':
+                    module = importlib.import_module(STANDALONE_MODULE)
+                    if module.GRAMMAR_HASH != LALR_GRAMMAR_HASH:
+                        raise ImportError('{} устарел, выполните: python sal_parser.py --build-standalone'.format(STANDALONE_MODULE))
+                    _parsers[engine] = module.Lark_StandAlone(transformer=ParserCallbacks(MelASTBuilder()))
+                    parsers_origin[engine] = 'module'
+                else:
+                    raise ValueError('Неизвестный движок парсера: {}'.format(engine))
+        parser = _parsers[engine]
+    return parser
+
+
+def syntax_errors() -> tuple:
+    """Классы ошибок разбора (для except): lark.exceptions.UnexpectedInput и одноименный класс standalone-модуля
+    """
+
+    module = sys.modules.get(STANDALONE_MODULE)
+    if module is None:
+        return lark.exceptions.UnexpectedInput,
+    return lark.exceptions.UnexpectedInput, module.UnexpectedInput
+
+
+def syntax_error(e: Exception) -> Tuple[str, Optional[int], Optional[int]]:
+    """Сообщение об ошибке разбора (с позицией, как у SemanticException) и позиция (строка, столбец)
+    """
+
+    row = e.line if getattr(e, 'line', -1) > 0 else None
+    col = e.column if getattr(e, 'column', -1) > 0 else None
+    token = getattr(e, 'token', None)
+    char = getattr(e, 'char', None)
+    # конец входа: $END у LALR, пустой токен у UnexpectedEOF Earley
+    if token is not None and token.type != '$END' and str(token):
+        message = "Синтаксическая ошибка: неожиданная лексема '{}'".format(token)
+    elif char is not None:
+        message = "Синтаксическая ошибка: неожиданный символ '{}'".format(char)
+    else:
+        message = 'Синтаксическая ошибка: неожиданный конец программы'
+    return SemanticException(message, row, col).message, row, col
+
+
+def parse(prog: str, engine: str = DEFAULT_ENGINE) -> StmtListNode:
+    if engine == 'earley':
+        prog = MelASTBuilder().transform(get_parser(engine).parse(str(prog)))
+    else:
+        # LALR-парсеры строят AST сразу (transformer передан при создании)
+        prog = get_parser(engine).parse(str(prog))
+    prog.program = True
+    return prog
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='SAL parser build tools')
+    arg_parser.add_argument('--build-standalone', metavar='PATH', nargs='?', const=STANDALONE_MODULE + '.py',
+                            help='generate standalone LALR parser module')
+    args = arg_parser.parse_args()
+    if args.build_standalone:
+        build_standalone(args.build_standalone)
+
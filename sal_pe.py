@@ -0,0 +1,595 @@
+"""Запись сборки CLI (PE32 .exe) из MSIL-кода CodeGenerator без ilasm (ECMA-335, раздел II)
+
+На входе - строки программы, которые выдает CodeGenerator (или sal_ir_msil): поля и методы класса Program,
+инструкции методов, в том числе короткие формы после sal_peephole. На выходе - образ PE с секцией кода .text
+(таблица импорта mscoree.dll!_CorExeMain, заголовок CLI, тела методов, метаданные, переходник точки входа)
+и секцией .reloc (поправка адреса в переходнике).
+
+Таблицы метаданных: Module, TypeRef (System.Object и System.String из mscorlib, CompilerDemo.Runtime из сборки
+RUNTIME_ASSEMBLY_NAME), TypeDef (<Module>, Program), Field, MethodDef, Param, MemberRef (методы mscorlib
+и библиотеки времени выполнения), StandAloneSig (.locals init), Assembly, AssemblyRef.
+Смещения переходов вычисляются по размерам инструкций; форма перехода берется из текста, короткий переход
+дальше -128..127 - ошибка. maxstack - наибольшая глубина стека по всем путям выполнения метода.
+Образ детерминирован: TimeDateStamp = 0, Mvid модуля - хэш кода.
+"""
+
+import hashlib
+import re
+import struct
+from typing import Dict, List, Optional, Tuple, Union
+
+from sal_msil import MsilException, PROGRAM_CLASS_NAME, RUNTIME_CLASS_NAME
+from sal_peephole import Line, parse_lines
+
+RUNTIME_ASSEMBLY_NAME = 'CompilerDemo.Runtime'
+MSCORLIB_PUBLIC_KEY_TOKEN = bytes.fromhex('b77a5c561934e089')
+METADATA_VERSION = 'v4.0.30319'
+
+ELEMENT_TYPES = {'void': 0x01, 'bool': 0x02, 'char': 0x03, 'int32': 0x08, 'float64': 0x0D, 'string': 0x0E}
+
+# виды операндов: i1/i4/r8 - числа, u1/u2 - номер переменной или аргумента, br1/br4 - смещение перехода,
+# str - токен строки (#US), field/method - токен поля/метода
+OPERAND_SIZES = {None: 0, 'i1': 1, 'u1': 1, 'br1': 1, 'u2': 2, 'i4': 4, 'br4': 4, 'str': 4, 'field': 4,
+                 'method': 4, 'r8': 8}
+
+OPCODES: Dict[str, Tuple[bytes, Optional[str]]] = {
+    'nop': (b'\x00', None), 'ldnull': (b'\x14', None), 'dup': (b'\x25', None), 'pop': (b'\x26', None),
+    'ldarg.s': (b'\x0e', 'u1'), 'starg.s': (b'\x10', 'u1'), 'ldloc.s': (b'\x11', 'u1'), 'stloc.s': (b'\x13', 'u1'),
+    'ldc.i4.m1': (b'\x15', None), 'ldc.i4.s': (b'\x1f', 'i1'), 'ldc.i4': (b'\x20', 'i4'), 'ldc.r8': (b'\x23', 'r8'),
+    'call': (b'\x28', 'method'), 'ret': (b'\x2a', None),
+    'add': (b'\x58', None), 'sub': (b'\x59', None), 'mul': (b'\x5a', None), 'div': (b'\x5b', None),
+    'rem': (b'\x5d', None), 'and': (b'\x5f', None), 'or': (b'\x60', None), 'xor': (b'\x61', None),
+    'neg': (b'\x65', None), 'not': (b'\x66', None),
+    'ldstr': (b'\x72', 'str'), 'ldsfld': (b'\x7e', 'field'), 'stsfld': (b'\x80', 'field'),
+    'ceq': (b'\xfe\x01', None), 'cgt': (b'\xfe\x02', None), 'cgt.un': (b'\xfe\x03', None),
+    'clt': (b'\xfe\x04', None), 'clt.un': (b'\xfe\x05', None),
+    'ldarg': (b'\xfe\x09', 'u2'), 'starg': (b'\xfe\x0b', 'u2'), 'ldloc': (b'\xfe\x0c', 'u2'),
+    'stloc': (b'\xfe\x0e', 'u2'),
+}
+for _i in range(4):
+    OPCODES['ldarg.{}'.format(_i)] = (bytes([0x02 + _i]), None)
+    OPCODES['ldloc.{}'.format(_i)] = (bytes([0x06 + _i]), None)
+    OPCODES['stloc.{}'.format(_i)] = (bytes([0x0a + _i]), None)
+for _i in range(9):
+    OPCODES['ldc.i4.{}'.format(_i)] = (bytes([0x16 + _i]), None)
+# переходы: короткие (.s) - 0x2b.., длинные - 0x38.. в одном порядке
+BRANCH_OPS = ('br', 'brfalse', 'brtrue', 'beq', 'bge', 'bgt', 'ble', 'blt', 'bne.un', 'bge.un', 'bgt.un', 'ble.un',
+              'blt.un')
+for _i, _op in enumerate(BRANCH_OPS):
+    OPCODES[_op + '.s'] = (bytes([0x2b + _i]), 'br1')
+    OPCODES[_op] = (bytes([0x38 + _i]), 'br4')
+
+# изменение глубины стека (снимается, кладется); call и ret - по сигнатуре
+STACK_EFFECTS: Dict[str, Tuple[int, int]] = {
+    'nop': (0, 0), 'ldnull': (0, 1), 'dup': (1, 2), 'pop': (1, 0), 'ldstr': (0, 1), 'ldsfld': (0, 1),
+    'stsfld': (1, 0), 'neg': (1, 1), 'not': (1, 1), 'br': (0, 0), 'brfalse': (1, 0), 'brtrue': (1, 0),
+}
+for _op in ('add', 'sub', 'mul', 'div', 'rem', 'and', 'or', 'xor', 'ceq', 'cgt', 'cgt.un', 'clt', 'clt.un'):
+    STACK_EFFECTS[_op] = (2, 1)
+for _op in BRANCH_OPS[3:]:
+    STACK_EFFECTS[_op] = (2, 0)
+
+# таблицы метаданных (номера по ECMA-335 II.22)
+MODULE, TYPEREF, TYPEDEF, FIELD, METHODDEF, PARAM, MEMBERREF, STANDALONESIG, MODULEREF, TYPESPEC, ASSEMBLY, \
+    ASSEMBLYREF = 0x00, 0x01, 0x02, 0x04, 0x06, 0x08, 0x0a, 0x11, 0x1a, 0x1b, 0x20, 0x23
+
+
+class CodedIndex:
+    def __init__(self, tables: Tuple[int, ...]) -> None:
+        self.tables = tables
+        self.bits = (len(tables) - 1).bit_length()
+
+
+TYPE_DEF_OR_REF = CodedIndex((TYPEDEF, TYPEREF, TYPESPEC))
+RESOLUTION_SCOPE = CodedIndex((MODULE, MODULEREF, ASSEMBLYREF, TYPEREF))
+MEMBER_REF_PARENT = CodedIndex((TYPEDEF, TYPEREF, MODULEREF, METHODDEF, TYPESPEC))
+
+# столбцы: u2/u4 - числа, str/guid/blob - индексы куч, номер таблицы - индекс строки таблицы, CodedIndex
+Column = Union[str, int, CodedIndex]
+SCHEMAS: Dict[int, Tuple[Column, ...]] = {
+    MODULE: ('u2', 'str', 'guid', 'guid', 'guid'),
+    TYPEREF: (RESOLUTION_SCOPE, 'str', 'str'),
+    TYPEDEF: ('u4', 'str', 'str', TYPE_DEF_OR_REF, FIELD, METHODDEF),
+    FIELD: ('u2', 'str', 'blob'),
+    METHODDEF: ('u4', 'u2', 'u2', 'str', 'blob', PARAM),
+    PARAM: ('u2', 'u2', 'str'),
+    MEMBERREF: (MEMBER_REF_PARENT, 'str', 'blob'),
+    STANDALONESIG: ('blob',),
+    ASSEMBLY: ('u4', 'u2', 'u2', 'u2', 'u2', 'u4', 'blob', 'str', 'str'),
+    ASSEMBLYREF: ('u2', 'u2', 'u2', 'u2', 'u4', 'blob', 'str', 'str', 'blob'),
+}
+# таблицы, отсортированные по ключу (стандартное значение Sorted из ECMA-335)
+SORTED_TABLES = 0x000016003301fa00
+
+TYPE_PUBLIC = 0x0001
+FIELD_PUBLIC_STATIC = 0x0016
+METHOD_PUBLIC_STATIC = 0x0016
+HASH_SHA1 = 0x8004
+
+ASSEMBLY_RE = re.compile(r'^\.assembly (\S+)')
+FIELD_RE = re.compile(r'^\.field public static (\S+) (\S+)$')
+METHOD_RE = re.compile(r'^\.method public static (\S+) ([^\s(]+)\((.*)\)')
+LOCALS_RE = re.compile(r'^\.locals init \((.*)\)$')
+CALL_RE = re.compile(r'^(\S+) (?:class )?(?:\[([^\]]+)\])?(\S+)::([^\s(]+)\((.*)\)$')
+FIELD_REF_RE = re.compile(r'^(\S+) (\S+)::(\S+)$')
+
+# escape-последовательности строк ilasm
+STRING_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', 'a': '\a', '0': '\0',
+                  '\\': '\\', '"': '"', "'": "'", '?': '?'}
+
+
+def compressed(value: int) -> bytes:
+    """Сжатое беззнаковое целое (длины в кучах и сигнатурах)
+    """
+
+    if value < 0x80:
+        return bytes((value,))
+    if value < 0x4000:
+        return struct.pack('>H', 0x8000 | value)
+    return struct.pack('>I', 0xc0000000 | value)
+
+
+def align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def split_types(text: str) -> List[str]:
+    return [t.strip() for t in text.split(',')] if text.strip() else []
+
+
+def element_type(name: str) -> int:
+    if name not in ELEMENT_TYPES:
+        raise MsilException('Тип {} не поддерживается'.format(name))
+    return ELEMENT_TYPES[name]
+
+
+def unquote(text: str) -> str:
+    """Значение строкового литерала ldstr (в кавычках, с escape-последовательностями ilasm)
+    """
+
+    if len(text) < 2 or text[0] != '"' or text[-1] != '"':
+        raise MsilException('Неверный строковый литерал {}'.format(text))
+    res = []
+    chars = iter(text[1:-1])
+    for c in chars:
+        if c == '\\':
+            c = next(chars, '\\')
+            c = STRING_ESCAPES.get(c, c)
+        res.append(c)
+    return ''.join(res)
+
+
+class Heap:
+    """Куча метаданных (#Strings, #US, #Blob) с повторным использованием одинаковых значений
+    """
+
+    def __init__(self) -> None:
+        self.data = bytearray(b'\x00')
+        self.offsets: Dict[bytes, int] = {}
+
+    def add(self, value: bytes) -> int:
+        offset = self.offsets.get(value)
+        if offset is None:
+            offset = self.offsets[value] = len(self.data)
+            self.data += value
+        return offset
+
+
+class MethodDesc:
+    def __init__(self, name: str, return_type: str, params: List[Tuple[str, str]]) -> None:
+        self.name = name
+        self.return_type = return_type
+        # (тип, имя)
+        self.params = params
+        self.locals: List[str] = []
+        self.lines: List[str] = []
+        self.entry = False
+
+
+class ProgramDesc:
+    """Класс Program, разобранный из строк MSIL
+    """
+
+    def __init__(self) -> None:
+        self.assembly = 'program'
+        # (тип, имя)
+        self.fields: List[Tuple[str, str]] = []
+        self.methods: List[MethodDesc] = []
+
+    @staticmethod
+    def parse(lines: List[str]) -> 'ProgramDesc':
+        res = ProgramDesc()
+        method: Optional[MethodDesc] = None
+        in_body = False
+        for line in lines:
+            text = line.strip()
+            if method is not None:
+                if not in_body:
+                    if text == '{':
+                        in_body = True
+                    elif text:
+                        raise MsilException('Ожидается {{ после заголовка метода {}'.format(method.name))
+                elif text == '}':
+                    method, in_body = None, False
+                elif text == '.entrypoint':
+                    method.entry = True
+                elif text.startswith('.locals'):
+                    m = LOCALS_RE.match(text)
+                    if m is None:
+                        raise MsilException('Неверное объявление локальных переменных: {}'.format(text))
+                    method.locals = [decl.split()[0] for decl in split_types(m.group(1))]
+                elif text:
+                    method.lines.append(line)
+                continue
+            m = METHOD_RE.match(text)
+            if m is not None:
+                params = [tuple(param.split(None, 1)) for param in split_types(m.group(3))]
+                method = MethodDesc(m.group(2), m.group(1),
+                                    [(param[0], param[1] if len(param) > 1 else '') for param in params])
+                res.methods.append(method)
+                continue
+            m = FIELD_RE.match(text)
+            if m is not None:
+                res.fields.append((m.group(1), m.group(2)))
+                continue
+            m = ASSEMBLY_RE.match(text)
+            if m is not None:
+                res.assembly = m.group(1)
+        if method is not None:
+            raise MsilException('Метод {} не завершен'.format(method.name))
+        return res
+
+
+class PeWriter:
+    """Сборка образа PE из разобранной программы (ProgramDesc)
+    """
+
+    IMAGE_BASE = 0x400000
+    SECTION_ALIGNMENT = 0x2000
+    FILE_ALIGNMENT = 0x200
+    HEADERS_SIZE = 0x200
+    CLI_HEADER_SIZE = 72
+
+    def __init__(self, prog: ProgramDesc) -> None:
+        self.prog = prog
+        self.strings = Heap()
+        self.user_strings = Heap()
+        self.blobs = Heap()
+        self.guids = bytearray()
+        self.tables: Dict[int, List[tuple]] = {table: [] for table in SCHEMAS}
+        # токены ссылок: поля и методы Program по имени, члены внешних типов по (тип, имя, сигнатура)
+        self.field_tokens = {name: 0x04000000 | (i + 1) for i, (_, name) in enumerate(prog.fields)}
+        self.method_tokens = {method.name: 0x06000000 | (i + 1) for i, method in enumerate(prog.methods)}
+        self.assembly_refs: Dict[str, int] = {}
+        self.type_refs: Dict[Tuple[str, str], int] = {}
+        self.member_refs: Dict[Tuple[int, str, bytes], int] = {}
+
+    def string(self, value: str) -> int:
+        return self.strings.add(value.encode('utf-8') + b'\x00') if value else 0
+
+    def blob(self, value: bytes) -> int:
+        return self.blobs.add(compressed(len(value)) + value)
+
+    def user_string(self, value: str) -> int:
+        data = value.encode('utf-16-le')
+        # последний байт: 1, если есть символы, требующие не только побайтового сравнения
+        special = any(ord(c) > 0xff or 0x01 <= ord(c) <= 0x08 or 0x0e <= ord(c) <= 0x1f or ord(c) in (0x27, 0x2d, 0x7f)
+                      for c in value)
+        offset = self.user_strings.add(compressed(len(data) + 1) + data + (b'\x01' if special else b'\x00'))
+        if offset > 0xffffff:
+            raise MsilException('Слишком много строковых констант')
+        return 0x70000000 | offset
+
+    def add_row(self, table: int, *values) -> int:
+        rows = self.tables[table]
+        rows.append(values)
+        return len(rows)
+
+    @staticmethod
+    def method_sig(return_type: str, param_types: List[str]) -> bytes:
+        # 0x00 - DEFAULT (статический метод)
+        return b'\x00' + compressed(len(param_types)) + bytes([element_type(return_type)]) + \
+            bytes(element_type(t) for t in param_types)
+
+    def assembly_ref(self, name: str) -> int:
+        row = self.assembly_refs.get(name)
+        if row is None:
+            if name == 'mscorlib':
+                row = self.add_row(ASSEMBLYREF, 4, 0, 0, 0, 0, self.blob(MSCORLIB_PUBLIC_KEY_TOKEN),
+                                   self.string(name), 0, 0)
+            else:
+                row = self.add_row(ASSEMBLYREF, 0, 0, 0, 0, 0, 0, self.string(name), 0, 0)
+            self.assembly_refs[name] = row
+        return row
+
+    def type_ref(self, assembly: str, full_name: str) -> int:
+        row = self.type_refs.get((assembly, full_name))
+        if row is None:
+            namespace, _, name = full_name.rpartition('.')
+            row = self.add_row(TYPEREF, (ASSEMBLYREF, self.assembly_ref(assembly)), self.string(name),
+                               self.string(namespace))
+            self.type_refs[(assembly, full_name)] = row
+        return row
+
+    def call_token(self, arg: str) -> Tuple[int, int, bool]:
+        """Токен вызываемого метода, количество параметров и есть ли результат
+        """
+
+        m = CALL_RE.match(arg or '')
+        if m is None:
+            raise MsilException('Неверный операнд call: {}'.format(arg))
+        return_type, assembly, class_name, name, params = m.groups()
+        param_types = split_types(params)
+        if class_name == PROGRAM_CLASS_NAME and assembly is None:
+            token = self.method_tokens.get(name)
+            if token is None:
+                raise MsilException('Метод {}::{} не найден'.format(class_name, name))
+        else:
+            if assembly is None:
+                if class_name != RUNTIME_CLASS_NAME:
+                    raise MsilException('Класс {} не найден'.format(class_name))
+                assembly = RUNTIME_ASSEMBLY_NAME
+            sig = self.method_sig(return_type, param_types)
+            key = (self.type_ref(assembly, class_name), name, sig)
+            row = self.member_refs.get(key)
+            if row is None:
+                row = self.member_refs[key] = self.add_row(MEMBERREF, (TYPEREF, key[0]), self.string(name),
+                                                           self.blob(sig))
+            token = 0x0a000000 | row
+        return token, len(param_types), return_type != 'void'
+
+    def field_token(self, arg: str) -> int:
+        m = FIELD_REF_RE.match(arg or '')
+        if m is None or m.group(2) != PROGRAM_CLASS_NAME or m.group(3) not in self.field_tokens:
+            raise MsilException('Поле {} не найдено'.format(arg))
+        return self.field_tokens[m.group(3)]
+
+    def method_body(self, method: MethodDesc) -> bytes:
+        code = [line for line in parse_lines(method.lines) if line.op is not None or line.label is not None]
+        # размеры и смещения инструкций (метки - смещение следующей инструкции)
+        offsets: Dict[str, int] = {}
+        instrs: List[Tuple[Line, bytes, Optional[str], int]] = []
+        offset = 0
+        for line in code:
+            if line.label is not None:
+                offsets[line.label] = offset
+                continue
+            if line.op not in OPCODES:
+                raise MsilException('Инструкция {} не поддерживается ({})'.format(line.op, method.name))
+            opcode, kind = OPCODES[line.op]
+            instrs.append((line, opcode, kind, offset))
+            offset += len(opcode) + OPERAND_SIZES[kind]
+        code_size = offset
+
+        out = bytearray()
+        # глубина стека перед каждой инструкцией (по смещению); переходы назад проверяются на согласованность
+        depths: Dict[int, int] = {}
+        depth: Optional[int] = 0
+        max_stack = 0
+        for line, opcode, kind, offset in instrs:
+            if offset in depths:
+                if depth is not None and depth != depths[offset]:
+                    raise MsilException('Разная глубина стека в точке перехода ({})'.format(method.name))
+                depth = depths[offset]
+            elif depth is None:
+                # после безусловного перехода, на инструкцию переходов еще не было: только переходы назад
+                depth = 0
+            depths[offset] = depth
+
+            out += opcode
+            arg = line.arg
+            size = len(opcode) + OPERAND_SIZES[kind]
+            effect = STACK_EFFECTS.get(line.op.rsplit('.s', 1)[0] if kind == 'br1' else line.op)
+            if kind in ('br1', 'br4'):
+                if arg not in offsets:
+                    raise MsilException('Метка {} не найдена ({})'.format(arg, method.name))
+                delta = offsets[arg] - (offset + size)
+                if kind == 'br1':
+                    if not -128 <= delta <= 127:
+                        raise MsilException('Короткий переход {} на {} байт ({})'.format(line.op, delta, method.name))
+                    out += struct.pack('<b', delta)
+                else:
+                    out += struct.pack('<i', delta)
+            elif kind == 'i1':
+                out += struct.pack('<b', int(arg))
+            elif kind == 'u1':
+                out += struct.pack('<B', int(arg))
+            elif kind == 'u2':
+                out += struct.pack('<H', int(arg))
+            elif kind == 'i4':
+                out += struct.pack('<I', int(arg) & 0xffffffff)
+            elif kind == 'r8':
+                out += struct.pack('<d', float(arg))
+            elif kind == 'str':
+                out += struct.pack('<I', self.user_string(unquote(arg)))
+            elif kind == 'field':
+                out += struct.pack('<I', self.field_token(arg))
+            elif kind == 'method':
+                token, params, has_result = self.call_token(arg)
+                out += struct.pack('<I', token)
+                effect = (params, 1 if has_result else 0)
+            if line.op == 'ret':
+                effect = (0 if method.return_type == 'void' else 1, 0)
+            elif effect is None:
+                # ldarg/ldloc/ldc и их формы кладут значение, starg/stloc снимают
+                effect = (1, 0) if line.op.startswith(('st', 'pop')) else (0, 1)
+            depth -= effect[0]
+            if depth < 0:
+                raise MsilException('Стек пуст: {} ({})'.format(line.op, method.name))
+            depth += effect[1]
+            max_stack = max(max_stack, depth)
+            if kind in ('br1', 'br4'):
+                target = offsets[arg]
+                if target in depths and depths[target] != depth:
+                    raise MsilException('Разная глубина стека в точке перехода ({})'.format(method.name))
+                depths[target] = depth
+                if line.op in ('br', 'br.s'):
+                    depth = None
+            elif line.op == 'ret':
+                depth = None
+
+        locals_token = 0
+        if method.locals:
+            sig = b'\x07' + compressed(len(method.locals)) + bytes(element_type(t) for t in method.locals)
+            locals_token = 0x11000000 | self.add_row(STANDALONESIG, self.blob(sig))
+        if code_size < 64 and max_stack <= 8 and not locals_token:
+            return bytes(((code_size << 2) | 0x2,)) + out
+        # fat-заголовок: флаги (0x3 - fat, 0x10 - InitLocals) и размер заголовка в двойных словах (3)
+        flags = 0x3003 | (0x10 if locals_token else 0)
+        return struct.pack('<HHII', flags, max_stack, code_size, locals_token) + out
+
+    def metadata(self, rvas: List[int], entry_token: int) -> bytes:
+        """Метаданные (корень и потоки #~, #Strings, #US, #GUID, #Blob); rvas - адреса тел методов
+        """
+
+        # MethodDef и Param заполняются здесь, чтобы строки шли в порядке объявления
+        param_index = 1
+        for method, rva in zip(self.prog.methods, rvas):
+            self.add_row(METHODDEF, rva, 0, METHOD_PUBLIC_STATIC, self.string(method.name),
+                         self.blob(self.method_sig(method.return_type, [t for t, _ in method.params])), param_index)
+            for seq, (_, name) in enumerate(method.params, 1):
+                self.add_row(PARAM, 0, seq, self.string(name))
+                param_index += 1
+        tables = self.encode_tables()
+
+        version = METADATA_VERSION.encode() + b'\x00'
+        version += b'\x00' * (align(len(version), 4) - len(version))
+        streams = [('#~', tables), ('#Strings', self.strings.data), ('#US', self.user_strings.data),
+                   ('#GUID', self.guids), ('#Blob', self.blobs.data)]
+        streams = [(name, bytes(data) + b'\x00' * (align(len(data), 4) - len(data))) for name, data in streams]
+        header_size = 16 + len(version) + 4 + sum(8 + align(len(name) + 1, 4) for name, _ in streams)
+        res = bytearray(struct.pack('<IHHII', 0x424a5342, 1, 1, 0, len(version)) + version +
+                        struct.pack('<HH', 0, len(streams)))
+        offset = header_size
+        for name, data in streams:
+            encoded = name.encode() + b'\x00'
+            res += struct.pack('<II', offset, len(data)) + encoded + b'\x00' * (align(len(encoded), 4) - len(encoded))
+            offset += len(data)
+        for _, data in streams:
+            res += data
+        return bytes(res)
+
+    def encode_tables(self) -> bytes:
+        counts = {table: len(rows) for table, rows in self.tables.items()}
+        heap_sizes = (0x01 if len(self.strings.data) > 0xffff else 0) | (0x02 if len(self.guids) // 16 > 0xffff else 0) | \
+            (0x04 if len(self.blobs.data) > 0xffff else 0)
+        heap_formats = {'str': 'I' if heap_sizes & 0x01 else 'H', 'guid': 'I' if heap_sizes & 0x02 else 'H',
+                        'blob': 'I' if heap_sizes & 0x04 else 'H', 'u2': 'H', 'u4': 'I'}
+
+        def column_format(column: Column) -> str:
+            if isinstance(column, str):
+                return heap_formats[column]
+            if isinstance(column, CodedIndex):
+                return 'I' if max(counts.get(t, 0) for t in column.tables) >= 1 << (16 - column.bits) else 'H'
+            return 'I' if counts[column] > 0xffff else 'H'
+
+        def column_value(column: Column, value) -> int:
+            if isinstance(column, CodedIndex):
+                table, row = value
+                return row << column.bits | column.tables.index(table)
+            return value
+
+        present = sorted(table for table, count in counts.items() if count)
+        res = bytearray(struct.pack('<IBBBBQQ', 0, 2, 0, heap_sizes, 1, sum(1 << table for table in present),
+                                    SORTED_TABLES))
+        res += b''.join(struct.pack('<I', counts[table]) for table in present)
+        for table in present:
+            schema = SCHEMAS[table]
+            row_struct = struct.Struct('<' + ''.join(column_format(column) for column in schema))
+            for row in self.tables[table]:
+                res += row_struct.pack(*(column_value(column, value) for column, value in zip(schema, row)))
+        return bytes(res)
+
+    def image(self) -> bytes:
+        prog = self.prog
+        entry = [method for method in prog.methods if method.entry]
+        if len(entry) != 1:
+            raise MsilException('Нет точки входа (.entrypoint)' if not entry else 'Несколько точек входа')
+
+        object_ref = self.type_ref('mscorlib', 'System.Object')
+        self.add_row(TYPEDEF, 0, self.string('<Module>'), 0, (TYPEDEF, 0), 1, 1)
+        self.add_row(TYPEDEF, TYPE_PUBLIC, self.string(PROGRAM_CLASS_NAME), 0, (TYPEREF, object_ref), 1, 1)
+        for type_, name in prog.fields:
+            self.add_row(FIELD, FIELD_PUBLIC_STATIC, self.string(name), self.blob(b'\x06' + bytes((element_type(type_),))))
+
+        # .text: IAT, заголовок CLI, тела методов, метаданные, таблица импорта, переходник точки входа
+        text_rva = self.SECTION_ALIGNMENT
+        text = bytearray(8 + self.CLI_HEADER_SIZE)
+        rvas = []
+        bodies = [self.method_body(method) for method in prog.methods]
+        for body in bodies:
+            if body[0] & 0x3 == 0x3:
+                text += b'\x00' * (align(len(text), 4) - len(text))
+            rvas.append(text_rva + len(text))
+            text += body
+
+        mvid = hashlib.sha1(b''.join(bodies) + '\n'.join(name for _, name in prog.fields).encode()).digest()[:16]
+        self.guids += mvid
+        self.tables[MODULE].append((0, self.string(prog.assembly + '.exe'), 1, 0, 0))
+        self.add_row(ASSEMBLY, HASH_SHA1, 0, 0, 0, 0, 0, 0, self.string(prog.assembly), 0)
+        entry_token = self.method_tokens[entry[0].name]
+
+        text += b'\x00' * (align(len(text), 4) - len(text))
+        metadata_rva = text_rva + len(text)
+        metadata = self.metadata(rvas, entry_token)
+        text += metadata
+
+        text += b'\x00' * (align(len(text), 4) - len(text))
+        import_rva = text_rva + len(text)
+        lookup_rva = import_rva + 40
+        hint_name_rva = lookup_rva + 8
+        hint_name = b'\x00\x00_CorExeMain\x00'
+        dll_name_rva = hint_name_rva + len(hint_name)
+        dll_name = b'mscoree.dll\x00'
+        text += struct.pack('<IIIII', lookup_rva, 0, 0, dll_name_rva, text_rva) + b'\x00' * 20
+        text += struct.pack('<II', hint_name_rva, 0) + hint_name + dll_name
+        # переходник jmp [IAT]: адрес в команде выравнивается на 4 байта
+        text += b'\x00' * (align(len(text) + 2, 4) - 2 - len(text))
+        entry_rva = text_rva + len(text)
+        text += b'\xff\x25' + struct.pack('<I', self.IMAGE_BASE + text_rva)
+        struct.pack_into('<II', text, 0, hint_name_rva, 0)
+        # заголовок CLI: размер, версия 2.5, метаданные, флаги (ILONLY), точка входа, остальные каталоги пустые
+        struct.pack_into('<IHHIIII' + 'I' * 12, text, 8, self.CLI_HEADER_SIZE, 2, 5, metadata_rva, len(metadata),
+                         0x1, entry_token, *([0] * 12))
+
+        reloc_rva = align(text_rva + len(text), self.SECTION_ALIGNMENT)
+        fixup_rva = entry_rva + 2
+        reloc = struct.pack('<IIHH', fixup_rva & ~0xfff, 12, 0x3000 | (fixup_rva & 0xfff), 0)
+
+        text_raw_size = align(len(text), self.FILE_ALIGNMENT)
+        reloc_raw_size = align(len(reloc), self.FILE_ALIGNMENT)
+        image_size = align(reloc_rva + len(reloc), self.SECTION_ALIGNMENT)
+
+        headers = bytearray(DOS_HEADER)
+        headers += b'PE\x00\x00' + struct.pack('<HHIIIHH', 0x14c, 2, 0, 0, 0, 0xe0, 0x0102)
+        headers += struct.pack('<HBBIIIIIIIIIHHHHHHIIIIHHIIIIII', 0x10b, 8, 0, text_raw_size, reloc_raw_size, 0,
+                               entry_rva, text_rva, reloc_rva, self.IMAGE_BASE, self.SECTION_ALIGNMENT,
+                               self.FILE_ALIGNMENT, 4, 0, 0, 0, 4, 0, 0, image_size, self.HEADERS_SIZE, 0, 3, 0x8540,
+                               0x100000, 0x1000, 0x100000, 0x1000, 0, 16)
+        directories = [(0, 0)] * 16
+        directories[1] = (import_rva, 40)
+        directories[5] = (reloc_rva, len(reloc))
+        directories[12] = (text_rva, 8)
+        directories[14] = (text_rva + 8, self.CLI_HEADER_SIZE)
+        headers += b''.join(struct.pack('<II', rva, size) for rva, size in directories)
+        headers += struct.pack('<8sIIIIIIHHI', b'.text', len(text), text_rva, text_raw_size, self.HEADERS_SIZE,
+                               0, 0, 0, 0, 0x60000020)
+        headers += struct.pack('<8sIIIIIIHHI', b'.reloc', len(reloc), reloc_rva, reloc_raw_size,
+                               self.HEADERS_SIZE + text_raw_size, 0, 0, 0, 0, 0x42000040)
+        headers += b'\x00' * (self.HEADERS_SIZE - len(headers))
+        return bytes(headers) + bytes(text) + b'\x00' * (text_raw_size - len(text)) + \
+            reloc + b'\x00' * (reloc_raw_size - len(reloc))
+
+
+# заголовок MS-DOS с заглушкой (ECMA-335 II.25.2.1), e_lfanew = 0x80
+DOS_HEADER = (b'MZ\x90\x00\x03\x00\x00\x00\x04\x00\x00\x00\xff\xff\x00\x00\xb8' + b'\x00' * 7 + b'\x40' +
+              b'\x00' * 35 + b'\x80\x00\x00\x00' +
+              b'\x0e\x1f\xba\x0e\x00\xb4\x09\xcd\x21\xb8\x01\x4c\xcd\x21This program cannot be run in DOS mode.\r\r\n$')
+DOS_HEADER += b'\x00' * (0x80 - len(DOS_HEADER))
+
+
+def assemble(lines: List[str]) -> bytes:
+    """Образ сборки (.exe) из строк MSIL программы (ошибки - MsilException)
+    """
+
+    return PeWriter(ProgramDesc.parse(lines)).image()
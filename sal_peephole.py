@@ -0,0 +1,275 @@
+"""Peephole-оптимизация MSIL-кода метода (включается ключом -O2)
+
+Работает со строками, которые выдает CodeGenerator (код одного метода целиком, вместе с заголовком и скобками).
+Директивы (.method, .entrypoint, ...) и скобки остаются как есть и разделяют шаблоны.
+Правила (в скобках - имя счетчика срабатываний):
+  - ldc.i4 0; ceq; brtrue L -> brfalse L (и наоборот) (brfalse)
+  - cgt/clt/ceq; brtrue L -> bgt/blt/beq L, ceq; brfalse L -> bne.un L (compare branch)
+  - stloc N; ldloc N -> dup; stloc N, то же для starg/ldarg и stsfld/ldsfld (dup)
+  - переход на безусловный переход заменяется переходом на его цель (jump threading)
+  - br на следующую за ним инструкцию удаляется (branch to next)
+  - метки, на которые нет переходов, удаляются (unused label)
+  - короткие формы: ldc.i4.0..8/m1/.s (ldc.i4 short), ldloc/stloc.0..3/.s (ldloc/stloc short),
+    ldarg.0..3/.s, starg.s (ldarg/starg short), переходы .s при смещении -128..127 (short branch)
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+LINE_RE = re.compile(r'^(?:(IL_\d+):)?(\s*)(.*?)\s*$')
+
+BRANCHES = {'br', 'brtrue', 'brfalse', 'beq', 'bne.un', 'bgt', 'blt', 'bge', 'ble',
+            'bgt.un', 'blt.un', 'bge.un', 'ble.un'}
+INVERTED_BRANCHES = {'brtrue': 'brfalse', 'brfalse': 'brtrue'}
+# сравнение и условный переход -> переход по сравнению; только точные замены (тип операндов здесь неизвестен,
+# поэтому cgt; brfalse не заменяется: ble для целых и ble.un для вещественных)
+COMPARE_BRANCHES = {('cgt', 'brtrue'): 'bgt', ('clt', 'brtrue'): 'blt', ('ceq', 'brtrue'): 'beq',
+                    ('ceq', 'brfalse'): 'bne.un'}
+STORE_LOAD = {'stloc': 'ldloc', 'starg': 'ldarg', 'stsfld': 'ldsfld'}
+VAR_OPS = {'ldloc': 'ldloc/stloc short', 'stloc': 'ldloc/stloc short',
+           'ldarg': 'ldarg/starg short', 'starg': 'ldarg/starg short'}
+# инструкции с формами .0 - .3 (у starg таких форм нет)
+INDEXED_VAR_OPS = {'ldloc', 'stloc', 'ldarg'}
+
+# размеры инструкций в байтах (для выбора коротких переходов, которые выбираются после коротких форм);
+# неизвестные инструкции считаются длинными, при этом расстояния только завышаются, и короткий переход
+# никогда не выбирается ошибочно
+OP_SIZES = {
+    'ldc.i4': 5, 'ldc.i4.s': 2, 'ldc.r8': 9, 'ldc.r4': 5, 'ldstr': 5, 'ldnull': 1,
+    'ldloc': 4, 'ldloc.s': 2, 'stloc': 4, 'stloc.s': 2, 'ldarg': 4, 'ldarg.s': 2, 'starg': 4, 'starg.s': 2,
+    'ldsfld': 5, 'stsfld': 5, 'call': 5, 'ret': 1, 'dup': 1, 'pop': 1, 'nop': 1,
+    'add': 1, 'sub': 1, 'mul': 1, 'div': 1, 'rem': 1, 'neg': 1, 'not': 1, 'and': 1, 'or': 1, 'xor': 1,
+    'ceq': 2, 'cgt': 2, 'clt': 2, 'cgt.un': 2, 'clt.un': 2,
+    'br': 5, 'brtrue': 5, 'brfalse': 5, 'beq': 5, 'bne.un': 5, 'bgt': 5, 'blt': 5, 'bge': 5, 'ble': 5,
+    'bgt.un': 5, 'blt.un': 5, 'bge.un': 5, 'ble.un': 5,
+    # короткие формы: ldc.i4.m1, ldc.i4.0 - ldc.i4.8, ldloc/stloc/ldarg.0 - .3 (1 байт), переходы .s (2 байта)
+    **{'ldc.i4.' + value: 1 for value in ['m1'] + [str(i) for i in range(9)]},
+    **{op + '.' + str(i): 1 for op in INDEXED_VAR_OPS for i in range(4)},
+    **{op + '.s': 2 for op in BRANCHES},
+}
+UNKNOWN_OP_SIZE = 16
+
+RULES = ('brfalse', 'compare branch', 'dup', 'jump threading', 'branch to next', 'unused label',
+         'ldc.i4 short', 'ldloc/stloc short', 'ldarg/starg short', 'short branch')
+
+
+class Line:
+    """Строка кода метода: метка (label), директива или скобка (text) либо инструкция (op, arg)
+    """
+
+    __slots__ = ('label', 'text', 'indent', 'op', 'arg')
+
+    def __init__(self, label: Optional[str] = None, text: Optional[str] = None,
+                 indent: str = '', op: Optional[str] = None, arg: Optional[str] = None) -> None:
+        self.label = label
+        self.text = text
+        self.indent = indent
+        self.op = op
+        self.arg = arg
+
+    def __str__(self) -> str:
+        if self.label is not None:
+            return self.label + ': '
+        if self.text is not None:
+            return self.text
+        return self.indent + self.op + ('' if self.arg is None else ' ' + self.arg)
+
+
+def parse_lines(lines: List[str]) -> List[Line]:
+    res: List[Line] = []
+    for line in lines:
+        label, indent, rest = LINE_RE.match(line).groups()
+        if label is not None:
+            res.append(Line(label=label))
+            if not rest:
+                continue
+        if not rest or rest[0] in '.{}/':
+            res.append(Line(text=line if label is None else indent + rest))
+            continue
+        op, _, arg = rest.partition(' ')
+        res.append(Line(indent=indent, op=op, arg=arg.strip() or None))
+    return res
+
+
+def short_int(value: int) -> bool:
+    return -128 <= value <= 127
+
+
+class Peephole:
+    """Peephole-оптимизатор; счетчики срабатываний правил накапливаются (hits) по всем обработанным методам
+    """
+
+    def __init__(self) -> None:
+        self.hits: Counter = Counter()
+
+    def report(self) -> str:
+        return ', '.join('{}: {}'.format(rule, self.hits[rule]) for rule in RULES)
+
+    def merge(self, other: 'Peephole') -> None:
+        self.hits.update(other.hits)
+
+    def run(self, lines: List[str]) -> List[str]:
+        code = parse_lines(lines)
+        changed = True
+        while changed:
+            changed = False
+            for rule in (self.fold_compare_zero, self.fuse_compare_branch, self.store_load_dup, self.thread_jumps, self.remove_branch_to_next,
+                         self.remove_unused_labels):
+                if rule(code):
+                    changed = True
+        self.short_forms(code)
+        self.short_branches(code)
+        return [str(line) for line in code]
+
+    def hit(self, rule: str) -> None:
+        self.hits[rule] += 1
+
+    def fold_compare_zero(self, code: List[Line]) -> bool:
+        changed = False
+        i = 0
+        while i + 2 < len(code):
+            a, b, c = code[i], code[i + 1], code[i + 2]
+            if (a.op in ('ldc.i4', 'ldc.i4.0') and (a.op == 'ldc.i4.0' or a.arg == '0') and b.op == 'ceq' and
+                    c.op in INVERTED_BRANCHES):
+                c.op = INVERTED_BRANCHES[c.op]
+                del code[i:i + 2]
+                self.hit('brfalse')
+                changed = True
+            i += 1
+        return changed
+
+    def fuse_compare_branch(self, code: List[Line]) -> bool:
+        changed = False
+        i = 0
+        while i + 1 < len(code):
+            a, b = code[i], code[i + 1]
+            # ldc.i4 0; ceq; brtrue к этому моменту уже заменено правилом brfalse
+            op = COMPARE_BRANCHES.get((a.op, b.op))
+            if op is not None:
+                b.op = op
+                del code[i]
+                self.hit('compare branch')
+                changed = True
+            i += 1
+        return changed
+
+    def store_load_dup(self, code: List[Line]) -> bool:
+        changed = False
+        for i in range(len(code) - 1):
+            a, b = code[i], code[i + 1]
+            if a.op in STORE_LOAD and b.op == STORE_LOAD[a.op] and a.arg == b.arg:
+                b.op, b.arg = a.op, a.arg
+                a.op, a.arg = 'dup', None
+                self.hit('dup')
+                changed = True
+        return changed
+
+    @staticmethod
+    def labels(code: List[Line]) -> Dict[str, int]:
+        return {line.label: i for i, line in enumerate(code) if line.label is not None}
+
+    @staticmethod
+    def next_instruction(code: List[Line], i: int) -> Optional[Line]:
+        """Первая инструкция, начиная с позиции i (метки пропускаются)
+        """
+
+        while i < len(code) and code[i].label is not None:
+            i += 1
+        return code[i] if i < len(code) and code[i].op is not None else None
+
+    def thread_jumps(self, code: List[Line]) -> bool:
+        labels = self.labels(code)
+        changed = False
+        for line in code:
+            if line.op not in BRANCHES:
+                continue
+            seen = {line.arg}
+            target = self.next_instruction(code, labels[line.arg] + 1) if line.arg in labels else None
+            while target is not None and target.op == 'br' and target.arg in labels and target.arg not in seen:
+                seen.add(target.arg)
+                line.arg = target.arg
+                self.hit('jump threading')
+                changed = True
+                target = self.next_instruction(code, labels[line.arg] + 1)
+        return changed
+
+    def remove_branch_to_next(self, code: List[Line]) -> bool:
+        changed = False
+        i = 0
+        while i < len(code):
+            line = code[i]
+            if line.op == 'br':
+                j = i + 1
+                while j < len(code) and code[j].label is not None and code[j].label != line.arg:
+                    j += 1
+                if j < len(code) and code[j].label == line.arg:
+                    del code[i]
+                    self.hit('branch to next')
+                    changed = True
+                    continue
+            i += 1
+        return changed
+
+    def remove_unused_labels(self, code: List[Line]) -> bool:
+        used = {line.arg for line in code if line.op in BRANCHES}
+        size = len(code)
+        code[:] = [line for line in code if line.label is None or line.label in used]
+        removed = size - len(code)
+        self.hits['unused label'] += removed
+        return removed > 0
+
+    def short_forms(self, code: List[Line]) -> None:
+        for line in code:
+            if line.op == 'ldc.i4':
+                try:
+                    value = int(line.arg)
+                except ValueError:
+                    continue
+                if -1 <= value <= 8:
+                    line.op, line.arg = 'ldc.i4.' + ('m1' if value == -1 else str(value)), None
+                elif short_int(value):
+                    line.op = 'ldc.i4.s'
+                else:
+                    continue
+                self.hit('ldc.i4 short')
+            elif line.op in VAR_OPS and line.arg is not None and line.arg.isdigit():
+                index = int(line.arg)
+                if index <= 3 and line.op in INDEXED_VAR_OPS:
+                    line.op, line.arg = line.op + '.' + line.arg, None
+                elif index <= 255:
+                    line.op = line.op + '.s'
+                else:
+                    continue
+                self.hit(VAR_OPS[line.op.split('.')[0]])
+
+    def short_branches(self, code: List[Line]) -> None:
+        """Короткие переходы: сначала все переходы короткие, затем слишком далекие удлиняются (до неподвижной точки)
+        """
+
+        branches = [line for line in code if line.op in BRANCHES]
+        if not branches:
+            return
+        short = {id(line) for line in branches}
+        while True:
+            offsets: Dict[str, int] = {}
+            ends: Dict[int, int] = {}
+            offset = 0
+            for line in code:
+                if line.label is not None:
+                    offsets[line.label] = offset
+                elif line.op is not None:
+                    if line.op in BRANCHES:
+                        offset += 2 if id(line) in short else 5
+                        ends[id(line)] = offset
+                    else:
+                        offset += OP_SIZES.get(line.op, UNKNOWN_OP_SIZE)
+            long_ = {id(line) for line in branches if id(line) in short and
+                     (line.arg not in offsets or not short_int(offsets[line.arg] - ends[id(line)]))}
+            if not long_:
+                break
+            short -= long_
+        for line in branches:
+            if id(line) in short:
+                line.op += '.s'
+                self.hit('short branch')
@@ -0,0 +1,401 @@
+"""Генерация исходного текста Python из проверенного AST и выполнение через compile() (app.py --run-py)
+
+Каждая функция (алг) - функция Python f_<имя>, операторы вне функций - функция main; код модуля объявляет
+глобальные переменные (нули типов) и вызывает main. Параметры, локальные переменные и скрытые конечные значения
+циклов для - локальные переменные функций Python (p<индекс>, v<слот>, b<вложенность>), поэтому обращение к ним
+не требует поиска по имени; глобальные переменные программы - глобальные переменные модуля (g<индекс поля _gv>).
+
+Семантика - как у MSIL и встроенной виртуальной машины (sal_vm, общие функции времени выполнения): цел -
+32-битные числа с переполнением, деление отбрасывает дробную часть, и/или вычисляют оба операнда, вещественные
+>= и <= истинны для NaN. нц для без присваиваний переменной цикла в теле выполняется через range.
+
+Объекты кода кэшируются (CodeCache): в памяти процесса и в SAL_CACHE_DIR/python (marshal), ключ - хэш текста
+исходника, флагов компиляции, версии компилятора и версии байт-кода Python.
+"""
+
+import importlib.util
+import marshal
+import os
+import sys
+from types import CodeType
+from typing import Dict, List, Optional, Set, TextIO
+
+import sal_cache
+import visitor
+from sal_ast import AssignNode, AstNode, BinOpNode, BoolNode, CharacterNode, DoWhileNode, ForNode, FuncCallNode, \
+    FuncDeclNode, IdentNode, IfNode, InputNode, NumNode, OutputNode, StmtListNode, StringNode, TypeConvertNode, \
+    VarDeclNode, WhileNode
+from sal_ir import program_fields
+from sal_msil import decls_locals, find_vars_decls, func_locals, res_ident
+from sal_optimizer import int32, int_div
+from sal_semantic_base import BaseType, BinOp, IdentDesc, ScopeType, TypeDesc
+from sal_vm import INPUT_TYPES, ZERO_VALUES, VmException, float_div, format_value, parse_input
+
+MODULE_NAME = '<sal>'
+
+# 32-битное переполнение целых: (x + 2**31 & 2**32 - 1) - 2**31
+INT_WRAP = '(({} + 2147483648 & 4294967295) - 2147483648)'
+
+INT_OPS = {BinOp.ADD: '+', BinOp.SUB: '-', BinOp.MUL: '*'}
+
+OPS = {BinOp.ADD: '+', BinOp.SUB: '-', BinOp.MUL: '*', BinOp.GT: '>', BinOp.LT: '<', BinOp.GE: '>=',
+       BinOp.LE: '<=', BinOp.EQUALS: '==', BinOp.AND: '&', BinOp.OR: '|'}
+
+
+def global_writes(node: Optional[AstNode]) -> Set[int]:
+    """Индексы глобальных переменных, которые изменяются в поддереве (для объявления global)
+    """
+
+    res: Set[int] = set()
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        var = n.var if isinstance(n, (AssignNode, InputNode)) else n.init if isinstance(n, ForNode) else None
+        if var is not None and var.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
+            res.add(var.node_ident.index)
+        stack.extend(n.children)
+    return res
+
+
+def writes_var(node: Optional[AstNode], ident: IdentDesc) -> bool:
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        var = n.var if isinstance(n, (AssignNode, InputNode)) else n.init if isinstance(n, ForNode) else None
+        if var is not None and var.node_ident is ident:
+            return True
+        stack.extend(n.children)
+    return False
+
+
+class PythonGenerator:
+    """Генератор исходного текста Python; реализация для выражения возвращает текст выражения
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.indent = 0
+        self.loop_depth = 0
+
+    def add(self, line: str) -> None:
+        self.lines.append('    ' * self.indent + line)
+
+    def name(self, ident: IdentDesc) -> str:
+        if ident.scope == ScopeType.PARAM:
+            return 'p{}'.format(ident.index)
+        if ident.scope == ScopeType.LOCAL:
+            return 'v{}'.format(ident.index)
+        return 'g{}'.format(ident.index)
+
+    def block(self, node: Optional[AstNode]):
+        """Тело составного оператора с отступом (генератор для yield from); пустое тело - pass
+        """
+
+        self.indent += 1
+        count = len(self.lines)
+        if node is not None:
+            yield node
+        if len(self.lines) == count:
+            self.add('pass')
+        self.indent -= 1
+
+    def start_function(self, header: str, locals_types: List[BaseType], writes: Set[int]) -> None:
+        self.add(header)
+        self.indent += 1
+        self.loop_depth = 0
+        if writes:
+            self.add('global ' + ', '.join('g{}'.format(i) for i in sorted(writes)))
+        # переменные, которые читаются до присваивания, равны нулю типа (как в .locals init)
+        for i, type_ in enumerate(locals_types):
+            self.add('v{} = {!r}'.format(i, ZERO_VALUES[type_]))
+
+    def gen_program(self, prog: StmtListNode) -> str:
+        for ident in program_fields(prog):
+            self.add('g{} = {!r}'.format(ident.index, ZERO_VALUES[ident.type.base_type]))
+        for stmt in prog.stmts:
+            if isinstance(stmt, FuncDeclNode):
+                self.add('')
+                self.add('')
+                self.py_gen(stmt)
+
+        main_stmts = [stmt for stmt in prog.stmts if not isinstance(stmt, FuncDeclNode)]
+        locals_types = decls_locals([decl for stmt in main_stmts
+                                     for decl in ([stmt] if isinstance(stmt, VarDeclNode) else find_vars_decls(stmt))])
+        self.add('')
+        self.add('')
+        self.start_function('def main():', locals_types, set().union(*(global_writes(stmt) for stmt in main_stmts)))
+        count = len(self.lines)
+        for stmt in main_stmts:
+            res = self.py_gen(stmt)
+            if res is not None:
+                self.add(res)
+        if len(self.lines) == count:
+            self.add('pass')
+        self.indent -= 1
+        self.add('')
+        self.add('')
+        self.add('main()')
+        return '\n'.join(self.lines) + '\n'
+
+    @visitor.on('node')
+    def py_gen(self, node):
+        pass
+
+    @visitor.when(AstNode)
+    def py_gen(self, node: AstNode) -> None:
+        raise VmException('{} не поддерживается генератором Python'.format(node))
+
+    @visitor.when(NumNode)
+    def py_gen(self, node: NumNode) -> str:
+        return repr(node.value) if node.value >= 0 else '({!r})'.format(node.value)
+
+    @visitor.when(BoolNode)
+    def py_gen(self, node: BoolNode) -> str:
+        return 'True' if node.value else 'False'
+
+    @visitor.when(StringNode)
+    def py_gen(self, node: StringNode) -> str:
+        # значения строк и символов хранятся вместе с кавычками
+        return repr(node.value[1:-1])
+
+    @visitor.when(CharacterNode)
+    def py_gen(self, node: CharacterNode) -> str:
+        return repr(node.value[1:-1])
+
+    @visitor.when(IdentNode)
+    def py_gen(self, node: IdentNode) -> str:
+        return self.name(node.node_ident)
+
+    @visitor.when(BinOpNode)
+    def py_gen(self, node: BinOpNode) -> str:
+        a = yield node.arg1
+        b = yield node.arg2
+        type_ = node.arg1.node_type.base_type
+        if type_ == BaseType.INT and node.op in INT_OPS:
+            return INT_WRAP.format('{} {} {}'.format(a, INT_OPS[node.op], b))
+        if node.op == BinOp.DIV:
+            return '{}({}, {})'.format('_div' if type_ == BaseType.INT else '_fdiv', a, b)
+        if type_ == BaseType.FLOAT and node.op in (BinOp.GE, BinOp.LE):
+            # как clt/cgt + ceq 0 в MSIL: для NaN истинно
+            return '(not {} {} {})'.format(a, '<' if node.op == BinOp.GE else '>', b)
+        op = OPS.get(node.op)
+        if op is None:
+            raise VmException('Операция {} не поддерживается'.format(node.op.value))
+        return '({} {} {})'.format(a, op, b)
+
+    @visitor.when(TypeConvertNode)
+    def py_gen(self, node: TypeConvertNode) -> str:
+        a = yield node.expr
+        from_type, to_type = node.expr.node_type.base_type, node.node_type.base_type
+        if to_type == BaseType.STR:
+            return a if from_type == BaseType.CHAR else '_fmt({})'.format(a)
+        if (from_type, to_type) == (BaseType.INT, BaseType.FLOAT):
+            return 'float({})'.format(a)
+        if (from_type, to_type) == (BaseType.INT, BaseType.BOOL):
+            return '({} != 0)'.format(a)
+        raise VmException('Преобразование {} в {} не поддерживается'.format(node.expr.node_type, node.node_type))
+
+    @visitor.when(FuncCallNode)
+    def py_gen(self, node: FuncCallNode) -> str:
+        if node.name.node_ident.built_in:
+            raise VmException('Встроенная функция {} не поддерживается'.format(node.name.name))
+        args = []
+        for param in node.params:
+            args.append((yield param))
+        return 'f_{}({})'.format(node.name.name, ', '.join(args))
+
+    @visitor.when(AssignNode)
+    def py_gen(self, node: AssignNode) -> None:
+        value = yield node.val
+        self.add('{} = {}'.format(self.name(node.var.node_ident), value))
+
+    @visitor.when(VarDeclNode)
+    def py_gen(self, node: VarDeclNode) -> None:
+        for var in node.vars:
+            if isinstance(var, AssignNode) and var.val is not None:
+                yield var
+
+    @visitor.when(StmtListNode)
+    def py_gen(self, node: StmtListNode) -> None:
+        for stmt in node.stmts:
+            res = yield stmt
+            # выражение-оператор (например, вызов функции с результатом)
+            if res is not None:
+                self.add(res)
+
+    @visitor.when(OutputNode)
+    def py_gen(self, node: OutputNode) -> None:
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        self.add('_print({})'.format(', '.join(args)))
+
+    @visitor.when(InputNode)
+    def py_gen(self, node: InputNode) -> None:
+        self.add('{} = _input({})'.format(self.name(node.var.node_ident),
+                                          INPUT_TYPES.index(node.var.node_type.base_type)))
+
+    @visitor.when(IfNode)
+    def py_gen(self, node: IfNode) -> None:
+        cond = yield node.cond
+        self.add('if {}:'.format(cond))
+        yield from self.block(node.then_stmt)
+        if node.else_stmt:
+            self.add('else:')
+            yield from self.block(node.else_stmt)
+
+    @visitor.when(WhileNode)
+    def py_gen(self, node: WhileNode) -> None:
+        cond = yield node.cond
+        self.add('while {}:'.format(cond))
+        yield from self.block(node.body)
+
+    @visitor.when(DoWhileNode)
+    def py_gen(self, node: DoWhileNode) -> None:
+        self.add('while True:')
+        self.indent += 1
+        if node.body is not None:
+            yield node.body
+        cond = yield node.cond
+        self.add('if not {}:'.format(cond))
+        self.add('    break')
+        self.indent -= 1
+
+    @visitor.when(ForNode)
+    def py_gen(self, node: ForNode) -> None:
+        var = node.init.node_ident
+        name = self.name(var)
+        bound = 'b{}'.format(self.loop_depth)
+        start = yield node.cond
+        self.add('{} = {}'.format(name, start))
+        end = yield node.step
+        self.add('{} = {}'.format(bound, end))
+        self.loop_depth += 1
+        if var.scope in (ScopeType.PARAM, ScopeType.LOCAL) and not writes_var(node.body, var):
+            # после цикла переменная на 1 больше конечного значения (если тело выполнялось)
+            self.add('for {0} in range({0}, {1} + 1):'.format(name, bound))
+            yield from self.block(node.body)
+            self.add('if {} <= {}:'.format(name, bound))
+            self.add('    {} = {} + 1'.format(name, bound))
+        else:
+            self.add('while {} <= {}:'.format(name, bound))
+            yield from self.block(node.body)
+            self.indent += 1
+            self.add('{} = {}'.format(name, INT_WRAP.format(name + ' + 1')))
+            self.indent -= 1
+        self.loop_depth -= 1
+
+    @visitor.when(FuncDeclNode)
+    def py_gen(self, node: FuncDeclNode) -> None:
+        params = [var.node_ident for decl in node.params.vars for var in decl.vars]
+        self.start_function('def f_{}({}):'.format(node.name.name, ', '.join(self.name(p) for p in params)),
+                            func_locals(node), global_writes(node.body))
+        count = len(self.lines)
+        if node.body is not None:
+            yield node.body
+        if node.res is not None:
+            self.add('return ' + self.name(res_ident(node)))
+        elif node.type.type != TypeDesc.VOID:
+            self.add('return {!r}'.format(ZERO_VALUES[node.type.type.base_type]))
+        elif len(self.lines) == count:
+            self.add('pass')
+        self.indent -= 1
+
+
+def gen_program(prog: StmtListNode) -> str:
+    return PythonGenerator().gen_program(prog)
+
+
+def compile_source(source: str) -> CodeType:
+    try:
+        return compile(source, MODULE_NAME, 'exec')
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        raise VmException('Программа не компилируется в Python: {}'.format(e))
+
+
+def idiv(a: int, b: int) -> int:
+    return int32(int_div(a, b))
+
+
+def run(code: CodeType, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> Dict[str, object]:
+    """Выполнение объекта кода программы
+    :return: пространство имен модуля (глобальные переменные программы - g<индекс>)
+    """
+
+    stdin = stdin if stdin is not None else sys.stdin
+    stdout = stdout if stdout is not None else sys.stdout
+
+    def print_(*values) -> None:
+        stdout.write(''.join(format_value(value) for value in values) + '\n')
+
+    def input_(type_index: int):
+        line = stdin.readline()
+        if not line:
+            raise VmException('Нет входных данных для ввода')
+        return parse_input(line.rstrip('\r\n'), INPUT_TYPES[type_index])
+
+    namespace = {'__name__': MODULE_NAME, '_div': idiv, '_fdiv': float_div, '_fmt': format_value,
+                 '_print': print_, '_input': input_}
+    try:
+        exec(code, namespace)
+    except ZeroDivisionError:
+        raise VmException('Деление на ноль')
+    except RecursionError:
+        raise VmException('Переполнение стека вызовов')
+    return namespace
+
+
+def program_globals(namespace: Dict[str, object]) -> Dict[int, object]:
+    """Значения глобальных переменных программы по индексам полей _gv
+    """
+
+    return {int(name[1:]): value for name, value in namespace.items() if name[:1] == 'g' and name[1:].isdigit()}
+
+
+class CodeCache:
+    """Объекты кода программ: в памяти процесса и на диске (marshal), ключ - хэш исходника и флагов (UnitCache.key)
+    и версии байт-кода Python
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory or sal_cache.cache_path('python')
+        self.memory: Dict[str, CodeType] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(src: str, flags: str = '') -> str:
+        return sal_cache.UnitCache.key(src, '{} py {}'.format(flags, importlib.util.MAGIC_NUMBER.hex()))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.marshal')
+
+    def get(self, key: str) -> Optional[CodeType]:
+        code = self.memory.get(key)
+        if code is None and self.directory:
+            try:
+                with open(self.path(key), mode='rb') as f:
+                    code = marshal.loads(f.read())
+                self.memory[key] = code
+            except (OSError, EOFError, ValueError, TypeError):
+                pass
+        if code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return code
+
+    def put(self, key: str, code: CodeType) -> None:
+        self.memory[key] = code
+        if self.directory:
+            try:
+                sal_cache.atomic_write(self.path(key), marshal.dumps(code))
+            except OSError:
+                pass
+
+    def report(self) -> str:
+        return 'hits: {}, misses: {}, in memory: {}'.format(self.hits, self.misses, len(self.memory))
@@ -0,0 +1,134 @@
+"""Распределение слотов локальных переменных функции (включается ключом -O1)
+
+IdentScope.add_ident нумерует локальные переменные функции подряд, поэтому переменные из соседних блоков
+(например, из разных ветвей если) занимают разные слоты. Здесь для каждой локальной переменной
+вычисляется интервал жизни в порядке обхода тела функции, и переменные с непересекающимися интервалами
+и одинаковым типом получают один слот (IdentDesc.index). По индексам CodeGenerator строит .locals init.
+
+Интервал переменной - от объявления до последнего использования. Переменная без инициализации живет
+с начала функции (.locals init обнуляет слот только при входе в функцию), переменная-результат (рез) - все тело.
+Если переменная, объявленная вне цикла, используется в цикле, ее интервал продлевается до конца цикла.
+
+Локальные переменные основной программы (Main) появляются только при встраивании функций (sal_inline)
+и распределяются так же.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sal_ast import AssignNode, AstNode, DoWhileNode, ForNode, FuncDeclNode, IdentNode, StmtListNode, \
+    VarDeclNode, WhileNode
+from sal_semantic_base import BaseType, IdentDesc, ScopeType
+
+LOOP_NODES = (WhileNode, DoWhileNode, ForNode)
+
+
+class LiveRange:
+    __slots__ = ('ident', 'start', 'end')
+
+    def __init__(self, ident: IdentDesc, start: int) -> None:
+        self.ident = ident
+        self.start = start
+        self.end = start
+
+
+def live_ranges(body: AstNode, results: Iterable[IdentDesc] = ()) -> List[LiveRange]:
+    """Интервалы жизни локальных переменных тела функции (позиции - номера узлов в порядке обхода)
+    :param results: переменные-результаты (живут все тело)
+    """
+
+    ranges: Dict[IdentDesc, LiveRange] = {}
+    # переменные по именам - для идентификаторов в непроверенных узлах (описание идентификатора неизвестно)
+    by_name: Dict[str, List[LiveRange]] = {}
+    loops: List[Tuple[int, int]] = []
+
+    def declare(ident: Optional[IdentDesc], pos: int) -> None:
+        if ident is not None and ident.scope == ScopeType.LOCAL and ident not in ranges:
+            ranges[ident] = LiveRange(ident, pos)
+            by_name.setdefault(ident.name, []).append(ranges[ident])
+
+    results = list(results)
+    for ident in results:
+        declare(ident, 0)
+
+    pos = 0
+    # элементы стека: (узел, None) - вход в узел, (None, начало цикла) - выход из цикла
+    stack: List[Tuple[Optional[AstNode], int]] = [(body, 0)]
+    while stack:
+        n, loop_start = stack.pop()
+        if n is None:
+            loops.append((loop_start, pos))
+            continue
+        pos += 1
+        if isinstance(n, VarDeclNode):
+            for var in n.vars:
+                if var is None:
+                    continue
+                if isinstance(var, AssignNode):
+                    declare(var.var.node_ident, pos)
+                else:
+                    declare(var.node_ident, 0)
+        elif isinstance(n, IdentNode):
+            if n.node_ident is not None:
+                live = ranges.get(n.node_ident)
+                if live is not None:
+                    live.end = pos
+            else:
+                for live in by_name.get(n.name, ()):
+                    live.end = pos
+        if isinstance(n, LOOP_NODES):
+            stack.append((None, pos))
+        stack.extend((child, 0) for child in reversed(n.children) if child is not None)
+    end = pos + 1
+
+    for ident in results:
+        ranges[ident].end = end
+    # значения переменных, объявленных до цикла, переходят на следующую итерацию
+    for loop_start, loop_end in loops:
+        for live in ranges.values():
+            if live.start < loop_start <= live.end:
+                live.end = max(live.end, loop_end)
+    return list(ranges.values())
+
+
+def allocate_slots(body: AstNode, results: Iterable[IdentDesc] = ()) -> List[BaseType]:
+    """Назначение слотов локальным переменным тела функции
+    :return: типы слотов (по индексам)
+    """
+
+    slots: List[BaseType] = []
+    slot_ends: List[int] = []
+    for live in sorted(live_ranges(body, results), key=lambda r: (r.start, r.ident.index)):
+        type_ = live.ident.type.base_type
+        for i, slot_type in enumerate(slots):
+            if slot_type == type_ and slot_ends[i] < live.start:
+                break
+        else:
+            i = len(slots)
+            slots.append(type_)
+            slot_ends.append(0)
+        live.ident.index = i
+        slot_ends[i] = live.end
+    return slots
+
+
+def allocate_locals(node: FuncDeclNode) -> List[BaseType]:
+    if node.body is None:
+        return []
+    results = [] if node.res is None else \
+        [(var.var if isinstance(var, AssignNode) else var).node_ident for var in node.res.res.vars]
+    return allocate_slots(node.body, results)
+
+
+def allocate_program(node: AstNode, skip: Optional[Dict[FuncDeclNode, List[str]]] = None) -> None:
+    """Распределение слотов во всех функциях (node - функция или программа)
+    :param skip: функции, код которых уже сгенерирован (инкрементальная компиляция)
+    """
+
+    funcs = [node] if isinstance(node, FuncDeclNode) else \
+        [stmt for stmt in node.stmts if isinstance(stmt, FuncDeclNode)] if isinstance(node, StmtListNode) else []
+    for func in funcs:
+        if not (skip and func in skip):
+            allocate_locals(func)
+    if isinstance(node, StmtListNode):
+        # основная программа: операторы вне функций
+        allocate_slots(StmtListNode(*(stmt for stmt in node.stmts if not isinstance(stmt, FuncDeclNode))))
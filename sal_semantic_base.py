@@ -1,4 +1,4 @@
-from typing import Tuple, Any, Dict, Optional
+from typing import Tuple, Any, Dict, List, Optional
 from enum import Enum
 
 
@@ -47,8 +47,13 @@ class TypeDesc:
 
        Сейчас поддерживаются только примитивные типы данных и функции.
        При поддержки сложных типов (массивы и т.п.) должен быть рассширен
+
+       Типы интернируются: TypeDesc(...) для структурно равных типов возвращает один и тот же объект,
+       поэтому сравнение типов - сравнение ссылок, а типы можно использовать как ключи словарей
     """
 
+    __slots__ = ('base_type', 'return_type', 'params', '__weakref__')
+
     VOID: 'TypeDesc'
     INT: 'TypeDesc'
     FLOAT: 'TypeDesc'
@@ -56,11 +61,30 @@ class TypeDesc:
     STR: 'TypeDesc'
     CHAR: 'TypeDesc'
 
-    def __init__(self, base_type_: Optional[BaseType] = None,
-                 return_type: Optional['TypeDesc'] = None, params: Optional[Tuple['TypeDesc']] = None) -> None:
-        self.base_type = base_type_
-        self.return_type = return_type
-        self.params = params
+    _instances: Dict[tuple, 'TypeDesc'] = {}
+
+    def __new__(cls, base_type_: Optional[BaseType] = None,
+                return_type: Optional['TypeDesc'] = None, params: Optional[Tuple['TypeDesc', ...]] = None) -> 'TypeDesc':
+        if params is not None:
+            params = tuple(params)
+        key = (base_type_, return_type, params)
+        type_ = cls._instances.get(key)
+        if type_ is None:
+            type_ = super().__new__(cls)
+            type_.base_type = base_type_
+            type_.return_type = return_type
+            type_.params = params
+            type_ = cls._instances.setdefault(key, type_)
+        return type_
+
+    def __reduce__(self):
+        return TypeDesc, (self.base_type, self.return_type, self.params)
+
+    def __copy__(self) -> 'TypeDesc':
+        return self
+
+    def __deepcopy__(self, memo) -> 'TypeDesc':
+        return self
 
     @property
     def func(self) -> bool:
@@ -70,21 +94,6 @@ class TypeDesc:
     def is_simple(self) -> bool:
         return not self.func
 
-    def __eq__(self, other: 'TypeDesc'):
-        if self.func != other.func:
-            return False
-        if not self.func:
-            return self.base_type == other.base_type
-        else:
-            if self.return_type != other.return_type:
-                return False
-            if len(self.params) != len(other.params):
-                return False
-            for i in range(len(self.params)):
-                if self.params[i] != other.params[i]:
-                    return False
-            return True
-
     @staticmethod
     def from_base_type(base_type_: BaseType) -> 'TypeDesc':
         return getattr(TypeDesc, base_type_.name)
@@ -143,16 +152,95 @@ class IdentDesc:
         return '{}, {}, {}'.format(self.type, self.scope, 'built-in' if self.built_in else self.index)
 
 
+class IdentTable:
+    """Общая для всех областей видимости таблица идентификаторов: имя -> стек описаний (глубина области, описание),
+       от внешних областей к внутренним. Поиск - O(1) (вершина стека), при выходе из области ее идентификаторы
+       снимаются со стеков по журналу (списку имен области)
+    """
+
+    def __init__(self) -> None:
+        self.names: Dict[str, List[Tuple[int, IdentDesc]]] = {}
+        # активные области видимости (цепочка от глобальной до текущей)
+        self.scopes: List['IdentScope'] = []
+
+    def enter(self, scope: 'IdentScope') -> None:
+        # области, не закрытые явно (например, соседний блок), закрываются при входе в новую
+        while self.scopes and self.scopes[-1] is not scope.parent:
+            self.exit(self.scopes[-1])
+        self.scopes.append(scope)
+
+    def exit(self, scope: 'IdentScope') -> None:
+        while self.scopes:
+            top = self.scopes.pop()
+            names = self.names
+            for name in top.idents:
+                stack = names[name]
+                stack.pop()
+                if not stack:
+                    del names[name]
+            if top is scope:
+                break
+
+    def push(self, scope: 'IdentScope', ident: IdentDesc) -> None:
+        stack = self.names.get(ident.name)
+        if stack is None:
+            self.names[ident.name] = [(scope.depth, ident)]
+            return
+        # объявление во внешней области (например, функции в глобальной) - ниже описаний внутренних областей
+        i = len(stack)
+        while i > 0 and stack[i - 1][0] > scope.depth:
+            i -= 1
+        stack.insert(i, (scope.depth, ident))
+
+    def get(self, scope: 'IdentScope', name: str) -> Optional[IdentDesc]:
+        stack = self.names.get(name)
+        if not stack:
+            return None
+        depth, ident = stack[-1]
+        if depth <= scope.depth:
+            return ident
+        for depth, ident in reversed(stack):
+            if depth <= scope.depth:
+                return ident
+        return None
+
+
 class IdentScope:
     """Класс для представлений областей видимости переменных во время семантического анализа
+
+    Области одной программы используют общую IdentTable. Создание области - вход в нее,
+    выход - exit() (или неявно, при входе в соседнюю область)
     """
 
     def __init__(self, parent: Optional['IdentScope'] = None) -> None:
         self.idents: Dict[str, IdentDesc] = {}
-        self.func: Optional[IdentDesc] = None
         self.parent = parent
         self.var_index = 0
         self.param_index = 0
+        self._func: Optional[IdentDesc] = None
+        if parent is None:
+            self.table = IdentTable()
+            self.depth = 0
+            self.global_scope = self
+            self.func_scope: Optional[IdentScope] = None
+        else:
+            self.table = parent.table
+            self.depth = parent.depth + 1
+            self.global_scope = parent.global_scope
+            self.func_scope = parent.func_scope
+        self.table.enter(self)
+
+    @property
+    def func(self) -> Optional[IdentDesc]:
+        return self._func
+
+    @func.setter
+    def func(self, func: Optional[IdentDesc]) -> None:
+        self._func = func
+        self.func_scope = self if func else self.parent.func_scope if self.parent else None
+
+    def exit(self) -> None:
+        self.table.exit(self)
 
     @property
     def is_global(self) -> bool:
@@ -160,21 +248,15 @@ class IdentScope:
 
     @property
     def curr_global(self) -> 'IdentScope':
-        curr = self
-        while curr.parent:
-            curr = curr.parent
-        return curr
+        return self.global_scope
 
     @property
     def curr_func(self) -> Optional['IdentScope']:
-        curr = self
-        while curr and not curr.func:
-            curr = curr.parent
-        return curr
+        return self.func_scope
 
     def add_ident(self, ident: IdentDesc) -> IdentDesc:
-        func_scope = self.curr_func
-        global_scope = self.curr_global
+        func_scope = self.func_scope
+        global_scope = self.global_scope
 
         if ident.scope != ScopeType.PARAM:
             ident.scope = ScopeType.LOCAL if func_scope else \
@@ -203,18 +285,23 @@ class IdentScope:
                 ident.index = ident_scope.var_index
                 ident_scope.var_index += 1
 
-        self.idents[ident.name] = ident
+        self.put(ident)
         return ident
 
+    def put(self, ident: IdentDesc) -> None:
+        """Добавление уже описанного идентификатора (без проверок и нумерации)
+        """
+
+        if ident.name in self.idents:
+            # повторное добавление в ту же область замещает прежнее описание
+            stack = self.table.names[ident.name]
+            stack[[i for i, (depth, _) in enumerate(stack) if depth == self.depth][0]] = (self.depth, ident)
+        else:
+            self.table.push(self, ident)
+        self.idents[ident.name] = ident
+
     def get_ident(self, name: str) -> Optional[IdentDesc]:
-        scope = self
-        ident = None
-        while scope:
-            ident = scope.idents.get(name)
-            if ident:
-                break
-            scope = scope.parent
-        return ident
+        return self.table.get(self, name)
 
 
 class SemanticException(Exception):
@@ -222,6 +309,8 @@ class SemanticException(Exception):
     """
 
     def __init__(self, message, row: int = None, col: int = None, **kwargs: Any) -> None:
+        self.row = row
+        self.col = col
         if row or col:
             message += " ("
             if row:
@@ -237,7 +326,8 @@ class SemanticException(Exception):
 TYPE_CONVERTIBILITY = {
     INT: (FLOAT, BOOL, STR),
     FLOAT: (STR,),
-    BOOL: (STR,)
+    BOOL: (STR,),
+    CHAR: (STR,)
 }
 
 
@@ -1,11 +1,10 @@
-from tkinter.messagebox import NO
-from typing import Optional, List
-from xml.dom.minidom import CharacterData
+import threading
+from typing import Optional, List, Dict
 
 import visitor
 from sal_ast import AstNode, CharacterNode, CompareOpNode, LogOpNode, NumNode, StmtListNode, ExprNode, FuncCallNode, ForNode, IfNode, ParamsNode, IdentNode, \
     BinOpNode, AssignNode, ResNode, FuncDeclNode, EMPTY_IDENT, StringNode, TypeConvertNode, TypeNode, EMPTY_STMT, BoolNode, VarDeclNode, \
-    WhileNode
+    WhileNode, DoWhileNode, OutputNode, InputNode
 from sal_semantic_base import IdentScope, ScopeType, TypeDesc, BIN_OP_TYPE_COMPATIBILITY, TYPE_CONVERTIBILITY, IdentDesc, \
     SemanticException
 
@@ -33,6 +32,29 @@ def type_convert(expr: ExprNode, type_: TypeDesc, except_node: Optional[AstNode]
             expr.node_type, type_, ' ({})'.format(comment) if comment else ''
         ))
 
+def declare_func(node: FuncDeclNode, type_: TypeDesc, scope: IdentScope) -> None:
+    func_ident = IdentDesc(node.name.name, type_)
+    node.name.node_type = type_
+    try:
+        node.name.node_ident = scope.curr_global.add_ident(func_ident)
+    except SemanticException:
+        node.name.semantic_error(f'Повторное объявление функции {node.name.name}')
+
+
+def declare_funcs(prog: StmtListNode, scope: IdentScope) -> None:
+    """Объявление всех функций программы до проверки операторов (функцию можно вызывать до ее описания)
+    """
+
+    for stmt in prog.stmts:
+        if not isinstance(stmt, FuncDeclNode):
+            continue
+        types = [stmt.type] + [param.type for param in stmt.params.vars]
+        for type_node in types:
+            if type_node.type is None:
+                type_node.semantic_error(f'Неизвестный тип {type_node.name}')
+        declare_func(stmt, TypeDesc(None, stmt.type.type, tuple(t.type for t in types[1:])), scope)
+
+
 class SemanticChecker:
     @visitor.on('AstNode')
     def semantic_check(self, AstNode):
@@ -77,8 +99,8 @@ class SemanticChecker:
 
     @visitor.when(BinOpNode)
     def semantic_check(self, node: BinOpNode, scope: IdentScope):
-        node.arg1.semantic_check(self, scope)
-        node.arg2.semantic_check(self, scope)
+        yield node.arg1, scope
+        yield node.arg2, scope
 
         if node.arg1.node_type.is_simple or node.arg2.node_type.is_simple:
             compatibility = BIN_OP_TYPE_COMPATIBILITY[node.op]
@@ -96,10 +118,10 @@ class SemanticChecker:
                         return
 
             if node.arg2.node_type.base_type in TYPE_CONVERTIBILITY:
-                for arg2_type in TYPE_CONVERTIBILITY[node.arg1.node_type.base_type]:
-                    args_types = (node.arg2.node_type.base_type, arg2_type)
+                for arg2_type in TYPE_CONVERTIBILITY[node.arg2.node_type.base_type]:
+                    args_types = (node.arg1.node_type.base_type, arg2_type)
                     if args_types in compatibility:
-                        node.arg2 = type_convert(node.arg1, TypeDesc.from_base_type(arg2_type))
+                        node.arg2 = type_convert(node.arg2, TypeDesc.from_base_type(arg2_type))
                         node.node_type = TypeDesc.from_base_type(compatibility[args_types])
                         return
 
@@ -107,8 +129,8 @@ class SemanticChecker:
 
     @visitor.when(LogOpNode)
     def semantic_check(self, node: LogOpNode, scope: IdentScope) -> None:
-        node.arg1.semantic_check(self, scope)
-        node.arg2.semantic_check(self, scope)
+        yield node.arg1, scope
+        yield node.arg2, scope
         if node.arg1.node_type.is_simple or node.arg2.node_type.is_simple:
             compatibility = BIN_OP_TYPE_COMPATIBILITY[node.op]
             args_types = (node.arg1.node_type.base_type, node.arg2.node_type.base_type)
@@ -118,8 +140,8 @@ class SemanticChecker:
 
     @visitor.when(CompareOpNode)
     def semantic_check(self, node: CompareOpNode, scope: IdentScope) -> None:
-        node.arg1.semantic_check(self, scope)
-        node.arg2.semantic_check(self, scope)
+        yield node.arg1, scope
+        yield node.arg2, scope
         if node.arg1.node_type.is_simple or node.arg2.node_type.is_simple:
             compatibility = BIN_OP_TYPE_COMPATIBILITY[node.op]
             args_types = (node.arg1.node_type.base_type, node.arg2.node_type.base_type)
@@ -129,10 +151,10 @@ class SemanticChecker:
 
     @visitor.when(AssignNode)
     def semantic_check(self, node: AssignNode, scope: IdentScope):
-        node.var.semantic_check(self, scope)
+        yield node.var, scope
         if node.var.name == 'flag' and node.val is None:
             pass
-        node.val.semantic_check(self, scope)
+        yield node.val, scope
         node.val = type_convert(node.val, node.var.node_type, node, 'присваиваемое значение')
         if node.var.name == 'flag':
             pass
@@ -140,7 +162,7 @@ class SemanticChecker:
 
     @visitor.when(VarDeclNode)
     def semantic_check(self, node: VarDeclNode, scope: IdentScope):
-        node.type.semantic_check(self, scope)
+        yield node.type, scope
         for var in node.vars:
             if var is None:
                 pass
@@ -150,13 +172,13 @@ class SemanticChecker:
                 scope.add_ident(IdentDesc(var_node.name, node.type.type))
             except SemanticException as e:
                 var_node.semantic_error(e.message)
-            var.semantic_check(self, scope)
+            yield var, scope
         node.node_type = TypeDesc.VOID
 
     @visitor.when(ParamsNode)
     def semantic_check(self, node: ParamsNode, scope: IdentScope):
         for var in node.vars:
-            var.type.semantic_check(self, scope)
+            yield var.type, scope
         node.node_type = TypeDesc.VOID
 
     @visitor.when(ResNode)
@@ -174,7 +196,7 @@ class SemanticChecker:
         # except SemanticException:
         #     raise node.name.semantic_error('Ошибка в ResNode')
         i = 3
-        node.res.semantic_check(self, scope)
+        yield node.res, scope
         node.node_type = TypeDesc.VOID
 
     @visitor.when(FuncDeclNode)
@@ -183,64 +205,101 @@ class SemanticChecker:
             node.semantic_error(f'Объявление функции ({node.name.name}) внутри другой функции не поддерживается')
         parent_scope = scope
         # if 1 or node.res is not None:
-        node.type.semantic_check(self, scope)
+        yield node.type, scope
         scope = IdentScope(scope)
         scope.func = EMPTY_IDENT
         params: List[TypeDesc] = []
         for param in node.params:
             if param is None:
                 break
-            param.semantic_check(self, scope)
+            # параметры - аргументы метода (ldarg/starg), а не локальные переменные
+            yield param.type, scope
+            for var in param.vars:
+                var_node: IdentNode = var.var if isinstance(var, AssignNode) else var
+                try:
+                    scope.add_ident(IdentDesc(var_node.name, param.type.type, ScopeType.PARAM))
+                except SemanticException as e:
+                    var_node.semantic_error(e.message)
+                yield var, scope
+            param.node_type = TypeDesc.VOID
             params.append(param.type.type)
 
         if node.res is not None:
-            node.res.semantic_check(self, scope)
-
-        type_ = TypeDesc(None, node.type.type, tuple(params))
-        func_ident = IdentDesc(node.name.name, type_)
-        scope.func = func_ident
-        node.name.node_type = type_
-        try:
-            node.name.node_ident = parent_scope.curr_global.add_ident(func_ident)
-        except SemanticException as e:
-            node.name.semantic_error(f'Повторное объявление функции {node.name.name}')
-        node.body.semantic_check(self, scope)
+            yield node.res, scope
+
+        if node.name.node_ident is None:
+            type_ = TypeDesc(None, node.type.type, tuple(params))
+            declare_func(node, type_, parent_scope)
+        scope.func = node.name.node_ident
+        yield node.body, scope
+        scope.exit()
         node.node_type = TypeDesc.VOID
 
     @visitor.when(StmtListNode)
     def semantic_check(self, node: StmtListNode, scope: IdentScope):
-        if not node.program:
-            scope = IdentScope(scope)
+        # область видимости нужна только блоку, в котором есть объявления
+        block_scope = None
+        if node.program or scope.is_global:
+            declare_funcs(node, scope)
+        if not node.program and any(isinstance(stmt, VarDeclNode) for stmt in node.stmts):
+            scope = block_scope = IdentScope(scope)
         for stmt in node.stmts:
-            stmt.semantic_check(self, scope)
+            yield stmt, scope
+        if block_scope is not None:
+            block_scope.exit()
         node.node_type = TypeDesc.VOID
 
+    # тела если/нц - StmtListNode (блок сам создает свою область видимости)
+    # нц для init от cond до step: init - переменная цикла, cond и step - начальное и конечное значения
     @visitor.when(ForNode)
     def semantic_check(self, node: ForNode, scope: IdentScope):
-        scope = IdentScope(scope)
-        node.init.semantic_check(self, scope)
-        if node.cond == EMPTY_STMT:
-            node.cond = BoolNode('да')
-        node.cond.semantic_check(self, scope)
-        node.cond = type_convert(node.cond, TypeDesc.BOOL, None, 'условие')
-        node.step.semantic_check(self, scope)
-        node.body.semantic_check(self, IdentScope(scope))
+        yield node.init, scope
+        if node.init.node_type != TypeDesc.INT:
+            node.init.semantic_error('Переменная цикла {} должна быть целой'.format(node.init.name))
+        yield node.cond, scope
+        node.cond = type_convert(node.cond, TypeDesc.INT, None, 'начальное значение')
+        yield node.step, scope
+        node.step = type_convert(node.step, TypeDesc.INT, None, 'конечное значение')
+        yield node.body, scope
         node.node_type = TypeDesc.VOID
 
     @visitor.when(IfNode)
     def semantic_check(self, node: IfNode, scope: IdentScope):
-        node.cond.semantic_check(self, scope)
+        yield node.cond, scope
         node.cond = type_convert(node.cond, TypeDesc.BOOL, None, 'условие')
-        node.then_stmt.semantic_check(self, IdentScope(scope))
+        yield node.then_stmt, scope
         if node.else_stmt:
-            node.else_stmt.semantic_check(self, IdentScope(scope))
+            yield node.else_stmt, scope
         node.node_type = TypeDesc.VOID
 
     @visitor.when(WhileNode)
     def semantic_check(self, node: WhileNode, scope: IdentScope):
-        node.cond.semantic_check(self, scope)
+        yield node.cond, scope
         node.cond = type_convert(node.cond, TypeDesc.BOOL, None, 'условие')
-        node.body.semantic_check(self, IdentScope(scope))
+        yield node.body, scope
+        node.node_type = TypeDesc.VOID
+
+    # нц ... кц_при cond: тело повторяется, пока условие истинно
+    @visitor.when(DoWhileNode)
+    def semantic_check(self, node: DoWhileNode, scope: IdentScope):
+        yield node.body, scope
+        yield node.cond, scope
+        node.cond = type_convert(node.cond, TypeDesc.BOOL, None, 'условие')
+        node.node_type = TypeDesc.VOID
+
+    @visitor.when(OutputNode)
+    def semantic_check(self, node: OutputNode, scope: IdentScope):
+        for arg in node.args:
+            yield arg, scope
+            if not arg.node_type.is_simple or arg.node_type == TypeDesc.VOID:
+                arg.semantic_error('Значение типа {} не может быть выведено'.format(arg.node_type))
+        node.node_type = TypeDesc.VOID
+
+    @visitor.when(InputNode)
+    def semantic_check(self, node: InputNode, scope: IdentScope):
+        yield node.var, scope
+        if not node.var.node_type.is_simple or node.var.node_type == TypeDesc.VOID:
+            node.var.semantic_error('Идентификатор {} не является переменной'.format(node.var.name))
         node.node_type = TypeDesc.VOID
 
     @visitor.when(FuncCallNode)
@@ -256,21 +315,17 @@ class SemanticChecker:
             ))
         params = []
         error = False
-        decl_params_str = fact_params_str = ''
         for i in range(len(node.params)):
             param: ExprNode = node.params[i]
-            param.semantic_check(self, scope)
-            if len(decl_params_str) > 0:
-                decl_params_str += ', '
-            decl_params_str += str(func.type.params[i])
-            if len(fact_params_str) > 0:
-                fact_params_str += ', '
-            fact_params_str += str(param.node_type)
+            yield param, scope
             try:
                 params.append(type_convert(param, func.type.params[i]))
             except:
                 error = True
         if error:
+            # строки типов нужны только для сообщения об ошибке
+            decl_params_str = ', '.join(str(param_type) for param_type in func.type.params)
+            fact_params_str = ', '.join(str(param.node_type) for param in node.params)
             node.semantic_error(
                 f'Фактические типы ({fact_params_str}) аргументов функции {func.name} не совпадают с формальными ({decl_params_str}) и не приводимы')
         else:
@@ -280,16 +335,29 @@ class SemanticChecker:
             node.node_type = func.type.return_type
 
 
+_built_in_idents: Optional[Dict[str, IdentDesc]] = None
+_built_in_lock = threading.Lock()
+
+
 def prepare_global_scope() -> IdentScope:
-    from sal_parser import parse
+    global _built_in_idents
+
+    # встроенные объекты разбираются и проверяются один раз на процесс (дальше идентификаторы только читаются)
+    with _built_in_lock:
+        if _built_in_idents is None:
+            from sal_parser import parse
+
+            prog = parse(BUILT_IN_OBJECTS)
+            checker = SemanticChecker()
+            scope = IdentScope()
+            checker.semantic_check(prog, scope)
+            for name, ident in scope.idents.items():
+                ident.built_in = True
+            _built_in_idents = dict(scope.idents)
 
-    prog = parse(BUILT_IN_OBJECTS)
-    checker = SemanticChecker()
     scope = IdentScope()
-    checker.semantic_check(prog, scope)
-    for name, ident in scope.idents.items():
-        ident.built_in = True
-    scope.var_index = 0
+    for ident in _built_in_idents.values():
+        scope.put(ident)
     return scope
 
 
@@ -0,0 +1,234 @@
+"""Компиляционный сервер: держит прогретыми парсер и глобальную область видимости,
+принимает запросы на компиляцию через Unix domain socket.
+
+Протокол: 4 байта длины (big-endian) + JSON в UTF-8, в обе стороны.
+    запрос:  {"src": "...", "parser": "lalr", "incremental": false, "cache": true, "opt": 0,
+             "inline_budget": 40, "drop_unused": false, "ir": false} | {"cmd": "stats"} | {"cmd": "shutdown"}
+    ответ:   {"ok": true, "msil": "..."} | {"ok": false, "error": "...", "busy": true?}
+"""
+
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+HEADER = struct.Struct('>I')
+DEFAULT_QUEUE_SIZE = 64
+LATENCY_WINDOW = 10000
+# время на чтение запроса сервером, с: клиент, который подключился и ничего не прислал, не занимает обработчик
+READ_TIMEOUT = 5.0
+# то же для запроса, на который отвечается busy (дочитывается отдельными потоками, не в потоке accept)
+BUSY_READ_TIMEOUT = 1.0
+BUSY_THREADS = 2
+# время ожидания ответа клиентом (вместе с ожиданием в очереди сервера и компиляцией), с
+CLIENT_TIMEOUT = 60.0
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise ConnectionError('соединение закрыто')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock: socket.socket) -> Dict[str, Any]:
+    size, = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return json.loads(recv_exact(sock, size).decode('utf-8'))
+
+
+def percentiles(values: list) -> Dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+    res = {'p{}'.format(p): round(values[min(len(values) - 1, len(values) * p // 100)], 3) for p in (50, 90, 99)}
+    res['max'] = round(values[-1], 3)
+    return res
+
+
+class CompileServer:
+    """Сервер с ограниченной очередью соединений: если очередь заполнена, клиент сразу получает
+       ответ busy (и может повторить запрос позже), а не копится в памяти сервера
+    """
+
+    def __init__(self, path: str, workers: int = 1, queue_size: int = DEFAULT_QUEUE_SIZE) -> None:
+        self.path = path
+        self.workers = workers
+        self.connections: queue.Queue = queue.Queue(maxsize=queue_size)
+        # время от приема соединения до ответа (с ожиданием в очереди) и время самой компиляции, мс
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.compile_times: deque = deque(maxlen=LATENCY_WINDOW)
+        self.served = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sock: Optional[socket.socket] = None
+
+    def warm_up(self, parser_engine: str) -> None:
+        import sal_parser
+        import sal_semantic_checker
+
+        sal_parser.get_parser(parser_engine)
+        sal_semantic_checker.prepare_global_scope()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            latencies = list(self.latencies)
+            compile_times = list(self.compile_times)
+            served, rejected = self.served, self.rejected
+        return {
+            'ok': True,
+            'served': served,
+            'rejected': rejected,
+            'queued': self.connections.qsize(),
+            'latency_ms': percentiles(latencies),
+            'compile_ms': percentiles(compile_times),
+        }
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        import program
+        import sal_msil
+        import sal_parser
+        import sal_semantic_base
+
+        cmd = request.get('cmd', 'compile')
+        if cmd == 'stats':
+            return self.stats()
+        if cmd == 'shutdown':
+            self.stop()
+            return {'ok': True}
+        if cmd != 'compile':
+            return {'ok': False, 'error': 'Неизвестная команда {}'.format(cmd)}
+        try:
+            text, cached = program.compile_text(request['src'], request.get('parser') or sal_parser.DEFAULT_ENGINE,
+                                                bool(request.get('incremental')), request.get('cache', True),
+                                                int(request.get('opt', 0)),
+                                                program.inline_options(request.get('inline_budget'),
+                                                                       bool(request.get('drop_unused'))),
+                                                bool(request.get('ir')))
+            return {'ok': True, 'msil': text, 'cached': cached}
+        except sal_parser.syntax_errors() as e:
+            return {'ok': False, 'error': sal_parser.syntax_error(e)[0]}
+        except (sal_semantic_base.SemanticException, sal_msil.MsilException) as e:
+            return {'ok': False, 'error': e.message}
+        except Exception as e:
+            return {'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)}
+
+    def worker(self) -> None:
+        while True:
+            item = self.connections.get()
+            if item is None:
+                break
+            conn, accepted = item
+            with conn:
+                try:
+                    conn.settimeout(READ_TIMEOUT)
+                    request = recv_message(conn)
+                    start = time.perf_counter()
+                    response = self.handle(request)
+                    compiled = time.perf_counter()
+                    send_message(conn, response)
+                except (ConnectionError, OSError, ValueError):
+                    continue
+            if request.get('cmd', 'compile') == 'compile':
+                with self.lock:
+                    self.served += 1
+                    self.latencies.append((time.perf_counter() - accepted) * 1000)
+                    self.compile_times.append((compiled - start) * 1000)
+
+    def reject(self, conn: socket.socket) -> None:
+        with conn:
+            # запрос дочитывается, чтобы клиент получил ответ busy, а не обрыв соединения
+            try:
+                conn.settimeout(BUSY_READ_TIMEOUT)
+                recv_message(conn)
+                send_message(conn, {'ok': False, 'busy': True, 'error': 'Сервер перегружен'})
+            except (ConnectionError, OSError, ValueError):
+                pass
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.sock is not None:
+            # разблокировать accept() в основном потоке
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                try:
+                    s.connect(self.path)
+                except OSError:
+                    pass
+
+    def serve_forever(self, parser_engine: Optional[str] = None) -> None:
+        import sal_parser
+
+        self.warm_up(parser_engine or sal_parser.DEFAULT_ENGINE)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(self.connections.maxsize)
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        rejecter = ThreadPoolExecutor(max_workers=BUSY_THREADS)
+        try:
+            while not self.stopped.is_set():
+                conn, _ = self.sock.accept()
+                if self.stopped.is_set():
+                    conn.close()
+                    break
+                try:
+                    self.connections.put_nowait((conn, time.perf_counter()))
+                except queue.Full:
+                    with self.lock:
+                        self.rejected += 1
+                    rejecter.submit(self.reject, conn)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for _ in threads:
+                self.connections.put(None)
+            for thread in threads:
+                thread.join()
+            rejecter.shutdown()
+            self.sock.close()
+            os.unlink(self.path)
+
+
+def request(path: str, message: Dict[str, Any], retries: int = 50,
+            timeout: Optional[float] = CLIENT_TIMEOUT) -> Dict[str, Any]:
+    """Клиент: отправить запрос серверу (при ответе busy - повтор с нарастающей паузой)
+    :param timeout: время ожидания ответа на одну попытку, с (None - без ограничения)
+    """
+
+    delay = 0.005
+    for attempt in range(retries + 1):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            try:
+                sock.connect(path)
+            except BlockingIOError:
+                # с таймаутом connect не ждет места в очереди listen, а сразу завершается ошибкой: как busy
+                if attempt == retries:
+                    raise
+                response = {'ok': False, 'busy': True, 'error': 'Сервер перегружен'}
+            else:
+                send_message(sock, message)
+                response = recv_message(sock)
+        if not response.get('busy') or attempt == retries:
+            return response
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    return response
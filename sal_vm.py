@@ -0,0 +1,635 @@
+"""Встроенная виртуальная машина: выполнение проверенной программы без MSIL и Mono (app.py --run)
+
+Проверенный (и оптимизированный) корневой StmtListNode переводится в байт-код (BytecodeCompiler): команды
+фиксированной длины - код операции и операнд - в одном массиве array('i') на всю программу; литералы - в списке
+consts. Стековая машина (Machine) выполняет код в одном цикле выбора команды, вызовы функций - без рекурсии
+Python (кадры в явном стеке).
+
+Переменные: глобальные - в списке по индексам полей _gv (IdentDesc.index), в кадре функции - параметры
+(по индексам параметров), затем локальные переменные (по слотам, как в .locals init CodeGenerator),
+затем скрытые конечные значения циклов для. Операнды в общем стеке, аргументы вызова - последние элементы стека.
+
+Семантика совпадает с MSIL, который выдает CodeGenerator: цел - 32-битные числа с переполнением, деление
+отбрасывает дробную часть, и/или вычисляют оба операнда, >= и <= - отрицание < и > (для NaN истинно),
+строки сравниваются посимвольно (CompareOrdinal). Значения по умолчанию - нули типов (у лит - пустая строка).
+вывод печатает значения подряд, без разделителей, и переводит строку; ввод читает одну строку
+и преобразует ее к типу переменной.
+"""
+
+import math
+import sys
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+import visitor
+from sal_ast import AssignNode, AstNode, BinOpNode, BoolNode, CharacterNode, DoWhileNode, ForNode, FuncCallNode, \
+    FuncDeclNode, IdentNode, IfNode, InputNode, NumNode, OutputNode, StmtListNode, StringNode, TypeConvertNode, \
+    VarDeclNode, WhileNode
+from sal_ir import program_fields
+from sal_msil import decls_locals, find_vars_decls, for_depth, func_locals, res_ident, value_unused
+from sal_optimizer import int32, int_div
+from sal_semantic_base import BaseType, BinOp, IdentDesc, ScopeType, TypeDesc
+
+
+class VmException(Exception):
+    def __init__(self, message, *args: object) -> None:
+        self.message = message
+
+
+# коды операций; у команд без операнда он равен 0
+(CONST, LOAD, STORE, LOAD_GLOBAL, STORE_GLOBAL, INC, POP,
+ ADD_INT, SUB_INT, MUL_INT, DIV_INT, ADD, SUB, MUL, DIV,
+ GT, LT, GE, LE, EQ, AND, OR, CONVERT,
+ JUMP, JUMP_TRUE, JUMP_FALSE, JUMP_GT, JUMP_LT, JUMP_GE, JUMP_LE, JUMP_EQ, JUMP_NE,
+ CALL, RET, PRINT, INPUT) = range(36)
+
+OP_NAMES = ('const', 'load', 'store', 'load_global', 'store_global', 'inc', 'pop',
+            'add_int', 'sub_int', 'mul_int', 'div_int', 'add', 'sub', 'mul', 'div',
+            'gt', 'lt', 'ge', 'le', 'eq', 'and', 'or', 'convert',
+            'jump', 'jump_true', 'jump_false', 'jump_gt', 'jump_lt', 'jump_ge', 'jump_le', 'jump_eq', 'jump_ne',
+            'call', 'ret', 'print', 'input')
+
+# арифметика: (операция, тип операндов) -> команда; для цел - с 32-битным переполнением
+ARITH_OPS = {
+    (BinOp.ADD, BaseType.INT): ADD_INT,
+    (BinOp.SUB, BaseType.INT): SUB_INT,
+    (BinOp.MUL, BaseType.INT): MUL_INT,
+    (BinOp.DIV, BaseType.INT): DIV_INT,
+    (BinOp.ADD, BaseType.FLOAT): ADD,
+    (BinOp.SUB, BaseType.FLOAT): SUB,
+    (BinOp.MUL, BaseType.FLOAT): MUL,
+    (BinOp.DIV, BaseType.FLOAT): DIV,
+    (BinOp.ADD, BaseType.STR): ADD,
+}
+
+COMPARE_OPS = {BinOp.GT: GT, BinOp.LT: LT, BinOp.GE: GE, BinOp.LE: LE, BinOp.EQUALS: EQ,
+               BinOp.AND: AND, BinOp.OR: OR}
+
+# сравнение целых перед условным переходом: операция -> (переход, если условие истинно; если ложно)
+INT_COMPARE_JUMPS = {
+    BinOp.GT: (JUMP_GT, JUMP_LE),
+    BinOp.LT: (JUMP_LT, JUMP_GE),
+    BinOp.GE: (JUMP_GE, JUMP_LT),
+    BinOp.LE: (JUMP_LE, JUMP_GT),
+    BinOp.EQUALS: (JUMP_EQ, JUMP_NE),
+}
+
+ZERO_VALUES = {
+    BaseType.INT: 0,
+    BaseType.FLOAT: 0.0,
+    BaseType.BOOL: False,
+    BaseType.STR: '',
+    BaseType.CHAR: '\0',
+}
+
+# наибольшая глубина вызовов (в MSIL - переполнение стека потока)
+MAX_FRAMES = 100000
+
+
+def format_float(value: float) -> str:
+    # как Double.ToString() в .NET: 1.0 -> 1, 1e+20 -> 1E+20
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return 'Infinity' if value > 0 else '-Infinity'
+    res = repr(value)
+    if res.endswith('.0'):
+        res = res[:-2]
+    return res.replace('e', 'E')
+
+
+def format_value(value) -> str:
+    cls = value.__class__
+    if cls is bool:
+        return 'да' if value else 'нет'
+    if cls is float:
+        return format_float(value)
+    return str(value)
+
+
+def float_div(a: float, b: float) -> float:
+    # деление вещественных на ноль по IEEE 754 (в Python - исключение)
+    if b:
+        return a / b
+    if a == 0 or math.isnan(a):
+        return math.nan
+    return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+# преобразования типов (TYPE_CONVERTIBILITY): (из типа, в тип) -> номер функции в CONVERTERS (операнд convert)
+CONVERTERS: List[Callable] = [float, bool, format_value, format_value, format_value, str]
+CONVERSIONS = {
+    (BaseType.INT, BaseType.FLOAT): 0,
+    (BaseType.INT, BaseType.BOOL): 1,
+    (BaseType.INT, BaseType.STR): 2,
+    (BaseType.FLOAT, BaseType.STR): 3,
+    (BaseType.BOOL, BaseType.STR): 4,
+    (BaseType.CHAR, BaseType.STR): 5,
+}
+
+INPUT_TYPES = (BaseType.INT, BaseType.FLOAT, BaseType.BOOL, BaseType.STR, BaseType.CHAR)
+
+
+def parse_input(line: str, type_: BaseType):
+    """Значение введенной строки для переменной типа type_
+    """
+
+    text = line.strip()
+    try:
+        if type_ == BaseType.INT:
+            value = int(text)
+            if value != int32(value):
+                raise ValueError(text)
+            return value
+        if type_ == BaseType.FLOAT:
+            return float(text.replace(',', '.'))
+        if type_ == BaseType.BOOL:
+            if text not in ('да', 'нет'):
+                raise ValueError(text)
+            return text == 'да'
+        if type_ == BaseType.CHAR:
+            if len(line) < 1:
+                raise ValueError(line)
+            return line[0]
+    except ValueError:
+        raise VmException('Введено "{}", ожидалось значение типа {}'.format(text, type_.value))
+    return line
+
+
+class FuncDesc:
+    """Функция в байт-коде: адрес первой команды и начальное содержимое кадра после аргументов
+    """
+
+    __slots__ = ('name', 'entry', 'params', 'defaults')
+
+    def __init__(self, name: str, params: int, defaults: List[object]) -> None:
+        self.name = name
+        self.entry = 0
+        self.params = params
+        # локальные переменные (нули типов) и скрытые конечные значения циклов для
+        self.defaults = defaults
+
+
+class VmProgram:
+    def __init__(self, code: array, consts: List[object], funcs: List[FuncDesc], main: FuncDesc,
+                 globals_: Dict[int, object]) -> None:
+        self.code = code
+        self.consts = consts
+        self.funcs = funcs
+        self.main = main
+        # начальные значения глобальных переменных по индексам полей _gv
+        self.globals = [globals_.get(i, 0) for i in range(max(globals_) + 1)] if globals_ else []
+
+    def dump(self) -> List[str]:
+        entries = {func.entry: func for func in self.funcs + [self.main]}
+        res = []
+        for pc in range(0, len(self.code), 2):
+            if pc in entries:
+                func = entries[pc]
+                res.append('{}: params {}, locals {}'.format(func.name, func.params, len(func.defaults)))
+            op, arg = self.code[pc], self.code[pc + 1]
+            if op == CONST:
+                text = '{} {!r}'.format(OP_NAMES[op], self.consts[arg])
+            elif op == CALL:
+                text = '{} {}'.format(OP_NAMES[op], self.funcs[arg].name)
+            elif op in (POP, RET) or ADD_INT <= op <= OR:
+                text = OP_NAMES[op]
+            else:
+                text = '{} {}'.format(OP_NAMES[op], arg)
+            res.append('{:6}  {}'.format(pc, text))
+        return res
+
+
+class BytecodeCompiler:
+    """Перевод проверенного AST в байт-код; реализация для выражения оставляет значение на стеке
+    """
+
+    def __init__(self) -> None:
+        self.code = array('i')
+        self.consts: List[object] = []
+        self.const_index: Dict[Tuple[type, object], int] = {}
+        self.funcs: List[FuncDesc] = []
+        self.func_index: Dict[IdentDesc, int] = {}
+        # кадр текущей функции: кол-во параметров (начало слотов локальных переменных)
+        # и первый слот скрытых переменных циклов для, текущая вложенность циклов для
+        self.params = 0
+        self.loop_slots_base = 0
+        self.loop_depth = 0
+
+    def emit(self, op: int, arg: int = 0) -> int:
+        pos = len(self.code)
+        self.code.append(op)
+        self.code.append(arg)
+        return pos
+
+    def patch(self, pos: int, target: Optional[int] = None) -> None:
+        self.code[pos + 1] = len(self.code) if target is None else target
+
+    def const(self, value) -> None:
+        key = (value.__class__, value)
+        index = self.const_index.get(key)
+        if index is None:
+            index = self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        self.emit(CONST, index)
+
+    def load(self, ident: IdentDesc) -> None:
+        if ident.scope == ScopeType.PARAM:
+            self.emit(LOAD, ident.index)
+        elif ident.scope == ScopeType.LOCAL:
+            self.emit(LOAD, self.params + ident.index)
+        else:
+            self.emit(LOAD_GLOBAL, ident.index)
+
+    def store(self, ident: IdentDesc) -> None:
+        if ident.scope == ScopeType.PARAM:
+            self.emit(STORE, ident.index)
+        elif ident.scope == ScopeType.LOCAL:
+            self.emit(STORE, self.params + ident.index)
+        else:
+            self.emit(STORE_GLOBAL, ident.index)
+
+    def start_frame(self, params: int, locals_types: List[BaseType], loops: int) -> List[object]:
+        self.params = params
+        self.loop_slots_base = params + len(locals_types)
+        self.loop_depth = 0
+        return [ZERO_VALUES[t] for t in locals_types] + [0] * loops
+
+    def compile_program(self, prog: StmtListNode) -> VmProgram:
+        funcs = [stmt for stmt in prog.stmts if isinstance(stmt, FuncDeclNode)]
+        # функции нумеруются до компиляции тел (функцию можно вызывать до ее описания)
+        for func in funcs:
+            params = [var.node_ident for decl in func.params.vars for var in decl.vars]
+            self.func_index[func.name.node_ident] = len(self.funcs)
+            self.funcs.append(FuncDesc(func.name.name, len(params), []))
+
+        # Main размещается первым: выполнение начинается с адреса 0
+        main_stmts = [stmt for stmt in prog.stmts if not isinstance(stmt, FuncDeclNode)]
+        locals_types = decls_locals([decl for stmt in main_stmts
+                                     for decl in ([stmt] if isinstance(stmt, VarDeclNode) else find_vars_decls(stmt))])
+        main = FuncDesc('Main', 0, self.start_frame(0, locals_types,
+                                                    max((for_depth(stmt) for stmt in main_stmts), default=0)))
+        for stmt in main_stmts:
+            self.compile(stmt)
+            if value_unused(stmt):
+                self.emit(POP)
+        self.emit(RET)
+
+        for func in funcs:
+            self.compile(func)
+
+        globals_ = {ident.index: ZERO_VALUES[ident.type.base_type] for ident in program_fields(prog)}
+        return VmProgram(self.code, self.consts, self.funcs, main, globals_)
+
+    @visitor.on('node')
+    def compile(self, node):
+        pass
+
+    @visitor.when(AstNode)
+    def compile(self, node: AstNode) -> None:
+        raise VmException('{} не поддерживается виртуальной машиной'.format(node))
+
+    @visitor.when(NumNode)
+    def compile(self, node: NumNode) -> None:
+        self.const(node.value)
+
+    @visitor.when(BoolNode)
+    def compile(self, node: BoolNode) -> None:
+        self.const(bool(node.value))
+
+    @visitor.when(StringNode)
+    def compile(self, node: StringNode) -> None:
+        # значения строк и символов хранятся вместе с кавычками
+        self.const(node.value[1:-1])
+
+    @visitor.when(CharacterNode)
+    def compile(self, node: CharacterNode) -> None:
+        self.const(node.value[1:-1])
+
+    @visitor.when(IdentNode)
+    def compile(self, node: IdentNode) -> None:
+        self.load(node.node_ident)
+
+    @visitor.when(BinOpNode)
+    def compile(self, node: BinOpNode) -> None:
+        yield node.arg1
+        yield node.arg2
+        op = ARITH_OPS.get((node.op, node.arg1.node_type.base_type)) or COMPARE_OPS.get(node.op)
+        if op is None:
+            raise VmException('Операция {} не поддерживается'.format(node.op.value))
+        self.emit(op)
+
+    @visitor.when(TypeConvertNode)
+    def compile(self, node: TypeConvertNode) -> None:
+        yield node.expr
+        conversion = CONVERSIONS.get((node.expr.node_type.base_type, node.node_type.base_type))
+        if conversion is None:
+            raise VmException('Преобразование {} в {} не поддерживается'.format(node.expr.node_type, node.node_type))
+        self.emit(CONVERT, conversion)
+
+    @visitor.when(FuncCallNode)
+    def compile(self, node: FuncCallNode) -> None:
+        index = self.func_index.get(node.name.node_ident)
+        if index is None:
+            raise VmException('Встроенная функция {} не поддерживается'.format(node.name.name))
+        for param in node.params:
+            yield param
+        self.emit(CALL, index)
+
+    @visitor.when(AssignNode)
+    def compile(self, node: AssignNode) -> None:
+        yield node.val
+        self.store(node.var.node_ident)
+
+    @visitor.when(VarDeclNode)
+    def compile(self, node: VarDeclNode) -> None:
+        for var in node.vars:
+            if isinstance(var, AssignNode) and var.val is not None:
+                yield var
+
+    @visitor.when(StmtListNode)
+    def compile(self, node: StmtListNode) -> None:
+        for stmt in node.stmts:
+            yield stmt
+            if value_unused(stmt):
+                self.emit(POP)
+
+    @visitor.when(OutputNode)
+    def compile(self, node: OutputNode) -> None:
+        for arg in node.args:
+            yield arg
+        self.emit(PRINT, len(node.args))
+
+    @visitor.when(InputNode)
+    def compile(self, node: InputNode) -> None:
+        self.emit(INPUT, INPUT_TYPES.index(node.var.node_type.base_type))
+        self.store(node.var.node_ident)
+
+    def branch(self, cond: AstNode, jump_if: bool):
+        """Условный переход по cond (генератор для yield from); сравнение целых объединяется с переходом
+        :return: позиция команды перехода (адрес - patch)
+        """
+
+        if isinstance(cond, BinOpNode) and cond.op in INT_COMPARE_JUMPS and \
+                cond.arg1.node_type == TypeDesc.INT and cond.arg2.node_type == TypeDesc.INT:
+            yield cond.arg1
+            yield cond.arg2
+            return self.emit(INT_COMPARE_JUMPS[cond.op][0 if jump_if else 1])
+        yield cond
+        return self.emit(JUMP_TRUE if jump_if else JUMP_FALSE)
+
+    @visitor.when(IfNode)
+    def compile(self, node: IfNode) -> None:
+        else_jump = yield from self.branch(node.cond, False)
+        yield node.then_stmt
+        if node.else_stmt:
+            end_jump = self.emit(JUMP)
+            self.patch(else_jump)
+            yield node.else_stmt
+            self.patch(end_jump)
+        else:
+            self.patch(else_jump)
+
+    # циклы - с проверкой условия в конце, как в CodeGenerator
+
+    @visitor.when(WhileNode)
+    def compile(self, node: WhileNode) -> None:
+        cond_jump = self.emit(JUMP)
+        body = len(self.code)
+        if node.body is not None:
+            yield node.body
+        self.patch(cond_jump)
+        body_jump = yield from self.branch(node.cond, True)
+        self.patch(body_jump, body)
+
+    @visitor.when(DoWhileNode)
+    def compile(self, node: DoWhileNode) -> None:
+        body = len(self.code)
+        if node.body is not None:
+            yield node.body
+        body_jump = yield from self.branch(node.cond, True)
+        self.patch(body_jump, body)
+
+    @visitor.when(ForNode)
+    def compile(self, node: ForNode) -> None:
+        var = node.init.node_ident
+        bound = self.loop_slots_base + self.loop_depth
+        yield node.cond
+        self.store(var)
+        yield node.step
+        self.emit(STORE, bound)
+        cond_jump = self.emit(JUMP)
+        body = len(self.code)
+        self.loop_depth += 1
+        yield node.body
+        self.loop_depth -= 1
+        if var.scope == ScopeType.GLOBAL or var.scope == ScopeType.GLOBAL_LOCAL:
+            self.load(var)
+            self.const(1)
+            self.emit(ADD_INT)
+            self.store(var)
+        else:
+            self.emit(INC, var.index if var.scope == ScopeType.PARAM else self.params + var.index)
+        self.patch(cond_jump)
+        self.load(var)
+        self.emit(LOAD, bound)
+        self.emit(JUMP_LE, body)
+
+    @visitor.when(FuncDeclNode)
+    def compile(self, node: FuncDeclNode) -> None:
+        func = self.funcs[self.func_index[node.name.node_ident]]
+        func.entry = len(self.code)
+        func.defaults = self.start_frame(func.params, func_locals(node), for_depth(node.body))
+        if node.body is not None:
+            yield node.body
+        # результат остается на стеке (стек операндов общий для всех кадров)
+        if node.res is not None:
+            self.load(res_ident(node))
+        elif node.type.type != TypeDesc.VOID:
+            self.const(ZERO_VALUES[node.type.type.base_type])
+        self.emit(RET)
+
+
+def compile_program(prog: StmtListNode) -> VmProgram:
+    return BytecodeCompiler().compile_program(prog)
+
+
+class Machine:
+    """Выполнение байт-кода; счетчики выполненных команд и вызовов накапливаются по всем запускам
+    """
+
+    def __init__(self, program: VmProgram, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> None:
+        self.program = program
+        self.stdin = stdin
+        self.stdout = stdout
+        self.globals: List[object] = []
+        self.executed = 0
+        self.calls = 0
+        self.seconds = 0.0
+
+    def run(self) -> None:
+        prog = self.program
+        code = prog.code
+        consts = prog.consts
+        funcs = prog.funcs
+        globals_ = self.globals = list(prog.globals)
+        converters = CONVERTERS
+        stdin = self.stdin if self.stdin is not None else sys.stdin
+        stdout = self.stdout if self.stdout is not None else sys.stdout
+        stack: list = []
+        push = stack.append
+        pop = stack.pop
+        frames: List[Tuple[int, list]] = []
+        locals_ = list(prog.main.defaults)
+        pc = prog.main.entry
+        executed = calls = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                op = code[pc]
+                arg = code[pc + 1]
+                pc += 2
+                executed += 1
+                if op == LOAD:
+                    push(locals_[arg])
+                elif op == CONST:
+                    push(consts[arg])
+                elif op == STORE:
+                    locals_[arg] = pop()
+                elif op == JUMP_LE:
+                    b = pop()
+                    if pop() <= b:
+                        pc = arg
+                elif op == INC:
+                    value = locals_[arg] + 1
+                    locals_[arg] = value if value <= 0x7fffffff else int32(value)
+                elif op == ADD_INT:
+                    b = pop()
+                    value = stack[-1] + b
+                    stack[-1] = value if -0x80000000 <= value <= 0x7fffffff else int32(value)
+                elif op == LOAD_GLOBAL:
+                    push(globals_[arg])
+                elif op == STORE_GLOBAL:
+                    globals_[arg] = pop()
+                elif op == JUMP:
+                    pc = arg
+                elif op == JUMP_FALSE:
+                    if not pop():
+                        pc = arg
+                elif op == JUMP_TRUE:
+                    if pop():
+                        pc = arg
+                elif op == JUMP_LT:
+                    b = pop()
+                    if pop() < b:
+                        pc = arg
+                elif op == JUMP_GT:
+                    b = pop()
+                    if pop() > b:
+                        pc = arg
+                elif op == JUMP_GE:
+                    b = pop()
+                    if pop() >= b:
+                        pc = arg
+                elif op == JUMP_EQ:
+                    b = pop()
+                    if pop() == b:
+                        pc = arg
+                elif op == JUMP_NE:
+                    b = pop()
+                    if pop() != b:
+                        pc = arg
+                elif op == SUB_INT:
+                    b = pop()
+                    value = stack[-1] - b
+                    stack[-1] = value if -0x80000000 <= value <= 0x7fffffff else int32(value)
+                elif op == MUL_INT:
+                    b = pop()
+                    value = stack[-1] * b
+                    stack[-1] = value if -0x80000000 <= value <= 0x7fffffff else int32(value)
+                elif op == DIV_INT:
+                    b = pop()
+                    stack[-1] = int32(int_div(stack[-1], b))
+                elif op == ADD:
+                    b = pop()
+                    stack[-1] += b
+                elif op == SUB:
+                    b = pop()
+                    stack[-1] -= b
+                elif op == MUL:
+                    b = pop()
+                    stack[-1] *= b
+                elif op == DIV:
+                    b = pop()
+                    stack[-1] = float_div(stack[-1], b)
+                elif op == GT:
+                    b = pop()
+                    stack[-1] = stack[-1] > b
+                elif op == LT:
+                    b = pop()
+                    stack[-1] = stack[-1] < b
+                elif op == GE:
+                    b = pop()
+                    stack[-1] = not stack[-1] < b
+                elif op == LE:
+                    b = pop()
+                    stack[-1] = not stack[-1] > b
+                elif op == EQ:
+                    b = pop()
+                    stack[-1] = stack[-1] == b
+                elif op == AND:
+                    b = pop()
+                    stack[-1] = stack[-1] and b
+                elif op == OR:
+                    b = pop()
+                    stack[-1] = stack[-1] or b
+                elif op == CALL:
+                    func = funcs[arg]
+                    count = func.params
+                    if count:
+                        args = stack[-count:]
+                        del stack[-count:]
+                    else:
+                        args = []
+                    args.extend(func.defaults)
+                    frames.append((pc, locals_))
+                    if len(frames) > MAX_FRAMES:
+                        raise VmException('Переполнение стека вызовов ({})'.format(func.name))
+                    locals_ = args
+                    pc = func.entry
+                    calls += 1
+                elif op == RET:
+                    if not frames:
+                        break
+                    pc, locals_ = frames.pop()
+                elif op == POP:
+                    pop()
+                elif op == CONVERT:
+                    stack[-1] = converters[arg](stack[-1])
+                elif op == PRINT:
+                    values = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    stdout.write(''.join(format_value(value) for value in values) + '\n')
+                elif op == INPUT:
+                    line = stdin.readline()
+                    if not line:
+                        raise VmException('Нет входных данных для ввода')
+                    push(parse_input(line.rstrip('\r\n'), INPUT_TYPES[arg]))
+                else:
+                    raise VmException('Неизвестная команда {} (адрес {})'.format(op, pc - 2))
+        except ZeroDivisionError:
+            raise VmException('Деление на ноль (адрес {})'.format(pc - 2))
+        finally:
+            self.executed += executed
+            self.calls += calls
+            self.seconds += time.perf_counter() - start
+
+
+def run_program(prog: StmtListNode, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None) -> Machine:
+    """Компиляция проверенной программы в байт-код и выполнение
+    """
+
+    machine = Machine(compile_program(prog), stdin, stdout)
+    machine.run()
+    return machine
@@ -21,57 +21,132 @@
 # THE SOFTWARE.
 
 import inspect
+from types import GeneratorType
 
-__all__ = ['on', 'when']
+__all__ = ['on', 'when', 'Dispatcher', 'DispatchError']
+
+# диспетчеры по __qualname__ метода ('CodeGenerator.msil_gen'), чтобы when() находил свой
+# диспетчер без обращения к фрейму тела класса
+_dispatchers = {}
+
+
+class DispatchError(TypeError):
+    pass
 
 
 def on(param_name):
     def f(fn):
         dispatcher = Dispatcher(param_name, fn)
-        return dispatcher
+        _dispatchers[fn.__qualname__] = dispatcher
+        return dispatcher.dispatch
 
     return f
 
 
 def when(param_type):
     def f(fn):
-        frame = inspect.currentframe().f_back
-        func_name = fn.func_name if 'func_name' in dir(fn) else fn.__name__
-        dispatcher = frame.f_locals[func_name]
-        if not isinstance(dispatcher, Dispatcher):
-            dispatcher = dispatcher.dispatcher
+        dispatcher = _dispatchers.get(fn.__qualname__)
+        if dispatcher is None:
+            raise DispatchError('{}: @when без предшествующего @on'.format(fn.__qualname__))
         dispatcher.add_target(param_type, fn)
-
-        def ff(*args, **kw):
-            return dispatcher(*args, **kw)
-
-        ff.dispatcher = dispatcher
-        return ff
+        return dispatcher.dispatch
 
     return f
 
 
 class Dispatcher(object):
+    """Выбор реализации по классу аргумента param_name: ближайший по MRO зарегистрированный класс,
+       результат выбора кэшируется для каждого конкретного класса, так что вызов стоит один поиск в dict
+
+       Реализация может быть генератором: вместо рекурсивного вызова она делает yield аргументов
+       (без self) для вложенного вызова, например `yield node.arg1, scope`, и получает его результат.
+       Такие вызовы выполняются с явным стеком, поэтому глубина дерева не ограничена стеком Python
+    """
+
     def __init__(self, param_name, fn):
-        frame = inspect.currentframe().f_back.f_back
-        top_level = frame.f_locals == frame.f_globals
         self.param_index = self.__argspec(fn).args.index(param_name)
         self.param_name = param_name
+        self.name = fn.__qualname__
         self.targets = {}
+        self.cache = {}
+        self.dispatch = self.__make_dispatch()
+        self.dispatch.dispatcher = self
+
+    def __make_dispatch(self):
+        cache = self.cache
+        resolve = self.resolve
+        run = self.run
+        index = self.param_index
+
+        def dispatch(*args, **kw):
+            typ = args[index].__class__
+            target = cache.get(typ)
+            if target is None:
+                target = resolve(typ)
+            res = target(*args, **kw)
+            if res.__class__ is GeneratorType:
+                return run(args[0], res)
+            return res
+
+        dispatch.__qualname__ = self.name
+        dispatch.__name__ = self.name.rpartition('.')[2]
+        return dispatch
 
     def __call__(self, *args, **kw):
-        typ = args[self.param_index].__class__
-        d = self.targets.get(typ)
-        if d is not None:
-            return d(*args, **kw)
-        else:
-            issub = issubclass
-            t = self.targets
-            ks = iter(t)
-            return [t[k](*args, **kw) for k in ks if issub(typ, k)]
+        return self.dispatch(*args, **kw)
+
+    def run(self, obj, gen):
+        """Выполнение реализации-генератора и всех вложенных вызовов с явным стеком генераторов
+        """
+
+        cache = self.cache
+        resolve = self.resolve
+        index = self.param_index - 1
+        stack = [gen]
+        value = exc = None
+        while stack:
+            try:
+                if exc is None:
+                    args = stack[-1].send(value)
+                else:
+                    args, exc = stack[-1].throw(exc), None
+            except StopIteration as e:
+                stack.pop()
+                value = e.value
+                continue
+            except BaseException as e:
+                stack.pop()
+                if not stack:
+                    raise
+                exc = e
+                continue
+            if args.__class__ is not tuple:
+                args = (args,)
+            typ = args[index].__class__
+            target = cache.get(typ)
+            try:
+                if target is None:
+                    target = resolve(typ)
+                value = target(obj, *args)
+            except BaseException as e:
+                exc = e
+                continue
+            if value.__class__ is GeneratorType:
+                stack.append(value)
+                value = None
+        return value
+
+    def resolve(self, typ):
+        for base in typ.__mro__:
+            target = self.targets.get(base)
+            if target is not None:
+                self.cache[typ] = target
+                return target
+        raise DispatchError('{}: нет обработчика для {}'.format(self.name, typ.__name__))
 
     def add_target(self, typ, target):
         self.targets[typ] = target
+        self.cache.clear()
 
     @staticmethod
     def __argspec(fn):